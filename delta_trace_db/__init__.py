@@ -1,7 +1,21 @@
 # --- db ---
+from delta_trace_db.db.async_delta_trace_db import AsyncDeltaTraceDatabase
+from delta_trace_db.db.column_store import ColumnStore
+from delta_trace_db.db.columnar_collection import ColumnarCollection
 from delta_trace_db.db.delta_trace_db_collection import Collection
 from delta_trace_db.db.delta_trace_db_core import DeltaTraceDatabase
+from delta_trace_db.db.enum_concurrency_mode import EnumConcurrencyMode
+from delta_trace_db.db.index.enum_index_type import EnumIndexType
+from delta_trace_db.db.lazy_delta_trace_db import LazyDeltaTraceDatabase
+from delta_trace_db.db.mapped_collection import MappedCollection
+from delta_trace_db.db.mapped_segment import MappedSegment
+from delta_trace_db.db.read_only_view import ReadOnlyDict, ReadOnlyList
+from delta_trace_db.db.util_binary_snapshot import UtilBinarySnapshot
+from delta_trace_db.db.util_collection_files import UtilCollectionFiles
 from delta_trace_db.db.util_copy import UtilCopy
+from delta_trace_db.db.util_json_stream import UtilJsonStream
+from delta_trace_db.db.util_query_planner import UtilQueryPlanner
+from delta_trace_db.db.write_ahead_log import WriteAheadLog
 
 # --- dsl ---
 from delta_trace_db.dsl.util_dsl_evaluator import UtilDslEvaluator
@@ -54,9 +68,24 @@ from delta_trace_db.query.util_query import UtilQuery
 # --- __all__ (公開対象一覧。Dart版と同様にUtilFieldのみ非公開) ---
 __all__ = [
     # db
+    "AsyncDeltaTraceDatabase",
     "Collection",
+    "ColumnarCollection",
+    "ColumnStore",
     "DeltaTraceDatabase",
+    "EnumConcurrencyMode",
+    "EnumIndexType",
+    "LazyDeltaTraceDatabase",
+    "MappedCollection",
+    "MappedSegment",
+    "ReadOnlyDict",
+    "ReadOnlyList",
+    "UtilBinarySnapshot",
+    "UtilCollectionFiles",
     "UtilCopy",
+    "UtilJsonStream",
+    "UtilQueryPlanner",
+    "WriteAheadLog",
     # dsl
     "UtilDslEvaluator",
     # query
@@ -0,0 +1,312 @@
+# coding: utf-8
+import asyncio
+from concurrent.futures import Executor
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple, TypeVar
+
+from delta_trace_db.db.delta_trace_db_core import DeltaTraceDatabase
+from delta_trace_db.db.enum_concurrency_mode import EnumConcurrencyMode
+from delta_trace_db.query.cause.permission import Permission
+from delta_trace_db.query.enum_query_type import EnumQueryType
+from delta_trace_db.query.query import Query
+from delta_trace_db.query.query_execution_result import QueryExecutionResult
+from delta_trace_db.query.query_result import QueryResult
+from delta_trace_db.query.transaction_query import TransactionQuery
+from delta_trace_db.query.transaction_query_result import TransactionQueryResult
+import logging
+
+_logger = logging.getLogger(__name__)
+
+_T = TypeVar("_T")
+
+
+class AsyncDeltaTraceDatabase:
+    def __init__(self, db: Optional[DeltaTraceDatabase] = None, executor: Optional[Executor] = None,
+                 max_concurrency: int = 16, inline_cost_limit: int = 10000):
+        """
+        (en) An asyncio front-end for DeltaTraceDatabase.
+        Queries whose estimated cost exceeds inline_cost_limit are run in the executor,
+        so that large scans do not stall the event loop.
+        Cheaper queries are run directly in the event loop, avoiding the overhead of the executor,
+        but only if the lock of the whole DB can be acquired without waiting,
+        so that the event loop never waits for a query running in another thread.
+        Since only global_ mode has a single lock for the whole operation,
+        all queries are run in the executor if the wrapped DB uses EnumConcurrencyMode.collection_.
+        The number of queries running at the same time is limited by max_concurrency.
+
+        (ja) DeltaTraceDatabaseのasyncio用のフロントエンドです。
+        見積もりコストがinline_cost_limitを超えるクエリはエクゼキュータで実行されるため、
+        大きな走査によってイベントループが止まることはありません。
+        それより軽いクエリは、エクゼキュータのオーバーヘッドを避けるためにイベントループ内で直接実行されますが、
+        イベントループが他のスレッドで実行中のクエリを待つことがないよう、
+        これはDB全体のロックを待たずに取得できた場合のみです。
+        処理全体に対する単一のロックを持つのはglobal_モードのみであるため、
+        包むDBがEnumConcurrencyMode.collection_を使用する場合は、全てのクエリがエクゼキュータで実行されます。
+        同時に実行されるクエリの数はmax_concurrencyで制限されます。
+
+        Parameters
+        ----------
+        db : Optional[DeltaTraceDatabase]
+            The wrapped DB. If None, a new DB is created.
+        executor : Optional[Executor]
+            The executor for heavy queries. If None, the default executor of the event loop is used.
+            A process pool cannot be used because the DB is shared in memory.
+        max_concurrency : int
+            The maximum number of queries executed at the same time.
+        inline_cost_limit : int
+            The maximum estimated cost, in number of records, of queries run directly in the event loop.
+        """
+        self._db = db if db is not None else DeltaTraceDatabase()
+        self._executor = executor
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._inline_cost_limit = inline_cost_limit
+        # (対象コレクション名, 名前またはコールバック) -> 登録した同期のリスナー
+        self._async_listeners: Dict[Tuple[str, Any], Callable[[], None]] = {}
+        # 実行中のリスナーのタスク。完了前に破棄されないよう参照を保持する。
+        self._tasks: Set[asyncio.Task] = set()
+
+    @property
+    def db(self) -> DeltaTraceDatabase:
+        """
+        (en) Returns the wrapped DB.
+
+        (ja) 包んでいるDBを返します。
+        """
+        return self._db
+
+    def estimate_cost(self, query: Query | TransactionQuery) -> int:
+        """
+        (en) Returns the estimated cost of the query in number of records.
+        This is based only on the number of records of the target collections
+        and the data to add, so it does not need the lock of the DB.
+
+        (ja) クエリの見積もりコストをレコード数で返します。
+        これは対象コレクションのレコード数と追加するデータ数のみに基づくため、
+        DBのロックを必要としません。
+
+        Parameters
+        ----------
+        query : Query | TransactionQuery
+            The query.
+        """
+        if isinstance(query, TransactionQuery):
+            return sum(self.estimate_cost(q) for q in query.queries)
+        match query.type:
+            case EnumQueryType.count | EnumQueryType.removeCollection:
+                return 0
+            case EnumQueryType.add:
+                return len(query.add_data or [])
+            case EnumQueryType.clearAdd:
+                return len(query.add_data or []) + self._length(query.target)
+            case EnumQueryType.merge:
+                mqp = query.merge_query_params
+                if mqp is None:
+                    return 0
+                return self._length(mqp.base) + sum(self._length(i) for i in mqp.source)
+            case _:
+                return self._length(query.target)
+
+    def _length(self, name: str) -> int:
+        """
+        (en) Returns the number of records of the collection, or 0 if it does not exist.
+
+        (ja) コレクションのレコード数を返します。存在しない場合は0を返します。
+
+        Parameters
+        ----------
+        name : str
+            The collection name.
+        """
+        # ロックを取らずに参照する。見積もりのため、多少古い値でも問題ない。
+        col = self._db.raw.get(name)
+        return col.length if col is not None else 0
+
+    def _try_lock(self) -> bool:
+        """
+        (en) Acquires the lock of the whole DB if it can be acquired without waiting.
+        This always fails unless the DB is in global_ mode.
+
+        (ja) 待たずに取得できる場合は、DB全体のロックを取得します。
+        DBがglobal_モードでない場合は常に失敗します。
+
+        Returns
+        -------
+        is_acquired : bool
+            True if the lock was acquired. The caller must release it.
+        """
+        if self._db.concurrency_mode != EnumConcurrencyMode.global_:
+            return False
+        return self._db._lock.acquire(blocking=False)
+
+    async def _run(self, func: Callable[[], _T], cost: int) -> _T:
+        """
+        (en) Runs the function directly or in the executor depending on the cost,
+        within the limit of concurrent queries.
+        Even a cheap function is run in the executor if the lock of the DB is held by another thread.
+
+        (ja) 同時実行数の制限内で、コストに応じて関数を直接、またはエクゼキュータで実行します。
+        軽い関数でも、DBのロックを他のスレッドが保持している場合はエクゼキュータで実行します。
+
+        Parameters
+        ----------
+        func : Callable[[], _T]
+            The function to run.
+        cost : int
+            The estimated cost.
+        """
+        async with self._semaphore:
+            if cost <= self._inline_cost_limit and self._try_lock():
+                # ロックは再入可能なため、保持したまま実行すれば関数内で待つことはない。
+                try:
+                    return func()
+                finally:
+                    self._db._lock.release()
+            return await asyncio.get_running_loop().run_in_executor(self._executor, func)
+
+    async def execute_query(self, q: Query,
+                            collection_permissions: Optional[Dict[str, Permission]] = None) -> QueryResult:
+        """
+        (en) Execute the query. See DeltaTraceDatabase.execute_query.
+
+        (ja) クエリを実行します。DeltaTraceDatabase.execute_queryを参照してください。
+
+        Parameters
+        ----------
+        q : Query
+            The query.
+        collection_permissions: Optional[Dict[str, Permission]]
+            Collection level operation permissions for the executing user.
+        """
+        return await self._run(lambda: self._db.execute_query(q, collection_permissions=collection_permissions),
+                               self.estimate_cost(q))
+
+    async def execute_transaction_query(self, q: TransactionQuery,
+                                        collection_permissions: Optional[Dict[str, Permission]] = None) \
+            -> TransactionQueryResult:
+        """
+        (en) Execute the transaction query. See DeltaTraceDatabase.execute_transaction_query.
+
+        (ja) トランザクションクエリを実行します。DeltaTraceDatabase.execute_transaction_queryを参照してください。
+
+        Parameters
+        ----------
+        q : TransactionQuery
+            The query.
+        collection_permissions: Optional[Dict[str, Permission]]
+            Collection level operation permissions for the executing user.
+        """
+        return await self._run(
+            lambda: self._db.execute_transaction_query(q, collection_permissions=collection_permissions),
+            self.estimate_cost(q))
+
+    async def execute_query_object(self, query: Any,
+                                   collection_permissions: Optional[Dict[str, Permission]] = None) \
+            -> QueryExecutionResult:
+        """
+        (en) Executes a query of any type. See DeltaTraceDatabase.execute_query_object.
+
+        (ja) 型を問わずにクエリを実行します。DeltaTraceDatabase.execute_query_objectを参照してください。
+
+        Parameters
+        ----------
+        query : Any
+            Query, TransactionQuery, or Dict.
+        collection_permissions: Optional[Dict[str, Permission]]
+            Collection level operation permissions for the executing user.
+
+        Raises
+        ------
+        ValueError
+            Throws on ValueError if the query is unsupported type.
+        """
+        if isinstance(query, dict):
+            if query.get("className") == "Query":
+                query = Query.from_dict(query)
+            elif query.get("className") == "TransactionQuery":
+                query = TransactionQuery.from_dict(query)
+            else:
+                raise ValueError("Unsupported query class")
+        if isinstance(query, Query):
+            return await self.execute_query(query, collection_permissions=collection_permissions)
+        elif isinstance(query, TransactionQuery):
+            return await self.execute_transaction_query(query, collection_permissions=collection_permissions)
+        else:
+            raise ValueError("Unsupported query type")
+
+    def add_async_listener(self, target: str, cb: Callable[[], Awaitable[None]], name: Optional[str] = None):
+        """
+        (en) Registers a coroutine function as a listener of the [target] collection.
+        When the collection is changed, the coroutine is scheduled as a task
+        on the event loop running at the time of registration,
+        even if the change was made in the executor.
+        Therefore, this must be called while the event loop is running.
+        Like listeners, async listeners are not serialized.
+
+        (ja) コルーチン関数を[target]のコレクションのリスナーとして登録します。
+        コレクションが変更されると、変更がエクゼキュータ内で行われた場合でも、
+        コルーチンは登録時に実行中のイベントループ上でタスクとしてスケジュールされます。
+        そのため、これはイベントループの実行中に呼び出す必要があります。
+        リスナーと同様に、非同期のリスナーはシリアライズされません。
+
+        Parameters
+        ----------
+        target : str
+            The target collection name.
+        cb : Callable[[], Awaitable[None]]
+            The coroutine function to execute when the DB is changed.
+        name : Optional[str]
+            If you set a non-null value, a listener will be registered with that name.
+
+        Raises
+        ------
+        RuntimeError
+            If no event loop is running.
+        """
+        loop = asyncio.get_running_loop()
+
+        def start():
+            task = loop.create_task(self._call_async_listener(cb))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+        def listener():
+            # 通知はエクゼキュータのスレッドから呼ばれる場合もある。
+            loop.call_soon_threadsafe(start)
+
+        self._async_listeners[(target, cb if name is None else name)] = listener
+        self._db.add_listener(target, listener, name=name)
+
+    def remove_async_listener(self, target: str, cb: Callable[[], Awaitable[None]], name: Optional[str] = None):
+        """
+        (en) Removes a listener registered with add_async_listener.
+
+        (ja) add_async_listenerで登録したリスナーを解除します。
+
+        Parameters
+        ----------
+        target : str
+            The target collection name.
+        cb : Callable[[], Awaitable[None]]
+            The coroutine function for which you want to cancel the notification.
+        name : Optional[str]
+            If you registered with a name, you must unregister with the same name.
+        """
+        listener = self._async_listeners.pop((target, cb if name is None else name), None)
+        if listener is not None:
+            self._db.remove_listener(target, listener, name=name)
+
+    @staticmethod
+    async def _call_async_listener(cb: Callable[[], Awaitable[None]]):
+        """
+        (en) Runs the async listener, logging the exception if it fails.
+
+        (ja) 非同期のリスナーを実行し、失敗した場合は例外をログに記録します。
+
+        Parameters
+        ----------
+        cb : Callable[[], Awaitable[None]]
+            The coroutine function.
+        """
+        try:
+            await cb()
+        except Exception:
+            _logger.error("Callback in async listeners failed", exc_info=True)
@@ -0,0 +1,371 @@
+# coding: utf-8
+import operator
+import sys
+from array import array
+from itertools import compress, count, repeat
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from delta_trace_db.query.nodes.comparison_node import FieldEquals, FieldNotEquals, FieldGreaterThan, \
+    FieldLessThan, FieldGreaterThanOrEqual, FieldLessThanOrEqual, FieldIn, FieldNotIn
+from delta_trace_db.query.nodes.enum_value_type import EnumValueType
+from delta_trace_db.query.nodes.logical_node import AndNode, OrNode
+from delta_trace_db.query.nodes.query_node import QueryNode
+
+# 列の種類。intとfloatは型付き配列、strは文字列のリスト、objはそれ以外の値のリストで保持する。
+_INT = "int"
+_FLOAT = "float"
+_STR = "str"
+_OBJ = "obj"
+
+# 値を持たない行の位置に置く値。行の形で存在しないことが分かるため、値自体は使われない。
+_PLACEHOLDERS = {_INT: 0, _FLOAT: 0.0, _STR: "", _OBJ: None}
+
+_INT64_MIN = -2 ** 63
+_INT64_MAX = 2 ** 63 - 1
+
+# 比較ノードの型 -> (演算子, 大小比較かどうか)
+_COMPARISONS: Dict[type, Tuple[Callable[[Any, Any], bool], bool]] = {
+    FieldEquals: (operator.eq, False),
+    FieldNotEquals: (operator.ne, False),
+    FieldGreaterThan: (operator.gt, True),
+    FieldLessThan: (operator.lt, True),
+    FieldGreaterThanOrEqual: (operator.ge, True),
+    FieldLessThanOrEqual: (operator.le, True),
+}
+
+
+def _kind_of(value: Any) -> str:
+    """
+    (en) Returns the kind of the column that can store the value.
+
+    (ja) 値を格納できる列の種類を返します。
+
+    Parameters
+    ----------
+    value : Any
+        The field value.
+    """
+    t = type(value)
+    if t is int and _INT64_MIN <= value <= _INT64_MAX:
+        return _INT
+    if t is float:
+        return _FLOAT
+    if t is str:
+        return _STR
+    return _OBJ
+
+
+class _Column:
+    """
+    (en) The values of one top-level field of all rows.
+    The values are kept in a typed array while they are all of the same type,
+    and fall back to a plain list when a value of another type is stored.
+
+    (ja) 全ての行の、一つのトップレベルのフィールドの値です。
+    値が全て同じ型である間は型付きの配列で保持し、別の型の値が格納された時点で通常のリストに切り替えます。
+    """
+    __slots__ = ("kind", "values")
+
+    def __init__(self, kind: str, length: int):
+        """
+        Parameters
+        ----------
+        kind : str
+            The kind of the column.
+        length : int
+            The number of the existing rows, which are filled with the placeholder.
+        """
+        self.kind = kind
+        placeholders = repeat(_PLACEHOLDERS[kind], length)
+        if kind == _INT:
+            self.values = array("q", placeholders)
+        elif kind == _FLOAT:
+            self.values = array("d", placeholders)
+        else:
+            self.values = list(placeholders)
+
+    def append(self, value: Any):
+        """
+        (en) Appends the value of the next row.
+
+        (ja) 次の行の値を追加します。
+
+        Parameters
+        ----------
+        value : Any
+            The field value.
+        """
+        kind = self.kind
+        if kind != _OBJ and _kind_of(value) != kind:
+            # 型が混在する列は、値の型を変えないよう通常のリストで保持する。
+            self.kind = kind = _OBJ
+            self.values = list(self.values)
+        if kind == _STR:
+            self.values.append(sys.intern(value))
+        else:
+            self.values.append(value)
+
+    def append_missing(self):
+        """
+        (en) Appends the placeholder for the next row, which does not have this field.
+
+        (ja) このフィールドを持たない次の行のために、プレースホルダを追加します。
+        """
+        self.values.append(_PLACEHOLDERS[self.kind])
+
+
+class ColumnStore:
+    """
+    (en) Stores rows of JSON compatible dictionaries as one column per top-level field.
+    Integers and floats are kept in typed arrays, and strings in lists of interned strings,
+    so each value costs a few bytes instead of a reference from a dictionary of its own.
+    The keys of each row and their order are kept as its shape,
+    so the rows are reconstructed exactly as they were stored, including irregular ones.
+    Comparisons on numeric and string columns are evaluated over the whole column at once.
+
+    (ja) JSON互換の辞書の行を、トップレベルのフィールド毎に一つの列として格納します。
+    整数と浮動小数点数は型付きの配列、文字列はインターンした文字列のリストで保持するため、
+    各値のコストは個別の辞書からの参照ではなく数バイトになります。
+    各行のキーとその順序は行の形として保持されるため、不揃いな行も含め、行は格納時と全く同じに復元されます。
+    数値と文字列の列に対する比較は、列全体に対して一度に評価されます。
+    """
+
+    def __init__(self):
+        self._columns: Dict[str, _Column] = {}
+        # 行の形(キーのタプル)の一覧と、その逆引き。
+        self._shapes: List[Tuple[str, ...]] = []
+        self._shape_ids: Dict[Tuple[str, ...], int] = {}
+        # 各行の形の番号。
+        self._row_shapes = array("I")
+
+    @property
+    def length(self) -> int:
+        """
+        (en) The number of the rows.
+
+        (ja) 行数です。
+        """
+        return len(self._row_shapes)
+
+    def column_kinds(self) -> Dict[str, str]:
+        """
+        (en) Returns the map from the field names to the kinds of their columns,
+        which are int, float, str or obj.
+
+        (ja) フィールド名から、その列の種類(int、float、str、obj)へのマップを返します。
+        """
+        return {k: c.kind for k, c in self._columns.items()}
+
+    def append(self, rows: Iterable[Dict[str, Any]]):
+        """
+        (en) Appends the rows. The values are stored without copying.
+
+        (ja) 行を追加します。値はコピーせずに格納されます。
+
+        Parameters
+        ----------
+        rows : Iterable[Dict[str, Any]]
+            The rows to append.
+        """
+        columns = self._columns
+        # 形の番号 -> その形に含まれない列の名前。
+        missing_by_shape: Dict[int, List[str]] = {}
+        for row in rows:
+            keys = tuple(row)
+            shape = self._shape_ids.get(keys)
+            if shape is None:
+                shape = len(self._shapes)
+                self._shapes.append(keys)
+                self._shape_ids[keys] = shape
+            position = len(self._row_shapes)
+            for k, v in row.items():
+                column = columns.get(k)
+                if column is None:
+                    column = _Column(_kind_of(v), position)
+                    columns[k] = column
+                    missing_by_shape.clear()
+                column.append(v)
+            missing = missing_by_shape.get(shape)
+            if missing is None:
+                missing = [k for k in columns if k not in row]
+                missing_by_shape[shape] = missing
+            for k in missing:
+                columns[k].append_missing()
+            self._row_shapes.append(shape)
+
+    def rows(self, positions: Optional[Iterable[int]] = None) -> List[Dict[str, Any]]:
+        """
+        (en) Reconstructs the rows at the specified positions as new dictionaries.
+        Nested values are shared with the store, not copied.
+
+        (ja) 指定位置の行を新しい辞書として復元します。
+        ネストされた値はコピーされず、ストアと共有されます。
+
+        Parameters
+        ----------
+        positions : Optional[Iterable[int]]
+            The positions of the rows. If None, all rows are reconstructed in order.
+        """
+        layouts = self._layouts()
+        row_shapes = self._row_shapes
+        if positions is None:
+            positions = range(len(row_shapes))
+        return [{k: v[i] for k, v in layouts[row_shapes[i]]} for i in positions]
+
+    def iter_rows(self, positions: Optional[Iterable[int]] = None) -> Iterator[Dict[str, Any]]:
+        """
+        (en) Reconstructs the rows at the specified positions one at a time.
+
+        (ja) 指定位置の行を一つずつ復元します。
+
+        Parameters
+        ----------
+        positions : Optional[Iterable[int]]
+            The positions of the rows. If None, all rows are reconstructed in order.
+        """
+        layouts = self._layouts()
+        row_shapes = self._row_shapes
+        for i in range(len(row_shapes)) if positions is None else positions:
+            yield {k: v[i] for k, v in layouts[row_shapes[i]]}
+
+    def _layouts(self) -> List[List[Tuple[str, Any]]]:
+        """
+        (en) Returns the pairs of the key and the column values for each shape.
+
+        (ja) 各形について、キーと列の値の組を返します。
+        """
+        columns = self._columns
+        return [[(k, columns[k].values) for k in shape] for shape in self._shapes]
+
+    def find(self, node: Optional[QueryNode]) -> Optional[List[int]]:
+        """
+        (en) Returns the positions of the rows that match the node in ascending order,
+        evaluating the conditions that can be evaluated on whole columns,
+        or None if no condition can be evaluated in this way.
+        Conditions that cannot be evaluated are ignored in AndNode,
+        so the rows must be evaluated again in the same way as index candidates.
+
+        (ja) 列全体で評価できる条件を評価して、ノードにマッチする行の位置を昇順で返します。
+        このように評価できる条件が無い場合はNoneを返します。
+        AndNodeでは評価できない条件は無視されるため、インデックスの候補と同様に行を再度評価する必要があります。
+
+        Parameters
+        ----------
+        node : Optional[QueryNode]
+            The node of the query.
+        """
+        if node is None:
+            return None
+        if isinstance(node, AndNode):
+            found = [r for r in (self.find(c) for c in node.conditions) if r is not None]
+            if not found:
+                return None
+            found.sort(key=len)
+            others = [set(r) for r in found[1:]]
+            return [i for i in found[0] if all(i in o for o in others)]
+        if isinstance(node, OrNode):
+            merged: set = set()
+            for c in node.conditions:
+                r = self.find(c)
+                if r is None:
+                    return None
+                merged.update(r)
+            return sorted(merged)
+        comparison = _COMPARISONS.get(type(node))
+        if comparison is not None:
+            if node.v_type != EnumValueType.auto_:
+                return None
+            op, is_magnitude = comparison
+            if is_magnitude and node.value is None:
+                return []
+            return self._compare(node.field, node.value, op, is_magnitude)
+        if isinstance(node, (FieldIn, FieldNotIn)):
+            try:
+                targets = frozenset(node.values)
+            except TypeError:
+                return None
+            is_in = isinstance(node, FieldIn)
+
+            def match(values: Any, kind: str) -> Optional[Iterable[int]]:
+                # ハッシュできない値を含み得る列は評価しない。
+                if kind == _OBJ:
+                    return None
+                found = map(targets.__contains__, values)
+                return compress(count(), found if is_in else map(operator.not_, found))
+
+            return self._match(node.field, (None in node.values) == is_in, match)
+        return None
+
+    def _compare(self, field: str, target: Any, op: Callable[[Any, Any], bool],
+                 is_magnitude: bool) -> Optional[List[int]]:
+        """
+        (en) Evaluates the comparison of auto_ on the whole column.
+
+        (ja) auto_の比較を列全体で評価します。
+
+        Parameters
+        ----------
+        field : str
+            The field name.
+        target : Any
+            The compare value.
+        op : Callable[[Any, Any], bool]
+            The comparison operator.
+        is_magnitude : bool
+            True for the comparison of magnitude, which never matches a missing field.
+        """
+        if is_magnitude:
+            is_missing_match = False
+        else:
+            try:
+                is_missing_match = bool(op(None, target))
+            except Exception:
+                is_missing_match = False
+        t = type(target)
+        is_numeric = t is int or t is float or t is bool
+
+        def match(values: Any, kind: str) -> Optional[Iterable[int]]:
+            # 比較が例外にならない組み合わせのみ、列全体で評価する。
+            if (kind == _INT or kind == _FLOAT) and is_numeric or kind == _STR and t is str:
+                return compress(count(), map(op, values, repeat(target)))
+            return None
+
+        return self._match(field, is_missing_match, match)
+
+    def _match(self, field: str, is_missing_match: bool,
+               match: Callable[[Any, str], Optional[Iterable[int]]]) -> Optional[List[int]]:
+        """
+        (en) Returns the positions of the rows that match,
+        combining the result on the column with the rows that do not have the field.
+
+        (ja) 列に対する結果と、フィールドを持たない行を組み合わせて、マッチする行の位置を返します。
+
+        Parameters
+        ----------
+        field : str
+            The field name.
+        is_missing_match : bool
+            True if the rows without the field match.
+        match : Callable[[Any, str], Optional[Iterable[int]]]
+            The function that returns the positions of the matched values in the column values,
+            or None if the column of the kind cannot be evaluated.
+        """
+        if "." in field:
+            return None
+        length = len(self._row_shapes)
+        column = self._columns.get(field)
+        if column is None:
+            return list(range(length)) if is_missing_match else []
+        hits = match(column.values, column.kind)
+        if hits is None:
+            return None
+        has_field = [field in shape for shape in self._shapes]
+        if all(has_field):
+            return list(hits)
+        row_shapes = self._row_shapes
+        # プレースホルダの位置の結果は捨て、フィールドを持たない行は別途判定する。
+        r = [i for i in hits if has_field[row_shapes[i]]]
+        if is_missing_match:
+            r.extend(i for i in range(length) if not has_field[row_shapes[i]])
+            r.sort()
+        return r
@@ -0,0 +1,289 @@
+# coding: utf-8
+from typing import Any, Callable, Dict, List, Optional, override
+
+from delta_trace_db.db.column_store import ColumnStore
+from delta_trace_db.db.delta_trace_db_collection import Collection
+from delta_trace_db.db.index.abstract_index import AbstractIndex
+from delta_trace_db.db.index.enum_index_type import EnumIndexType
+from delta_trace_db.db.util_query_planner import UtilQueryPlanner
+from delta_trace_db.query.nodes.enum_value_type import EnumValueType
+from delta_trace_db.query.nodes.query_node import QueryNode
+from delta_trace_db.query.query import Query
+from delta_trace_db.query.query_result import QueryResult
+
+
+class ColumnarCollection(Collection):
+
+    def __init__(self):
+        """
+        (en) A collection that stores its records in a ColumnStore,
+        one typed column per top-level field, instead of a list of dictionaries.
+        The query API is the same as Collection.
+        Records are reconstructed only when a query touches them,
+        and comparisons of auto_ on numeric and string columns are evaluated over the whole column,
+        which replaces indexes, so indexes cannot be added.
+        Adding records appends them to the columns directly,
+        while other writes reconstruct all records, change them in the same way as Collection,
+        and store them in the columns again.
+        During a transaction the records are kept as dictionaries until it ends.
+        This suits large collections that are mostly read or appended to.
+
+        (ja) レコードを辞書のリストではなく、トップレベルのフィールド毎に一つの型付きの列として
+        ColumnStoreに格納するコレクションです。クエリのAPIはCollectionと同じです。
+        レコードはクエリが触れた時にのみ復元され、数値と文字列の列に対するauto_の比較は列全体で評価されます。
+        これがインデックスの代わりとなるため、インデックスは追加できません。
+        レコードの追加では列に直接追加されますが、それ以外の書き込みでは全てのレコードを復元し、
+        Collectionと同様に変更してから再度列に格納します。
+        トランザクションの間は、終了するまでレコードを辞書のまま保持します。
+        これは、主に読み込みや追加が行われる大きなコレクションに適しています。
+        """
+        super().__init__()
+        self._store: ColumnStore = ColumnStore()
+        # trueの場合、レコードは_dataに辞書として展開されており、列は空。
+        self._is_materialized: bool = False
+
+    @classmethod
+    @override
+    def from_data(cls, data: List[Dict[str, Any]], serial_num: int):
+        obj = super().from_data(data, serial_num)
+        obj._encode()
+        return obj
+
+    @classmethod
+    @override
+    def from_dict(cls, src: Dict[str, Any], is_trusted: bool = False) -> "ColumnarCollection":
+        instance = super().from_dict(src, is_trusted)
+        instance._encode()
+        return instance
+
+    @override
+    def clone(self) -> "ColumnarCollection":
+        return ColumnarCollection.from_dict(self.to_dict(), is_trusted=True)
+
+    @property
+    def column_kinds(self) -> Dict[str, str]:
+        """
+        (en) The map from the field names to the kinds of their columns,
+        which are int, float, str or obj.
+        Fields with values of mixed types are stored as obj.
+
+        (ja) フィールド名から、その列の種類(int、float、str、obj)へのマップです。
+        型が混在する値を持つフィールドはobjとして格納されます。
+        """
+        if self._is_materialized:
+            store = ColumnStore()
+            store.append(self._data)
+            return store.column_kinds()
+        return self._store.column_kinds()
+
+    def _encode(self):
+        """
+        (en) Stores the records expanded into _data in the columns.
+
+        (ja) _dataに展開されたレコードを列に格納します。
+        """
+        store = ColumnStore()
+        store.append(super()._compacted())
+        self._store = store
+        self._data = []
+        self._tombstones = 0
+        self._is_data_shared = False
+        self._is_materialized = False
+
+    def _materialize(self):
+        """
+        (en) Reconstructs all records into _data as dictionaries, so that they can be changed.
+
+        (ja) レコードを変更できるよう、全てのレコードを辞書として_dataに復元します。
+        """
+        if self._is_materialized:
+            return
+        self._data = self._store.rows()
+        self._store = ColumnStore()
+        self._is_materialized = True
+
+    def _write(self, run: Callable[[], QueryResult]) -> QueryResult:
+        """
+        (en) Runs the write of Collection on the reconstructed records,
+        and stores them in the columns again unless a transaction is in progress.
+
+        (ja) 復元したレコードに対してCollectionの書き込みを実行し、
+        トランザクション中でなければ再度列に格納します。
+
+        Parameters
+        ----------
+        run : Callable[[], QueryResult]
+            The write of Collection.
+        """
+        self._materialize()
+        try:
+            return run()
+        finally:
+            if not self._is_transaction_mode:
+                self._encode()
+
+    def _append(self, run: Callable[[], QueryResult]) -> QueryResult:
+        """
+        (en) Runs the write of Collection that only appends records to the empty _data,
+        and appends them to the columns without reconstructing the existing records.
+
+        (ja) 空の_dataにレコードを追加するだけのCollectionの書き込みを実行し、
+        既存のレコードを復元せずにそれらを列に追加します。
+
+        Parameters
+        ----------
+        run : Callable[[], QueryResult]
+            The write of Collection.
+        """
+        if self._is_materialized or self._is_transaction_mode:
+            # 取り消しの記録は_data上の位置を参照するため、トランザクション中は展開する。
+            return self._write(run)
+        try:
+            return run()
+        finally:
+            self._store.append(self._data)
+            self._data = []
+
+    @property
+    @override
+    def length(self) -> int:
+        return self._store.length + super().length
+
+    @property
+    @override
+    def raw(self) -> List[Dict[str, Any]]:
+        """
+        (en) Returns the records reconstructed from the columns.
+        Editing the returned list or records does not change the collection.
+
+        (ja) 列から復元したレコードを返します。
+        返されたリストやレコードを編集しても、コレクションは変更されません。
+        """
+        return self._compacted()
+
+    @override
+    def _compacted(self) -> List[Dict[str, Any]]:
+        if self._is_materialized:
+            return super()._compacted()
+        return self._store.rows()
+
+    @override
+    def _scan_targets(self, node: Optional[QueryNode]) -> List[Dict[str, Any]]:
+        if self._is_materialized:
+            return super()._scan_targets(node)
+        return self._store.rows(self._store.find(node))
+
+    @override
+    def explain(self, q: Query) -> Dict[str, Any]:
+        if self._is_materialized:
+            return super().explain(q)
+        node = self._plan(q.query_node)
+        positions = self._store.find(node)
+        return {
+            'target': q.target,
+            'length': self.length,
+            'scan': 'full' if positions is None else 'column',
+            'scanCount': self.length if positions is None else len(positions),
+            'plan': None if node is None else UtilQueryPlanner.explain(node, None, self.length),
+        }
+
+    @override
+    def search_one(self, q: Query) -> QueryResult:
+        if self._is_materialized:
+            return super().search_one(q)
+        r: List[Dict[str, Any]] = []
+        node = self._plan(q.query_node)
+        matches = node.compile()
+        # 最初のヒットまでのレコードのみを復元する。
+        for item in self._store.iter_rows(self._store.find(node)):
+            if matches(item):
+                r.append(item)
+                break
+        return QueryResult(True, q.target, q.type, self._to_result(r), self.length, 0, len(r))
+
+    @override
+    def get_all(self, q: Query) -> QueryResult:
+        if self._is_materialized or q.sort_obj is not None or q.cursor is not None or q.start_after is not None \
+                or q.end_before is not None or (q.limit is not None and q.limit < 0):
+            return super().get_all(q)
+        # 格納順のままの範囲指定では、返す範囲のレコードのみを復元する。
+        length = self._store.length
+        start = min(max(q.offset or 0, 0), length)
+        end = length if q.limit is None else min(start + q.limit, length)
+        r = self._store.rows(range(start, end))
+        return QueryResult(True, q.target, q.type, self._to_result(r), length, 0, length,
+                           next_cursor=self._next_cursor(q, r))
+
+    @override
+    def add_index(self, field: str, index_type: EnumIndexType = EnumIndexType.hash_,
+                  v_type: EnumValueType = EnumValueType.auto_):
+        """
+        (en) Indexes are not supported, since the columns are scanned instead.
+
+        (ja) 代わりに列が走査されるため、インデックスはサポートされません。
+
+        Raises
+        ------
+        ValueError
+            Always.
+        """
+        raise ValueError("ColumnarCollection does not support indexes")
+
+    @override
+    def _register_index(self, index: AbstractIndex):
+        # シリアルキーや引き継いだ設定のインデックスは、列の走査で代替する。
+        pass
+
+    @override
+    def change_transaction_mode(self, is_transaction_mode: bool):
+        super().change_transaction_mode(is_transaction_mode)
+        if not is_transaction_mode and self._is_materialized:
+            self._encode()
+
+    @override
+    def rollback_transaction(self):
+        if self._is_materialized:
+            super().rollback_transaction()
+            return
+        # 書き込みは必ず展開を伴うため、展開されていない場合は何も変更されていない。
+        self._generation += 1
+        self._undo_log = None
+        self._serial_num = self._undo_serial_num
+
+    @override
+    def _clear_data(self):
+        if not self._is_materialized:
+            self._store = ColumnStore()
+        super()._clear_data()
+
+    @override
+    def add_all(self, q: Query) -> QueryResult:
+        return self._append(lambda: super(ColumnarCollection, self).add_all(q))
+
+    @override
+    def update(self, q: Query, is_single_target: bool) -> QueryResult:
+        return self._write(lambda: super(ColumnarCollection, self).update(q, is_single_target))
+
+    @override
+    def delete(self, q: Query) -> QueryResult:
+        return self._write(lambda: super(ColumnarCollection, self).delete(q))
+
+    @override
+    def delete_one(self, q: Query) -> QueryResult:
+        return self._write(lambda: super(ColumnarCollection, self).delete_one(q))
+
+    @override
+    def conform_to_template(self, q: Query) -> QueryResult:
+        return self._write(lambda: super(ColumnarCollection, self).conform_to_template(q))
+
+    @override
+    def rename_field(self, q: Query) -> QueryResult:
+        return self._write(lambda: super(ColumnarCollection, self).rename_field(q))
+
+    @override
+    def clear(self, q: Query) -> QueryResult:
+        return self._append(lambda: super(ColumnarCollection, self).clear(q))
+
+    @override
+    def clear_add(self, q: Query) -> QueryResult:
+        return self._append(lambda: super(ColumnarCollection, self).clear_add(q))
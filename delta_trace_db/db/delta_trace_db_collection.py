@@ -1,15 +1,42 @@
 # coding: utf-8
 import functools
-from typing import Any, Callable, Dict, List, Set, Optional, override
+import heapq
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Set, Optional, Tuple, override
 from file_state_manager.cloneable_file import CloneableFile
+from delta_trace_db.db.index.abstract_index import AbstractIndex
+from delta_trace_db.db.index.enum_index_type import EnumIndexType
+from delta_trace_db.db.index.hash_index import HashIndex
+from delta_trace_db.db.index.sorted_index import SortedIndex
+from delta_trace_db.db.mapped_segment import MappedSegment
+from delta_trace_db.db.read_only_view import ReadOnlyDict
+from delta_trace_db.db.result_cache import ResultCache
+from delta_trace_db.db.sorted_view import SortedView
+from delta_trace_db.db.util_binary_snapshot import UtilBinarySnapshot
 from delta_trace_db.db.util_copy import UtilCopy
+from delta_trace_db.db.util_json_stream import UtilJsonStream
+from delta_trace_db.db.util_parallel_scan import UtilParallelScan
+from delta_trace_db.db.util_query_planner import UtilQueryPlanner
+from delta_trace_db.query.enum_query_type import EnumQueryType
+from delta_trace_db.query.nodes.comparison_node import FieldEquals
+from delta_trace_db.query.nodes.enum_value_type import EnumValueType
+from delta_trace_db.query.nodes.logical_node import AndNode, OrNode, NotNode
 from delta_trace_db.query.nodes.query_node import QueryNode
 from delta_trace_db.query.query import Query
 from delta_trace_db.query.query_result import QueryResult
+from delta_trace_db.query.sort.abstract_sort import AbstractSort
+from delta_trace_db.query.sort.multi_sort import MultiSort
+from delta_trace_db.query.sort.single_sort import SingleSort
+from delta_trace_db.query.util_cursor import UtilCursor
+from delta_trace_db.query.util_field import UtilField
 import logging
 
 _logger = logging.getLogger(__name__)
 
+# 更新の取り消し時に、元々存在しなかったキーを表す値。
+_MISSING = object()
+
 
 class Collection(CloneableFile):
     class_name = "Collection"
@@ -30,6 +57,32 @@ class Collection(CloneableFile):
         self.named_listeners: Dict[str, Callable[[], None]] = {}
         self._is_transaction_mode: bool = False
         self.run_notify_listeners_in_transaction: bool = False
+        # インデックス関連。インデックスが無い場合は一切管理しない。
+        self._indexes: Dict[Tuple[str, EnumIndexType], AbstractIndex] = {}
+        self._seq: Dict[int, int] = {}  # id(record) -> _data内の位置
+        # 削除済みの位置にはNoneが入り、全件走査の前などにまとめて詰められる。
+        self._tombstones: int = 0
+        self._serial_key: Optional[str] = None
+        # trueの場合、結果はコピーではなく読み取り専用のビューで返し、レコードの変更は置き換えで行う。
+        self._is_read_only_results: bool = False
+        # trueの場合、読み込みのクエリは固定したバージョンに対してロックの外で実行され、
+        # レコードの変更は置き換えで、固定中の格納リストの変更はコピーに対して行う。
+        self._is_snapshot_reads: bool = False
+        self._is_data_shared: bool = False  # 現在の格納リストが読み込み側に固定されている場合はtrue
+        # 検索の絞り込みに使うワーカープロセス数と、並列化する最小の走査件数。1の場合は並列化しない。
+        self._parallel_processes: int = 1
+        self._parallel_min_records: int = 100000
+        # ソート指定の識別文字列 -> ソート済みビュー。最近使用した順に並ぶ。格納位置のマップがある場合のみ保持する。
+        self._sorted_views: OrderedDict[str, SortedView] = OrderedDict()
+        self._max_sorted_views: int = 4
+        # collection_モードでは読み込みが並行してビューの参照や作成、破棄を行うため、それらをこのロックで保護する。
+        self._views_lock = threading.Lock()
+        # 書き込みの世代。内容を変更しうる操作の度に増え、検索結果のキャッシュの有効性の判定に使う。
+        self._generation: int = 0
+        self._result_cache: Optional[ResultCache] = None  # Noneの場合はキャッシュしない。
+        # トランザクション中のみ、変更を取り消すための操作単位の記録を保持する。
+        self._undo_log: Optional[List[Tuple[Any, ...]]] = None
+        self._undo_serial_num: int = 0
 
     @classmethod
     def from_data(cls, data: List[Dict[str, Any]], serial_num: int):
@@ -61,10 +114,16 @@ class Collection(CloneableFile):
     def change_transaction_mode(self, is_transaction_mode: bool):
         """
         (en) Called when switching to or from transaction mode.
+        While in transaction mode, each operation records only the information
+        needed to undo its changes, which is used by rollback_transaction.
+        The record is discarded when leaving transaction mode.
         This is intended to be called only from DeltaTraceDB.
         Do not normally use this.
 
         (ja) トランザクションモードへの変更時、及び解除時に呼び出します。
+        トランザクションモードの間、各操作は変更の取り消しに必要な情報のみを記録し、
+        これはrollback_transactionで使用されます。
+        記録はトランザクションモードの解除時に破棄されます。
         これはDeltaTraceDBからのみ呼び出されることを想定しています。
         通常は使用しないでください。
 
@@ -75,38 +134,261 @@ class Collection(CloneableFile):
         """
         self._is_transaction_mode = is_transaction_mode
         self.run_notify_listeners_in_transaction = False
+        if is_transaction_mode:
+            self._undo_log = []
+            self._undo_serial_num = self._serial_num
+        else:
+            self._undo_log = None
+
+    def rollback_transaction(self):
+        """
+        (en) Undoes all changes made since switching to transaction mode,
+        by replaying the recorded operations backwards.
+        The cost depends on the number of changed records, except that
+        the indexes are rebuilt if they exist.
+        This is intended to be called only from DeltaTraceDB.
+        Do not normally use this.
+
+        (ja) トランザクションモードへの変更以降の全ての変更を、
+        記録された操作を逆順に再生することで取り消します。
+        インデックスがある場合はそれらが再構築されますが、
+        それ以外のコストは変更されたレコード数に依存します。
+        これはDeltaTraceDBからのみ呼び出されることを想定しています。
+        通常は使用しないでください。
+        """
+        self._generation += 1
+        log = self._undo_log
+        if log is None:
+            return
+        # 取り消しの処理自体は記録しない。
+        self._undo_log = None
+        replaced: Dict[int, Dict[str, Any]] = {}
+        for entry in reversed(log):
+            # 連続した置き換えの取り消しは、まとめて一度の走査で行う。
+            if entry[0] != "replace" and replaced:
+                self._undo_replace(replaced)
+                replaced = {}
+            match entry[0]:
+                case "add":
+                    self._compacted()
+                    self._own_data()
+                    del self._data[len(self._data) - entry[1]:]
+                case "update":
+                    for item, old_values in reversed(entry[1]):
+                        for k, v in old_values.items():
+                            if v is _MISSING:
+                                item.pop(k, None)
+                            else:
+                                item[k] = v
+                case "replace":
+                    replaced[id(entry[1])] = entry[2]
+                case "restore":
+                    for item, snapshot in entry[1]:
+                        item.clear()
+                        item.update(snapshot)
+                case "delete":
+                    self._undo_delete(entry[1])
+                case "data":
+                    self._data = entry[1]
+                    self._tombstones = entry[2]
+                    # 戻したリストは固定中の可能性がある。
+                    self._is_data_shared = self._is_snapshot_reads
+        if replaced:
+            self._undo_replace(replaced)
+        self._serial_num = self._undo_serial_num
+        data = self._compacted()
+        self._sorted_views.clear()
+        if self._indexes:
+            self._rebuild_seq()
+            for index in self._indexes.values():
+                index.rebuild(data)
+        self._undo_log = []
+
+    def _undo_replace(self, replaced: Dict[int, Dict[str, Any]]):
+        """
+        (en) Puts the original records back in place of the records that replaced them.
+
+        (ja) 置き換え後のレコードの位置に、元のレコードを戻します。
+
+        Parameters
+        ----------
+        replaced : Dict[int, Dict[str, Any]]
+            The map from the id of the replacing record to the original record.
+            It may be chained if a record was replaced more than once.
+        """
+        self._own_data()
+        data = self._data
+        for i, item in enumerate(data):
+            if item is None:
+                continue
+            while id(item) in replaced:
+                item = replaced[id(item)]
+            data[i] = item
+
+    def _undo_delete(self, deleted: List[Tuple[int, Dict[str, Any]]]):
+        """
+        (en) Inserts the deleted records back at their original positions.
+
+        (ja) 削除されたレコードを元の位置に戻します。
+
+        Parameters
+        ----------
+        deleted : List[Tuple[int, Dict[str, Any]]]
+            The pairs of the position before the deletion, excluding the deleted positions,
+            and the record, in ascending order of the position.
+        """
+        data = self._compacted()
+        r: List[Dict[str, Any]] = []
+        src = 0
+        for position, item in deleted:
+            take = position - len(r)
+            r.extend(data[src:src + take])
+            src += take
+            r.append(item)
+        r.extend(data[src:])
+        self._data = r
+
+    def _log_delete(self, positions: List[int]):
+        """
+        (en) Records the records at the specified positions as deleted,
+        if in transaction mode. This must be called before they are deleted.
+
+        (ja) トランザクションモードの場合、指定位置のレコードを削除されたものとして記録します。
+        これは削除の前に呼び出す必要があります。
+
+        Parameters
+        ----------
+        positions : List[int]
+            The positions in the stored list.
+        """
+        if self._undo_log is None:
+            return
+        data = self._data
+        positions = sorted(positions)
+        logical = positions
+        if self._tombstones > 0:
+            # 削除済みの位置を除いた位置に変換する。
+            logical = []
+            skipped = 0
+            pre = 0
+            for i in positions:
+                skipped += data[pre:i].count(None)
+                pre = i
+                logical.append(i - skipped)
+        self._undo_log.append(("delete", [(p, data[i]) for p, i in zip(logical, positions)]))
 
     @classmethod
-    def from_dict(cls, src: Dict[str, Any]) -> "Collection":
+    def from_dict(cls, src: Dict[str, Any], is_trusted: bool = False) -> "Collection":
         """
         (en) Restore this object from the dictionary.
-        Note that src is used as is, not copied.
+        The data is validated and copied by jsonable_deep_copy,
+        unless is_trusted is true.
 
         (ja) このオブジェクトを辞書から復元します。
-        srcはコピーされずにそのまま利用されることに注意してください。
+        is_trustedがtrueでない限り、データはjsonable_deep_copyで検証及びコピーされます。
 
         Parameters
         ----------
         src : Dict[str, Any]
             A dictionary made with toDict of this class.
+        is_trusted : bool
+            If true, the data list in src is stored as is, without validation or copying.
+            Set this only if src was just decoded from a file saved by this DB
+            and is not referenced from anywhere else.
         """
         instance = cls()
-        instance._data = UtilCopy.jsonable_deep_copy(src.get("data", []))
+        if is_trusted:
+            instance._data = src.get("data", [])
+        else:
+            instance._data = UtilCopy.jsonable_deep_copy(src.get("data", []))
         instance._serial_num = src.get("serialNum", 0)
         return instance
 
+    @classmethod
+    def from_binary(cls, src: bytes) -> "Collection":
+        """
+        (en) Restore this object from the bytes made with to_binary.
+        The decoded data is stored as is, without validation or copying.
+
+        (ja) to_binaryで作成したバイト列からこのオブジェクトを復元します。
+        デコードされたデータは、検証やコピーを行わずにそのまま格納されます。
+
+        Parameters
+        ----------
+        src : bytes
+            The bytes made with to_binary of this class.
+
+        Raises
+        ------
+        ValueError
+            Throws on ValueError if the src is invalid format.
+        """
+        return cls.from_dict(UtilBinarySnapshot.loads_collection(src), is_trusted=True)
+
+    def to_binary(self) -> bytes:
+        """
+        (en) Encodes the same dictionary as to_dict in the binary format of UtilBinarySnapshot.
+        The stored data is encoded directly, without a deep copy.
+
+        (ja) to_dictと同じ辞書を、UtilBinarySnapshotのバイナリ形式でエンコードします。
+        保持しているデータはディープコピーせずに直接エンコードされます。
+        """
+        return UtilBinarySnapshot.dumps_collection(self.class_name, self.version, self._compacted(),
+                                                   self._serial_num)
+
+    def to_mapped(self, path: str, columns: Iterable[str] = ()):
+        """
+        (en) Writes the records of this collection to a file of MappedSegment,
+        which can be opened with MappedCollection.
+        The stored data is encoded directly, without a deep copy.
+
+        (ja) このコレクションのレコードを、MappedCollectionで開けるMappedSegmentのファイルに書き込みます。
+        保持しているデータはディープコピーせずに直接エンコードされます。
+
+        Parameters
+        ----------
+        path : str
+            The file path.
+        columns : Iterable[str]
+            The fields to store as column arrays, used in the same way as hash indexes.
+            Nested fields can be specified with "." like user.name.
+        """
+        MappedSegment.write(path, self._compacted(), self._serial_num, columns, self._serial_key, self.class_name,
+                            self.version)
+
+    def to_json_lines(self, name: str, is_first: bool) -> Iterator[str]:
+        """
+        (en) Returns a generator that converts this collection to the lines of UtilJsonStream
+        one record at a time, directly from the stored data without a deep copy.
+        The generator must be consumed while the lock is held.
+
+        (ja) このコレクションを、ディープコピーせずに保持しているデータから直接、
+        レコード毎にUtilJsonStreamの行へ変換するジェネレータを返します。
+        ジェネレータはロックを保持している間に消費する必要があります。
+
+        Parameters
+        ----------
+        name : str
+            The collection name.
+        is_first : bool
+            True if this is the first collection in the file.
+        """
+        return UtilJsonStream.collection_lines(name, self.class_name, self.version, self._compacted(),
+                                               self._serial_num, is_first)
+
     @override
     def to_dict(self) -> Dict[str, Any]:
         return {
             "className": self.class_name,
             "version": self.version,
-            "data": UtilCopy.jsonable_deep_copy(self._data),
+            "data": UtilCopy.validated_deep_copy(self._compacted()),
             "serialNum": self._serial_num
         }
 
     @override
     def clone(self) -> "Collection":
-        return Collection.from_dict(self.to_dict())
+        # to_dictで既にコピーされているため、再度コピーしない。
+        return Collection.from_dict(self.to_dict(), is_trusted=True)
 
     @property
     def raw(self) -> List[Dict[str, Any]]:
@@ -117,7 +399,7 @@ class Collection(CloneableFile):
         (ja) 保持している内容をリストの参照として返します。
         直接編集すると危険なため注意してください。
         """
-        return self._data
+        return self._compacted()
 
     @property
     def length(self) -> int:
@@ -126,7 +408,20 @@ class Collection(CloneableFile):
 
         (ja) コレクションのデータ数を返します。
         """
-        return len(self._data)
+        return len(self._data) - self._tombstones
+
+    @property
+    def is_compacted(self) -> bool:
+        """
+        (en) True if the stored list contains no deleted positions.
+        Read-only queries on a compacted collection do not change its internal state,
+        so they can be run concurrently.
+
+        (ja) 格納リストに削除済みの位置が含まれない場合はtrueです。
+        詰め直し済みのコレクションに対する読み込みのみのクエリは内部状態を変更しないため、
+        同時に実行できます。
+        """
+        return self._tombstones == 0
 
     def add_listener(self, cb: Callable[[], None], name: Optional[str] = None):
         """
@@ -209,25 +504,1091 @@ class Collection(CloneableFile):
         else:
             self.run_notify_listeners_in_transaction = True
 
-    def _evaluate(self, item: Dict[str, Any], node: QueryNode) -> bool:
+    def add_index(self, field: str, index_type: EnumIndexType = EnumIndexType.hash_,
+                  v_type: EnumValueType = EnumValueType.auto_):
+        """
+        (en) Sets an index on the specified field of this collection.
+        Once set, the index is maintained automatically by each query,
+        and search-type queries use it to narrow down the target records.
+        If an index of the same type already exists for the field,
+        it will be rebuilt.
+        Like listeners, indexes are not serialized.
+        You must re-register them each time after deserialization.
+        Do not edit the contents of raw directly while indexes are set.
+
+        (ja) このコレクションの指定フィールドにインデックスを設定します。
+        設定後は各クエリによって自動的に維持され、
+        検索系のクエリでは対象レコードの絞り込みに利用されます。
+        同じフィールドに同じ種類のインデックスが既にある場合は再構築されます。
+        リスナーと同様にインデックスはシリアライズされないため、
+        デシリアライズ後は毎回再登録する必要があります。
+        インデックスの設定中は、rawの内容を直接編集しないでください。
+
+        Parameters
+        ----------
+        field : str
+            The target variable name. Nested fields can be specified with "." like user.name.
+        index_type : EnumIndexType
+            The type of the index.
+            hash_ is used for FieldEquals (auto_ only) and FieldIn.
+            sorted_ is used for FieldGreaterThan, FieldLessThan, FieldGreaterThanOrEqual
+            and FieldLessThanOrEqual with the same v_type,
+            and for SingleSort with the same v_type (auto_ or string_ only).
+        v_type : EnumValueType
+            Only valid for sorted_. The comparison type of the index.
+            auto_, datetime_, int_, floatStrict_ and string_ are supported.
+
+        Raises
+        ------
+        ValueError
+            If an unsupported index type or v_type is specified.
         """
-        (en) The evaluation function for the query.
+        match index_type:
+            case EnumIndexType.hash_:
+                index = HashIndex(field)
+            case EnumIndexType.sorted_:
+                index = SortedIndex(field, v_type=v_type)
+            case _:
+                raise ValueError("Unsupported index type")
+        self._register_index(index)
+
+    def remove_index(self, field: str, index_type: Optional[EnumIndexType] = None):
+        """
+        (en) Removes the index set on the specified field.
+        If the index does not exist, this does nothing.
 
-        (ja) クエリの評価関数。
+        (ja) 指定フィールドに設定されたインデックスを削除します。
+        インデックスが存在しない場合は何もしません。
+
+        Parameters
+        ----------
+        field : str
+            The target variable name.
+        index_type : Optional[EnumIndexType]
+            The type of the index. If None, all indexes of the field are removed.
+        """
+        for key in [k for k in self._indexes.keys() if k[0] == field]:
+            if index_type is None or key[1] == index_type:
+                del self._indexes[key]
+                if key == (self._serial_key, EnumIndexType.hash_):
+                    self._serial_key = None
+        if not self._indexes:
+            self._seq.clear()
+            self._sorted_views.clear()
+
+    @property
+    def indexes(self) -> List[AbstractIndex]:
+        """
+        (en) Returns the list of indexes set on this collection.
+        Be careful as it is dangerous to edit them directly.
+
+        (ja) このコレクションに設定されているインデックスの一覧を返します。
+        直接編集すると危険なため注意してください。
+        """
+        return list(self._indexes.values())
+
+    def inherit_settings(self, other: "Collection"):
+        """
+        (en) Applies the same indexes and result mode as the specified collection
+        to this collection, and builds the indexes from the current contents.
+        This is intended to be called only from DeltaTraceDB.
+
+        (ja) 指定したコレクションと同じインデックスと結果のモードをこのコレクションに適用し、
+        現在の内容からインデックスを構築します。
+        これはDeltaTraceDBからのみ呼び出されることを想定しています。
+
+        Parameters
+        ----------
+        other : Collection
+            The collection from which the settings are copied.
+        """
+        for index in other.indexes:
+            self._register_index(index.new_instance())
+        self._serial_key = other.get_serial_key()
+        self._is_read_only_results = other.is_read_only_results
+        self._is_snapshot_reads = other.is_snapshot_reads
+        self._parallel_processes = other.parallel_scan_processes
+        self._parallel_min_records = other._parallel_min_records
+        self._max_sorted_views = other.max_sorted_views
+        if other._result_cache is not None:
+            self.set_result_cache(other._result_cache.max_entries, other._result_cache.max_bytes)
+
+    def set_read_only_results(self, is_read_only: bool):
+        """
+        (en) Sets whether the query results of this collection are returned as
+        read-only views instead of deep copies.
+        When enabled, the records in the results are ReadOnlyDict that refer to
+        the stored records without copying, and the DB replaces a record
+        instead of changing it when updating, so the returned views are
+        never changed afterwards.
+        This is useful for read-heavy use, but the results cannot be edited directly.
+        Like listeners, this setting is not serialized.
+
+        (ja) このコレクションのクエリ結果を、ディープコピーの代わりに
+        読み取り専用のビューで返すかどうかを設定します。
+        有効な場合、結果のレコードは保持しているレコードをコピーせずに参照するReadOnlyDictになり、
+        DBは更新時にレコードを変更せずに置き換えるため、返されたビューが後から変化することはありません。
+        読み込みの多い用途で有用ですが、結果を直接編集することはできません。
+        リスナーと同様に、この設定はシリアライズされません。
+
+        Parameters
+        ----------
+        is_read_only : bool
+            If true, the results are returned as read-only views.
+        """
+        self._is_read_only_results = is_read_only
+
+    @property
+    def is_read_only_results(self) -> bool:
+        """
+        (en) True if the query results are returned as read-only views.
+
+        (ja) クエリ結果が読み取り専用のビューで返される場合はtrueです。
+        """
+        return self._is_read_only_results
+
+    def set_snapshot_reads(self, is_snapshot_reads: bool):
+        """
+        (en) Sets whether read-only queries (search, searchOne, getAll and count)
+        and to_dict run against a pinned version of this collection.
+        When enabled, the DB only pins the current version while holding the lock,
+        and filters, sorts, pages and copies the records after releasing it,
+        so long reads do not block writers.
+        To keep pinned versions unchanged, writers replace records instead of changing them,
+        and copy the stored list before changing it if it is pinned.
+        A pinned version is freed when the last reader drops it.
+        Sorting by sorted indexes is not used for the pinned version.
+        Like listeners, this setting is not serialized.
+        Do not disable this while queries are running.
+
+        (ja) 読み込みのみのクエリ(search、searchOne、getAll、count)及びto_dictを、
+        このコレクションの固定したバージョンに対して実行するかどうかを設定します。
+        有効な場合、DBはロックの保持中に現在のバージョンを固定するだけで、
+        レコードの絞り込み、ソート、ページング、コピーはロックの解放後に行うため、
+        長い読み込みが書き込みを妨げません。
+        固定したバージョンを変化させないよう、書き込み時はレコードを変更せずに置き換え、
+        格納リストが固定中の場合は変更前にコピーします。
+        固定したバージョンは、最後の読み込み側が手放した時点で解放されます。
+        固定したバージョンに対しては、ソート済みインデックスによるソートは使用されません。
+        リスナーと同様に、この設定はシリアライズされません。
+        クエリの実行中にこれを無効にしないでください。
+
+        Parameters
+        ----------
+        is_snapshot_reads : bool
+            If true, reads run against a pinned version.
+        """
+        self._is_snapshot_reads = is_snapshot_reads
+
+    @property
+    def is_snapshot_reads(self) -> bool:
+        """
+        (en) True if read-only queries run against a pinned version of this collection.
+
+        (ja) 読み込みのみのクエリが、このコレクションの固定したバージョンに対して実行される場合はtrueです。
+        """
+        return self._is_snapshot_reads
+
+    def set_max_sorted_views(self, count: int):
+        """
+        (en) Sets the maximum number of sorted views kept by this collection.
+        A sorted view is a list of all records in the order of a SingleSort or MultiSort,
+        created by getAll with that sort and kept up to date on each write,
+        so that later getAll calls with the same sort only slice it.
+        Search queries with many hits also use an existing view.
+        Views are kept only while the collection has indexes, including the serial key map,
+        and the least recently used view is discarded when the limit is exceeded.
+        Each view holds references to all records, so set 0 to disable them if memory is tight.
+        Like listeners, this setting is not serialized.
+
+        (ja) このコレクションが保持するソート済みビューの最大数を設定します。
+        ソート済みビューは全レコードをSingleSortまたはMultiSortの順に並べたリストで、
+        そのソートを指定したgetAllで作成され、書き込みの度に更新されるため、
+        同じソートを指定した以降のgetAllはそれを切り出すだけになります。
+        ヒット数の多いsearchクエリも、既存のビューを利用します。
+        ビューはシリアルキーのマップを含むインデックスをコレクションが持つ間のみ保持され、
+        上限を超えた場合は最も長く使われていないビューが破棄されます。
+        各ビューは全レコードへの参照を保持するため、メモリが厳しい場合は0を設定して無効にしてください。
+        リスナーと同様に、この設定はシリアライズされません。
+
+        Parameters
+        ----------
+        count : int
+            The maximum number of sorted views. 0 disables them.
+        """
+        with self._views_lock:
+            self._max_sorted_views = max(0, count)
+            while len(self._sorted_views) > self._max_sorted_views:
+                self._sorted_views.popitem(last=False)
+
+    @property
+    def max_sorted_views(self) -> int:
+        """
+        (en) The maximum number of sorted views kept by this collection.
+
+        (ja) このコレクションが保持するソート済みビューの最大数です。
+        """
+        return self._max_sorted_views
+
+    def set_result_cache(self, max_entries: int, max_bytes: int = 64 * 1024 * 1024):
+        """
+        (en) Sets the cache of the results of search and getAll queries on this collection.
+        Queries with the same canonical key (Query.canonical_key), which ignores the cause
+        and the order of the children of AndNode and OrNode, return the cached result
+        without filtering or sorting, while the returned records are still copies or read-only views.
+        Every operation that may change the contents increases the write generation of this collection,
+        and the cached results of older generations are discarded.
+        The least recently used results are discarded when either limit is exceeded.
+        The size is estimated from the list and the records themselves, without their nested values.
+        Changing the records directly via raw is not detected, so do not use the cache in that case.
+        Like listeners, this setting is not serialized.
+
+        (ja) このコレクションに対するsearch及びgetAllクエリの結果のキャッシュを設定します。
+        causeやAndNode、OrNodeの子の順序を無視した正規化したキー(Query.canonical_key)が同じクエリは、
+        絞り込みやソートを行わずにキャッシュした結果を返しますが、
+        返されるレコードは引き続きコピーまたは読み取り専用のビューです。
+        内容を変更しうる全ての操作でこのコレクションの書き込みの世代が増え、
+        古い世代のキャッシュした結果は破棄されます。
+        いずれかの上限を超えた場合は、最も長く使われていない結果から破棄されます。
+        サイズはリストとレコード自体から推定され、ネストした値は含みません。
+        rawを介してレコードを直接変更した場合は検出されないため、その場合はキャッシュを使わないでください。
+        リスナーと同様に、この設定はシリアライズされません。
+
+        Parameters
+        ----------
+        max_entries : int
+            The maximum number of cached results. 0 disables the cache.
+        max_bytes : int
+            The maximum total estimated size of the cached results in bytes.
+        """
+        if max_entries <= 0 or max_bytes <= 0:
+            self._result_cache = None
+        else:
+            self._result_cache = ResultCache(max_entries, max_bytes)
+
+    @property
+    def result_cache_stats(self) -> Optional[Dict[str, int]]:
+        """
+        (en) The number of hits, misses and entries, and the total estimated size in bytes
+        of the result cache, or None if the cache is disabled.
+
+        (ja) 結果のキャッシュのヒット数、ミス数、エントリ数、及びバイト単位の推定サイズの合計です。
+        キャッシュが無効な場合はNoneです。
+        """
+        return self._result_cache.stats() if self._result_cache is not None else None
+
+    def _result_cache_key(self, q: Query) -> Optional[str]:
+        """
+        (en) Returns the key of the query in the result cache,
+        or None if the cache is disabled or the query cannot be cached.
+        This is the canonical key cached in the query,
+        which is discarded when an attribute of the query or its nodes is set.
+
+        (ja) 結果のキャッシュにおけるクエリのキーを返します。
+        キャッシュが無効な場合や、クエリをキャッシュできない場合はNoneを返します。
+        これはクエリにキャッシュされた正規化したキーで、クエリやそのノードの属性の設定で破棄されます。
+
+        Parameters
+        ----------
+        q: Query
+            The search or getAll query.
+        """
+        if self._result_cache is None:
+            return None
+        try:
+            return q.canonical_key()
+        except (TypeError, ValueError):
+            return None
+
+    def _cached_result(self, q: Query, key: Optional[str]) -> Optional[QueryResult]:
+        """
+        (en) Returns the result of the query from the result cache, or None if it is not cached.
+
+        (ja) 結果のキャッシュからクエリの結果を返します。キャッシュされていない場合はNoneを返します。
+
+        Parameters
+        ----------
+        q: Query
+            The search or getAll query.
+        key: Optional[str]
+            The key returned by _result_cache_key.
+        """
+        if key is None:
+            return None
+        entry = self._result_cache.get(key, self._generation)
+        if entry is None:
+            return None
+        records, hit_count, next_cursor, _ = entry
+        return QueryResult(True, q.target, q.type, self._to_result(records), self.length, 0, hit_count,
+                           next_cursor=next_cursor)
+
+    def _cache_result(self, key: str, r: List[Dict[str, Any]], hit_count: int, next_cursor: Optional[str]):
+        """
+        (en) Stores the result of the query in the result cache.
+        If the result is the storage list itself or a sorted view, which later writes change in place,
+        a copy of the list is stored instead, so that a pinned cache hit is not affected by the writes.
+
+        (ja) クエリの結果を結果のキャッシュに格納します。
+        結果が以降の書き込みでその場で変更される格納リスト自体やソート済みビューの場合は、
+        固定されたキャッシュのヒットが書き込みの影響を受けないよう、代わりにリストのコピーを格納します。
+
+        Parameters
+        ----------
+        key: str
+            The key returned by _result_cache_key.
+        r: List[Dict[str, Any]]
+            The records of the result.
+        hit_count: int
+            The number of hits before paging.
+        next_cursor: Optional[str]
+            The cursor for the next page.
+        """
+        is_live = r is self._data
+        if not is_live and self._sorted_views:
+            with self._views_lock:
+                is_live = any(r is view.items for view in self._sorted_views.values())
+        self._result_cache.put(key, self._generation, list(r) if is_live else r, hit_count, next_cursor)
+
+    def _update_views(self, apply: Callable[[SortedView], bool]):
+        """
+        (en) Applies the change to all sorted views, and discards the views that failed to follow it.
+
+        (ja) 全てのソート済みビューに変更を適用し、追従できなかったビューを破棄します。
+
+        Parameters
+        ----------
+        apply : Callable[[SortedView], bool]
+            The function that applies the change to the view.
+        """
+        for signature, view in list(self._sorted_views.items()):
+            if not apply(view):
+                del self._sorted_views[signature]
+
+    def _sort_by_view(self, sort_obj: Optional[AbstractSort],
+                      pre_r: List[Dict[str, Any]]) -> Optional[List[Dict[str, Any]]]:
+        """
+        (en) Returns the records in the order of the sorted view without sorting them.
+        A view is created if all records are targeted and no view exists yet.
+        Returns None if no view can be used.
+        The returned list may be the view itself, so it must not be changed.
+        Since this is called by concurrent readers, the views are looked up and replaced under a lock.
+
+        (ja) ソートを行わずに、ソート済みビューの順序でレコードを並べて返します。
+        全レコードが対象で、まだビューが無い場合はビューを作成します。
+        ビューが利用できない場合はNoneを返します。
+        返されるリストはビュー自体の場合があるため、変更してはいけません。
+        これは並行する読み込みから呼ばれるため、ビューの参照や入れ替えはロック内で行います。
+
+        Parameters
+        ----------
+        sort_obj : Optional[AbstractSort]
+            The sort object.
+        pre_r : List[Dict[str, Any]]
+            Pre result. All of them must be records in this collection.
+        """
+        if sort_obj is None or not self._indexes or self._max_sorted_views == 0:
+            return None
+        signature = SortedView.signature(sort_obj)
+        if signature is None:
+            return None
+        is_all = pre_r is self._data and self._tombstones == 0
+        with self._views_lock:
+            view = self._sorted_views.get(signature)
+            if view is not None:
+                self._sorted_views.move_to_end(signature)
+        if view is None:
+            if not is_all or len(pre_r) < 2:
+                return None
+            # ソートは時間がかかるため、ロックの外で行う。
+            view = SortedView.build(sort_obj, pre_r)
+            if view is None:
+                return None
+            with self._views_lock:
+                if self._max_sorted_views == 0:
+                    return None
+                # 他の読み込みが先に作成していた場合はそれを使う。
+                view = self._sorted_views.setdefault(signature, view)
+                self._sorted_views.move_to_end(signature)
+                while len(self._sorted_views) > self._max_sorted_views:
+                    self._sorted_views.popitem(last=False)
+        if is_all:
+            return view.items
+        # 結果が少ない場合は、ビュー全体を走査するより直接ソートした方が速い。
+        if len(pre_r) * 4 < len(view.items):
+            return None
+        targets = {id(item) for item in pre_r}
+        return [item for item in view.items if id(item) in targets]
+
+    def set_parallel_scan(self, processes: int, min_records: int = 100000):
+        """
+        (en) Sets the number of worker processes used to filter the records of search queries.
+        When processes is 2 or more and the number of records to scan is at least min_records,
+        the records are split into partitions and the query node is evaluated
+        in forked worker processes, and the hits are merged in the stored order,
+        so the results are the same as a serial scan.
+        Since forking has a fixed cost, this is only worthwhile for large collections
+        and expensive conditions. On platforms that cannot fork, the scan is always serial.
+        Since forking a multi-threaded process can deadlock, the scan is also serial
+        while other threads are running, and if a worker process fails, the records are scanned serially.
+        Like listeners, this setting is not serialized.
+
+        (ja) searchクエリのレコードの絞り込みに使用するワーカープロセス数を設定します。
+        processesが2以上で、走査するレコード数がmin_records以上の場合、
+        レコードは区間に分割されてフォークしたワーカープロセスでクエリノードが評価され、
+        ヒットは格納順にマージされるため、結果は逐次の走査と同じになります。
+        フォークには固定のコストがかかるため、大きなコレクションや重い条件でのみ有効です。
+        フォークできないプラットフォームでは、常に逐次に走査されます。
+        複数のスレッドが動作するプロセスのフォークはデッドロックする恐れがあるため、
+        他のスレッドが動作している間も逐次に走査され、ワーカープロセスが失敗した場合も逐次に走査されます。
+        リスナーと同様に、この設定はシリアライズされません。
+
+        Parameters
+        ----------
+        processes : int
+            The number of worker processes. 1 disables the parallel scan.
+        min_records : int
+            The minimum number of records to scan in parallel.
+        """
+        self._parallel_processes = max(1, processes)
+        self._parallel_min_records = min_records
+
+    @property
+    def parallel_scan_processes(self) -> int:
+        """
+        (en) The number of worker processes used to filter the records of search queries.
+
+        (ja) searchクエリのレコードの絞り込みに使用するワーカープロセス数です。
+        """
+        return self._parallel_processes
+
+    def _filter(self, node: QueryNode, targets: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        (en) Returns the records matching the node in the order of the targets,
+        evaluating them in worker processes if the parallel scan is enabled.
+
+        (ja) ノードにマッチするレコードを対象の順序で返します。
+        並列走査が有効な場合は、ワーカープロセスで評価します。
 
         Parameters
         ----------
-        item : Dict[str, Any]
-            Items (objects) to compare.
         node : QueryNode
-            The node of the query to use for the comparison.
+            The node of the query.
+        targets : List[Dict[str, Any]]
+            The records to scan.
+        """
+        if self._parallel_processes > 1 and len(targets) >= self._parallel_min_records:
+            positions = UtilParallelScan.find_positions(targets, node, self._parallel_processes)
+            if positions is not None:
+                return [targets[i] for i in positions]
+        matches = node.compile()
+        r: List[Dict[str, Any]] = []
+        for item in targets:
+            if matches(item):
+                r.append(item)
+        return r
+
+    @property
+    def _is_copy_on_write(self) -> bool:
+        """
+        (en) True if records are replaced instead of being changed in place.
+
+        (ja) レコードをその場で変更せずに置き換える場合はtrueです。
+        """
+        return self._is_read_only_results or self._is_snapshot_reads
+
+    def _own_data(self):
+        """
+        (en) If the stored list is pinned by snapshots, replaces it with its copy
+        so that it can be changed in place.
+        The pinned list is left unchanged.
+
+        (ja) 格納リストがスナップショットに固定されている場合、その場で変更できるよう、
+        コピーで置き換えます。固定されたリストは変更されずに残ります。
+        """
+        if self._is_data_shared:
+            self._data = list(self._data)
+            self._is_data_shared = False
+
+    def snapshot_query(self, q: Query) -> Callable[[], QueryResult]:
+        """
+        (en) Pins the current version of the records targeted by the read-only query
+        (search, searchOne, getAll or count),
+        and returns a function that executes the query against it.
+        Queries with a cursor are not supported, since they refer to the stored positions.
+        The returned function does not need the lock,
+        since later writes never change the pinned version.
+        This is only available when snapshot reads are enabled,
+        and is intended to be called only from DeltaTraceDB.
+
+        (ja) 読み込みのみのクエリ(search、searchOne、getAll、count)の対象レコードの
+        現在のバージョンを固定し、それに対してクエリを実行する関数を返します。
+        カーソルを指定したクエリは、格納位置を参照するため対象外です。
+        後の書き込みによって固定したバージョンが変化することは無いため、
+        返される関数はロックを必要としません。
+        これはスナップショット読み込みが有効な場合にのみ利用でき、
+        DeltaTraceDBからのみ呼び出されることを想定しています。
+
+        Parameters
+        ----------
+        q: Query
+            The query.
+
+        Raises
+        ------
+        ValueError
+            If snapshot reads are disabled or the query type is not read-only.
+        """
+        if not self._is_snapshot_reads:
+            raise ValueError("Snapshot reads are disabled")
+        if q.cursor is not None:
+            raise ValueError("Queries with a cursor are not supported for snapshot reads")
+        length = self.length
+        if q.type == EnumQueryType.count:
+            return lambda: QueryResult(True, q.target, q.type, [], length, 0, length)
+        cache = self._result_cache
+        generation = self._generation
+        key = self._result_cache_key(q) if q.type != EnumQueryType.searchOne else None
+        entry = cache.get(key, generation) if key is not None else None
+        if entry is not None:
+            # 書き込みはレコードを置き換えるため、キャッシュしたレコードはロックの外でも変化しない。
+            records, hit_count, next_cursor, _ = entry
+            return lambda: QueryResult(True, q.target, q.type, self._to_result(records), length, 0, hit_count,
+                                       next_cursor=next_cursor)
+        node: Optional[QueryNode] = None
+        if q.type == EnumQueryType.getAll:
+            targets = self._compacted()
+        elif q.type in (EnumQueryType.search, EnumQueryType.searchOne):
+            node = self._plan(q.query_node)
+            targets = self._scan_targets(node)
+        else:
+            raise ValueError("Unsupported query type for snapshot reads")
+        if targets is self._data:
+            self._is_data_shared = True
+        is_single_target = q.type == EnumQueryType.searchOne
+
+        def run() -> QueryResult:
+            r = targets
+            if node is not None and is_single_target:
+                matches = node.compile()
+                r = []
+                for item in targets:
+                    if matches(item):
+                        r.append(item)
+                        break
+            elif node is not None:
+                r = self._filter(node, targets)
+            hit_count = len(r)
+            if is_single_target:
+                return QueryResult(True, q.target, q.type, self._to_result(r), length, 0, hit_count)
+            r = self._sort_paging_limit(q=q, pre_r=r, use_index=False)
+            next_cursor = self._next_cursor(q, r)
+            if key is not None:
+                # 固定した時点の世代で格納するため、その後に書き込みがあった場合は破棄される。
+                cache.put(key, generation, r, hit_count, next_cursor)
+            return QueryResult(True, q.target, q.type, self._to_result(r), length, 0, hit_count,
+                               next_cursor=next_cursor)
+
+        return run
+
+    def snapshot_to_dict(self) -> Callable[[], Dict[str, Any]]:
+        """
+        (en) Pins the current version of this collection,
+        and returns a function that makes the same dictionary as to_dict from it.
+        The returned function does not need the lock.
+        This is only available when snapshot reads are enabled.
+
+        (ja) このコレクションの現在のバージョンを固定し、
+        そこからto_dictと同じ辞書を作る関数を返します。
+        返される関数はロックを必要としません。
+        これはスナップショット読み込みが有効な場合にのみ利用できます。
+
+        Raises
+        ------
+        ValueError
+            If snapshot reads are disabled.
+        """
+        if not self._is_snapshot_reads:
+            raise ValueError("Snapshot reads are disabled")
+        data = self._compacted()
+        self._is_data_shared = True
+        serial_num = self._serial_num
+        return lambda: {
+            "className": self.class_name,
+            "version": self.version,
+            "data": UtilCopy.validated_deep_copy(data),
+            "serialNum": serial_num
+        }
+
+    def snapshot_to_binary(self) -> Callable[[], bytes]:
+        """
+        (en) Pins the current version of this collection,
+        and returns a function that makes the same bytes as to_binary from it.
+        The returned function does not need the lock.
+        This is only available when snapshot reads are enabled.
+
+        (ja) このコレクションの現在のバージョンを固定し、
+        そこからto_binaryと同じバイト列を作る関数を返します。
+        返される関数はロックを必要としません。
+        これはスナップショット読み込みが有効な場合にのみ利用できます。
+
+        Raises
+        ------
+        ValueError
+            If snapshot reads are disabled.
+        """
+        if not self._is_snapshot_reads:
+            raise ValueError("Snapshot reads are disabled")
+        data = self._compacted()
+        self._is_data_shared = True
+        serial_num = self._serial_num
+        return lambda: UtilBinarySnapshot.dumps_collection(self.class_name, self.version, data, serial_num)
+
+    def snapshot_to_json_lines(self, name: str, is_first: bool) -> Iterator[str]:
+        """
+        (en) Pins the current version of this collection,
+        and returns a generator that makes the same lines as to_json_lines from it.
+        The returned generator does not need the lock.
+        This is only available when snapshot reads are enabled.
+
+        (ja) このコレクションの現在のバージョンを固定し、
+        そこからto_json_linesと同じ行を作るジェネレータを返します。
+        返されるジェネレータはロックを必要としません。
+        これはスナップショット読み込みが有効な場合にのみ利用できます。
+
+        Parameters
+        ----------
+        name : str
+            The collection name.
+        is_first : bool
+            True if this is the first collection in the file.
+
+        Raises
+        ------
+        ValueError
+            If snapshot reads are disabled.
+        """
+        if not self._is_snapshot_reads:
+            raise ValueError("Snapshot reads are disabled")
+        data = self._compacted()
+        self._is_data_shared = True
+        return UtilJsonStream.collection_lines(name, self.class_name, self.version, data, self._serial_num,
+                                               is_first)
+
+    def _to_result(self, items: List[Dict[str, Any]]) -> List[Any]:
+        """
+        (en) Converts the records to the form returned in the query result.
+
+        (ja) レコードを、クエリ結果として返す形式に変換します。
+
+        Parameters
+        ----------
+        items : List[Dict[str, Any]]
+            The target records.
+        """
+        if self._is_read_only_results:
+            return [ReadOnlyDict(item) for item in items]
+        return UtilCopy.validated_deep_copy(items)
+
+    def _detach(self, item: Dict[str, Any], position: int) -> Dict[str, Any]:
+        """
+        (en) Replaces the record at the specified position with its shallow copy,
+        so that it can be changed without affecting the views already returned.
+
+        (ja) 指定位置のレコードをその浅いコピーで置き換え、
+        既に返されたビューに影響を与えずに変更できるようにします。
+
+        Parameters
+        ----------
+        item : Dict[str, Any]
+            The target record.
+        position : int
+            The position of the record in the stored list.
 
         Returns
         -------
-        result : bool
-            If true, the query matches the item.
+        new_item : Dict[str, Any]
+            The record that replaced the original one.
+        """
+        new_item = dict(item)
+        self._own_data()
+        self._data[position] = new_item
+        if self._undo_log is not None:
+            self._undo_log.append(("replace", new_item, item))
+        if self._indexes:
+            self._update_views(lambda view: view.replace(item, new_item, self._seq))
+            del self._seq[id(item)]
+            self._seq[id(new_item)] = position
+            for index in self._indexes.values():
+                index.remove(item)
+                index.add(new_item)
+        return new_item
+
+    def _prepare_change_all(self):
+        """
+        (en) Prepares all records to be changed in place.
+        The deleted positions are removed from the stored list.
+        When read-only results are enabled, all records are replaced with their shallow copies.
+        In transaction mode, the information needed to undo the changes is also recorded.
+
+        (ja) 全てのレコードをその場で変更するための準備をします。
+        格納リストからは削除済みの位置が取り除かれます。
+        読み取り専用の結果が有効な場合は、全てのレコードをその浅いコピーで置き換えます。
+        トランザクションモードの場合は、変更の取り消しに必要な情報も記録します。
+        """
+        data = self._compacted()
+        if not self._is_copy_on_write:
+            if self._undo_log is not None:
+                self._undo_log.append(("restore", [(item, dict(item)) for item in data]))
+            return
+        if self._undo_log is not None:
+            self._undo_log.append(("data", data, 0))
+        self._data = [dict(item) for item in data]
+        self._is_data_shared = False
+        self._sorted_views.clear()
+        if self._indexes:
+            self._rebuild_seq()
+            for index in self._indexes.values():
+                index.rebuild(self._data)
+
+    def _register_index(self, index: AbstractIndex):
+        """
+        (en) Registers the index and builds it from the current contents.
+
+        (ja) インデックスを登録し、現在の内容から構築します。
+
+        Parameters
+        ----------
+        index : AbstractIndex
+            The target index.
+        """
+        data = self._compacted()
+        if not self._indexes:
+            self._rebuild_seq()
+        index.rebuild(data)
+        self._indexes[(index.field, index.index_type)] = index
+
+    def _rebuild_seq(self):
+        """
+        (en) Reassigns the sequence numbers that represent the order of the records.
+
+        (ja) レコードの格納位置を振り直します。
+        """
+        self._seq = {id(item): i for i, item in enumerate(self._data) if item is not None}
+
+    def _index_add(self, items: List[Dict[str, Any]]):
+        """
+        (en) Registers the records added to the end of the collection to the indexes.
+
+        (ja) コレクションの末尾に追加されたレコードをインデックスに登録します。
+
+        Parameters
+        ----------
+        items : List[Dict[str, Any]]
+            The added records. They must be at the end of the collection in this order.
+        """
+        if not self._indexes:
+            return
+        end = len(self._data)
+        self._seq.update(zip(map(id, items), range(end - len(items), end)))
+        for index in self._indexes.values():
+            index.add_all(items)
+        if self._sorted_views:
+            self._update_views(lambda view: view.add_all(items, self._seq))
+
+    def _index_remove(self, items: Iterable[Dict[str, Any]]):
+        """
+        (en) Removes the deleted records from the indexes.
+
+        (ja) 削除されたレコードをインデックスから取り除きます。
+
+        Parameters
+        ----------
+        items : Iterable[Dict[str, Any]]
+            The deleted records.
+        """
+        if not self._indexes:
+            return
+        if self._sorted_views:
+            items = list(items)
+            # 格納位置を参照するため、マップから取り除く前に更新する。
+            self._update_views(lambda view: view.remove_all(items, self._seq))
+        indexes = self._indexes.values()
+        for item in items:
+            self._seq.pop(id(item), None)
+            for index in indexes:
+                index.remove(item)
+
+    def _index_update(self, items: Iterable[Dict[str, Any]], keys: Iterable[str]):
+        """
+        (en) Re-indexes the records whose top-level keys have been changed.
+
+        (ja) トップレベルのキーが変更されたレコードのインデックスを更新します。
+
+        Parameters
+        ----------
+        items : Iterable[Dict[str, Any]]
+            The changed records.
+        keys : Iterable[str]
+            The changed top-level keys.
+        """
+        if not self._indexes:
+            return
+        keys = set(keys)
+        if self._sorted_views:
+            items = list(items)
+            self._update_views(lambda view: not view.is_affected_by(keys) or view.update(items, self._seq))
+        targets = [i for i in self._indexes.values() if i.is_affected_by(keys)]
+        if not targets:
+            return
+        for item in items:
+            for index in targets:
+                index.update(item)
+
+    def _index_clear(self):
+        """
+        (en) Clears the contents of all indexes.
+
+        (ja) 全てのインデックスの内容を破棄します。
+        """
+        if not self._indexes:
+            return
+        self._seq.clear()
+        self._sorted_views.clear()
+        for index in self._indexes.values():
+            index.clear()
+
+    def _find_by_index(self, node: QueryNode) -> Optional[Dict[int, Dict[str, Any]]]:
+        """
+        (en) Returns the candidate records narrowed down by the indexes,
+        or None if no index can be used.
+
+        (ja) インデックスで絞り込んだ候補レコードを返します。
+        利用可能なインデックスが無い場合はNoneを返します。
+
+        Parameters
+        ----------
+        node : QueryNode
+            The node of the query.
+        """
+        if isinstance(node, AndNode):
+            # 候補が少ない順に共通部分を取る。インデックスが使えない条件は評価時に確認される。
+            found = [r for r in (self._find_by_index(c) for c in node.conditions) if r is not None]
+            if not found:
+                return None
+            found.sort(key=len)
+            best = found[0]
+            if len(found) > 1 and best:
+                others = found[1:]
+                best = {k: v for k, v in best.items() if all(k in o for o in others)}
+            return best
+        if isinstance(node, OrNode):
+            # 全ての条件でインデックスが使える場合のみ和集合を取る。
+            merged: Dict[int, Dict[str, Any]] = {}
+            for c in node.conditions:
+                r = self._find_by_index(c)
+                if r is None:
+                    return None
+                merged.update(r)
+            return merged
+        for index in self._indexes.values():
+            r = index.find(node)
+            if r is not None:
+                return r
+        return None
+
+    def _scan_targets(self, node: Optional[QueryNode]) -> List[Dict[str, Any]]:
+        """
+        (en) Returns the records that need to be evaluated for the node,
+        in the order in which they are stored in the collection.
+        If an index can be used, only the candidate records are returned.
+
+        (ja) ノードに対して評価が必要なレコードを、コレクション内の格納順で返します。
+        インデックスが利用できる場合は候補レコードのみを返します。
+
+        Parameters
+        ----------
+        node : Optional[QueryNode]
+            The node of the query.
+        """
+        candidates = self._index_candidates(node)
+        if candidates is None:
+            return self._compacted()
+        seq = self._seq
+        return sorted(candidates.values(), key=lambda item: seq[id(item)])
+
+    def _index_candidates(self, node: Optional[QueryNode]) -> Optional[Dict[int, Dict[str, Any]]]:
+        """
+        (en) Returns the candidate records if the scan is narrowed down by the indexes,
+        or None if all records should be scanned.
+
+        (ja) インデックスで走査対象を絞り込む場合は候補レコードを返し、
+        全件を走査すべき場合はNoneを返します。
+
+        Parameters
+        ----------
+        node : Optional[QueryNode]
+            The node of the query.
+        """
+        if not self._indexes or node is None:
+            return None
+        candidates = self._find_by_index(node)
+        # 候補が半数を超える場合は、並べ替えずに全件を評価した方が速い。
+        if candidates is None or len(candidates) * 2 > self.length:
+            return None
+        return candidates
+
+    def _estimate_count(self, node: QueryNode) -> Optional[int]:
+        """
+        (en) Returns the smallest number of candidate records estimated by the indexes,
+        or None if no index can be used.
+
+        (ja) インデックスで見積もった候補レコードの最小件数を返します。
+        利用可能なインデックスが無い場合はNoneを返します。
+
+        Parameters
+        ----------
+        node : QueryNode
+            The comparison node of the query.
+        """
+        r: Optional[int] = None
+        for index in self._indexes.values():
+            count = index.estimate(node)
+            if count is not None and (r is None or count < r):
+                r = count
+        return r
+
+    def _plan(self, node: Optional[QueryNode]) -> Optional[QueryNode]:
+        """
+        (en) Returns an equivalent node rewritten to be cheaper to evaluate.
+        The selectivity of each condition is estimated from the indexes, if any.
+
+        (ja) 評価コストが低くなるよう書き換えた、等価なノードを返します。
+        インデックスがある場合は、各条件の選択率がインデックスから見積もられます。
+
+        Parameters
+        ----------
+        node : Optional[QueryNode]
+            The node of the query.
+        """
+        if not isinstance(node, (AndNode, OrNode, NotNode)):
+            return node
+        return UtilQueryPlanner.optimize(node, self._estimate_count if self._indexes else None, self.length)
+
+    def explain(self, q: Query) -> Dict[str, Any]:
+        """
+        (en) Returns how the query node would be executed in this collection,
+        without executing the query.
+        The result contains whether the indexes narrow down the scan,
+        the number of records to be evaluated, and the chosen plan
+        with the estimated cost per record and selectivity of each node.
+
+        (ja) クエリを実行せずに、このコレクションでクエリノードがどのように実行されるかを返します。
+        結果には、インデックスで走査対象が絞り込まれるかどうか、評価されるレコード数、
+        及び各ノードのレコード毎の見積もりコストと選択率を含む、選択された計画が含まれます。
+
+        Parameters
+        ----------
+        q: Query
+            The query.
+        """
+        node = self._plan(q.query_node)
+        candidates = self._index_candidates(node)
+        return {
+            'target': q.target,
+            'length': self.length,
+            'scan': 'full' if candidates is None else 'index',
+            'scanCount': self.length if candidates is None else len(candidates),
+            'plan': None if node is None else UtilQueryPlanner.explain(
+                node, self._estimate_count if self._indexes else None, self.length),
+        }
+
+    def _compacted(self) -> List[Dict[str, Any]]:
+        """
+        (en) Removes the deleted positions from the stored list, and returns it.
+
+        (ja) 格納リストから削除済みの位置を取り除き、そのリストを返します。
+        """
+        if self._tombstones > 0:
+            self._data = [item for item in self._data if item is not None]
+            self._is_data_shared = False
+            self._tombstones = 0
+            if self._indexes:
+                self._rebuild_seq()
+        return self._data
+
+    def _delete_at(self, positions: Iterable[int]):
+        """
+        (en) Marks the records at the specified positions as deleted.
+        The list is not shifted here, and is compacted when the number of
+        deleted positions exceeds half, or before the next full scan.
+        The indexes must be updated separately.
+
+        (ja) 指定位置のレコードを削除済みにします。
+        ここではリストの詰め直しは行わず、削除済みの位置が半数を超えた場合、
+        または次の全件走査の前に詰め直されます。
+        インデックスは別途更新する必要があります。
+
+        Parameters
+        ----------
+        positions : Iterable[int]
+            The positions in the stored list.
+        """
+        positions = list(positions)
+        self._log_delete(positions)
+        self._own_data()
+        for i in positions:
+            self._data[i] = None
+            self._tombstones += 1
+        if self._tombstones * 2 > len(self._data):
+            self._compacted()
+
+    def _clear_data(self):
+        """
+        (en) Removes all records from the collection and the indexes.
+
+        (ja) コレクション及びインデックスから全てのレコードを取り除きます。
+        """
+        if self._undo_log is not None or self._is_data_shared:
+            # 元のリストはそのまま取り消し用、または固定中のバージョンとして残す。
+            if self._undo_log is not None:
+                self._undo_log.append(("data", self._data, self._tombstones))
+            self._data = []
+            self._is_data_shared = False
+        else:
+            self._data.clear()
+        self._tombstones = 0
+        self._index_clear()
+
+    def _use_serial_key(self, serial_key: str):
+        """
+        (en) Records the key used as the serial key,
+        and keeps a map from the serial number to the record
+        so that queries targeting a single serial number can be resolved in constant time.
+
+        (ja) シリアルキーとして使用されたキーを記録し、
+        単一のシリアルナンバーを対象とするクエリを定数時間で解決できるよう、
+        シリアルナンバーからレコードへのマップを保持します。
+
+        Parameters
+        ----------
+        serial_key : str
+            The serial key of the query.
+        """
+        if self._serial_key == serial_key:
+            return
+        self._serial_key = serial_key
+        if (serial_key, EnumIndexType.hash_) not in self._indexes:
+            self._register_index(HashIndex(serial_key))
+
+    def get_serial_key(self) -> Optional[str]:
+        """
+        (en) Gets the key that was last used as the serial key in this collection.
+        Returns None if no serial key has been used.
+
+        (ja) このコレクションで最後にシリアルキーとして使用されたキーを取得します。
+        シリアルキーが使用されていない場合はNoneを返します。
         """
-        return node.evaluate(item)
+        return self._serial_key
 
     def add_all(self, q: Query) -> QueryResult:
         """
@@ -242,6 +1603,7 @@ class Collection(CloneableFile):
         q: Query
             The query.
         """
+        self._generation += 1
         add_data = UtilCopy.jsonable_deep_copy(q.add_data)
         added_items = []
         if q.serial_key is not None:
@@ -253,12 +1615,16 @@ class Collection(CloneableFile):
                         target=q.target,
                         type_=q.type,
                         result=[],
-                        db_length=len(self._data),
+                        db_length=self.length,
                         update_count=0,
                         hit_count=0,
                         error_message='The target serialKey does not exist',
                     )
-
+            self._use_serial_key(q.serial_key)
+        if self._undo_log is not None:
+            self._undo_log.append(("add", len(add_data)))
+        self._own_data()
+        if q.serial_key is not None:
             for item in add_data:
                 serial_num = self._serial_num
                 item[q.serial_key] = serial_num
@@ -270,8 +1636,9 @@ class Collection(CloneableFile):
             self._data.extend(add_data)
             if q.return_data:
                 added_items.extend(add_data)
+        self._index_add(add_data)
         self.notify_listeners()
-        return QueryResult(True, q.target, q.type, UtilCopy.jsonable_deep_copy(added_items), len(self._data),
+        return QueryResult(True, q.target, q.type, self._to_result(added_items), self.length,
                            len(add_data), 0)
 
     def update(self, q: Query, is_single_target: bool) -> QueryResult:
@@ -298,30 +1665,54 @@ class Collection(CloneableFile):
         is_single_target: bool
             If true, the target is single object.
         """
+        self._generation += 1
+        node = self._plan(q.query_node)
+        matches = node.compile()
+        changes: Optional[List[Tuple[Dict[str, Any], Dict[str, Any]]]] = None
+        if self._undo_log is not None and not self._is_copy_on_write:
+            changes = []
+            self._undo_log.append(("update", changes))
         if q.return_data:
             r = []
-            for item in self._data:
-                if self._evaluate(item, q.query_node):
+            targets = self._scan_targets(node)
+            # 固定中の格納リストは最初の置き換えでコピーに差し替わるため、全件走査かどうかは先に判定する。
+            is_full_scan = targets is self._data
+            for i, item in enumerate(targets):
+                if matches(item):
+                    if self._is_copy_on_write:
+                        item = self._detach(item, i if is_full_scan else self._seq[id(item)])
+                    elif changes is not None:
+                        changes.append((item, {k: item.get(k, _MISSING) for k in q.override_data}))
                     item.update(UtilCopy.jsonable_deep_copy(q.override_data))
                     r.append(item)
                     if is_single_target:
                         break
+            self._index_update(r, q.override_data.keys())
             r = self._apply_sort(q=q, pre_r=r)
             if r:
                 # 要素が空ではないなら通知を発行。
                 self.notify_listeners()
-            return QueryResult(True, q.target, q.type, UtilCopy.jsonable_deep_copy(r), len(self._data), len(r), len(r))
+            return QueryResult(True, q.target, q.type, self._to_result(r), self.length, len(r), len(r))
         else:
-            count = 0
-            for item in self._data:
-                if self._evaluate(item, q.query_node):
+            updated_items = []
+            targets = self._scan_targets(node)
+            # 固定中の格納リストは最初の置き換えでコピーに差し替わるため、全件走査かどうかは先に判定する。
+            is_full_scan = targets is self._data
+            for i, item in enumerate(targets):
+                if matches(item):
+                    if self._is_copy_on_write:
+                        item = self._detach(item, i if is_full_scan else self._seq[id(item)])
+                    elif changes is not None:
+                        changes.append((item, {k: item.get(k, _MISSING) for k in q.override_data}))
                     item.update(UtilCopy.jsonable_deep_copy(q.override_data))
-                    count += 1
+                    updated_items.append(item)
                     if is_single_target:
                         break
+            self._index_update(updated_items, q.override_data.keys())
+            count = len(updated_items)
             if count > 0:
                 self.notify_listeners()
-            return QueryResult(True, q.target, q.type, [], len(self._data), count, count)
+            return QueryResult(True, q.target, q.type, [], self.length, count, count)
 
     def delete(self, q: Query) -> QueryResult:
         """
@@ -334,21 +1725,57 @@ class Collection(CloneableFile):
         q: Query
             The query.
         """
+        self._generation += 1
+        deleted_items = self._remove_matched(self._plan(q.query_node))
         if q.return_data:
-            deleted_items = [item for item in self._data if self._evaluate(item, q.query_node)]
-            self._data = [item for item in self._data if not self._evaluate(item, q.query_node)]
             deleted_items = self._apply_sort(q=q, pre_r=deleted_items)
             if deleted_items:
                 self.notify_listeners()
-            return QueryResult(True, q.target, q.type, UtilCopy.jsonable_deep_copy(deleted_items), len(self._data),
+            return QueryResult(True, q.target, q.type, self._to_result(deleted_items), self.length,
                                len(deleted_items),
                                len(deleted_items))
         else:
-            count = sum(1 for item in self._data if self._evaluate(item, q.query_node))
-            self._data = [item for item in self._data if not self._evaluate(item, q.query_node)]
+            count = len(deleted_items)
             if count > 0:
                 self.notify_listeners()
-            return QueryResult(True, q.target, q.type, [], len(self._data), count, count)
+            return QueryResult(True, q.target, q.type, [], self.length, count, count)
+
+    def _remove_matched(self, node: QueryNode) -> List[Dict[str, Any]]:
+        """
+        (en) Removes all records that match the node from the collection,
+        and returns them in the order in which they were stored.
+
+        (ja) ノードにマッチする全てのレコードをコレクションから取り除き、格納順で返します。
+
+        Parameters
+        ----------
+        node : QueryNode
+            The node of the query.
+        """
+        matches = node.compile()
+        targets = self._scan_targets(node)
+        if targets is self._data:
+            deleted_items = []
+            remained_items = []
+            for item in self._data:
+                if matches(item):
+                    deleted_items.append(item)
+                else:
+                    remained_items.append(item)
+            if deleted_items:
+                if self._undo_log is not None:
+                    self._undo_log.append(("data", self._data, 0))
+                self._data = remained_items
+                self._is_data_shared = False
+                self._index_remove(deleted_items)
+                if self._indexes:
+                    self._rebuild_seq()
+        else:
+            deleted_items = [item for item in targets if matches(item)]
+            positions = [self._seq[id(item)] for item in deleted_items]
+            self._index_remove(deleted_items)
+            self._delete_at(positions)
+        return deleted_items
 
     def delete_one(self, q: Query) -> QueryResult:
         """
@@ -361,15 +1788,22 @@ class Collection(CloneableFile):
         q: Query
             The query.
         """
+        self._generation += 1
         deleted_items = []
-        for i, item in enumerate(self._data):
-            if self._evaluate(item, q.query_node):
+        node = self._plan(q.query_node)
+        matches = node.compile()
+        targets = self._scan_targets(node)
+        for i, item in enumerate(targets):
+            if matches(item):
                 deleted_items.append(item)
-                del self._data[i]
+                # インデックスの候補から見つかった場合は、記録済みの位置を使う。
+                position = i if targets is self._data else self._seq[id(item)]
+                self._index_remove(deleted_items)
+                self._delete_at((position,))
                 break
         if deleted_items:
             self.notify_listeners()
-        return QueryResult(True, q.target, q.type, UtilCopy.jsonable_deep_copy(deleted_items), len(self._data),
+        return QueryResult(True, q.target, q.type, self._to_result(deleted_items), self.length,
                            len(deleted_items),
                            len(deleted_items))
 
@@ -384,25 +1818,32 @@ class Collection(CloneableFile):
         q: Query
             The query.
         """
-        r: List[Dict[str, Any]] = []
+        key = self._result_cache_key(q)
+        cached = self._cached_result(q, key)
+        if cached is not None:
+            return cached
         # 検索
-        for item in self._data:
-            if self._evaluate(item, q.query_node):
-                r.append(item)
+        node = self._plan(q.query_node)
+        r = self._filter(node, self._scan_targets(node))
         hit_count = len(r)
         # ソートやページングのオプション
         r = self._sort_paging_limit(q=q, pre_r=r)
+        next_cursor = self._next_cursor(q, r)
+        if key is not None:
+            self._cache_result(key, r, hit_count, next_cursor)
         return QueryResult(
             is_success=True,
             target=q.target,
             type_=q.type,
-            result=UtilCopy.jsonable_deep_copy(r),
-            db_length=len(self._data),
+            result=self._to_result(r),
+            db_length=self.length,
             update_count=0,
             hit_count=hit_count,
+            next_cursor=next_cursor,
         )
 
-    def _sort_paging_limit(self, q: Query, pre_r: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    def _sort_paging_limit(self, q: Query, pre_r: List[Dict[str, Any]],
+                           use_index: bool = True) -> List[Dict[str, Any]]:
         """
         (en) Sorting, paging, and limits are applied before returning the result.
 
@@ -414,14 +1855,188 @@ class Collection(CloneableFile):
             The query.
         pre_r : List[Dict[str, Any]]
             Pre result.
+        use_index : bool
+            If false, sorted indexes and sorted views are not used for sorting.
         """
+        if q.cursor is not None:
+            return self._apply_cursor(q, pre_r)
         r = pre_r
-        r = self._apply_sort(q, r)
+        window = self._top_k_window(q, len(r))
+        sorted_list = self._sort_by_view(q.sort_obj, r) if use_index else None
+        if sorted_list is not None:
+            r = sorted_list
+        elif window is None:
+            r = self._apply_sort(q, r, use_index)
+        else:
+            sorted_list = self._sort_by_index(q.sort_obj, r) if use_index else None
+            r = sorted_list if sorted_list is not None else self._sort_records(q.sort_obj, r, window)
         r = self._apply_get_position(q, r)
         r = self._apply_limit(q, r)
         return r
 
-    def _apply_sort(self, q: Query, pre_r: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    @staticmethod
+    def _sort_fields(sort_obj: Optional[AbstractSort]) -> Optional[List[str]]:
+        """
+        (en) Returns the fields used by the sort object in order,
+        or None if the sort object is of an unknown type.
+
+        (ja) ソートオブジェクトが使用するフィールドを順に返します。
+        未知の型のソートオブジェクトの場合はNoneを返します。
+
+        Parameters
+        ----------
+        sort_obj : Optional[AbstractSort]
+            The sort object.
+        """
+        if sort_obj is None:
+            return []
+        if isinstance(sort_obj, SingleSort):
+            return [sort_obj.field]
+        if isinstance(sort_obj, MultiSort):
+            return [i.field for i in sort_obj.sort_orders]
+        return None
+
+    def _next_cursor(self, q: Query, page: List[Dict[str, Any]]) -> Optional[str]:
+        """
+        (en) Returns the cursor pointing after the last record of the page,
+        or None if the page is not full or no cursor can be made.
+
+        (ja) ページの最後のレコードの後ろを指すカーソルを返します。
+        ページが埋まっていない場合や、カーソルを作れない場合はNoneを返します。
+
+        Parameters
+        ----------
+        q: Query
+            The query.
+        page : List[Dict[str, Any]]
+            The records returned by the query.
+        """
+        if self._serial_key is None or q.limit is None or q.limit <= 0 or len(page) < q.limit:
+            return None
+        fields = self._sort_fields(q.sort_obj)
+        if fields is None:
+            return None
+        last = page[-1]
+        return UtilCursor.encode([UtilField.get_nested_field_value(last, f) for f in fields],
+                                 last.get(self._serial_key))
+
+    def _apply_cursor(self, q: Query, pre_r: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        (en) Applies the cursor and the limit to the records in stored order.
+        Only the records after the position recorded in the cursor are kept,
+        by comparing their sort keys with the recorded values once each,
+        and the first limit records of them are selected without sorting all records.
+        Records with equal sort keys are ordered by their stored position,
+        which is the same order as the stable sort without a cursor.
+
+        (ja) 格納順のレコードに、カーソルとリミットを適用します。
+        各レコードのソートキーを記録された値と一度ずつ比較することで、カーソルに記録された位置より後ろのみを残し、
+        その中の先頭のlimit件を、全件をソートせずに選択します。
+        ソートキーが等しいレコードは格納位置の順に並び、カーソルを使わない安定ソートと同じ順序になります。
+
+        Parameters
+        ----------
+        q: Query
+            The query.
+        pre_r : List[Dict[str, Any]]
+            Pre result in stored order.
+
+        Raises
+        ------
+        ValueError
+            If the cursor is invalid or cannot be used for this query.
+        """
+        values, serial = UtilCursor.decode(q.cursor)
+        fields = self._sort_fields(q.sort_obj)
+        if fields is None or self._serial_key is None or len(values) != len(fields):
+            raise ValueError("The cursor cannot be used for this query")
+        # カーソルの値から、ソート対象フィールドのみを持つ仮のレコードを作る。
+        anchor: Dict[str, Any] = {}
+        for field, value in zip(fields, values):
+            if value is not None:
+                UtilField.set_nested_field_value(anchor, field, value)
+        is_tie_after = self._tie_after(serial)
+        sort_obj = q.sort_obj
+        if sort_obj is None:
+            r = [item for item in pre_r if is_tie_after(item)]
+        else:
+            keys = sort_obj.get_sort_keys(pre_r + [anchor]) if pre_r else None
+            if keys is not None:
+                ak = keys[-1]
+                r = [item for item, k in zip(pre_r, keys) if k > ak or (k == ak and is_tie_after(item))]
+            else:
+                comparator = sort_obj.get_comparator()
+                r = []
+                for item in pre_r:
+                    c = comparator(item, anchor)
+                    if c > 0 or (c == 0 and is_tie_after(item)):
+                        r.append(item)
+            r = self._sort_records(sort_obj, r, q.limit if q.limit is not None and q.limit >= 0 else None)
+        return r if q.limit is None else r[:q.limit]
+
+    def _tie_after(self, serial: Any) -> Callable[[Dict[str, Any]], bool]:
+        """
+        (en) Returns a function that determines whether a record with the same sort key as
+        the record with the specified serial number comes after it.
+        If that record still exists, its stored position is used,
+        otherwise the serial numbers are compared.
+
+        (ja) 指定シリアルナンバーのレコードとソートキーが等しいレコードが、その後ろに並ぶかを判定する関数を返します。
+        そのレコードが存在する場合はその格納位置を、存在しない場合はシリアルナンバーを比較します。
+
+        Parameters
+        ----------
+        serial : Any
+            The serial number recorded in the cursor.
+        """
+        serial_key = self._serial_key
+        index = self._indexes.get((serial_key, EnumIndexType.hash_))
+        found = index.find(FieldEquals(serial_key, serial)) if index is not None else None
+        seq = self._seq
+        for item in (found or {}).values():
+            if item.get(serial_key) == serial and id(item) in seq:
+                position = seq[id(item)]
+                return lambda other: seq[id(other)] > position
+
+        def is_serial_after(other: Dict[str, Any]) -> bool:
+            v = other.get(serial_key)
+            try:
+                return v is not None and v > serial
+            except TypeError:
+                return False
+
+        return is_serial_after
+
+    @staticmethod
+    def _top_k_window(q: Query, length: int) -> Optional[int]:
+        """
+        (en) Returns the number of leading records of the sorted result that are needed
+        to apply the offset and limit, if it is small enough to select them
+        without sorting all records. Otherwise, returns None.
+        startAfter and endBefore need the whole sorted result, so they always return None.
+
+        (ja) オフセットとリミットの適用に必要な、ソート結果の先頭の件数を返します。
+        全件をソートせずに選択できるほど小さくない場合はNoneを返します。
+        startAfterとendBeforeはソート結果の全体を必要とするため、常にNoneになります。
+
+        Parameters
+        ----------
+        q: Query
+            The query.
+        length : int
+            The number of records to sort.
+        """
+        if q.sort_obj is None or q.limit is None or q.limit < 0:
+            return None
+        if q.offset is None and (q.start_after is not None or q.end_before is not None):
+            return None
+        window = max(q.offset or 0, 0) + q.limit
+        # 件数が対象に近い場合は、全件のソートの方が速い。
+        if window * 4 >= length:
+            return None
+        return window
+
+    def _apply_sort(self, q: Query, pre_r: List[Dict[str, Any]], use_index: bool = True) -> List[Dict[str, Any]]:
         """
         (en) Apply sort.
 
@@ -433,12 +2048,100 @@ class Collection(CloneableFile):
             The query.
         pre_r : List[Dict[str, Any]]
             Pre result.
+        use_index : bool
+            If false, sorted indexes are not used for sorting.
         """
         r = pre_r
         if q.sort_obj is not None:
-            sorted_list = list(r)
-            sorted_list.sort(key=functools.cmp_to_key(q.sort_obj.get_comparator()))
-            return sorted_list
+            sorted_list = self._sort_by_index(q.sort_obj, r) if use_index else None
+            if sorted_list is not None:
+                return sorted_list
+            return self._sort_records(q.sort_obj, r)
+        return r
+
+    @staticmethod
+    def _sort_records(sort_obj: AbstractSort, items: List[Dict[str, Any]],
+                      window: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        (en) Returns a new list of the records sorted by the sort object.
+        The sort keys are extracted only once per record when the sort object supports it,
+        otherwise the comparator is used.
+        The leading records are selected without sorting all records only when the sort keys are available.
+        With the comparator, all records are sorted even if a window is specified,
+        so that incomparable values, such as mixed types, raise the same error regardless of the window.
+
+        (ja) ソートオブジェクトでソートしたレコードの新しいリストを返します。
+        ソートオブジェクトが対応している場合、ソートキーはレコード毎に一度だけ取り出され、
+        それ以外の場合は比較関数が使用されます。
+        全件をソートせずに先頭のレコードを選択するのは、ソートキーが利用できる場合のみです。
+        比較関数を使う場合は、型の混在など比較できない値が範囲に関わらず同じエラーとなるよう、
+        範囲が指定されていても全件をソートします。
+
+        Parameters
+        ----------
+        sort_obj : AbstractSort
+            The sort object.
+        items : List[Dict[str, Any]]
+            The records to sort.
+        window : Optional[int]
+            If specified, only this number of leading records of the sorted result are returned.
+        """
+        # 1件以下では比較関数が呼ばれないため、キーの取り出しによる変換エラーも起こさない。
+        keys = sort_obj.get_sort_keys(items) if len(items) > 1 else None
+        if keys is None:
+            # 比較関数での選択では、limitが0の場合や範囲が小さい場合に比較されない組み合わせがあり、
+            # 全件のソートでは発生する比較のエラーを見逃すため、常に全件をソートする。
+            r = sorted(items, key=functools.cmp_to_key(sort_obj.get_comparator()))
+            return r[:window] if window is not None else r
+        positions = range(len(items))
+        if window is not None:
+            # キーは比較関数を再現できる場合のみ得られ、比較のエラーは起こらないため、
+            # 先頭のwindow件のみを有界のヒープで選択する。nsmallestとsortはどちらも安定なので、同順位の順序は同じになる。
+            positions = heapq.nsmallest(window, positions, key=keys.__getitem__)
+        else:
+            positions = sorted(positions, key=keys.__getitem__)
+        return [items[i] for i in positions]
+
+    def _sort_by_index(self, sort_obj: AbstractSort,
+                       pre_r: List[Dict[str, Any]]) -> Optional[List[Dict[str, Any]]]:
+        """
+        (en) Returns the records arranged in the order of the sorted index
+        without sorting them.
+        Returns None if no suitable index exists,
+        or if sorting directly is expected to be faster.
+
+        (ja) ソートを行わずに、ソート済みインデックスの順序でレコードを並べて返します。
+        適切なインデックスが無い場合や、直接ソートした方が速いと見込まれる場合はNoneを返します。
+
+        Parameters
+        ----------
+        sort_obj : AbstractSort
+            The sort object.
+        pre_r : List[Dict[str, Any]]
+            Pre result. All of them must be records in this collection.
+        """
+        if not self._indexes or not isinstance(sort_obj, SingleSort):
+            return None
+        index = self._indexes.get((sort_obj.field, EnumIndexType.sorted_))
+        if index is None or not index.can_order(sort_obj):
+            return None
+        k = len(pre_r)
+        # インデックスの走査は全件分のコストがかかるため、結果が少ない場合は通常のソートを使う。
+        if k < 2 or k * k.bit_length() * 4 < self.length:
+            return None
+        targets = None if pre_r is self._data else {id(item) for item in pre_r}
+        seq = self._seq
+        r: List[Dict[str, Any]] = []
+        for group in index.ordered_groups(sort_obj.reversed):
+            if targets is not None:
+                group = [item for item in group if id(item) in targets]
+            if len(group) > 1:
+                # 同値のものは格納順に並べる(安定ソートと同じ結果にする)。
+                group.sort(key=lambda item: seq[id(item)])
+            r.extend(group)
+        # 削除済みのレコードなど、インデックスに無いものが含まれる場合は使えない。
+        if len(r) != k:
+            return None
         return r
 
     def _apply_get_position(self, q: Query, pre_r: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
@@ -525,16 +2228,18 @@ class Collection(CloneableFile):
         """
         r: List[Dict[str, Any]] = []
         # 検索
-        for item in self._data:
-            if self._evaluate(item, q.query_node):
+        node = self._plan(q.query_node)
+        matches = node.compile()
+        for item in self._scan_targets(node):
+            if matches(item):
                 r.append(item)
                 break
         return QueryResult(
             is_success=True,
             target=q.target,
             type_=q.type,
-            result=UtilCopy.jsonable_deep_copy(r),
-            db_length=len(self._data),
+            result=self._to_result(r),
+            db_length=self.length,
             update_count=0,
             hit_count=len(r),
         )
@@ -556,11 +2261,19 @@ class Collection(CloneableFile):
         q: Query
             The query.
         """
-        r = UtilCopy.jsonable_deep_copy(self._data)
+        key = self._result_cache_key(q)
+        cached = self._cached_result(q, key)
+        if cached is not None:
+            return cached
+        r = self._compacted()
         hit_count = len(r)
-        # ソートやページングのオプション
+        # ソートやページングのオプション。コピーは最終的に返す範囲のみに対して行う。
         r = self._sort_paging_limit(q=q, pre_r=r)
-        return QueryResult(True, q.target, q.type, r, len(self._data), 0, hit_count)
+        next_cursor = self._next_cursor(q, r)
+        if key is not None:
+            self._cache_result(key, r, hit_count, next_cursor)
+        return QueryResult(True, q.target, q.type, self._to_result(r), self.length, 0, hit_count,
+                           next_cursor=next_cursor)
 
     def conform_to_template(self, q: Query) -> QueryResult:
         """
@@ -579,15 +2292,21 @@ class Collection(CloneableFile):
         q: Query
             The query.
         """
+        self._generation += 1
+        changed_keys: Set[str] = set()
+        self._prepare_change_all()
         for item in self._data:
             keys_to_remove = [k for k in item.keys() if k not in q.template]
             for k in keys_to_remove:
                 item.pop(k)
+                changed_keys.add(k)
             for k, v in q.template.items():
                 if k not in item:
                     item[k] = UtilCopy.jsonable_deep_copy(v)
+                    changed_keys.add(k)
+        self._index_update(self._data, changed_keys)
         self.notify_listeners()
-        return QueryResult(True, q.target, q.type, [], len(self._data), len(self._data), len(self._data))
+        return QueryResult(True, q.target, q.type, [], self.length, self.length, self.length)
 
     def rename_field(self, q: Query) -> QueryResult:
         """
@@ -602,23 +2321,26 @@ class Collection(CloneableFile):
         q: Query
             The query.
         """
+        self._generation += 1
         r = []
-        for item in self._data:
+        for item in self._compacted():
             if q.rename_before not in item:
-                return QueryResult(False, q.target, q.type, [], len(self._data), 0, 0,
+                return QueryResult(False, q.target, q.type, [], self.length, 0, 0,
                                    'The renameBefore key does not exist')
             if q.rename_after in item:
-                return QueryResult(False, q.target, q.type, [], len(self._data), 0, 0,
+                return QueryResult(False, q.target, q.type, [], self.length, 0, 0,
                                    'An existing key was specified as the new key')
         update_count = 0
+        self._prepare_change_all()
         for item in self._data:
             item[q.rename_after] = item[q.rename_before]
             del item[q.rename_before]
             update_count += 1
             if q.return_data:
                 r.append(item)
+        self._index_update(self._data, (q.rename_before, q.rename_after))
         self.notify_listeners()
-        return QueryResult(True, q.target, q.type, UtilCopy.jsonable_deep_copy(r), len(self._data), update_count,
+        return QueryResult(True, q.target, q.type, self._to_result(r), self.length, update_count,
                            update_count)
 
     def count(self, q: Query) -> QueryResult:
@@ -632,7 +2354,7 @@ class Collection(CloneableFile):
         q: Query
             The query.
         """
-        return QueryResult(True, q.target, q.type, [], len(self._data), 0, len(self._data))
+        return QueryResult(True, q.target, q.type, [], self.length, 0, self.length)
 
     def clear(self, q: Query) -> QueryResult:
         """
@@ -645,8 +2367,9 @@ class Collection(CloneableFile):
         q: Query
             The query.
         """
-        pre_len = len(self._data)
-        self._data.clear()
+        self._generation += 1
+        pre_len = self.length
+        self._clear_data()
         if q.reset_serial:
             self._serial_num = 0
         self.notify_listeners()
@@ -670,6 +2393,7 @@ class Collection(CloneableFile):
         q: Query
             The query.
         """
+        self._generation += 1
         add_data = UtilCopy.jsonable_deep_copy(q.add_data)
         if q.serial_key is not None:
             # 対象キーの存在チェック
@@ -680,16 +2404,21 @@ class Collection(CloneableFile):
                         target=q.target,
                         type_=q.type,
                         result=[],
-                        db_length=len(self._data),
+                        db_length=self.length,
                         update_count=0,
                         hit_count=0,
                         error_message='The target serialKey does not exist',
                     )
-        pre_len = len(self._data)
-        self._data.clear()
+        pre_len = self.length
+        self._clear_data()
         if q.reset_serial:
             self._serial_num = 0
         added_items = []
+        if q.serial_key is not None:
+            self._use_serial_key(q.serial_key)
+        if self._undo_log is not None:
+            self._undo_log.append(("add", len(add_data)))
+        self._own_data()
         if q.serial_key is not None:
             for item in add_data:
                 serial_num = self._serial_num
@@ -702,6 +2431,7 @@ class Collection(CloneableFile):
             self._data.extend(add_data)
             if q.return_data:
                 added_items.extend(add_data)
+        self._index_add(add_data)
         self.notify_listeners()
-        return QueryResult(True, q.target, q.type, UtilCopy.jsonable_deep_copy(added_items), len(self._data), pre_len,
+        return QueryResult(True, q.target, q.type, self._to_result(added_items), self.length, pre_len,
                            pre_len)
@@ -1,14 +1,27 @@
 # coding: utf-8
+import os
+from contextlib import contextmanager, nullcontext
 from threading import RLock
-from typing import Any, Dict, List, Callable, Optional, override
+from typing import Any, BinaryIO, ContextManager, Dict, Iterable, Iterator, List, Callable, Optional, Tuple, \
+    override
 
 from file_state_manager.cloneable_file import CloneableFile
 
 from delta_trace_db.query.raw_query_builder import RawQueryBuilder
+from delta_trace_db.db.columnar_collection import ColumnarCollection
 from delta_trace_db.db.delta_trace_db_collection import Collection
+from delta_trace_db.db.enum_concurrency_mode import EnumConcurrencyMode
+from delta_trace_db.db.index.enum_index_type import EnumIndexType
+from delta_trace_db.db.mapped_collection import MappedCollection
+from delta_trace_db.db.rw_lock import RWLock
+from delta_trace_db.db.util_binary_snapshot import UtilBinarySnapshot
+from delta_trace_db.db.util_collection_files import UtilCollectionFiles
+from delta_trace_db.db.util_json_stream import UtilJsonStream
+from delta_trace_db.db.write_ahead_log import WriteAheadLog
 from delta_trace_db.dsl.util_dsl_evaluator import UtilDslEvaluator
 from delta_trace_db.query.cause.permission import Permission
 from delta_trace_db.query.enum_query_type import EnumQueryType
+from delta_trace_db.query.nodes.enum_value_type import EnumValueType
 from delta_trace_db.query.query import Query
 from delta_trace_db.query.query_execution_result import QueryExecutionResult
 from delta_trace_db.query.query_result import QueryResult
@@ -19,12 +32,20 @@ import logging
 
 _logger = logging.getLogger(__name__)
 
+# コレクションの内容を変更しないクエリの種類。
+_READ_QUERY_TYPES = frozenset((
+    EnumQueryType.search,
+    EnumQueryType.searchOne,
+    EnumQueryType.getAll,
+    EnumQueryType.count,
+))
+
 
 class DeltaTraceDatabase(CloneableFile):
     class_name = "DeltaTraceDatabase"
     version = "16"
 
-    def __init__(self):
+    def __init__(self, concurrency_mode: EnumConcurrencyMode = EnumConcurrencyMode.global_):
         """
         (en) It is an in-memory database that takes into consideration the
         safety of various operations.
@@ -33,24 +54,48 @@ class DeltaTraceDatabase(CloneableFile):
 
         (ja) 様々な操作の安全性を考慮したインメモリデータベースです。
         人間以外で、AIも主な利用者であると想定して作成しています。
+
+        Parameters
+        ----------
+        concurrency_mode : EnumConcurrencyMode
+            How concurrent access from multiple threads is controlled.
+            With global_, all operations are serialized by a single lock.
+            With collection_, each collection has a readers-writer lock,
+            so read-only queries (search, searchOne, getAll and count) on the same collection
+            and any queries on different collections can run at the same time.
+            Transactions, merges and whole-DB operations such as to_dict acquire
+            the locks of the collections involved in name order to avoid deadlocks.
+            In this mode, listeners are called while the write lock of the collection is held,
+            so they must not run operations on other collections.
         """
         super().__init__()
         self._collections: Dict[str, Collection] = {}
-        self._lock = RLock()  # execute_query / execute_transaction_query 共通
+        # global_の場合は全体を、collection_の場合はコレクションの辞書の操作のみを排他する。
+        self._lock = RLock()
+        self._concurrency_mode: EnumConcurrencyMode = concurrency_mode
+        self._collection_locks: Dict[str, RWLock] = {}
+        # 先行書き込みログ。collection_モードでは、記録するクエリは共有で、チェックポイントは排他でゲートを保持する。
+        self._wal: Optional[WriteAheadLog] = None
+        self._wal_gate = RWLock()
 
     @classmethod
-    def from_dict(cls, src: Dict[str, Any]) -> "DeltaTraceDatabase":
+    def from_dict(cls, src: Dict[str, Any], is_trusted: bool = False) -> "DeltaTraceDatabase":
         """
         (en) Restore this object from the dictionary.
-        Note that src is used as is, not copied.
+        The data of each collection is validated and copied by jsonable_deep_copy,
+        unless is_trusted is true.
 
         (ja) このオブジェクトを辞書から復元します。
-        srcはコピーされずにそのまま利用されることに注意してください。
+        is_trustedがtrueでない限り、各コレクションのデータはjsonable_deep_copyで検証及びコピーされます。
 
         Parameters
         ----------
         src : Dict[str, Any]
             A dictionary made with toDict of this class.
+        is_trusted : bool
+            If true, the data lists in src are stored as is, without validation or copying.
+            Set this only if src was just decoded from a file saved by this DB
+            and is not referenced from anywhere else.
 
         Raises
         ------
@@ -58,11 +103,66 @@ class DeltaTraceDatabase(CloneableFile):
             Throws on ValueError if the src is invalid format.
         """
         instance = cls()
-        instance._collections = cls._parse_collections(src)
+        instance._collections = cls._parse_collections(src, is_trusted)
+        return instance
+
+    @classmethod
+    def from_binary(cls, file: BinaryIO) -> "DeltaTraceDatabase":
+        """
+        (en) Restore this object from a binary file saved with write_binary.
+        The collections are decoded one at a time and stored without validation or copying,
+        so only load files that you have saved yourself.
+
+        (ja) write_binaryで保存したバイナリファイルからこのオブジェクトを復元します。
+        コレクションは一つずつデコードされ、検証やコピーを行わずに格納されるため、
+        自分で保存したファイルのみを読み込んでください。
+
+        Parameters
+        ----------
+        file : BinaryIO
+            The binary file to read from.
+
+        Raises
+        ------
+        ValueError
+            Throws on ValueError if the file is invalid format.
+        """
+        instance = cls()
+        _, collections = UtilBinarySnapshot.read(file)
+        for name, src in collections:
+            instance._collections[name] = Collection.from_dict(src, is_trusted=True)
+        return instance
+
+    @classmethod
+    def load_from(cls, path: str) -> "DeltaTraceDatabase":
+        """
+        (en) Restore this object from a JSON file saved with save_to.
+        The file is parsed one record at a time,
+        and the parsed records are stored without validation or copying,
+        so the whole document is never held in memory.
+
+        (ja) save_toで保存したJSONファイルからこのオブジェクトを復元します。
+        ファイルはレコード毎に解析され、解析したレコードは検証やコピーを行わずに格納されるため、
+        ドキュメント全体がメモリに保持されることはありません。
+
+        Parameters
+        ----------
+        path : str
+            The file path.
+
+        Raises
+        ------
+        ValueError
+            Throws on ValueError if the file is invalid format.
+        """
+        instance = cls()
+        with open(path, "r", encoding="utf-8") as f:
+            for name, src in UtilJsonStream.read(f):
+                instance._collections[name] = Collection.from_dict(src, is_trusted=True)
         return instance
 
     @staticmethod
-    def _parse_collections(src: Dict[str, Any]) -> Dict[str, Collection]:
+    def _parse_collections(src: Dict[str, Any], is_trusted: bool = False) -> Dict[str, Collection]:
         """
         (en) Restoring database data from JSON.
 
@@ -72,6 +172,8 @@ class DeltaTraceDatabase(CloneableFile):
         ----------
         src : Dict[str, Any]
             A dictionary made with toDict of this class.
+        is_trusted : bool
+            If true, the data lists in src are stored as is.
 
         Raises
         ------
@@ -85,9 +187,190 @@ class DeltaTraceDatabase(CloneableFile):
         for key, value in cols.items():
             if not isinstance(value, dict):
                 raise ValueError("Invalid format: target is not a dict")
-            result[key] = Collection.from_dict(value)
+            result[key] = Collection.from_dict(value, is_trusted)
         return result
 
+    @property
+    def concurrency_mode(self) -> EnumConcurrencyMode:
+        """
+        (en) Returns how concurrent access from multiple threads is controlled.
+
+        (ja) 複数のスレッドからの同時アクセスの制御方法を返します。
+        """
+        return self._concurrency_mode
+
+    def _collection_lock(self, name: str) -> RWLock:
+        """
+        (en) Returns the readers-writer lock of the specified collection name,
+        creating it if necessary.
+        The lock is kept even if the collection is removed or replaced.
+
+        (ja) 指定したコレクション名の読み書きロックを、必要なら作成して返します。
+        ロックはコレクションが削除されたり置き換えられたりしても維持されます。
+
+        Parameters
+        ----------
+        name : str
+            The collection name.
+        """
+        with self._lock:
+            lock = self._collection_locks.get(name)
+            if lock is None:
+                lock = RWLock()
+                self._collection_locks[name] = lock
+            return lock
+
+    def _global_lock(self) -> ContextManager:
+        """
+        (en) Returns the lock that serializes the whole operation in global_ mode,
+        or an empty context in collection_ mode.
+
+        (ja) global_モードでは処理全体を排他するロックを返し、
+        collection_モードでは何もしないコンテキストを返します。
+        """
+        if self._concurrency_mode == EnumConcurrencyMode.global_:
+            return self._lock
+        return nullcontext()
+
+    @contextmanager
+    def _lock_collections(self, names: Iterable[str]) -> Iterator[None]:
+        """
+        (en) Holds the write locks of the specified collections.
+        The locks are acquired in name order so that threads locking
+        multiple collections do not deadlock.
+        In global_ mode, the lock of the whole DB is held instead.
+
+        (ja) 指定したコレクションの書き込みロックを保持します。
+        複数のコレクションをロックするスレッド同士がデッドロックしないよう、
+        ロックは名前順に取得されます。
+        global_モードでは、代わりにDB全体のロックが保持されます。
+
+        Parameters
+        ----------
+        names : Iterable[str]
+            The collection names.
+        """
+        if self._concurrency_mode == EnumConcurrencyMode.global_:
+            with self._lock:
+                yield
+            return
+        acquired: List[RWLock] = []
+        try:
+            for name in sorted(set(names)):
+                lock = self._collection_lock(name)
+                lock.acquire_write()
+                acquired.append(lock)
+            yield
+        finally:
+            for lock in reversed(acquired):
+                lock.release_write()
+
+    @contextmanager
+    def _read_lock_collection(self, name: str) -> Iterator[None]:
+        """
+        (en) Holds the read lock of the specified collection.
+        Since the first read after deleting records compacts the stored list,
+        the write lock is held instead if the collection is not compacted.
+        In global_ mode, the lock of the whole DB is held instead.
+
+        (ja) 指定したコレクションの読み込みロックを保持します。
+        レコードの削除後の最初の読み込みでは格納リストが詰め直されるため、
+        コレクションが詰め直されていない場合は代わりに書き込みロックが保持されます。
+        global_モードでは、代わりにDB全体のロックが保持されます。
+
+        Parameters
+        ----------
+        name : str
+            The collection name.
+        """
+        if self._concurrency_mode == EnumConcurrencyMode.global_:
+            with self._lock:
+                yield
+            return
+        lock = self._collection_lock(name)
+        lock.acquire_read()
+        col = self.find_collection(name)
+        if col is None or col.is_compacted:
+            try:
+                yield
+            finally:
+                lock.release_read()
+            return
+        lock.release_read()
+        with lock.write():
+            yield
+
+    def _lock_query(self, q: Query) -> ContextManager:
+        """
+        (en) Returns the context that holds the locks required to execute the query.
+
+        (ja) クエリの実行に必要なロックを保持するコンテキストを返します。
+
+        Parameters
+        ----------
+        q : Query
+            The query.
+        """
+        if q.type in _READ_QUERY_TYPES:
+            return self._read_lock_collection(q.target)
+        names = [q.target]
+        mqp = q.merge_query_params
+        if q.type == EnumQueryType.merge and mqp is not None:
+            names.extend((mqp.base, mqp.output, *mqp.source))
+            if mqp.serial_base is not None:
+                names.append(mqp.serial_base)
+        return self._lock_collections(names)
+
+    def _lock_wal(self, is_exclusive: bool) -> ContextManager:
+        """
+        (en) Returns the context that holds the gate of the write-ahead log.
+        Queries that are logged hold it shared, and checkpoints hold it exclusively,
+        so that a checkpoint includes exactly the logged records.
+        It is acquired before the locks of the collections.
+        In global_ mode, the lock of the whole DB already serializes them,
+        so the lock of the whole DB is returned for checkpoints and an empty context otherwise.
+
+        (ja) 先行書き込みログのゲートを保持するコンテキストを返します。
+        ログに記録されるクエリは共有で、チェックポイントは排他で保持するため、
+        チェックポイントには記録されたレコードが過不足なく含まれます。
+        これはコレクションのロックよりも先に取得されます。
+        global_モードではDB全体のロックで既に排他されるため、
+        チェックポイントにはDB全体のロックを、それ以外には何もしないコンテキストを返します。
+
+        Parameters
+        ----------
+        is_exclusive : bool
+            If true, the gate is held exclusively.
+        """
+        if self._concurrency_mode == EnumConcurrencyMode.global_:
+            return self._lock if is_exclusive else nullcontext()
+        return self._wal_gate.write() if is_exclusive else self._wal_gate.read()
+
+    def _collection_names(self) -> List[str]:
+        """
+        (en) Returns the names of the current collections.
+
+        (ja) 現在のコレクションの名前の一覧を返します。
+        """
+        with self._lock:
+            return list(self._collections.keys())
+
+    def _target_collections(self, names: List[str]) -> Dict[str, Collection]:
+        """
+        (en) Returns the collections with the specified names that still exist,
+        in the order they are stored. Collections created after the names were taken are excluded.
+
+        (ja) 指定した名前のコレクションのうち、まだ存在するものを格納順で返します。
+        名前の取得後に作成されたコレクションは対象外となります。
+
+        Parameters
+        ----------
+        names : List[str]
+            The names taken by _collection_names. Their locks must be held.
+        """
+        with self._lock:
+            return {k: v for k, v in self._collections.items() if k in names}
+
     def collection(self, name: str) -> Collection:
         """
         (en) If the specified collection exists, it will be retrieved.
@@ -163,11 +446,87 @@ class DeltaTraceDatabase(CloneableFile):
         name : str
             The collection name.
         """
-        with self._lock:
-            collection = self._collections.get(name)
-            return collection.to_dict() if collection is not None else None
+        with self._lock_collections((name,)):
+            collection = self.find_collection(name)
+            if collection is None:
+                return None
+            if not collection.is_snapshot_reads:
+                return collection.to_dict()
+            run = collection.snapshot_to_dict()
+        # 固定したバージョンからのコピーはロックの外で行う。
+        return run()
+
+    def collection_to_binary(self, name: str) -> Optional[bytes]:
+        """
+        (en) Saves individual collections as bytes made with Collection.to_binary.
+        If you specify a collection that does not exist, None is returned.
 
-    def collection_from_dict(self, name: str, src: Dict[str, Any]) -> Collection:
+        (ja) 個別のコレクションを、Collection.to_binaryで作成したバイト列として保存します。
+        存在しないコレクションを指定した場合はNoneが返されます。
+
+        Parameters
+        ----------
+        name : str
+            The collection name.
+        """
+        with self._lock_collections((name,)):
+            collection = self.find_collection(name)
+            if collection is None:
+                return None
+            if not collection.is_snapshot_reads:
+                return collection.to_binary()
+            run = collection.snapshot_to_binary()
+        # 固定したバージョンのエンコードはロックの外で行う。
+        return run()
+
+    def save_collections(self, directory: str):
+        """
+        (en) Saves each collection of this DB to its own file in the specified directory,
+        in the layout of UtilCollectionFiles, which can be loaded with LazyDeltaTraceDatabase.
+        Each collection is saved while only its own lock is held,
+        so the files are consistent per collection, not across collections.
+        The files of the collections that no longer exist are removed.
+
+        (ja) このDBの各コレクションを、UtilCollectionFilesの形式で指定したディレクトリの個別のファイルに保存します。
+        保存したファイルはLazyDeltaTraceDatabaseで読み込めます。
+        各コレクションはそのロックのみを保持して保存されるため、
+        ファイルの内容はコレクション単位では一貫していますが、コレクション間では一貫していません。
+        既に存在しないコレクションのファイルは削除されます。
+
+        Parameters
+        ----------
+        directory : str
+            The directory of the files. It is created if it does not exist.
+        """
+        self._save_collections(directory, self._collection_names(), ())
+
+    def _save_collections(self, directory: str, names: List[str], unchanged: Iterable[str]):
+        """
+        (en) Saves the specified collections to their files,
+        and removes the files of the other collections except the unchanged ones.
+
+        (ja) 指定したコレクションをそれぞれのファイルに保存し、
+        変更されていないもの以外の、その他のコレクションのファイルを削除します。
+
+        Parameters
+        ----------
+        directory : str
+            The directory of the files.
+        names : List[str]
+            The collection names to save.
+        unchanged : Iterable[str]
+            The collection names whose files are already up to date.
+        """
+        os.makedirs(directory, exist_ok=True)
+        saved: List[str] = list(unchanged)
+        for name in names:
+            payload = self.collection_to_binary(name)
+            if payload is not None:
+                UtilCollectionFiles.write(directory, name, payload)
+                saved.append(name)
+        UtilCollectionFiles.remove_others(directory, saved)
+
+    def collection_from_dict(self, name: str, src: Dict[str, Any], is_trusted: bool = False) -> Collection:
         """
         (en) Restores a specific collection from a dictionary, re-registers it,
         and retrieves it.
@@ -185,30 +544,35 @@ class DeltaTraceDatabase(CloneableFile):
             The collection name.
         src : Dict[str, Any]
             A dictionary made with collectionToDict of this class.
+        is_trusted : bool
+            If true, the data list in src is stored as is, without validation or copying.
 
         Raises
         ------
         ValueError
             Throws on ValueError if the src is invalid format.
         """
-        with self._lock:
-            col = Collection.from_dict(src)
-            self._collections[name] = col
+        with self._lock_collections((name,)):
+            col = Collection.from_dict(src, is_trusted)
+            with self._lock:
+                self._collections[name] = col
             return col
 
-    def collection_from_dict_keep_listener(self, name: str, src: Dict[str, Any]) -> Collection:
+    def collection_from_dict_keep_listener(self, name: str, src: Dict[str, Any],
+                                           is_trusted: bool = False) -> Collection:
         """
         (en) Restores a specific collection from a dictionary, re-registers it,
         and retrieves it.
         If a collection with the same name already exists, it will be overwritten.
         This is typically used to restore data saved with collection_to_dict.
-        This method preserves existing listeners when overwriting the specified
-        collection.
+        This method preserves existing listeners, index settings,
+        the result mode and the columnar storage when overwriting the specified collection.
 
         (ja) 特定のコレクションを辞書から復元して再登録し、取得します。
         既存の同名のコレクションが既にある場合は上書きされます。
         通常は、collection_to_dictで保存したデータを復元する際に使用します。
-        このメソッドでは、指定されたコレクションの上書き時、既存のリスナが維持されます。
+        このメソッドでは、指定されたコレクションの上書き時、既存のリスナ、インデックスの設定、結果のモード、
+        及び列指向の格納が維持されます。
 
         Parameters
         ----------
@@ -216,30 +580,102 @@ class DeltaTraceDatabase(CloneableFile):
             The collection name.
         src : Dict[str, Any]
             A dictionary made with collectionToDict of this class.
+        is_trusted : bool
+            If true, the data list in src is stored as is, without validation or copying.
 
         Raises
         ------
         ValueError
             Throws on ValueError if the src is invalid format.
         """
-        with self._lock:
-            col = Collection.from_dict(src)
+        with self._lock_collections((name,)):
+            pre_col = self.find_collection(name)
+            if isinstance(pre_col, ColumnarCollection):
+                col = ColumnarCollection.from_dict(src, is_trusted)
+            else:
+                col = Collection.from_dict(src, is_trusted)
             listeners_buf = None
             named_listeners_buf = None
-            if name in self._collections:
-                listeners_buf = self._collections[name].listeners
-                named_listeners_buf = self._collections[name].named_listeners
-            self._collections[name] = col
+            if pre_col is not None:
+                listeners_buf = pre_col.listeners
+                named_listeners_buf = pre_col.named_listeners
+                # インデックス等の設定も引き継ぐ。
+                col.inherit_settings(pre_col)
+            with self._lock:
+                self._collections[name] = col
             if listeners_buf is not None:
                 col.listeners = listeners_buf
             if named_listeners_buf is not None:
                 col.named_listeners = named_listeners_buf
             return col
 
+    def collection_to_mapped(self, name: str, path: str, columns: Iterable[str] = ()) -> bool:
+        """
+        (en) Writes a specific collection to a file of MappedSegment,
+        which can be opened with collection_from_mapped.
+        The collection is written while its lock is held.
+
+        (ja) 特定のコレクションを、collection_from_mappedで開けるMappedSegmentのファイルに書き込みます。
+        コレクションはそのロックを保持したまま書き込まれます。
+
+        Parameters
+        ----------
+        name : str
+            The collection name.
+        path : str
+            The file path.
+        columns : Iterable[str]
+            The fields to store as column arrays, used in the same way as hash indexes.
+            Nested fields can be specified with "." like user.name.
+
+        Returns
+        -------
+        bool
+            False if the collection does not exist, otherwise True.
+        """
+        with self._lock_collections((name,)):
+            collection = self.find_collection(name)
+            if collection is None:
+                return False
+            collection.to_mapped(path, columns)
+            return True
+
+    def collection_from_mapped(self, name: str, path: str) -> MappedCollection:
+        """
+        (en) Opens a file written with collection_to_mapped as a MappedCollection, and registers it.
+        Records are decoded from the memory-mapped file only when a query touches them,
+        until the first write to the collection decodes all of them into memory.
+        If a collection with the same name already exists, it will be overwritten.
+
+        (ja) collection_to_mappedで書き込んだファイルをMappedCollectionとして開き、登録します。
+        コレクションへの最初の書き込みで全てがメモリ上にデコードされるまで、
+        レコードはクエリが触れた時にのみメモリマップしたファイルからデコードされます。
+        既存の同名のコレクションが既にある場合は上書きされます。
+
+        Parameters
+        ----------
+        name : str
+            The collection name.
+        path : str
+            The file path.
+
+        Raises
+        ------
+        ValueError
+            Throws on ValueError if the file is invalid format.
+        """
+        with self._lock_collections((name,)):
+            col = MappedCollection.open(path)
+            with self._lock:
+                self._collections[name] = col
+            return col
+
     @override
     def clone(self) -> "DeltaTraceDatabase":
-        with self._lock:
-            return DeltaTraceDatabase.from_dict(self.to_dict())
+        r = DeltaTraceDatabase(concurrency_mode=self._concurrency_mode)
+        # to_dictで既にコピーされているため、再度コピーしない。
+        r._collections = self._parse_collections(self.to_dict(), is_trusted=True)
+        return r
 
     @property
     def raw(self) -> Dict[str, Collection]:
@@ -254,12 +690,143 @@ class DeltaTraceDatabase(CloneableFile):
 
     @override
     def to_dict(self) -> Dict[str, Any]:
-        with self._lock:
-            return {
-                "className": self.class_name,
-                "version": self.version,
-                "collections": {k: v.to_dict() for k, v in self._collections.items()},
-            }
+        names = self._collection_names()
+        collections: Dict[str, Any] = {}
+        snapshots: Dict[str, Callable[[], Dict[str, Any]]] = {}
+        with self._lock_collections(names):
+            targets = self._target_collections(names)
+            for k, v in targets.items():
+                if v.is_snapshot_reads:
+                    collections[k] = None
+                    snapshots[k] = v.snapshot_to_dict()
+                else:
+                    collections[k] = v.to_dict()
+        # 固定したバージョンからのコピーはロックの外で行う。
+        for k, run in snapshots.items():
+            collections[k] = run()
+        return {
+            "className": self.class_name,
+            "version": self.version,
+            "collections": collections,
+        }
+
+    def write_binary(self, file: BinaryIO):
+        """
+        (en) Saves this DB to a binary file in the format of UtilBinarySnapshot,
+        which can be restored with from_binary or load_binary_keep_listener.
+        Each collection is encoded directly from the stored data without a deep copy,
+        and written before the next one is encoded.
+        The collections are written while their locks are held,
+        except for those with snapshot reads enabled,
+        which are encoded and written from the pinned version after the locks are released.
+
+        (ja) このDBをUtilBinarySnapshotの形式でバイナリファイルに保存します。
+        保存したファイルはfrom_binary、またはload_binary_keep_listenerで復元できます。
+        各コレクションはディープコピーせずに保持しているデータから直接エンコードされ、
+        次のコレクションのエンコード前に書き込まれます。
+        コレクションはロックを保持したまま書き込まれますが、
+        スナップショット読み込みが有効なコレクションは、ロックの解放後に固定したバージョンから
+        エンコードされて書き込まれます。
+
+        Parameters
+        ----------
+        file : BinaryIO
+            The binary file to write to.
+        """
+        names = self._collection_names()
+        snapshots: List[Tuple[str, Callable[[], bytes]]] = []
+        with self._lock_collections(names):
+            targets = self._target_collections(names)
+            UtilBinarySnapshot.write_header(file, {"className": self.class_name, "version": self.version},
+                                            len(targets))
+            for k, v in targets.items():
+                if v.is_snapshot_reads:
+                    snapshots.append((k, v.snapshot_to_binary()))
+                else:
+                    UtilBinarySnapshot.write_collection(file, k, v.to_binary())
+        # 固定したバージョンのエンコードはロックの外で行う。
+        for k, run in snapshots:
+            UtilBinarySnapshot.write_collection(file, k, run())
+
+    def save_to(self, path: str):
+        """
+        (en) Saves this DB to a JSON file, which can be restored with load_from.
+        The file has the same structure as to_dict, with one record per line,
+        so it can also be read with json.load and from_dict.
+        The records are converted and written one at a time directly from the stored data,
+        without making a copy of the whole DB.
+        The collections are written while their locks are held,
+        except for those with snapshot reads enabled,
+        which are written from the pinned version after the locks are released.
+        The file is written to a temporary file first and then renamed,
+        so the previous file remains if this fails.
+
+        (ja) このDBをJSONファイルに保存します。保存したファイルはload_fromで復元できます。
+        ファイルはto_dictと同じ構造で、一行に一つのレコードが書き込まれるため、
+        json.loadとfrom_dictでも読み込めます。
+        レコードは、DB全体のコピーを作らずに、保持しているデータから直接一つずつ変換されて書き込まれます。
+        コレクションはロックを保持したまま書き込まれますが、
+        スナップショット読み込みが有効なコレクションは、ロックの解放後に固定したバージョンから書き込まれます。
+        ファイルはまず一時ファイルに書き込まれてから名前が変更されるため、
+        これが失敗した場合は以前のファイルが残ります。
+
+        Parameters
+        ----------
+        path : str
+            The file path.
+        """
+        names = self._collection_names()
+        snapshots: List[Iterator[str]] = []
+        tmp_path = path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(UtilJsonStream.db_header(self.class_name, self.version))
+                with self._lock_collections(names):
+                    targets = self._target_collections(names)
+                    # ロックの外で書き込むスナップショットを後に回し、書き込む順に並べる。
+                    ordered = sorted(targets.items(), key=lambda e: e[1].is_snapshot_reads)
+                    for i, (k, v) in enumerate(ordered):
+                        if v.is_snapshot_reads:
+                            snapshots.append(v.snapshot_to_json_lines(k, i == 0))
+                        else:
+                            f.writelines(v.to_json_lines(k, i == 0))
+                # 固定したバージョンからの書き込みはロックの外で行う。
+                for lines in snapshots:
+                    f.writelines(lines)
+                f.write(UtilJsonStream.db_footer())
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def load_binary_keep_listener(self, file: BinaryIO):
+        """
+        (en) Restores the collections saved with write_binary into this DB,
+        in the same way as collection_from_dict_keep_listener.
+        The collections are decoded one at a time and stored without validation or copying,
+        so only load files that you have saved yourself.
+        Collections that are not in the file are not changed.
+
+        (ja) write_binaryで保存したコレクションを、
+        collection_from_dict_keep_listenerと同様にこのDBに復元します。
+        コレクションは一つずつデコードされ、検証やコピーを行わずに格納されるため、
+        自分で保存したファイルのみを読み込んでください。
+        ファイルに含まれないコレクションは変更されません。
+
+        Parameters
+        ----------
+        file : BinaryIO
+            The binary file to read from.
+
+        Raises
+        ------
+        ValueError
+            Throws on ValueError if the file is invalid format.
+        """
+        _, collections = UtilBinarySnapshot.read(file)
+        for name, src in collections:
+            self.collection_from_dict_keep_listener(name, src, is_trusted=True)
 
     def add_listener(self, target: str, cb: Callable[[], None], name: Optional[str] = None):
         """
@@ -294,7 +861,7 @@ class DeltaTraceDatabase(CloneableFile):
             If you set a non-null value, a listener will be registered with that name.
             Setting a name is useful if you want to be more precise about registration and release.
         """
-        with self._lock:
+        with self._lock_collections((target,)):
             self.collection(target).add_listener(cb, name=name)
 
     def remove_listener(self, target: str, cb: Callable[[], None], name: Optional[str] = None):
@@ -314,9 +881,315 @@ class DeltaTraceDatabase(CloneableFile):
         name : Optional[str]
             If you registered with a name when you added Listener, you must unregister with the same name.
         """
-        with self._lock:
+        with self._lock_collections((target,)):
             self.collection(target).remove_listener(cb, name=name)
 
+    def add_index(self, target: str, field: str, index_type: EnumIndexType = EnumIndexType.hash_,
+                  v_type: EnumValueType = EnumValueType.auto_):
+        """
+        (en) Sets an index on the specified field of the [target] collection.
+        Search-type queries, as well as update and delete queries,
+        use the index to narrow down the target records.
+        Like listeners, indexes are not serialized.
+        You must re-register them each time after deserialization.
+
+        (ja) [target]のコレクションの指定フィールドにインデックスを設定します。
+        検索系のクエリ及び更新、削除のクエリでは、対象レコードの絞り込みにインデックスが利用されます。
+        リスナーと同様にインデックスはシリアライズされないため、
+        デシリアライズ後は毎回再登録する必要があります。
+
+        Parameters
+        ----------
+        target : str
+            The target collection name.
+        field : str
+            The target variable name. Nested fields can be specified with "." like user.name.
+        index_type : EnumIndexType
+            The type of the index.
+            hash_ is used for equality conditions and sorted_ is used for
+            range conditions and sorting.
+        v_type : EnumValueType
+            Only valid for sorted_. The comparison type of the index.
+
+        Raises
+        ------
+        ValueError
+            If an unsupported index type or v_type is specified.
+        """
+        with self._lock_collections((target,)):
+            self.collection(target).add_index(field, index_type=index_type, v_type=v_type)
+
+    def remove_index(self, target: str, field: str, index_type: Optional[EnumIndexType] = None):
+        """
+        (en) Removes the index set on the specified field of the [target] collection.
+
+        (ja) [target]のコレクションの指定フィールドに設定されたインデックスを削除します。
+
+        Parameters
+        ----------
+        target : str
+            The target collection name.
+        field : str
+            The target variable name.
+        index_type : Optional[EnumIndexType]
+            The type of the index. If None, all indexes of the field are removed.
+        """
+        with self._lock_collections((target,)):
+            col = self.find_collection(target)
+            if col is not None:
+                col.remove_index(field, index_type=index_type)
+
+    def set_read_only_results(self, target: str, is_read_only: bool = True):
+        """
+        (en) Sets whether the query results of the [target] collection are returned as
+        read-only views (ReadOnlyDict) instead of deep copies.
+        When enabled, reads skip copying the records, and the DB replaces a record
+        instead of changing it when updating, so the returned views are never changed afterwards.
+        Like listeners, this setting is not serialized.
+
+        (ja) [target]のコレクションのクエリ結果を、ディープコピーの代わりに
+        読み取り専用のビュー(ReadOnlyDict)で返すかどうかを設定します。
+        有効な場合、読み込み時のレコードのコピーが省略され、
+        DBは更新時にレコードを変更せずに置き換えるため、返されたビューが後から変化することはありません。
+        リスナーと同様に、この設定はシリアライズされません。
+
+        Parameters
+        ----------
+        target : str
+            The target collection name.
+        is_read_only : bool
+            If true, the results are returned as read-only views.
+        """
+        with self._lock_collections((target,)):
+            self.collection(target).set_read_only_results(is_read_only)
+
+    def set_snapshot_reads(self, target: str, is_snapshot_reads: bool = True):
+        """
+        (en) Sets whether read-only queries (search, searchOne, getAll and count)
+        and to_dict of the [target] collection run against a pinned version of the collection.
+        When enabled, the lock is held only while pinning the current version,
+        and the records are filtered, sorted, paged and copied after releasing it,
+        so long reads do not block writers.
+        Instead, writers replace records instead of changing them,
+        and copy the list of records once before changing it if a reader has pinned it.
+        Like listeners, this setting is not serialized.
+
+        (ja) [target]のコレクションの読み込みのみのクエリ(search、searchOne、getAll、count)及びto_dictを、
+        コレクションの固定したバージョンに対して実行するかどうかを設定します。
+        有効な場合、ロックは現在のバージョンを固定する間のみ保持され、
+        レコードの絞り込み、ソート、ページング、コピーはロックの解放後に行われるため、
+        長い読み込みが書き込みを妨げません。
+        代わりに書き込み時はレコードを変更せずに置き換え、
+        レコードのリストが読み込み側に固定されている場合は変更前に一度コピーします。
+        リスナーと同様に、この設定はシリアライズされません。
+
+        Parameters
+        ----------
+        target : str
+            The target collection name.
+        is_snapshot_reads : bool
+            If true, reads run against a pinned version.
+        """
+        with self._lock_collections((target,)):
+            self.collection(target).set_snapshot_reads(is_snapshot_reads)
+
+    def set_columnar(self, target: str, is_columnar: bool = True):
+        """
+        (en) Sets whether the [target] collection stores its records as typed columns
+        in a ColumnarCollection, instead of a list of dictionaries.
+        The records, listeners and settings are moved to the new collection,
+        except the indexes, which are replaced by scans of the columns.
+        Indexes cannot be added while this is enabled.
+        Like listeners, this setting is not serialized.
+
+        (ja) [target]のコレクションが、レコードを辞書のリストではなく、
+        ColumnarCollectionの型付きの列として格納するかどうかを設定します。
+        レコード、リスナー、及び設定は新しいコレクションに移されますが、
+        インデックスは列の走査で代替されるため移されません。
+        これが有効な間はインデックスを追加できません。
+        リスナーと同様に、この設定はシリアライズされません。
+
+        Parameters
+        ----------
+        target : str
+            The target collection name.
+        is_columnar : bool
+            If true, the records are stored as columns.
+        """
+        with self._lock_collections((target,)):
+            pre_col = self.collection(target)
+            if isinstance(pre_col, ColumnarCollection) == is_columnar:
+                return
+            cls = ColumnarCollection if is_columnar else Collection
+            col = cls.from_data(pre_col.raw, pre_col.get_serial_num())
+            col.inherit_settings(pre_col)
+            col.listeners = pre_col.listeners
+            col.named_listeners = pre_col.named_listeners
+            with self._lock:
+                self._collections[target] = col
+
+    def set_parallel_scan(self, target: str, processes: int, min_records: int = 100000):
+        """
+        (en) Sets the number of worker processes used to filter the records of
+        search queries on the [target] collection.
+        When enabled, large scans are split into partitions evaluated in forked worker processes,
+        and the hits are merged so that the results are the same as a serial scan.
+        On platforms that cannot fork, the scan is always serial.
+        Since forking a multi-threaded process can deadlock, the scan is also serial
+        while other threads are running, such as in collection_ mode with concurrent readers,
+        snapshot queries run outside the lock, or AsyncDeltaTraceDatabase.
+        Like listeners, this setting is not serialized.
+
+        (ja) [target]のコレクションに対するsearchクエリの、レコードの絞り込みに使用するワーカープロセス数を設定します。
+        有効な場合、大きな走査は区間に分割されてフォークしたワーカープロセスで評価され、
+        ヒットは逐次の走査と同じ結果になるようにマージされます。
+        フォークできないプラットフォームでは、常に逐次に走査されます。
+        複数のスレッドが動作するプロセスのフォークはデッドロックする恐れがあるため、
+        並行して読み込むcollection_モードや、ロックの外で実行されるスナップショットのクエリ、
+        AsyncDeltaTraceDatabaseなど、他のスレッドが動作している間も逐次に走査されます。
+        リスナーと同様に、この設定はシリアライズされません。
+
+        Parameters
+        ----------
+        target : str
+            The target collection name.
+        processes : int
+            The number of worker processes. 1 disables the parallel scan.
+        min_records : int
+            The minimum number of records to scan in parallel.
+        """
+        with self._lock_collections((target,)):
+            self.collection(target).set_parallel_scan(processes, min_records)
+
+    def set_max_sorted_views(self, target: str, count: int):
+        """
+        (en) Sets the maximum number of sorted views kept by the [target] collection.
+        A sorted view keeps all records in the order of a sort used by getAll,
+        and is updated on each write so that paging with the same sort does not sort again.
+        Like listeners, this setting is not serialized.
+
+        (ja) [target]のコレクションが保持するソート済みビューの最大数を設定します。
+        ソート済みビューはgetAllで使われたソートの順に全レコードを保持し、
+        書き込みの度に更新されるため、同じソートでのページングで再度ソートする必要がありません。
+        リスナーと同様に、この設定はシリアライズされません。
+
+        Parameters
+        ----------
+        target : str
+            The target collection name.
+        count : int
+            The maximum number of sorted views. 0 disables them.
+        """
+        with self._lock_collections((target,)):
+            self.collection(target).set_max_sorted_views(count)
+
+    def set_result_cache(self, target: str, max_entries: int, max_bytes: int = 64 * 1024 * 1024):
+        """
+        (en) Sets the cache of the results of search and getAll queries on the [target] collection.
+        Identical queries return the cached result until the collection is changed,
+        and the hit and miss counts can be read from Collection.result_cache_stats.
+        Like listeners, this setting is not serialized.
+
+        (ja) [target]のコレクションに対するsearch及びgetAllクエリの結果のキャッシュを設定します。
+        同一のクエリは、コレクションが変更されるまでキャッシュした結果を返し、
+        ヒット数とミス数はCollection.result_cache_statsから参照できます。
+        リスナーと同様に、この設定はシリアライズされません。
+
+        Parameters
+        ----------
+        target : str
+            The target collection name.
+        max_entries : int
+            The maximum number of cached results. 0 disables the cache.
+        max_bytes : int
+            The maximum total estimated size of the cached results in bytes.
+        """
+        with self._lock_collections((target,)):
+            self.collection(target).set_result_cache(max_entries, max_bytes)
+
+    def set_write_ahead_log(self, wal: Optional[WriteAheadLog]):
+        """
+        (en) Sets the write-ahead log to which this DB appends the executed changes.
+        Each successful query that changes the contents (add, update, delete, merge and so on)
+        is appended while the locks are held, so the log has the same order as the execution.
+        Each successful transaction is appended as a single record before it is committed,
+        and the transaction is rolled back if appending fails.
+        If appending a single query fails, the exception is raised to the caller
+        after the query has been applied to the contents.
+        Changes made without queries, such as collection_from_dict, are not logged,
+        so call checkpoint after them.
+        To restore the DB, use WriteAheadLog.recover before setting the log.
+
+        (ja) このDBが実行した変更を追記する先行書き込みログを設定します。
+        内容を変更する成功したクエリ(add、update、delete、mergeなど)はロックの保持中に追記されるため、
+        ログは実行と同じ順序になります。
+        成功したトランザクションはコミット前に単一のレコードとして追記され、
+        追記に失敗した場合はロールバックされます。
+        単一のクエリの追記に失敗した場合は、クエリが内容に適用された後に例外が呼び出し元に送出されます。
+        collection_from_dictなど、クエリを介さない変更は記録されないため、その後にcheckpointを呼んでください。
+        DBを復元するには、ログを設定する前にWriteAheadLog.recoverを使用してください。
+
+        Parameters
+        ----------
+        wal : Optional[WriteAheadLog]
+            The write-ahead log. None stops logging.
+        """
+        with self._lock_wal(True):
+            self._wal = wal
+
+    @property
+    def write_ahead_log(self) -> Optional[WriteAheadLog]:
+        """
+        (en) The write-ahead log set to this DB, or None.
+
+        (ja) このDBに設定された先行書き込みログ、またはNoneです。
+        """
+        return self._wal
+
+    def checkpoint(self):
+        """
+        (en) Writes the current contents of this DB as the checkpoint of the write-ahead log
+        and empties the log, so that recovery only replays the changes after this.
+        Logged queries wait while the checkpoint is written.
+        Do not call this from listeners.
+
+        (ja) このDBの現在の内容を先行書き込みログのチェックポイントとして書き込み、ログを空にするため、
+        復旧時にはこれ以降の変更のみが再実行されます。
+        チェックポイントの書き込み中は、ログに記録されるクエリは待機します。
+        リスナーからは呼び出さないでください。
+
+        Raises
+        ------
+        ValueError
+            If the write-ahead log is not set.
+        """
+        with self._lock_wal(True):
+            if self._wal is None:
+                raise ValueError("The write-ahead log is not set")
+            self._wal.write_checkpoint(self)
+
+    def explain(self, q: Query) -> Dict[str, Any]:
+        """
+        (en) Returns how the query node would be executed, without executing the query.
+        The result contains whether the indexes narrow down the scan,
+        the number of records to be evaluated, and the chosen plan
+        with the estimated cost per record and selectivity of each node.
+        The collection is not created even if it does not exist.
+
+        (ja) クエリを実行せずに、クエリノードがどのように実行されるかを返します。
+        結果には、インデックスで走査対象が絞り込まれるかどうか、評価されるレコード数、
+        及び各ノードのレコード毎の見積もりコストと選択率を含む、選択された計画が含まれます。
+        コレクションが存在しない場合でも、コレクションは作成されません。
+
+        Parameters
+        ----------
+        q : Query
+            The query.
+        """
+        with self._read_lock_collection(q.target):
+            col = self.find_collection(q.target)
+            return (col if col is not None else Collection()).explain(q)
+
     def execute_query_object(self, query: Any,
                              collection_permissions: Optional[Dict[str, Permission]] = None) -> QueryExecutionResult:
         """
@@ -346,7 +1219,7 @@ class DeltaTraceDatabase(CloneableFile):
         ValueError
             Throws on ValueError if the query is unsupported type.
         """
-        with self._lock:  # 排他制御
+        with self._global_lock():  # 排他制御
             if isinstance(query, Query):
                 return self.execute_query(query, collection_permissions=collection_permissions)
             elif isinstance(query, TransactionQuery):
@@ -381,7 +1254,35 @@ class DeltaTraceDatabase(CloneableFile):
             Collection level operation permissions for the executing user. This is an optional argument for the server,
             the key is the target collection name. Use null on the frontend, if this is null then everything is allowed.
         """
-        with self._lock:  # 単体クエリもここで排他
+        if q.type in _READ_QUERY_TYPES:
+            r = self._execute_snapshot_query(q, collection_permissions=collection_permissions)
+            if r is not None:
+                return r
+        if self._wal is None or q.type in _READ_QUERY_TYPES:
+            return self._execute_query(q, collection_permissions)
+        with self._lock_wal(False):
+            with self._lock_query(q):
+                r = self._execute_query(q, collection_permissions)
+                # 実行順とログの順序が一致するよう、ロックの保持中に追記する。
+                if r.is_success and self._wal is not None:
+                    self._wal.append_query(q)
+                return r
+
+    def _execute_query(self, q: Query, collection_permissions: Optional[Dict[str, Permission]] = None) \
+            -> QueryResult:
+        """
+        (en) Executes the query without the snapshot reads and the write-ahead log.
+
+        (ja) スナップショット読み込みと先行書き込みログを使わずにクエリを実行します。
+
+        Parameters
+        ----------
+        q : Query
+            The query.
+        collection_permissions: Optional[Dict[str, Permission]]
+            Collection level operation permissions for the executing user.
+        """
+        with self._lock_query(q):  # 単体クエリもここで排他
             try:
                 # パーミッションのチェック
                 if not UtilQuery.check_permissions(q=q, collection_permissions=collection_permissions):
@@ -395,7 +1296,7 @@ class DeltaTraceDatabase(CloneableFile):
                         hit_count=0,
                         error_message="Operation not permitted."
                     )
-                is_exist_col = q.target in self._collections
+                is_exist_col = self.find_collection(q.target) is not None
                 col = self.collection(q.target)
                 match q.type:
                     case EnumQueryType.add:
@@ -500,6 +1401,63 @@ class DeltaTraceDatabase(CloneableFile):
                     error_message="execute_query Unexpected Error",
                 )
 
+    def _execute_snapshot_query(self, q: Query,
+                                collection_permissions: Optional[Dict[str, Permission]] = None) \
+            -> Optional[QueryResult]:
+        """
+        (en) Executes the read-only query against a pinned version of the collection,
+        if snapshot reads are enabled for it.
+        The lock is held only while pinning the version.
+        Returns None if the query should be executed normally.
+
+        (ja) コレクションでスナップショット読み込みが有効な場合、
+        読み込みのみのクエリをコレクションの固定したバージョンに対して実行します。
+        ロックはバージョンを固定する間のみ保持されます。
+        通常通りに実行すべき場合はNoneを返します。
+
+        Parameters
+        ----------
+        q : Query
+            The query.
+        collection_permissions: Optional[Dict[str, Permission]]
+            Collection level operation permissions for the executing user.
+        """
+        try:
+            with self._read_lock_collection(q.target):
+                col = self.find_collection(q.target)
+                # 存在しないコレクションや、権限の無い場合の結果は通常の処理で返す。
+                # カーソルは格納位置を参照するため、ロックの保持中に通常通り実行する。
+                if col is None or not col.is_snapshot_reads or q.cursor is not None:
+                    return None
+                if not UtilQuery.check_permissions(q=q, collection_permissions=collection_permissions):
+                    return None
+                run = col.snapshot_query(q)
+            return run()
+        except ValueError:
+            _logger.error("execute_query ArgumentError", exc_info=True)
+            return QueryResult(
+                is_success=False,
+                target=q.target,
+                type_=q.type,
+                result=[],
+                db_length=-1,
+                update_count=0,
+                hit_count=0,
+                error_message="execute_query ArgumentError"
+            )
+        except Exception:
+            _logger.error("execute_query Unexpected Error", exc_info=True)
+            return QueryResult(
+                is_success=False,
+                target=q.target,
+                type_=q.type,
+                result=[],
+                db_length=-1,
+                update_count=0,
+                hit_count=0,
+                error_message="execute_query Unexpected Error",
+            )
+
     def execute_transaction_query(self, q: TransactionQuery,
                                   collection_permissions: Optional[
                                       Dict[str, Permission]] = None) -> TransactionQueryResult:
@@ -530,7 +1488,10 @@ class DeltaTraceDatabase(CloneableFile):
             Collection level operation permissions for the executing user. This is an optional argument for the server,
             the key is the target collection name. Use null on the frontend, if this is null then everything is allowed.
         """
-        with self._lock:  # トランザクション全体で排他
+        wal = self._wal
+        # トランザクション全体で排他
+        with self._lock_wal(False) if wal is not None else nullcontext(), \
+                self._lock_collections(i.target for i in q.queries):
             # 許可されていないクエリが混ざっていないか調査し、混ざっていたら失敗にする。
             for i in q.queries:
                 if i.type == EnumQueryType.removeCollection or i.type == EnumQueryType.merge:
@@ -539,22 +1500,24 @@ class DeltaTraceDatabase(CloneableFile):
             # トランザクション付き処理を開始。
             results: List[QueryResult] = []
             try:
-                buff: Dict[str, Dict[str, Any]] = {}
+                # コレクション全体のコピーは取らず、各操作が取り消し用の記録を残す。
+                buff: Dict[str, Collection] = {}
                 non_exist_targets: set[str] = set()
                 for i in q.queries:
                     if i.target in buff:
                         continue
                     else:
-                        t_collection: Optional[dict[str, Any]] = self.collection_to_dict(i.target)
+                        t_collection: Optional[Collection] = self.find_collection(i.target)
                         if t_collection is not None:
                             buff[i.target] = t_collection
                             # コレクションをトランザクションモードに変更する。
-                            self.collection(i.target).change_transaction_mode(True)
+                            t_collection.change_transaction_mode(True)
                         else:
                             non_exist_targets.add(i.target)
                 try:
                     for i in q.queries:
-                        results.append(self.execute_query(i, collection_permissions=collection_permissions))
+                        # 個々のクエリはログに記録せず、トランザクション全体を記録する。
+                        results.append(self._execute_query(i, collection_permissions=collection_permissions))
                 except Exception:
                     _logger.error("execute_transaction_query: Transaction failed", exc_info=True)
                     return self._rollback_collections(buff=buff, non_exist_targets=non_exist_targets)
@@ -563,9 +1526,16 @@ class DeltaTraceDatabase(CloneableFile):
                 if any(not r.is_success for r in results):
                     return self._rollback_collections(buff=buff, non_exist_targets=non_exist_targets)
 
+                # ログへの追記に失敗した場合は、コミットせずにロールバックする。
+                if wal is not None and any(i.type not in _READ_QUERY_TYPES for i in q.queries):
+                    try:
+                        wal.append_transaction(q)
+                    except Exception:
+                        _logger.error("execute_transaction_query: Failed to write the log", exc_info=True)
+                        return self._rollback_collections(buff=buff, non_exist_targets=non_exist_targets)
+
                 # commit: notify listeners
-                for key in buff.keys():
-                    col = self.collection(key)
+                for col in buff.values():
                     need_callback = col.run_notify_listeners_in_transaction
                     col.change_transaction_mode(False)
                     if need_callback:
@@ -576,7 +1546,7 @@ class DeltaTraceDatabase(CloneableFile):
                 return TransactionQueryResult(is_success=False, results=[], error_message="Unexpected Error")
 
     def _rollback_collections(self,
-                              buff: dict[str, dict[str, Any]],
+                              buff: dict[str, Collection],
                               non_exist_targets: set[str],
                               ) -> TransactionQueryResult:
         """
@@ -586,16 +1556,16 @@ class DeltaTraceDatabase(CloneableFile):
 
         Parameters
         ----------
-        buff: dict[str, dict[str, Any]]
-            The collection buffer that needs to be undone.
+        buff: dict[str, Collection]
+            The collections in transaction mode that need to be undone.
         non_exist_targets: set[str]
             A list of collections that did not exist before the operation.
         """
         # DBの変更を元に戻す。
-        for key in buff.keys():
-            self.collection_from_dict_keep_listener(key, buff[key])
+        for col in buff.values():
+            col.rollback_transaction()
             # 念のため確実に false にする。
-            self.collection(key).change_transaction_mode(False)
+            col.change_transaction_mode(False)
         # 操作前に存在しなかったコレクションは削除する。
         for key in non_exist_targets:
             self.remove_collection(key)
@@ -717,10 +1687,12 @@ class DeltaTraceDatabase(CloneableFile):
             # 新しいコレクションとして追加
             if mqp.serial_base is not None:
                 # シリアルナンバーを引き継ぐ
-                self._collections[mqp.output] = Collection.from_data(
+                col = Collection.from_data(
                     new_data,
                     self.find_collection(mqp.serial_base).get_serial_num(),
                 )
+                with self._lock:
+                    self._collections[mqp.output] = col
             else:
                 # serial_key 依存でシリアル追加
                 added_result = (
@@ -0,0 +1,12 @@
+# coding: utf-8
+from enum import Enum
+
+
+class EnumConcurrencyMode(Enum):
+    """
+    (en) An enum that defines how the DB controls concurrent access from multiple threads.
+
+    (ja) 複数のスレッドからの同時アクセスを、DBがどのように制御するかを定義したEnumです。
+    """
+    global_ = "global_"  # DB全体を単一のロックで排他する
+    collection_ = "collection_"  # コレクション毎の読み書きロック
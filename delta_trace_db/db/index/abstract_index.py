@@ -0,0 +1,182 @@
+# coding: utf-8
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterable, Optional
+
+from delta_trace_db.db.index.enum_index_type import EnumIndexType
+from delta_trace_db.query.nodes.query_node import QueryNode
+
+
+class AbstractIndex(ABC):
+    def __init__(self, field: str):
+        """
+        (en) Base class for indexes held by a Collection.
+        Records are tracked by their object identity,
+        so the index stays valid as long as the records are changed via queries.
+
+        (ja) コレクションが保持するインデックスの基底クラスです。
+        レコードはオブジェクトの同一性で管理されるため、
+        クエリ経由で変更される限りインデックスは正しい状態に保たれます。
+
+        Parameters
+        ----------
+        field: str
+            The target variable name. Nested fields can be specified with "." like user.name.
+        """
+        self.field = field
+        self._root_key = field.split('.')[0]
+
+    @property
+    @abstractmethod
+    def index_type(self) -> EnumIndexType:
+        """
+        (en) The type of this index.
+
+        (ja) このインデックスの種類です。
+        """
+        pass
+
+    @abstractmethod
+    def new_instance(self) -> "AbstractIndex":
+        """
+        (en) Returns a new empty index with the same settings as this index.
+
+        (ja) このインデックスと同じ設定の、空のインデックスを返します。
+        """
+        pass
+
+    @abstractmethod
+    def add(self, item: Dict[str, Any]) -> None:
+        """
+        (en) Adds a record to the index.
+
+        (ja) レコードをインデックスに追加します。
+
+        Parameters
+        ----------
+        item: Dict[str, Any]
+            The target record.
+        """
+        pass
+
+    @abstractmethod
+    def remove(self, item: Dict[str, Any]) -> None:
+        """
+        (en) Removes a record from the index.
+        If the record is not registered, this does nothing.
+
+        (ja) レコードをインデックスから削除します。
+        登録されていないレコードの場合は何もしません。
+
+        Parameters
+        ----------
+        item: Dict[str, Any]
+            The target record.
+        """
+        pass
+
+    @abstractmethod
+    def clear(self) -> None:
+        """
+        (en) Removes all records from the index.
+
+        (ja) インデックスから全てのレコードを削除します。
+        """
+        pass
+
+    @abstractmethod
+    def find(self, node: QueryNode) -> Optional[Dict[int, Dict[str, Any]]]:
+        """
+        (en) Returns the candidate records for the specified node,
+        keyed by the id of each record.
+        The candidates always include every record that matches the node,
+        but may include records that do not match, so they must be evaluated again.
+        Returns None if this index cannot be used for the node.
+        The returned dict may be held internally, so do not modify it.
+
+        (ja) 指定ノードに対する候補レコードを、レコードのidをキーとした辞書で返します。
+        候補にはノードにマッチする全てのレコードが必ず含まれますが、
+        マッチしないレコードが含まれる可能性もあるため、再度評価する必要があります。
+        このインデックスが利用できないノードの場合はNoneを返します。
+        戻り値の辞書は内部で保持されている場合があるため、変更しないでください。
+
+        Parameters
+        ----------
+        node: QueryNode
+            The node of the query.
+        """
+        pass
+
+    def estimate(self, node: QueryNode) -> Optional[int]:
+        """
+        (en) Returns the number of candidate records for the specified node,
+        or None if this index cannot be used for the node.
+        This is used to estimate the selectivity of the node when planning a query.
+
+        (ja) 指定ノードに対する候補レコードの件数を返します。
+        このインデックスが利用できないノードの場合はNoneを返します。
+        これはクエリの計画時に、ノードの選択率を見積もるために使用されます。
+
+        Parameters
+        ----------
+        node: QueryNode
+            The node of the query.
+        """
+        r = self.find(node)
+        return None if r is None else len(r)
+
+    def add_all(self, items: Iterable[Dict[str, Any]]) -> None:
+        """
+        (en) Adds multiple records to the index.
+
+        (ja) 複数のレコードをインデックスに追加します。
+
+        Parameters
+        ----------
+        items: Iterable[Dict[str, Any]]
+            The target records.
+        """
+        for item in items:
+            self.add(item)
+
+    def update(self, item: Dict[str, Any]) -> None:
+        """
+        (en) Re-indexes a record whose content has been changed.
+
+        (ja) 内容が変更されたレコードのインデックスを更新します。
+
+        Parameters
+        ----------
+        item: Dict[str, Any]
+            The target record.
+        """
+        self.remove(item)
+        self.add(item)
+
+    def rebuild(self, items: Iterable[Dict[str, Any]]) -> None:
+        """
+        (en) Discards the current contents and rebuilds the index from the records.
+
+        (ja) 現在の内容を破棄し、レコードからインデックスを再構築します。
+
+        Parameters
+        ----------
+        items: Iterable[Dict[str, Any]]
+            All records of the collection.
+        """
+        self.clear()
+        self.add_all(items)
+
+    def is_affected_by(self, keys: Iterable[str]) -> bool:
+        """
+        (en) Returns true if changing the specified top-level keys
+        may change the indexed value.
+
+        (ja) 指定したトップレベルのキーの変更で、
+        インデックス対象の値が変化する可能性がある場合はtrueを返します。
+
+        Parameters
+        ----------
+        keys: Iterable[str]
+            The changed top-level keys.
+        """
+        return self._root_key in keys
@@ -0,0 +1,12 @@
+# coding: utf-8
+from enum import Enum
+
+
+class EnumIndexType(Enum):
+    """
+    (en) An enum that defines the type of index that can be set on a collection.
+
+    (ja) コレクションに設定可能なインデックスの種類を定義したEnumです。
+    """
+    hash_ = "hash_"  # FieldEquals / FieldIn 用
+    sorted_ = "sorted_"  # 大小比較及びSingleSort用
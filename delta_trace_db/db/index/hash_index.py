@@ -0,0 +1,162 @@
+# coding: utf-8
+from typing import Any, Dict, Iterable, Optional, override
+
+from delta_trace_db.db.index.abstract_index import AbstractIndex
+from delta_trace_db.db.index.enum_index_type import EnumIndexType
+from delta_trace_db.query.nodes.comparison_node import FieldEquals, FieldIn
+from delta_trace_db.query.nodes.enum_value_type import EnumValueType
+from delta_trace_db.query.nodes.query_node import QueryNode
+from delta_trace_db.query.util_field import UtilField
+
+# リストや辞書など、ハッシュできない値を持つレコードを表すキー。
+_UNHASHABLE = object()
+
+
+class _Bucket(dict):
+    """
+    (en) A bucket that holds multiple records with the same key.
+    A key with only one record holds the record directly instead of this.
+
+    (ja) 同じキーを持つ複数のレコードを保持するバケットです。
+    レコードが1件のみのキーでは、これの代わりにレコードを直接保持します。
+    """
+    pass
+
+
+def _is_hashable(value: Any) -> bool:
+    try:
+        hash(value)
+        return True
+    except TypeError:
+        return False
+
+
+class HashIndex(AbstractIndex):
+    def __init__(self, field: str):
+        """
+        (en) An index that groups records by the value of the target field.
+        It is used for FieldEquals (auto_ only) and FieldIn.
+        Missing fields are indexed as None,
+        in the same way as they are treated during evaluation.
+
+        (ja) 対象フィールドの値でレコードをまとめるインデックスです。
+        FieldEquals(auto_のみ)及びFieldInで利用されます。
+        存在しないフィールドは、評価時と同様にNoneとしてインデックスされます。
+
+        Parameters
+        ----------
+        field: str
+            The target variable name. Nested fields can be specified with "." like user.name.
+        """
+        super().__init__(field)
+        self._get_value = UtilField.make_getter(field)
+        # key -> レコード、または同じキーの複数レコードを持つ_Bucket
+        self._buckets: Dict[Any, Any] = {}
+        self._unhashable: Dict[int, Dict[str, Any]] = {}
+        self._keys: Dict[int, Any] = {}
+
+    @property
+    @override
+    def index_type(self) -> EnumIndexType:
+        return EnumIndexType.hash_
+
+    @override
+    def new_instance(self) -> "HashIndex":
+        return HashIndex(self.field)
+
+    @override
+    def add(self, item: Dict[str, Any]) -> None:
+        self.add_all((item,))
+
+    @override
+    def add_all(self, items: Iterable[Dict[str, Any]]) -> None:
+        get_value = self._get_value
+        buckets = self._buckets
+        keys = self._keys
+        for item in items:
+            key = get_value(item)
+            item_id = id(item)
+            try:
+                current = buckets.get(key)
+            except TypeError:
+                self._unhashable[item_id] = item
+                keys[item_id] = _UNHASHABLE
+                continue
+            if current is None:
+                buckets[key] = item
+            elif type(current) is _Bucket:
+                current[item_id] = item
+            else:
+                buckets[key] = _Bucket({id(current): current, item_id: item})
+            keys[item_id] = key
+
+    @override
+    def remove(self, item: Dict[str, Any]) -> None:
+        item_id = id(item)
+        if item_id not in self._keys:
+            return
+        key = self._keys.pop(item_id)
+        if key is _UNHASHABLE:
+            self._unhashable.pop(item_id, None)
+            return
+        current = self._buckets[key]
+        if type(current) is _Bucket:
+            current.pop(item_id, None)
+            if len(current) == 1:
+                self._buckets[key] = next(iter(current.values()))
+        elif current is item:
+            del self._buckets[key]
+
+    @override
+    def update(self, item: Dict[str, Any]) -> None:
+        new_key = self._get_value(item)
+        old_key = self._keys.get(id(item), _UNHASHABLE)
+        # キーが変化していなければ何もしない。
+        if old_key is not _UNHASHABLE and _is_hashable(new_key) and type(old_key) is type(new_key) \
+                and old_key == new_key:
+            return
+        super().update(item)
+
+    @override
+    def clear(self) -> None:
+        self._buckets.clear()
+        self._unhashable.clear()
+        self._keys.clear()
+
+    @override
+    def find(self, node: QueryNode) -> Optional[Dict[int, Dict[str, Any]]]:
+        if isinstance(node, FieldEquals):
+            if node.field != self.field or node.v_type != EnumValueType.auto_:
+                return None
+            return self._find_value(node.value)
+        if isinstance(node, FieldIn):
+            if node.field != self.field:
+                return None
+            if len(node.values) == 1:
+                return self._find_value(node.values[0])
+            r: Dict[int, Dict[str, Any]] = {}
+            for v in node.values:
+                r.update(self._find_value(v))
+            return r
+        return None
+
+    def _find_value(self, value: Any) -> Dict[int, Dict[str, Any]]:
+        """
+        (en) Returns the records that may be equal to the specified value.
+
+        (ja) 指定値と等しい可能性のあるレコードを返します。
+
+        Parameters
+        ----------
+        value: Any
+            The compare value.
+        """
+        if not _is_hashable(value):
+            # ハッシュできない値と等しくなり得るのは、ハッシュできない値のみ。
+            return self._unhashable
+        current = self._buckets.get(value)
+        if current is None:
+            return {}
+        if type(current) is _Bucket:
+            return current
+        return {id(current): current}
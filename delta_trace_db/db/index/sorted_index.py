@@ -0,0 +1,439 @@
+# coding: utf-8
+import math
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, override
+
+from delta_trace_db.db.index.abstract_index import AbstractIndex
+from delta_trace_db.db.index.enum_index_type import EnumIndexType
+from delta_trace_db.query.nodes.comparison_node import FieldGreaterThan, FieldLessThan, FieldGreaterThanOrEqual, \
+    FieldLessThanOrEqual, FieldStartsWith, FieldMatchesRegex
+from delta_trace_db.query.nodes.enum_value_type import EnumValueType
+from delta_trace_db.query.nodes.query_node import QueryNode
+from delta_trace_db.query.sort.abstract_sort import AbstractSort
+from delta_trace_db.query.sort.single_sort import SingleSort
+from delta_trace_db.query.util_field import UtilField
+
+# キーの分類用。
+_NULL = object()  # フィールドがNone(存在しない場合も含む)。
+_NEVER = object()  # 変換に失敗するなど、範囲比較で常にFalseになる値。
+_IRREGULAR = object()  # 大小比較の結果を事前に判定できない値。常に候補として扱う。
+
+# 一度に追加する件数がこれ以上の場合は、挿入ではなく再ソートで登録する。
+_BULK_THRESHOLD = 64
+
+
+class _Partition:
+    __slots__ = ("keys", "items")
+
+    def __init__(self):
+        """
+        (en) Sorted keys and records whose keys are comparable with each other.
+
+        (ja) 相互に比較可能なキーとレコードを、キーの順に保持するクラスです。
+        """
+        self.keys: List[Any] = []
+        self.items: List[Dict[str, Any]] = []
+
+    def insert(self, key: Any, item: Dict[str, Any]):
+        i = bisect_right(self.keys, key)
+        self.keys.insert(i, key)
+        self.items.insert(i, item)
+
+    def extend(self, pairs: List[Tuple[Any, Dict[str, Any]]]):
+        # 安定ソートのため、同一キーの既存要素の後ろに新しい要素が並ぶ。
+        merged = list(zip(self.keys, self.items))
+        merged.extend(pairs)
+        merged.sort(key=lambda e: e[0])
+        self.keys = [e[0] for e in merged]
+        self.items = [e[1] for e in merged]
+
+    def remove(self, key: Any, item: Dict[str, Any]):
+        lo = bisect_left(self.keys, key)
+        hi = bisect_right(self.keys, key)
+        for i in range(lo, hi):
+            if self.items[i] is item:
+                del self.keys[i]
+                del self.items[i]
+                return
+
+
+class SortedIndex(AbstractIndex):
+    def __init__(self, field: str, v_type: EnumValueType = EnumValueType.auto_):
+        """
+        (en) An index that holds records in the order of the value of the target field.
+        It is used for FieldGreaterThan, FieldLessThan, FieldGreaterThanOrEqual and
+        FieldLessThanOrEqual with the same v_type as this index,
+        and only the matching range of records is evaluated.
+        When v_type is auto_ or string_,
+        it is also used for SingleSort on the same field with the same v_type,
+        and for FieldStartsWith and FieldMatchesRegex anchored by a literal prefix.
+        For auto_, the prefix search is used only if all values are strings.
+        The values are converted in the same way as the query nodes do during evaluation.
+
+        (ja) 対象フィールドの値の順にレコードを保持するインデックスです。
+        このインデックスと同じv_typeのFieldGreaterThan、FieldLessThan、
+        FieldGreaterThanOrEqual、FieldLessThanOrEqualで利用され、
+        該当する範囲のレコードのみが評価されます。
+        v_typeがauto_またはstring_の場合は、同じフィールド、同じv_typeのSingleSort、
+        及びFieldStartsWithと、リテラルの接頭辞で先頭に固定されたFieldMatchesRegexでも利用されます。
+        auto_の場合、接頭辞による検索は全ての値が文字列である場合のみ利用されます。
+        値は、クエリノードの評価時と同じ方法で変換されます。
+
+        Parameters
+        ----------
+        field: str
+            The target variable name. Nested fields can be specified with "." like user.name.
+        v_type: EnumValueType
+            The comparison type. auto_, datetime_, int_, floatStrict_ and string_ are supported.
+
+        Raises
+        ------
+        ValueError
+            If an unsupported v_type is specified.
+        """
+        super().__init__(field)
+        if v_type not in (EnumValueType.auto_, EnumValueType.datetime_, EnumValueType.int_,
+                          EnumValueType.floatStrict_, EnumValueType.string_):
+            raise ValueError("Unsupported value type for sorted index")
+        self.v_type = v_type
+        self._partitions: Dict[str, _Partition] = {}
+        self._nulls: Dict[int, Dict[str, Any]] = {}
+        self._irregular: Dict[int, Dict[str, Any]] = {}
+        self._keys: Dict[int, Tuple[Any, Any, type]] = {}  # id -> (partition名または分類, key, 元の値の型)
+        self._type_counts: Dict[type, int] = {}  # None以外の値の型ごとの件数
+
+    @property
+    @override
+    def index_type(self) -> EnumIndexType:
+        return EnumIndexType.sorted_
+
+    @override
+    def new_instance(self) -> "SortedIndex":
+        return SortedIndex(self.field, v_type=self.v_type)
+
+    def _to_key(self, value: Any) -> Tuple[Any, Any]:
+        """
+        (en) Converts the field value to a pair of the partition name and the key.
+
+        (ja) フィールドの値を、パーティション名とキーの組に変換します。
+
+        Parameters
+        ----------
+        value: Any
+            The field value.
+        """
+        if value is None:
+            return _NULL, None
+        try:
+            match self.v_type:
+                case EnumValueType.auto_:
+                    if isinstance(value, (bool, int)):
+                        return "num", value
+                    if isinstance(value, float):
+                        return (_IRREGULAR, None) if math.isnan(value) else ("num", value)
+                    if isinstance(value, str):
+                        return "str", value
+                    return _IRREGULAR, None
+                case EnumValueType.datetime_:
+                    v = datetime.fromisoformat(str(value))
+                    return ("aware" if v.utcoffset() is not None else "naive"), v
+                case EnumValueType.int_:
+                    return "", int(str(value))
+                case EnumValueType.floatStrict_:
+                    v = float(str(value))
+                    return (_NEVER, None) if math.isnan(v) else ("", v)
+                case EnumValueType.string_:
+                    return "", str(value)
+        except Exception:
+            return _NEVER, None
+        return _NEVER, None
+
+    def _compare_key(self, value: Any) -> Optional[Tuple[Any, Any]]:
+        """
+        (en) Converts the compare value of the query node to a pair of
+        the partition name and the key.
+        Returns (_NEVER, None) if no record can match,
+        or None if this index cannot be used.
+
+        (ja) クエリノードの比較値を、パーティション名とキーの組に変換します。
+        マッチするレコードが存在し得ない場合は(_NEVER, None)を、
+        このインデックスが利用できない場合はNoneを返します。
+
+        Parameters
+        ----------
+        value: Any
+            The compare value of the query node.
+        """
+        if value is None:
+            return _NEVER, None
+        try:
+            match self.v_type:
+                case EnumValueType.auto_:
+                    if isinstance(value, (bool, int)):
+                        return "num", value
+                    if isinstance(value, float):
+                        return (_NEVER, None) if math.isnan(value) else ("num", value)
+                    if isinstance(value, str):
+                        return "str", value
+                    return None
+                case EnumValueType.datetime_:
+                    if not isinstance(value, datetime):
+                        return _NEVER, None
+                    return ("aware" if value.utcoffset() is not None else "naive"), value
+                case EnumValueType.int_:
+                    return "", int(value)
+                case EnumValueType.floatStrict_:
+                    v = float(value)
+                    return (_NEVER, None) if math.isnan(v) else ("", v)
+                case EnumValueType.string_:
+                    return "", str(value)
+        except Exception:
+            return _NEVER, None
+        return None
+
+    def _register(self, item: Dict[str, Any]) -> Optional[Tuple[str, Any]]:
+        """
+        (en) Registers the record except for the sorted partitions,
+        and returns the partition name and key if it should be added to a partition.
+
+        (ja) ソート済みパーティション以外への登録を行い、
+        パーティションへの追加が必要な場合はパーティション名とキーを返します。
+
+        Parameters
+        ----------
+        item: Dict[str, Any]
+            The target record.
+        """
+        value = UtilField.get_nested_field_value(item, self.field)
+        if value is not None:
+            t = type(value)
+            self._type_counts[t] = self._type_counts.get(t, 0) + 1
+        part, key = self._to_key(value)
+        item_id = id(item)
+        self._keys[item_id] = (part, key, type(value))
+        if part is _NULL:
+            self._nulls[item_id] = item
+        elif part is _IRREGULAR:
+            self._irregular[item_id] = item
+        elif part is not _NEVER:
+            return part, key
+        return None
+
+    def _partition(self, name: str) -> _Partition:
+        p = self._partitions.get(name)
+        if p is None:
+            p = _Partition()
+            self._partitions[name] = p
+        return p
+
+    @override
+    def add(self, item: Dict[str, Any]) -> None:
+        r = self._register(item)
+        if r is not None:
+            self._partition(r[0]).insert(r[1], item)
+
+    @override
+    def add_all(self, items: Iterable[Dict[str, Any]]) -> None:
+        items = list(items)
+        if len(items) < _BULK_THRESHOLD:
+            for item in items:
+                self.add(item)
+            return
+        pending: Dict[str, List[Tuple[Any, Dict[str, Any]]]] = {}
+        for item in items:
+            r = self._register(item)
+            if r is not None:
+                pending.setdefault(r[0], []).append((r[1], item))
+        for name, pairs in pending.items():
+            self._partition(name).extend(pairs)
+
+    @override
+    def remove(self, item: Dict[str, Any]) -> None:
+        item_id = id(item)
+        if item_id not in self._keys:
+            return
+        part, key, t = self._keys.pop(item_id)
+        if t is not type(None):
+            self._type_counts[t] -= 1
+            if self._type_counts[t] == 0:
+                del self._type_counts[t]
+        if part is _NULL:
+            self._nulls.pop(item_id, None)
+        elif part is _IRREGULAR:
+            self._irregular.pop(item_id, None)
+        elif part is not _NEVER:
+            self._partitions[part].remove(key, item)
+
+    @override
+    def clear(self) -> None:
+        self._partitions.clear()
+        self._nulls.clear()
+        self._irregular.clear()
+        self._keys.clear()
+        self._type_counts.clear()
+
+    @override
+    def rebuild(self, items: Iterable[Dict[str, Any]]) -> None:
+        self.clear()
+        self.add_all(items)
+
+    @override
+    def find(self, node: QueryNode) -> Optional[Dict[int, Dict[str, Any]]]:
+        matched = self._matching_range(node)
+        if matched is None:
+            return None
+        with_irregular, items, start, end = matched
+        r: Dict[int, Dict[str, Any]] = dict(self._irregular) if with_irregular else {}
+        for item in items[start:end]:
+            r[id(item)] = item
+        return r
+
+    @override
+    def estimate(self, node: QueryNode) -> Optional[int]:
+        matched = self._matching_range(node)
+        if matched is None:
+            return None
+        with_irregular, _, start, end = matched
+        return (len(self._irregular) if with_irregular else 0) + end - start
+
+    def _matching_range(self, node: QueryNode) -> Optional[Tuple[bool, List[Dict[str, Any]], int, int]]:
+        """
+        (en) Returns the range of the sorted records that may match the node,
+        as a tuple of (whether irregular records are included, sorted records, start, end).
+        Returns None if this index cannot be used for the node.
+
+        (ja) ノードにマッチする可能性のあるソート済みレコードの範囲を、
+        (不規則なレコードを含むかどうか, ソート済みレコード, 開始位置, 終了位置)のタプルで返します。
+        このインデックスが利用できないノードの場合はNoneを返します。
+
+        Parameters
+        ----------
+        node: QueryNode
+            The node of the query.
+        """
+        if isinstance(node, (FieldStartsWith, FieldMatchesRegex)):
+            return self._prefix_range(node)
+        if not isinstance(node, (FieldGreaterThan, FieldLessThan, FieldGreaterThanOrEqual, FieldLessThanOrEqual)):
+            return None
+        if node.field != self.field or node.v_type != self.v_type:
+            return None
+        ck = self._compare_key(node.value)
+        if ck is None:
+            return None
+        part_name, key = ck
+        if part_name is _NEVER:
+            return False, [], 0, 0
+        part = self._partitions.get(part_name)
+        if part is None:
+            return True, [], 0, 0
+        n = len(part.keys)
+        if isinstance(node, FieldGreaterThan):
+            return True, part.items, bisect_right(part.keys, key), n
+        if isinstance(node, FieldGreaterThanOrEqual):
+            return True, part.items, bisect_left(part.keys, key), n
+        if isinstance(node, FieldLessThan):
+            return True, part.items, 0, bisect_left(part.keys, key)
+        return True, part.items, 0, bisect_right(part.keys, key)
+
+    def _prefix_range(self, node: FieldStartsWith | FieldMatchesRegex) \
+            -> Optional[Tuple[bool, List[Dict[str, Any]], int, int]]:
+        """
+        (en) Returns the range of the records whose string value starts with
+        the prefix of the node, in the same format as _matching_range.
+
+        (ja) 文字列としての値がノードの接頭辞で始まるレコードの範囲を、
+        _matching_rangeと同じ形式で返します。
+
+        Parameters
+        ----------
+        node: FieldStartsWith | FieldMatchesRegex
+            The node of the query.
+        """
+        if node.field != self.field:
+            return None
+        prefix = node.value if isinstance(node, FieldStartsWith) else node.literal_prefix()
+        # 空の接頭辞では絞り込めない。
+        if not isinstance(prefix, str) or prefix == "":
+            return None
+        if self.v_type == EnumValueType.string_:
+            part_name = ""
+        elif self.v_type == EnumValueType.auto_ and not self._irregular \
+                and all(t is str for t in self._type_counts):
+            part_name = "str"
+        else:
+            return None
+        part = self._partitions.get(part_name)
+        if part is None:
+            return False, [], 0, 0
+        start = bisect_left(part.keys, prefix)
+        # 接頭辞の直後の文字列を上限とする。
+        upper = prefix.rstrip(chr(0x10FFFF))
+        if upper == "":
+            return False, part.items, start, len(part.keys)
+        upper = upper[:-1] + chr(ord(upper[-1]) + 1)
+        return False, part.items, start, bisect_left(part.keys, upper)
+
+    def can_order(self, sort_obj: AbstractSort) -> bool:
+        """
+        (en) Returns true if this index can produce the same order as the
+        specified sort object.
+        The values must be of a single type so that the sort does not raise
+        an exception due to incompatible types.
+
+        (ja) このインデックスで、指定のソートオブジェクトと同じ順序を生成できる場合はtrueを返します。
+        型の不一致によってソートが例外を送出しないよう、値は単一の型である必要があります。
+
+        Parameters
+        ----------
+        sort_obj: AbstractSort
+            The sort object.
+        """
+        if not isinstance(sort_obj, SingleSort):
+            return False
+        if sort_obj.field != self.field or sort_obj.v_type != self.v_type:
+            return False
+        if self.v_type == EnumValueType.string_:
+            return True
+        if self.v_type == EnumValueType.auto_:
+            return not self._irregular and len(self._type_counts) <= 1
+        return False
+
+    def ordered_groups(self, reversed_: bool) -> Iterator[List[Dict[str, Any]]]:
+        """
+        (en) Returns the groups of records with equal keys in the order of the keys.
+        The records with None are returned as the last group in ascending order,
+        and as the first group in descending order.
+        The order of the records within each group is not guaranteed.
+        This is only valid when can_order returns true.
+
+        (ja) 同じキーを持つレコードのグループを、キーの順に返します。
+        Noneのレコードは、昇順では最後のグループ、降順では最初のグループとして返されます。
+        各グループ内のレコードの順序は保証されません。
+        can_orderがtrueを返す場合のみ有効です。
+
+        Parameters
+        ----------
+        reversed_: bool
+            If true, returns in descending order.
+        """
+        if reversed_ and self._nulls:
+            yield list(self._nulls.values())
+        for part in self._partitions.values():
+            keys = part.keys
+            items = part.items
+            n = len(keys)
+            if not reversed_:
+                i = 0
+                while i < n:
+                    j = bisect_right(keys, keys[i], i)
+                    yield items[i:j]
+                    i = j
+            else:
+                j = n
+                while j > 0:
+                    i = bisect_left(keys, keys[j - 1], 0, j)
+                    yield items[i:j]
+                    j = i
+        if not reversed_ and self._nulls:
+            yield list(self._nulls.values())
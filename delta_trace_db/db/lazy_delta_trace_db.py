@@ -0,0 +1,178 @@
+# coding: utf-8
+import os
+from typing import Dict, List, Optional, override
+
+from delta_trace_db.db.delta_trace_db_collection import Collection
+from delta_trace_db.db.delta_trace_db_core import DeltaTraceDatabase
+from delta_trace_db.db.enum_concurrency_mode import EnumConcurrencyMode
+from delta_trace_db.db.util_collection_files import UtilCollectionFiles
+
+
+class LazyDeltaTraceDatabase(DeltaTraceDatabase):
+
+    def __init__(self, directory: Optional[str] = None,
+                 concurrency_mode: EnumConcurrencyMode = EnumConcurrencyMode.global_):
+        """
+        (en) A DeltaTraceDatabase that opens a directory saved with save_collections,
+        and loads each collection from its file only when it is first accessed.
+        Only the collection names are read when this is created,
+        so the startup time and memory depend only on the collections actually used.
+        Operations that need all collections, such as to_dict and raw, load all of them.
+        Collections are loaded by collection and find_collection, and therefore by queries,
+        in the same way as if they had been in memory from the start.
+        Since the files are decoded without validation, only open directories that you have saved yourself.
+
+        (ja) save_collectionsで保存したディレクトリを開き、
+        各コレクションを最初にアクセスされた時にのみそのファイルから読み込むDeltaTraceDatabaseです。
+        作成時にはコレクション名のみが読み込まれるため、
+        起動時間とメモリは実際に使用されるコレクションのみに依存します。
+        to_dictやrawなど、全てのコレクションを必要とする操作では全てが読み込まれます。
+        コレクションはcollectionとfind_collection、つまりクエリによって、
+        最初からメモリ上にあった場合と同様に読み込まれます。
+        ファイルは検証を行わずにデコードされるため、自分で保存したディレクトリのみを開いてください。
+
+        Parameters
+        ----------
+        directory : Optional[str]
+            The directory saved with save_collections.
+            If None or the directory does not exist, this starts empty.
+        concurrency_mode : EnumConcurrencyMode
+            How concurrent access from multiple threads is controlled. See DeltaTraceDatabase.
+        """
+        super().__init__(concurrency_mode=concurrency_mode)
+        self._directory: Optional[str] = directory
+        # まだ読み込まれていないコレクションの名前と、そのファイルのパス。
+        self._unloaded: Dict[str, str] = {} if directory is None else UtilCollectionFiles.list_files(directory)
+
+    @property
+    def directory(self) -> Optional[str]:
+        """
+        (en) The directory that this DB was opened from.
+
+        (ja) このDBを開いたディレクトリです。
+        """
+        return self._directory
+
+    def is_loaded(self, name: str) -> bool:
+        """
+        (en) Returns False if the specified collection exists in the directory
+        and has not been loaded yet, otherwise True.
+
+        (ja) 指定したコレクションがディレクトリに存在し、まだ読み込まれていない場合はFalseを、
+        それ以外の場合はTrueを返します。
+
+        Parameters
+        ----------
+        name : str
+            The collection name.
+        """
+        with self._lock:
+            return name in self._collections or name not in self._unloaded
+
+    def _hydrate(self, name: str):
+        """
+        (en) Loads the specified collection from its file if it has not been loaded yet.
+        The file is read outside the lock,
+        so other collections can be used while a large collection is being loaded.
+
+        (ja) 指定したコレクションがまだ読み込まれていない場合、そのファイルから読み込みます。
+        ファイルはロックの外で読み込まれるため、大きなコレクションの読み込み中も他のコレクションを使用できます。
+
+        Parameters
+        ----------
+        name : str
+            The collection name.
+        """
+        with self._lock:
+            if name in self._collections:
+                return
+            path = self._unloaded.get(name)
+        if path is None:
+            return
+        col = Collection.from_binary(UtilCollectionFiles.read(path))
+        with self._lock:
+            # 読み込み中に他のスレッドが読み込んだ、または削除した場合は破棄する。
+            if self._unloaded.pop(name, None) is not None and name not in self._collections:
+                self._collections[name] = col
+
+    def _hydrate_all(self):
+        """
+        (en) Loads all collections that have not been loaded yet.
+
+        (ja) まだ読み込まれていない全てのコレクションを読み込みます。
+        """
+        with self._lock:
+            names = list(self._unloaded.keys())
+        for name in names:
+            self._hydrate(name)
+
+    @override
+    def _collection_names(self) -> List[str]:
+        with self._lock:
+            return list(self._collections.keys()) + [k for k in self._unloaded if k not in self._collections]
+
+    @override
+    def _target_collections(self, names: List[str]) -> Dict[str, Collection]:
+        for name in names:
+            self._hydrate(name)
+        return super()._target_collections(names)
+
+    @override
+    def collection(self, name: str) -> Collection:
+        self._hydrate(name)
+        return super().collection(name)
+
+    @override
+    def find_collection(self, name: str) -> Optional[Collection]:
+        self._hydrate(name)
+        return super().find_collection(name)
+
+    @override
+    def remove_collection(self, name: str) -> None:
+        with self._lock:
+            self._unloaded.pop(name, None)
+            super().remove_collection(name)
+
+    @property
+    @override
+    def raw(self) -> Dict[str, Collection]:
+        self._hydrate_all()
+        return super().raw
+
+    @override
+    def save_collections(self, directory: Optional[str] = None):
+        """
+        (en) Saves each collection of this DB to its own file in the specified directory.
+        If the directory is omitted or is the directory this DB was opened from,
+        the collections that have not been loaded are not changed, so only the loaded ones are saved.
+        Otherwise all collections are loaded and saved. See DeltaTraceDatabase.save_collections.
+
+        (ja) このDBの各コレクションを、指定したディレクトリの個別のファイルに保存します。
+        ディレクトリを省略した場合、またはこのDBを開いたディレクトリの場合は、
+        読み込まれていないコレクションは変更されていないため、読み込まれたもののみが保存されます。
+        それ以外の場合は、全てのコレクションが読み込まれて保存されます。
+        DeltaTraceDatabase.save_collectionsも参照してください。
+
+        Parameters
+        ----------
+        directory : Optional[str]
+            The directory of the files. If None, the directory this DB was opened from is used.
+
+        Raises
+        ------
+        ValueError
+            If the directory is omitted and this DB was not opened from a directory.
+        """
+        if directory is None:
+            if self._directory is None:
+                raise ValueError("The directory is not specified")
+            directory = self._directory
+        is_own = self._directory is not None and os.path.isdir(directory) and os.path.isdir(self._directory) \
+            and os.path.samefile(directory, self._directory)
+        if not is_own:
+            super().save_collections(directory)
+            return
+        with self._lock:
+            unchanged = [k for k in self._unloaded if k not in self._collections]
+            names = list(self._collections.keys())
+        self._save_collections(directory, names, unchanged)
@@ -0,0 +1,221 @@
+# coding: utf-8
+from typing import Any, Dict, List, Optional, override
+
+from delta_trace_db.db.delta_trace_db_collection import Collection
+from delta_trace_db.db.index.abstract_index import AbstractIndex
+from delta_trace_db.db.mapped_segment import MappedSegment
+from delta_trace_db.db.util_query_planner import UtilQueryPlanner
+from delta_trace_db.query.nodes.query_node import QueryNode
+from delta_trace_db.query.query import Query
+from delta_trace_db.query.query_result import QueryResult
+
+
+class MappedCollection(Collection):
+
+    def __init__(self, segment: Optional[MappedSegment] = None):
+        """
+        (en) A collection that reads its records from a MappedSegment,
+        for large reference collections that rarely change.
+        While the segment is open, only the records touched by a query are decoded,
+        and the column arrays of the segment narrow down the records to decode in the same way as hash indexes.
+        The first write decodes all records into memory and closes the segment,
+        after which this behaves exactly like a normal Collection.
+        The segment file is never changed, so save the collection again to persist the writes.
+
+        (ja) ほとんど変更されない大きな参照用のコレクションのための、
+        MappedSegmentからレコードを読み込むコレクションです。
+        セグメントが開いている間は、クエリが触れたレコードのみがデコードされ、
+        セグメントの列の配列はハッシュインデックスと同様にデコードするレコードを絞り込みます。
+        最初の書き込みで全てのレコードがメモリ上にデコードされてセグメントは閉じられ、
+        以後は通常のCollectionと全く同様に動作します。
+        セグメントのファイルは変更されないため、書き込みを永続化するにはコレクションを再度保存してください。
+
+        Parameters
+        ----------
+        segment : Optional[MappedSegment]
+            The opened segment. If None, this starts as an empty in-memory collection.
+        """
+        super().__init__()
+        self._segment: Optional[MappedSegment] = segment
+        if segment is not None:
+            self._serial_num = segment.serial_num
+            self._serial_key = segment.serial_key
+
+    @classmethod
+    def open(cls, path: str) -> "MappedCollection":
+        """
+        (en) Opens the file written with MappedSegment.write or DeltaTraceDatabase.collection_to_mapped.
+
+        (ja) MappedSegment.write、またはDeltaTraceDatabase.collection_to_mappedで書き込んだファイルを開きます。
+
+        Parameters
+        ----------
+        path : str
+            The file path.
+
+        Raises
+        ------
+        ValueError
+            If the file is invalid format.
+        """
+        return cls(MappedSegment(path))
+
+    @property
+    def is_mapped(self) -> bool:
+        """
+        (en) True if the records are still read from the segment.
+
+        (ja) レコードがまだセグメントから読み込まれている場合はtrueです。
+        """
+        return self._segment is not None
+
+    def _materialize(self):
+        """
+        (en) Decodes all records of the segment into memory and closes it,
+        so that the collection can be changed.
+
+        (ja) コレクションを変更できるよう、セグメントの全てのレコードをメモリ上にデコードして閉じます。
+        """
+        segment = self._segment
+        if segment is None:
+            return
+        self._data = list(segment.records())
+        self._segment = None
+        segment.close()
+
+    def close(self):
+        """
+        (en) Closes the segment if it is still open. The records become empty.
+
+        (ja) セグメントがまだ開いている場合は閉じます。レコードは空になります。
+        """
+        segment = self._segment
+        if segment is not None:
+            self._segment = None
+            segment.close()
+
+    @property
+    @override
+    def length(self) -> int:
+        if self._segment is not None:
+            return self._segment.length
+        return super().length
+
+    @property
+    @override
+    def raw(self) -> List[Dict[str, Any]]:
+        # 参照を編集できるよう、メモリ上に展開してから返す。
+        self._materialize()
+        return super().raw
+
+    @override
+    def _compacted(self) -> List[Dict[str, Any]]:
+        if self._segment is not None:
+            # デコードしたリストは保持しない。
+            return list(self._segment.records())
+        return super()._compacted()
+
+    @override
+    def _scan_targets(self, node: Optional[QueryNode]) -> List[Dict[str, Any]]:
+        if self._segment is not None:
+            positions = self._segment.find(node)
+            return list(self._segment.records(positions))
+        return super()._scan_targets(node)
+
+    @override
+    def explain(self, q: Query) -> Dict[str, Any]:
+        if self._segment is None:
+            return super().explain(q)
+        node = self._plan(q.query_node)
+        positions = self._segment.find(node)
+        return {
+            'target': q.target,
+            'length': self.length,
+            'scan': 'full' if positions is None else 'column',
+            'scanCount': self.length if positions is None else len(positions),
+            'plan': None if node is None else UtilQueryPlanner.explain(node, None, self.length),
+        }
+
+    @override
+    def search_one(self, q: Query) -> QueryResult:
+        if self._segment is None:
+            return super().search_one(q)
+        r: List[Dict[str, Any]] = []
+        node = self._plan(q.query_node)
+        matches = node.compile()
+        # 最初のヒットまでのレコードのみをデコードする。
+        for item in self._segment.records(self._segment.find(node)):
+            if matches(item):
+                r.append(item)
+                break
+        return QueryResult(True, q.target, q.type, self._to_result(r), self.length, 0, len(r))
+
+    @override
+    def get_all(self, q: Query) -> QueryResult:
+        segment = self._segment
+        if segment is None or q.sort_obj is not None or q.cursor is not None or q.start_after is not None \
+                or q.end_before is not None or (q.limit is not None and q.limit < 0):
+            return super().get_all(q)
+        # 格納順のままの範囲指定では、返す範囲のレコードのみをデコードする。
+        length = segment.length
+        start = min(max(q.offset or 0, 0), length)
+        end = length if q.limit is None else min(start + q.limit, length)
+        r = list(segment.records(range(start, end)))
+        return QueryResult(True, q.target, q.type, self._to_result(r), length, 0, length,
+                           next_cursor=self._next_cursor(q, r))
+
+    @override
+    def rollback_transaction(self):
+        if self._segment is None:
+            super().rollback_transaction()
+            return
+        # 書き込みは必ず展開を伴うため、セグメントが開いている場合は何も変更されていない。
+        self._generation += 1
+        self._undo_log = None
+        self._serial_num = self._undo_serial_num
+
+    @override
+    def _register_index(self, index: AbstractIndex):
+        self._materialize()
+        super()._register_index(index)
+
+    @override
+    def add_all(self, q: Query) -> QueryResult:
+        self._materialize()
+        return super().add_all(q)
+
+    @override
+    def update(self, q: Query, is_single_target: bool) -> QueryResult:
+        self._materialize()
+        return super().update(q, is_single_target)
+
+    @override
+    def delete(self, q: Query) -> QueryResult:
+        self._materialize()
+        return super().delete(q)
+
+    @override
+    def delete_one(self, q: Query) -> QueryResult:
+        self._materialize()
+        return super().delete_one(q)
+
+    @override
+    def conform_to_template(self, q: Query) -> QueryResult:
+        self._materialize()
+        return super().conform_to_template(q)
+
+    @override
+    def rename_field(self, q: Query) -> QueryResult:
+        self._materialize()
+        return super().rename_field(q)
+
+    @override
+    def clear(self, q: Query) -> QueryResult:
+        # トランザクションで取り消せるよう、破棄する内容もメモリ上に展開する。
+        self._materialize()
+        return super().clear(q)
+
+    @override
+    def clear_add(self, q: Query) -> QueryResult:
+        self._materialize()
+        return super().clear_add(q)
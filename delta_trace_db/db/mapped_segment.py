@@ -0,0 +1,419 @@
+# coding: utf-8
+import json
+import marshal
+import mmap
+import os
+import struct
+import sys
+from array import array
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from delta_trace_db.query.nodes.comparison_node import FieldEquals, FieldIn
+from delta_trace_db.query.nodes.enum_value_type import EnumValueType
+from delta_trace_db.query.nodes.logical_node import AndNode, OrNode
+from delta_trace_db.query.nodes.query_node import QueryNode
+from delta_trace_db.query.util_field import UtilField
+
+# ファイル末尾に置く、識別子、marshalのバージョン、メタデータの位置とバイト数。
+_TRAILER = struct.Struct(">4sHQQ")
+_ITEM_SIZE = array("Q").itemsize
+
+
+def _pad(file: Any, position: int) -> int:
+    """
+    (en) Writes zero bytes so that the next array starts at a multiple of 8 bytes,
+    and returns the new position.
+
+    (ja) 次の配列が8バイトの倍数の位置から始まるよう0のバイトを書き込み、新しい位置を返します。
+
+    Parameters
+    ----------
+    file : Any
+        The binary file.
+    position : int
+        The current position.
+    """
+    padding = -position % _ITEM_SIZE
+    file.write(b"\0" * padding)
+    return position + padding
+
+
+class _Column:
+    """
+    (en) A column of a MappedSegment, which maps each value of a field to the positions of its records.
+    The positions stay in the mapping, and only the distinct values are decoded.
+
+    (ja) MappedSegmentの列で、フィールドの各値をそのレコードの位置に対応付けます。
+    位置はマッピング内に留まり、重複を除いた値のみがデコードされます。
+    """
+
+    def __init__(self, keys: List[Any], starts: Sequence[int], positions: Sequence[int]):
+        """
+        Parameters
+        ----------
+        keys : List[Any]
+            The distinct hashable values of the field.
+        starts : Sequence[int]
+            The start of the positions of each value in positions.
+            The last group holds the records with unhashable values.
+        positions : Sequence[int]
+            The positions of the records, grouped by the value in ascending order.
+        """
+        self.groups: Dict[Any, int] = {k: i for i, k in enumerate(keys)}
+        self.unhashable_group = len(keys)
+        self.starts = starts
+        self.positions = positions
+
+    def find_value(self, value: Any) -> Sequence[int]:
+        """
+        (en) Returns the positions of the records that may be equal to the specified value,
+        in the same way as HashIndex.
+
+        (ja) HashIndexと同様に、指定値と等しい可能性のあるレコードの位置を返します。
+
+        Parameters
+        ----------
+        value : Any
+            The compare value.
+        """
+        try:
+            group = self.groups.get(value)
+        except TypeError:
+            # ハッシュできない値と等しくなり得るのは、ハッシュできない値のみ。
+            group = self.unhashable_group
+        if group is None:
+            return ()
+        return self.positions[self.starts[group]:self.starts[group + 1]]
+
+
+class MappedSegment:
+    """
+    (en) A read-only file of the records of a collection, opened by memory mapping.
+    The file contains the records encoded by marshal, a table of their offsets,
+    and column arrays that map the values of the specified fields to the positions of the records.
+    Records are decoded only when they are accessed,
+    and the mapping is shared in the page cache by all processes that open the same file.
+    Since marshal does not validate the data, only open files that you have written yourself.
+
+    (ja) メモリマッピングで開く、コレクションのレコードの読み込み専用のファイルです。
+    ファイルには、marshalでエンコードしたレコードとそのオフセットの表、
+    及び指定したフィールドの値をレコードの位置に対応付ける列の配列が含まれます。
+    レコードはアクセスされた時にのみデコードされ、
+    マッピングは同じファイルを開いた全てのプロセスでページキャッシュ上で共有されます。
+    marshalはデータを検証しないため、自分で書き込んだファイルのみを開いてください。
+    """
+    magic = b"DTMS"
+
+    def __init__(self, path: str):
+        """
+        Parameters
+        ----------
+        path : str
+            The file written with write.
+
+        Raises
+        ------
+        ValueError
+            If the file is invalid format, or written by a newer version of Python.
+        """
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            size = os.fstat(self._file.fileno()).st_size
+            if size < _TRAILER.size:
+                raise ValueError("Invalid format: not a mapped segment")
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except BaseException:
+            self._file.close()
+            raise
+        self._views: List[memoryview] = []
+        try:
+            magic, marshal_version, meta_offset, meta_size = _TRAILER.unpack_from(self._map, size - _TRAILER.size)
+            if magic != self.magic:
+                raise ValueError("Invalid format: not a mapped segment")
+            if marshal_version > marshal.version:
+                raise ValueError("The mapped segment was written by a newer version of Python")
+            meta = marshal.loads(self._map[meta_offset:meta_offset + meta_size])
+            self.class_name: str = meta["className"]
+            self.version: str = meta["version"]
+            self.serial_num: int = meta["serialNum"]
+            self.serial_key: Optional[str] = meta["serialKey"]
+            self._length: int = meta["length"]
+            self._is_swapped: bool = meta["byteorder"] != sys.byteorder
+            self._offsets = self._array(meta["offsets"], self._length + 1)
+            self._column_meta: Dict[str, Tuple[int, int, int, int, int]] = meta["columns"]
+        except (EOFError, TypeError, KeyError) as e:
+            self.close()
+            raise ValueError("Invalid format: broken mapped segment") from e
+        except BaseException:
+            self.close()
+            raise
+        self._columns: Dict[str, _Column] = {}
+
+    @staticmethod
+    def write(path: str, data: Iterable[Dict[str, Any]], serial_num: int, columns: Iterable[str] = (),
+              serial_key: Optional[str] = None, class_name: str = "Collection", version: str = "1"):
+        """
+        (en) Writes the records to a file that can be opened with MappedSegment.
+        The file is written to a temporary file first and then renamed,
+        so the previous file remains if this fails.
+
+        (ja) レコードを、MappedSegmentで開けるファイルに書き込みます。
+        ファイルはまず一時ファイルに書き込まれてから名前が変更されるため、
+        これが失敗した場合は以前のファイルが残ります。
+
+        Parameters
+        ----------
+        path : str
+            The file path.
+        data : Iterable[Dict[str, Any]]
+            The records, which can contain only JSON compatible values.
+        serial_num : int
+            The serial number of the collection.
+        columns : Iterable[str]
+            The fields to store as column arrays, used in the same way as hash indexes.
+            Nested fields can be specified with "." like user.name.
+        serial_key : Optional[str]
+            The serial key of the collection, used for cursors.
+        class_name : str
+            The class name of the collection.
+        version : str
+            The version of the collection.
+        """
+        getters = {f: UtilField.make_getter(f) for f in columns}
+        groups: Dict[str, Dict[Any, array]] = {f: {} for f in getters}
+        unhashable: Dict[str, array] = {f: array("Q") for f in getters}
+        offsets = array("Q", [0])
+        tmp_path = path + ".tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                position = 0
+                for i, item in enumerate(data):
+                    try:
+                        payload = marshal.dumps(item)
+                    except ValueError:
+                        # スカラー型のサブクラスなど、marshalで扱えない型は通常の型に変換する。
+                        payload = marshal.dumps(json.loads(json.dumps(item)))
+                    f.write(payload)
+                    position += len(payload)
+                    offsets.append(position)
+                    for field, get_value in getters.items():
+                        key = get_value(item)
+                        try:
+                            positions = groups[field].get(key)
+                        except TypeError:
+                            unhashable[field].append(i)
+                            continue
+                        if positions is None:
+                            groups[field][key] = array("Q", (i,))
+                        else:
+                            positions.append(i)
+                position = _pad(f, position)
+                meta_offsets = position
+                f.write(offsets.tobytes())
+                position += len(offsets) * _ITEM_SIZE
+                column_meta: Dict[str, Tuple[int, int, int, int, int]] = {}
+                for field, by_key in groups.items():
+                    keys_bytes = marshal.dumps(list(by_key.keys()))
+                    starts = array("Q", [0])
+                    for positions in list(by_key.values()) + [unhashable[field]]:
+                        starts.append(starts[-1] + len(positions))
+                    keys_offset = position
+                    f.write(keys_bytes)
+                    position = _pad(f, position + len(keys_bytes))
+                    starts_offset = position
+                    f.write(starts.tobytes())
+                    position += len(starts) * _ITEM_SIZE
+                    positions_offset = position
+                    for positions in list(by_key.values()) + [unhashable[field]]:
+                        f.write(positions.tobytes())
+                        position += len(positions) * _ITEM_SIZE
+                    column_meta[field] = (keys_offset, len(keys_bytes), starts_offset, positions_offset,
+                                          len(by_key))
+                meta = marshal.dumps({
+                    "className": class_name,
+                    "version": version,
+                    "serialNum": serial_num,
+                    "serialKey": serial_key,
+                    "length": len(offsets) - 1,
+                    "byteorder": sys.byteorder,
+                    "offsets": meta_offsets,
+                    "columns": column_meta,
+                })
+                f.write(meta)
+                f.write(_TRAILER.pack(MappedSegment.magic, marshal.version, position, len(meta)))
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _array(self, offset: int, count: int) -> Sequence[int]:
+        """
+        (en) Returns the array of unsigned 64-bit integers at the specified offset.
+        It refers to the mapping without copying,
+        unless the file was written on a machine with a different byte order.
+
+        (ja) 指定位置にある符号なし64ビット整数の配列を返します。
+        ファイルが異なるバイト順のマシンで書き込まれた場合を除き、コピーせずにマッピングを参照します。
+
+        Parameters
+        ----------
+        offset : int
+            The offset in the file.
+        count : int
+            The number of the integers.
+        """
+        view = memoryview(self._map)[offset:offset + count * _ITEM_SIZE]
+        if self._is_swapped:
+            r = array("Q", view.tobytes())
+            view.release()
+            r.byteswap()
+            return r
+        self._views.append(view)
+        cast = view.cast("Q")
+        self._views.append(cast)
+        return cast
+
+    @property
+    def length(self) -> int:
+        """
+        (en) The number of the records.
+
+        (ja) レコード数です。
+        """
+        return self._length
+
+    @property
+    def columns(self) -> List[str]:
+        """
+        (en) The fields stored as column arrays.
+
+        (ja) 列の配列として格納されたフィールドです。
+        """
+        return list(self._column_meta.keys())
+
+    def record(self, position: int) -> Dict[str, Any]:
+        """
+        (en) Decodes the record at the specified position. A new object is returned each time.
+
+        (ja) 指定位置のレコードをデコードします。毎回新しいオブジェクトが返されます。
+
+        Parameters
+        ----------
+        position : int
+            The position of the record.
+        """
+        offsets = self._offsets
+        return marshal.loads(self._map[offsets[position]:offsets[position + 1]])
+
+    def records(self, positions: Optional[Iterable[int]] = None) -> Iterator[Dict[str, Any]]:
+        """
+        (en) Decodes the records at the specified positions one at a time.
+
+        (ja) 指定位置のレコードを一つずつデコードします。
+
+        Parameters
+        ----------
+        positions : Optional[Iterable[int]]
+            The positions of the records. If None, all records are decoded in order.
+        """
+        for i in range(self._length) if positions is None else positions:
+            yield self.record(i)
+
+    def _column(self, field: str) -> Optional[_Column]:
+        """
+        (en) Returns the column of the field, decoding its distinct values on first use,
+        or None if the field is not stored as a column.
+
+        (ja) フィールドの列を返します。重複を除いた値は最初の使用時にデコードされます。
+        フィールドが列として格納されていない場合はNoneを返します。
+
+        Parameters
+        ----------
+        field : str
+            The field name.
+        """
+        column = self._columns.get(field)
+        if column is None and field in self._column_meta:
+            keys_offset, keys_size, starts_offset, positions_offset, count = self._column_meta[field]
+            starts = self._array(starts_offset, count + 2)
+            column = _Column(marshal.loads(self._map[keys_offset:keys_offset + keys_size]), starts,
+                             self._array(positions_offset, starts[count + 1]))
+            self._columns[field] = column
+        return column
+
+    def find(self, node: Optional[QueryNode]) -> Optional[List[int]]:
+        """
+        (en) Returns the positions of the candidate records narrowed down by the column arrays,
+        in ascending order, or None if no column can be used.
+        As with indexes, the candidates must be evaluated again.
+
+        (ja) 列の配列で絞り込んだ候補レコードの位置を昇順で返します。
+        利用可能な列が無い場合はNoneを返します。
+        インデックスと同様に、候補は再度評価する必要があります。
+
+        Parameters
+        ----------
+        node : Optional[QueryNode]
+            The node of the query.
+        """
+        if node is None or not self._column_meta:
+            return None
+        r = self._find(node)
+        return None if r is None else sorted(r)
+
+    def _find(self, node: QueryNode) -> Optional[set]:
+        """
+        (en) Returns the set of the positions of the candidate records,
+        combining the conditions in the same way as the indexes of Collection.
+
+        (ja) Collectionのインデックスと同様に条件を組み合わせて、候補レコードの位置の集合を返します。
+
+        Parameters
+        ----------
+        node : QueryNode
+            The node of the query.
+        """
+        if isinstance(node, AndNode):
+            found = [r for r in (self._find(c) for c in node.conditions) if r is not None]
+            if not found:
+                return None
+            found.sort(key=len)
+            return found[0].intersection(*found[1:])
+        if isinstance(node, OrNode):
+            merged: set = set()
+            for c in node.conditions:
+                r = self._find(c)
+                if r is None:
+                    return None
+                merged.update(r)
+            return merged
+        if isinstance(node, FieldEquals):
+            column = self._column(node.field)
+            if column is None or node.v_type != EnumValueType.auto_:
+                return None
+            return set(column.find_value(node.value))
+        if isinstance(node, FieldIn):
+            column = self._column(node.field)
+            if column is None:
+                return None
+            r: set = set()
+            for v in node.values:
+                r.update(column.find_value(v))
+            return r
+        return None
+
+    def close(self):
+        """
+        (en) Closes the mapping and the file. The records can no longer be decoded.
+
+        (ja) マッピングとファイルを閉じます。以後、レコードはデコードできません。
+        """
+        self._columns = {}
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        if not self._map.closed:
+            self._map.close()
+        self._file.close()
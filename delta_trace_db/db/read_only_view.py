@@ -0,0 +1,133 @@
+# coding: utf-8
+from collections.abc import Mapping, Sequence
+from typing import Any, Dict, Iterator, List
+
+
+def _wrap(value: Any) -> Any:
+    """
+    (en) Wraps dicts and lists in read-only views. Other values are returned as is.
+
+    (ja) 辞書とリストを読み取り専用のビューで包みます。それ以外の値はそのまま返します。
+    """
+    t = type(value)
+    if t is dict:
+        return ReadOnlyDict(value)
+    if t is list:
+        return ReadOnlyList(value)
+    return value
+
+
+class ReadOnlyDict(Mapping):
+    __slots__ = ("_src",)
+
+    def __init__(self, src: Dict[str, Any]):
+        """
+        (en) A read-only view of a record held by the DB.
+        It is returned instead of a copy when read-only results are enabled
+        for the collection.
+        Nested dicts and lists are also returned as read-only views.
+        The DB never changes the viewed record,
+        so the contents are a snapshot at the time of the query.
+        Use to_mutable if you need an editable copy.
+
+        (ja) DBが保持するレコードの、読み取り専用のビューです。
+        コレクションで読み取り専用の結果が有効な場合に、コピーの代わりに返されます。
+        ネストされた辞書やリストも読み取り専用のビューとして返されます。
+        DBが参照先のレコードを変更することは無いため、内容はクエリ時点のスナップショットです。
+        編集可能なコピーが必要な場合はto_mutableを使用してください。
+
+        Parameters
+        ----------
+        src: Dict[str, Any]
+            The target dict.
+        """
+        self._src = src
+
+    def __getitem__(self, key: str) -> Any:
+        return _wrap(self._src[key])
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._src)
+
+    def __len__(self) -> int:
+        return len(self._src)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._src
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return _wrap(self._src.get(key, default))
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, ReadOnlyDict):
+            return self._src == other._src
+        if isinstance(other, dict):
+            return self._src == other
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"ReadOnlyDict({self._src!r})"
+
+    def to_mutable(self) -> Dict[str, Any]:
+        """
+        (en) Returns a deep copy of the contents as a normal dict.
+
+        (ja) 内容のディープコピーを通常の辞書として返します。
+        """
+        # 遅延インポート
+        from delta_trace_db.db.util_copy import UtilCopy
+        return UtilCopy.jsonable_deep_copy(self._src)
+
+
+class ReadOnlyList(Sequence):
+    __slots__ = ("_src",)
+
+    def __init__(self, src: List[Any]):
+        """
+        (en) A read-only view of a list in a record held by the DB.
+        Nested dicts and lists are also returned as read-only views.
+
+        (ja) DBが保持するレコード内のリストの、読み取り専用のビューです。
+        ネストされた辞書やリストも読み取り専用のビューとして返されます。
+
+        Parameters
+        ----------
+        src: List[Any]
+            The target list.
+        """
+        self._src = src
+
+    def __getitem__(self, index: Any) -> Any:
+        if isinstance(index, slice):
+            return ReadOnlyList(self._src[index])
+        return _wrap(self._src[index])
+
+    def __iter__(self) -> Iterator[Any]:
+        for v in self._src:
+            yield _wrap(v)
+
+    def __len__(self) -> int:
+        return len(self._src)
+
+    def __contains__(self, value: object) -> bool:
+        return value in self._src
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, ReadOnlyList):
+            return self._src == other._src
+        if isinstance(other, list):
+            return self._src == other
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"ReadOnlyList({self._src!r})"
+
+    def to_mutable(self) -> List[Any]:
+        """
+        (en) Returns a deep copy of the contents as a normal list.
+
+        (ja) 内容のディープコピーを通常のリストとして返します。
+        """
+        # 遅延インポート
+        from delta_trace_db.db.util_copy import UtilCopy
+        return UtilCopy.jsonable_deep_copy(self._src)
@@ -0,0 +1,139 @@
+# coding: utf-8
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class ResultCache:
+    def __init__(self, max_entries: int, max_bytes: int):
+        """
+        (en) An LRU cache of the results of read-only queries on a collection.
+        Each entry holds the stored records of the result, not their copies,
+        so it is valid only for the write generation of the collection in which it was made.
+        When an operation sees a newer generation, all entries are discarded.
+        The operations are guarded by a lock, since queries that only read
+        may run at the same time.
+
+        (ja) コレクションに対する読み込みのみのクエリの結果の、LRUキャッシュです。
+        各エントリは結果のレコードのコピーではなく格納されたレコードを保持するため、
+        作成された時点のコレクションの書き込みの世代でのみ有効です。
+        より新しい世代で操作された場合は、全てのエントリが破棄されます。
+        読み込みのみのクエリは同時に実行される場合があるため、各操作はロックで保護されます。
+
+        Parameters
+        ----------
+        max_entries: int
+            The maximum number of entries.
+        max_bytes: int
+            The maximum total estimated size of the entries in bytes.
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # キー -> (結果のレコード, ヒット数, 次のカーソル, 推定サイズ)
+        self._entries: OrderedDict[str, Tuple[List[Dict[str, Any]], int, Optional[str], int]] = OrderedDict()
+        self._generation: int = 0
+        self._bytes: int = 0
+        self.hits: int = 0
+        self.misses: int = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def estimate_size(records: List[Dict[str, Any]]) -> int:
+        """
+        (en) Returns the estimated size of the records in bytes.
+        Only the list and each record itself are counted, not the nested values.
+
+        (ja) レコードの推定サイズをバイト単位で返します。
+        リストと各レコード自体のみを数え、ネストした値は含みません。
+
+        Parameters
+        ----------
+        records: List[Dict[str, Any]]
+            The target records.
+        """
+        return sys.getsizeof(records) + sum(sys.getsizeof(item) for item in records)
+
+    def _sync(self, generation: int):
+        """
+        (en) Discards all entries if the generation is newer than that of the entries.
+
+        (ja) 世代がエントリの世代より新しい場合、全てのエントリを破棄します。
+
+        Parameters
+        ----------
+        generation: int
+            The current write generation of the collection.
+        """
+        if generation > self._generation:
+            self._entries.clear()
+            self._bytes = 0
+            self._generation = generation
+
+    def get(self, key: str, generation: int) -> Optional[Tuple[List[Dict[str, Any]], int, Optional[str], int]]:
+        """
+        (en) Returns the entry of the key made in the generation, or None if there is none.
+
+        (ja) その世代で作成されたキーのエントリを返します。無い場合はNoneを返します。
+
+        Parameters
+        ----------
+        key: str
+            The key of the query.
+        generation: int
+            The current write generation of the collection.
+        """
+        with self._lock:
+            self._sync(generation)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: str, generation: int, records: List[Dict[str, Any]], hit_count: int,
+            next_cursor: Optional[str]):
+        """
+        (en) Stores the result made in the generation.
+        Results made in an older generation, or larger than the byte limit, are not stored.
+
+        (ja) その世代で作成された結果を格納します。
+        古い世代で作成された結果や、バイト数の上限より大きい結果は格納されません。
+
+        Parameters
+        ----------
+        key: str
+            The key of the query.
+        generation: int
+            The write generation of the collection in which the result was made.
+        records: List[Dict[str, Any]]
+            The stored records of the result.
+        hit_count: int
+            The number of hits before paging.
+        next_cursor: Optional[str]
+            The cursor for the next page.
+        """
+        size = self.estimate_size(records) + sys.getsizeof(key)
+        with self._lock:
+            self._sync(generation)
+            if generation < self._generation or size > self.max_bytes:
+                return
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[3]
+            self._entries[key] = (records, hit_count, next_cursor, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted[3]
+
+    def stats(self) -> Dict[str, int]:
+        """
+        (en) Returns the number of hits, misses and entries, and the total estimated size in bytes.
+
+        (ja) ヒット数、ミス数、エントリ数、及びバイト単位の推定サイズの合計を返します。
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries), "bytes": self._bytes}
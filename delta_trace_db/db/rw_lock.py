@@ -0,0 +1,125 @@
+# coding: utf-8
+from contextlib import contextmanager
+from threading import Condition, Lock, get_ident
+from typing import Dict, Iterator, Optional
+
+
+class RWLock:
+    def __init__(self):
+        """
+        (en) A readers-writer lock.
+        Multiple threads can hold the read lock at the same time,
+        while the write lock is held by only one thread, excluding readers.
+        Waiting writers take precedence over new readers, so writers are not starved.
+        Both locks are reentrant, and the thread holding the write lock
+        can also acquire the read lock.
+        Upgrading from the read lock to the write lock is not supported.
+
+        (ja) 読み書きロックです。
+        読み込みロックは複数のスレッドが同時に保持でき、
+        書き込みロックは読み込みも含めて排他し、１つのスレッドのみが保持できます。
+        待機中の書き込みは新しい読み込みよりも優先されるため、書き込みが待たされ続けることはありません。
+        どちらのロックも再入可能で、書き込みロックを保持するスレッドは読み込みロックも取得できます。
+        読み込みロックから書き込みロックへの昇格はサポートされていません。
+        """
+        self._cond = Condition(Lock())
+        self._readers: Dict[int, int] = {}  # スレッドID -> 保持数
+        self._writer: Optional[int] = None
+        self._writer_count: int = 0
+        self._waiting_writers: int = 0
+
+    def acquire_read(self):
+        """
+        (en) Acquires the read lock, blocking while another thread writes or waits to write.
+
+        (ja) 読み込みロックを取得します。他のスレッドが書き込み中、または書き込み待ちの間はブロックします。
+        """
+        me = get_ident()
+        with self._cond:
+            if self._writer == me or me in self._readers:
+                self._readers[me] = self._readers.get(me, 0) + 1
+                return
+            while self._writer is not None or self._waiting_writers > 0:
+                self._cond.wait()
+            self._readers[me] = 1
+
+    def release_read(self):
+        """
+        (en) Releases the read lock.
+
+        (ja) 読み込みロックを解放します。
+        """
+        me = get_ident()
+        with self._cond:
+            count = self._readers[me] - 1
+            if count > 0:
+                self._readers[me] = count
+                return
+            del self._readers[me]
+            if not self._readers:
+                self._cond.notify_all()
+
+    def acquire_write(self):
+        """
+        (en) Acquires the write lock, blocking while other threads hold either lock.
+
+        (ja) 書き込みロックを取得します。他のスレッドがいずれかのロックを保持している間はブロックします。
+
+        Raises
+        ------
+        RuntimeError
+            If the calling thread holds only the read lock.
+        """
+        me = get_ident()
+        with self._cond:
+            if self._writer == me:
+                self._writer_count += 1
+                return
+            if me in self._readers:
+                raise RuntimeError("Cannot upgrade a read lock to a write lock")
+            self._waiting_writers += 1
+            try:
+                while self._writer is not None or self._readers:
+                    self._cond.wait()
+            finally:
+                self._waiting_writers -= 1
+            self._writer = me
+            self._writer_count = 1
+
+    def release_write(self):
+        """
+        (en) Releases the write lock.
+
+        (ja) 書き込みロックを解放します。
+        """
+        with self._cond:
+            self._writer_count -= 1
+            if self._writer_count == 0:
+                self._writer = None
+                self._cond.notify_all()
+
+    @contextmanager
+    def read(self) -> Iterator[None]:
+        """
+        (en) A context manager that holds the read lock.
+
+        (ja) 読み込みロックを保持するコンテキストマネージャです。
+        """
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write(self) -> Iterator[None]:
+        """
+        (en) A context manager that holds the write lock.
+
+        (ja) 書き込みロックを保持するコンテキストマネージャです。
+        """
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
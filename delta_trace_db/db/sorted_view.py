@@ -0,0 +1,312 @@
+# coding: utf-8
+import json
+from bisect import bisect_left, bisect_right
+from typing import Any, Dict, Iterable, List, Optional
+
+from delta_trace_db.query.nodes.enum_value_type import EnumValueType
+from delta_trace_db.query.sort.abstract_sort import AbstractSort
+from delta_trace_db.query.sort.multi_sort import MultiSort
+from delta_trace_db.query.sort.single_sort import SingleSort
+from delta_trace_db.query.util_field import UtilField
+
+# 同値の範囲がこれ以下の場合は、格納位置による二分探索ではなく線形に探す。
+_LINEAR_SEARCH_LIMIT = 16
+
+
+class SortedView:
+    def __init__(self, sort_obj: AbstractSort, fields: List[str]):
+        """
+        (en) A materialized list of all records of a collection in the order of a sort object.
+        Records with equal sort keys are kept in their stored order,
+        so the list is the same as the result of the stable sort.
+        It is updated incrementally when records are added, removed or changed,
+        using the map from the record to its stored position kept by the collection.
+        Each update returns false if the view can no longer reproduce the sort,
+        for example when a value of an incompatible type is added,
+        in which case the view must be discarded.
+
+        (ja) コレクションの全レコードを、ソートオブジェクトの順に並べて保持するリストです。
+        ソートキーが等しいレコードは格納順に保持されるため、このリストは安定ソートの結果と同じになります。
+        レコードの追加、削除、変更時には、コレクションが保持するレコードから格納位置へのマップを使って
+        差分で更新されます。
+        互換性の無い型の値が追加された場合など、ビューでソートを再現できなくなった場合は
+        各更新がfalseを返すため、その場合はビューを破棄する必要があります。
+
+        Parameters
+        ----------
+        sort_obj: AbstractSort
+            The sort object.
+        fields: List[str]
+            The fields used by the sort object.
+        """
+        self.sort_obj = sort_obj
+        self._fields = fields
+        self._root_keys = {f.split('.')[0] for f in fields}
+        self.items: List[Dict[str, Any]] = []
+        self._keys: List[Any] = []
+        self._key_of: Dict[int, Any] = {}  # id(record) -> ソートキー
+        # 各フィールドの非nullの値の例。新しい値の型がこれと互換であることを確認するために使う。
+        self._witness: Dict[str, Any] = {}
+
+    @staticmethod
+    def signature(sort_obj: AbstractSort) -> Optional[str]:
+        """
+        (en) Returns the string that identifies the order of the sort object,
+        or None if a view cannot be made for it.
+        A view cannot be made for unknown sort objects or floatEpsilon12_,
+        since the tolerance makes the order depend on the values being compared.
+
+        (ja) ソートオブジェクトの順序を識別する文字列を返します。
+        ビューを作成できない場合はNoneを返します。
+        未知のソートオブジェクトと、許容誤差によって比較対象の値に順序が依存するfloatEpsilon12_では、
+        ビューは作成できません。
+
+        Parameters
+        ----------
+        sort_obj: AbstractSort
+            The sort object.
+        """
+        if isinstance(sort_obj, SingleSort):
+            orders = [sort_obj]
+        elif isinstance(sort_obj, MultiSort):
+            orders = sort_obj.sort_orders
+        else:
+            return None
+        if any(s.v_type == EnumValueType.floatEpsilon12_ for s in orders):
+            return None
+        return json.dumps(sort_obj.to_dict(), sort_keys=True)
+
+    @classmethod
+    def build(cls, sort_obj: AbstractSort, data: List[Dict[str, Any]]) -> Optional["SortedView"]:
+        """
+        (en) Creates a view of the records, or returns None if the sort keys
+        cannot reproduce the sort for them.
+
+        (ja) レコードのビューを作成します。
+        ソートキーでソートを再現できない場合はNoneを返します。
+
+        Parameters
+        ----------
+        sort_obj: AbstractSort
+            The sort object. signature must not return None for it.
+        data: List[Dict[str, Any]]
+            All records of the collection in stored order.
+        """
+        fields = [sort_obj.field] if isinstance(sort_obj, SingleSort) else [s.field for s in sort_obj.sort_orders]
+        view = cls(sort_obj, fields)
+        keys = view._make_keys(data)
+        if keys is None:
+            return None
+        order = sorted(range(len(data)), key=keys.__getitem__)
+        view.items = [data[i] for i in order]
+        view._keys = [keys[i] for i in order]
+        view._key_of = {id(item): k for item, k in zip(data, keys)}
+        return view
+
+    def _make_keys(self, items: List[Dict[str, Any]]) -> Optional[List[Any]]:
+        """
+        (en) Returns the sort keys of the records that are comparable with the keys in this view,
+        or None if they are not.
+
+        (ja) このビュー内のキーと比較可能な、レコードのソートキーを返します。
+        比較可能でない場合はNoneを返します。
+
+        Parameters
+        ----------
+        items: List[Dict[str, Any]]
+            The target records.
+        """
+        # 空のレコードを含めることで、null値の有無に関わらずキーの形式を揃え、
+        # 値の例を含めることで、既存の値と型が互換であることを確認する。
+        keys = self.sort_obj.get_sort_keys([{}, self._witness] + items)
+        if keys is None:
+            return None
+        for field in self._fields:
+            if UtilField.get_nested_field_value(self._witness, field) is not None:
+                continue
+            for item in items:
+                value = UtilField.get_nested_field_value(item, field)
+                if value is not None:
+                    UtilField.set_nested_field_value(self._witness, field, value)
+                    break
+        return keys[2:]
+
+    def is_affected_by(self, keys: Iterable[str]) -> bool:
+        """
+        (en) Returns true if changing the specified top-level keys may change the order.
+
+        (ja) 指定したトップレベルのキーの変更で、順序が変化する可能性がある場合はtrueを返します。
+
+        Parameters
+        ----------
+        keys: Iterable[str]
+            The changed top-level keys.
+        """
+        return not self._root_keys.isdisjoint(keys)
+
+    def _find(self, item: Dict[str, Any], key: Any, seq: Dict[int, int]) -> Optional[int]:
+        """
+        (en) Returns the position of the record in this view, or None if it is not found.
+
+        (ja) このビュー内のレコードの位置を返します。見つからない場合はNoneを返します。
+
+        Parameters
+        ----------
+        item: Dict[str, Any]
+            The target record.
+        key: Any
+            The sort key of the record in this view.
+        seq: Dict[int, int]
+            The map from the id of the record to its stored position.
+        """
+        lo = bisect_left(self._keys, key)
+        hi = bisect_right(self._keys, key, lo)
+        items = self.items
+        position = seq.get(id(item))
+        if position is not None and hi - lo > _LINEAR_SEARCH_LIMIT:
+            # 同値の範囲は格納位置の順に並んでいる。
+            i = bisect_left(items, position, lo, hi, key=lambda e: seq.get(id(e), -1))
+            if i < hi and items[i] is item:
+                return i
+        for i in range(lo, hi):
+            if items[i] is item:
+                return i
+        return None
+
+    def _insert(self, item: Dict[str, Any], key: Any, seq: Dict[int, int]):
+        """
+        (en) Inserts the record at the position determined by the sort key and the stored position.
+
+        (ja) ソートキーと格納位置で決まる位置にレコードを挿入します。
+
+        Parameters
+        ----------
+        item: Dict[str, Any]
+            The target record.
+        key: Any
+            The sort key of the record.
+        seq: Dict[int, int]
+            The map from the id of the record to its stored position.
+        """
+        lo = bisect_left(self._keys, key)
+        hi = bisect_right(self._keys, key, lo)
+        if lo < hi:
+            lo = bisect_left(self.items, seq[id(item)], lo, hi, key=lambda e: seq[id(e)])
+        self.items.insert(lo, item)
+        self._keys.insert(lo, key)
+        self._key_of[id(item)] = key
+
+    def add_all(self, items: List[Dict[str, Any]], seq: Dict[int, int]) -> bool:
+        """
+        (en) Adds the records appended to the end of the collection.
+
+        (ja) コレクションの末尾に追加されたレコードを追加します。
+
+        Parameters
+        ----------
+        items: List[Dict[str, Any]]
+            The added records.
+        seq: Dict[int, int]
+            The map from the id of the record to its stored position.
+        """
+        keys = self._make_keys(items)
+        if keys is None:
+            return False
+        for item, key in zip(items, keys):
+            # 末尾に追加されたレコードは、同値の中で最後に並ぶ。
+            i = bisect_right(self._keys, key)
+            self.items.insert(i, item)
+            self._keys.insert(i, key)
+            self._key_of[id(item)] = key
+        return True
+
+    def remove_all(self, items: List[Dict[str, Any]], seq: Dict[int, int]) -> bool:
+        """
+        (en) Removes the records deleted from the collection.
+
+        (ja) コレクションから削除されたレコードを取り除きます。
+
+        Parameters
+        ----------
+        items: List[Dict[str, Any]]
+            The deleted records.
+        seq: Dict[int, int]
+            The map from the id of the record to its stored position.
+        """
+        if len(items) * _LINEAR_SEARCH_LIMIT > len(self.items):
+            # 多数の削除は、一度の走査で取り除いた方が速い。
+            removed = set()
+            for item in items:
+                if self._key_of.pop(id(item), None) is not None:
+                    removed.add(id(item))
+            pairs = [(item, k) for item, k in zip(self.items, self._keys) if id(item) not in removed]
+            self.items = [p[0] for p in pairs]
+            self._keys = [p[1] for p in pairs]
+            return True
+        for item in items:
+            key = self._key_of.pop(id(item), None)
+            if key is None:
+                continue
+            i = self._find(item, key, seq)
+            if i is None:
+                return False
+            del self.items[i]
+            del self._keys[i]
+        return True
+
+    def update(self, items: List[Dict[str, Any]], seq: Dict[int, int]) -> bool:
+        """
+        (en) Moves the records changed in place to the positions of their new sort keys.
+
+        (ja) その場で変更されたレコードを、新しいソートキーの位置に移動します。
+
+        Parameters
+        ----------
+        items: List[Dict[str, Any]]
+            The changed records.
+        seq: Dict[int, int]
+            The map from the id of the record to its stored position.
+        """
+        if len(items) * _LINEAR_SEARCH_LIMIT > len(self.items):
+            return False
+        keys = self._make_keys(items)
+        if keys is None:
+            return False
+        for item, key in zip(items, keys):
+            old_key = self._key_of.get(id(item))
+            if old_key is None:
+                return False
+            i = self._find(item, old_key, seq)
+            if i is None:
+                return False
+            del self.items[i]
+            del self._keys[i]
+            self._insert(item, key, seq)
+        return True
+
+    def replace(self, old: Dict[str, Any], new: Dict[str, Any], seq: Dict[int, int]) -> bool:
+        """
+        (en) Replaces the record with its copy placed at the same stored position.
+        This must be called while the stored position of the old record is still available.
+
+        (ja) レコードを、同じ格納位置に置かれたそのコピーで置き換えます。
+        これは古いレコードの格納位置が参照可能な間に呼び出す必要があります。
+
+        Parameters
+        ----------
+        old: Dict[str, Any]
+            The replaced record.
+        new: Dict[str, Any]
+            The record that has the same contents as the old one.
+        seq: Dict[int, int]
+            The map from the id of the record to its stored position.
+        """
+        key = self._key_of.pop(id(old), None)
+        if key is None:
+            return False
+        i = self._find(old, key, seq)
+        if i is None:
+            return False
+        self.items[i] = new
+        self._key_of[id(new)] = key
+        return True
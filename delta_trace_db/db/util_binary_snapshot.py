@@ -0,0 +1,206 @@
+# coding: utf-8
+import json
+import marshal
+import struct
+from typing import Any, BinaryIO, Dict, Iterator, List, Tuple
+
+# ファイル先頭の識別子、marshalのバージョン、コレクション数、ヘッダのバイト数。
+_FILE_HEADER = struct.Struct(">4sHII")
+# 各コレクションの名前のバイト数と、内容のバイト数。
+_RECORD_HEADER = struct.Struct(">IQ")
+
+
+class UtilBinarySnapshot:
+    """
+    (en) Utility for saving the DB in a compact binary format and loading it quickly.
+    The file has a header followed by one record per collection,
+    and each record is the collection name and the same dictionary as to_dict encoded by marshal.
+    The records are encoded directly from the stored data without deep copies,
+    and are written and read one collection at a time.
+    Since marshal does not validate the data, only load files that you have saved yourself.
+    The files can be loaded by the same or newer versions of Python.
+
+    (ja) DBをコンパクトなバイナリ形式で保存し、高速に読み込むためのユーティリティです。
+    ファイルはヘッダと、それに続くコレクション毎のレコードで構成され、
+    各レコードはコレクション名と、to_dictと同じ辞書をmarshalでエンコードしたものです。
+    レコードはディープコピーを行わずに保持しているデータから直接エンコードされ、
+    コレクション毎に書き込み、及び読み込みが行われます。
+    marshalはデータを検証しないため、自分で保存したファイルのみを読み込んでください。
+    ファイルは同じか、より新しいバージョンのPythonで読み込めます。
+    """
+    magic = b"DTDB"
+
+    @staticmethod
+    def dumps_collection(class_name: str, version: str, data: List[Dict[str, Any]], serial_num: int) -> bytes:
+        """
+        (en) Encodes the contents of a collection as the same dictionary as to_dict.
+        If the data contains a type that marshal cannot handle,
+        such as a subclass of a scalar type, it is converted to plain types through JSON first.
+
+        (ja) コレクションの内容を、to_dictと同じ辞書としてエンコードします。
+        スカラー型のサブクラスなど、marshalで扱えない型がデータに含まれる場合は、
+        先にJSONを介して通常の型に変換されます。
+
+        Parameters
+        ----------
+        class_name : str
+            The class name of the collection.
+        version : str
+            The version of the collection.
+        data : List[Dict[str, Any]]
+            The stored records. They are not copied.
+        serial_num : int
+            The current serial number.
+        """
+        src = {"className": class_name, "version": version, "data": data, "serialNum": serial_num}
+        try:
+            return marshal.dumps(src)
+        except ValueError:
+            # 稀なケースのため、速度よりも確実さを優先する。
+            src["data"] = json.loads(json.dumps(data))
+            return marshal.dumps(src)
+
+    @staticmethod
+    def loads_collection(src: bytes) -> Dict[str, Any]:
+        """
+        (en) Decodes a dictionary encoded by dumps_collection.
+
+        (ja) dumps_collectionでエンコードされた辞書をデコードします。
+
+        Parameters
+        ----------
+        src : bytes
+            The encoded collection.
+
+        Raises
+        ------
+        ValueError
+            If the src is invalid format.
+        """
+        try:
+            r = marshal.loads(src)
+        except (EOFError, TypeError) as e:
+            raise ValueError("Invalid format: broken collection") from e
+        if not isinstance(r, dict) or not isinstance(r.get("data", []), list) \
+                or not isinstance(r.get("serialNum", 0), int):
+            raise ValueError("Invalid format: target is not a collection")
+        return r
+
+    @staticmethod
+    def write_header(file: BinaryIO, header: Dict[str, Any], count: int):
+        """
+        (en) Writes the header of the file.
+
+        (ja) ファイルのヘッダを書き込みます。
+
+        Parameters
+        ----------
+        file : BinaryIO
+            The binary file to write to.
+        header : Dict[str, Any]
+            The className and version of the DB.
+        count : int
+            The number of the collections that follow.
+        """
+        header_bytes = marshal.dumps(header)
+        file.write(_FILE_HEADER.pack(UtilBinarySnapshot.magic, marshal.version, count, len(header_bytes)))
+        file.write(header_bytes)
+
+    @staticmethod
+    def write_collection(file: BinaryIO, name: str, payload: bytes):
+        """
+        (en) Writes a collection after the header.
+
+        (ja) ヘッダの後にコレクションを書き込みます。
+
+        Parameters
+        ----------
+        file : BinaryIO
+            The binary file to write to.
+        name : str
+            The collection name.
+        payload : bytes
+            The contents encoded by dumps_collection.
+        """
+        name_bytes = name.encode("utf-8")
+        file.write(_RECORD_HEADER.pack(len(name_bytes), len(payload)))
+        file.write(name_bytes)
+        file.write(payload)
+
+    @staticmethod
+    def read(file: BinaryIO) -> Tuple[Dict[str, Any], Iterator[Tuple[str, Dict[str, Any]]]]:
+        """
+        (en) Reads the header, and returns it with an iterator
+        that reads and decodes one collection at a time.
+
+        (ja) ヘッダを読み込み、コレクションを一つずつ読み込んでデコードするイテレータと共に返します。
+
+        Parameters
+        ----------
+        file : BinaryIO
+            The binary file to read from.
+
+        Raises
+        ------
+        ValueError
+            If the file is invalid format, incomplete,
+            or saved by a newer version of Python.
+        """
+        magic, marshal_version, count, header_size = _FILE_HEADER.unpack(_read_exactly(file, _FILE_HEADER.size))
+        if magic != UtilBinarySnapshot.magic:
+            raise ValueError("Invalid format: not a binary snapshot")
+        if marshal_version > marshal.version:
+            raise ValueError("The binary snapshot was saved by a newer version of Python")
+        header = UtilBinarySnapshot._loads_header(_read_exactly(file, header_size))
+
+        def collections() -> Iterator[Tuple[str, Dict[str, Any]]]:
+            for _ in range(count):
+                name_size, payload_size = _RECORD_HEADER.unpack(_read_exactly(file, _RECORD_HEADER.size))
+                name = _read_exactly(file, name_size).decode("utf-8")
+                yield name, UtilBinarySnapshot.loads_collection(_read_exactly(file, payload_size))
+
+        return header, collections()
+
+    @staticmethod
+    def _loads_header(src: bytes) -> Dict[str, Any]:
+        """
+        (en) Decodes the header of the DB.
+
+        (ja) DBのヘッダをデコードします。
+
+        Parameters
+        ----------
+        src : bytes
+            The encoded header.
+        """
+        try:
+            r = marshal.loads(src)
+        except (EOFError, TypeError) as e:
+            raise ValueError("Invalid format: broken header") from e
+        if not isinstance(r, dict):
+            raise ValueError("Invalid format: broken header")
+        return r
+
+
+def _read_exactly(file: BinaryIO, size: int) -> bytes:
+    """
+    (en) Reads the specified number of bytes.
+
+    (ja) 指定したバイト数を読み込みます。
+
+    Parameters
+    ----------
+    file : BinaryIO
+        The binary file to read from.
+    size : int
+        The number of bytes.
+
+    Raises
+    ------
+    ValueError
+        If the file ends before that.
+    """
+    r = file.read(size)
+    if len(r) != size:
+        raise ValueError("Invalid format: the binary snapshot is incomplete")
+    return r
@@ -0,0 +1,142 @@
+# coding: utf-8
+import os
+from typing import Dict, Iterable, Optional
+
+
+class UtilCollectionFiles:
+    """
+    (en) Utility for the storage layout that saves each collection of the DB in its own file.
+    Each file contains the collection encoded by Collection.to_binary,
+    and its name is the UTF-8 bytes of the collection name in hexadecimal followed by the extension,
+    so the collection names can be listed without reading the files,
+    even on file systems that do not distinguish upper and lower case.
+
+    (ja) DBの各コレクションをそれぞれ個別のファイルに保存する、保存形式のためのユーティリティです。
+    各ファイルにはCollection.to_binaryでエンコードしたコレクションが含まれ、
+    ファイル名はコレクション名のUTF-8のバイト列を16進数にしたものと拡張子で構成されるため、
+    大文字と小文字を区別しないファイルシステムでも、ファイルを読まずにコレクション名の一覧を取得できます。
+    """
+    extension = ".dtdb"
+
+    @staticmethod
+    def file_name(name: str) -> str:
+        """
+        (en) Returns the file name of the collection.
+
+        (ja) コレクションのファイル名を返します。
+
+        Parameters
+        ----------
+        name : str
+            The collection name.
+        """
+        return name.encode("utf-8").hex() + UtilCollectionFiles.extension
+
+    @staticmethod
+    def collection_name(file_name: str) -> Optional[str]:
+        """
+        (en) Returns the collection name of the file,
+        or None if the file is not a collection file.
+
+        (ja) ファイルのコレクション名を返します。
+        ファイルがコレクションのファイルではない場合はNoneを返します。
+
+        Parameters
+        ----------
+        file_name : str
+            The file name.
+        """
+        if not file_name.endswith(UtilCollectionFiles.extension):
+            return None
+        try:
+            return bytes.fromhex(file_name[:-len(UtilCollectionFiles.extension)]).decode("utf-8")
+        except ValueError:
+            return None
+
+    @staticmethod
+    def list_files(directory: str) -> Dict[str, str]:
+        """
+        (en) Returns the map from the collection names to the paths of the files
+        in the specified directory. If the directory does not exist, returns an empty map.
+
+        (ja) 指定したディレクトリにある、コレクション名からファイルのパスへのマップを返します。
+        ディレクトリが存在しない場合は空のマップを返します。
+
+        Parameters
+        ----------
+        directory : str
+            The directory of the files.
+        """
+        if not os.path.isdir(directory):
+            return {}
+        r: Dict[str, str] = {}
+        for file_name in sorted(os.listdir(directory)):
+            name = UtilCollectionFiles.collection_name(file_name)
+            if name is not None:
+                r[name] = os.path.join(directory, file_name)
+        return r
+
+    @staticmethod
+    def read(path: str) -> bytes:
+        """
+        (en) Reads the encoded collection from the file.
+
+        (ja) ファイルからエンコードされたコレクションを読み込みます。
+
+        Parameters
+        ----------
+        path : str
+            The file path.
+        """
+        with open(path, "rb") as f:
+            return f.read()
+
+    @staticmethod
+    def write(directory: str, name: str, payload: bytes):
+        """
+        (en) Writes the encoded collection to its file.
+        The file is written to a temporary file first and then renamed,
+        so the previous file remains if this fails.
+
+        (ja) エンコードされたコレクションをそのファイルに書き込みます。
+        ファイルはまず一時ファイルに書き込まれてから名前が変更されるため、
+        これが失敗した場合は以前のファイルが残ります。
+
+        Parameters
+        ----------
+        directory : str
+            The directory of the files.
+        name : str
+            The collection name.
+        payload : bytes
+            The collection encoded by Collection.to_binary.
+        """
+        path = os.path.join(directory, UtilCollectionFiles.file_name(name))
+        tmp_path = path + ".tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(payload)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    @staticmethod
+    def remove_others(directory: str, names: Iterable[str]):
+        """
+        (en) Removes the files of the collections other than the specified ones.
+
+        (ja) 指定したもの以外のコレクションのファイルを削除します。
+
+        Parameters
+        ----------
+        directory : str
+            The directory of the files.
+        names : Iterable[str]
+            The collection names to keep.
+        """
+        keep = set(names)
+        for name, path in UtilCollectionFiles.list_files(directory).items():
+            if name not in keep:
+                os.remove(path)
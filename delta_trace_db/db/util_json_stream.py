@@ -0,0 +1,147 @@
+# coding: utf-8
+import json
+from typing import Any, Dict, Iterator, List, TextIO, Tuple
+
+# DBの末尾と、コレクションの末尾の行。
+_DB_FOOTER = "}}"
+_COLLECTION_FOOTER = "]}"
+
+
+class UtilJsonStream:
+    """
+    (en) Utility for saving the DB as JSON one record at a time, and loading it incrementally.
+    The file is a valid JSON document with the same structure as to_dict of DeltaTraceDatabase,
+    laid out so that each record of each collection is on its own line.
+    Therefore only one line needs to be held in memory besides the DB while saving or loading,
+    and the file can also be read with json.load and from_dict.
+    Files written by other means can only be loaded with json.load.
+
+    (ja) DBをレコード毎にJSONとして保存し、逐次的に読み込むためのユーティリティです。
+    ファイルはDeltaTraceDatabaseのto_dictと同じ構造の有効なJSONドキュメントで、
+    各コレクションの各レコードがそれぞれ一行になるように配置されます。
+    そのため保存や読み込みの際にDB以外にメモリに保持する必要があるのは一行のみで、
+    ファイルはjson.loadとfrom_dictでも読み込めます。
+    他の方法で書き込まれたファイルは、json.loadでのみ読み込めます。
+    """
+
+    @staticmethod
+    def _dumps(value: Any) -> str:
+        """
+        (en) Converts the value to a single line of JSON.
+
+        (ja) 値を一行のJSONに変換します。
+
+        Parameters
+        ----------
+        value : Any
+            The target value.
+        """
+        return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+    @staticmethod
+    def db_header(class_name: str, version: str) -> str:
+        """
+        (en) Returns the first line of the file.
+
+        (ja) ファイルの最初の行を返します。
+
+        Parameters
+        ----------
+        class_name : str
+            The class name of the DB.
+        version : str
+            The version of the DB.
+        """
+        return UtilJsonStream._dumps({"className": class_name, "version": version})[:-1] + ',"collections":{\n'
+
+    @staticmethod
+    def db_footer() -> str:
+        """
+        (en) Returns the last line of the file.
+
+        (ja) ファイルの最後の行を返します。
+        """
+        return _DB_FOOTER + "\n"
+
+    @staticmethod
+    def collection_lines(name: str, class_name: str, version: str, data: List[Dict[str, Any]], serial_num: int,
+                         is_first: bool) -> Iterator[str]:
+        """
+        (en) Returns a generator that converts a collection to lines one record at a time.
+        The records are read when the generator is iterated,
+        so they must not be changed until then.
+
+        (ja) コレクションをレコード毎に行へ変換するジェネレータを返します。
+        レコードはジェネレータの反復時に読み込まれるため、それまで変更してはいけません。
+
+        Parameters
+        ----------
+        name : str
+            The collection name.
+        class_name : str
+            The class name of the collection.
+        version : str
+            The version of the collection.
+        data : List[Dict[str, Any]]
+            The stored records. They are not copied.
+        serial_num : int
+            The current serial number.
+        is_first : bool
+            True if this is the first collection in the file.
+        """
+        dumps = UtilJsonStream._dumps
+        header = dumps({"className": class_name, "version": version, "serialNum": serial_num})[:-1]
+        yield f'{"" if is_first else ","}{dumps(name)}:{header},"data":[\n'
+        # 区切りのカンマを行頭に置くことで、各行を単独でデコードできるようにする。
+        separator = ""
+        for item in data:
+            yield separator + dumps(item) + "\n"
+            separator = ","
+        yield _COLLECTION_FOOTER + "\n"
+
+    @staticmethod
+    def read(file: TextIO) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        (en) Reads a file written with this utility one line at a time,
+        and yields each collection as the same dictionary as to_dict.
+
+        (ja) このユーティリティで書き込んだファイルを一行ずつ読み込み、
+        各コレクションをto_dictと同じ辞書として返します。
+
+        Parameters
+        ----------
+        file : TextIO
+            The text file to read from.
+
+        Raises
+        ------
+        ValueError
+            If the file is invalid format or incomplete.
+        """
+        line = file.readline()
+        if not line.endswith('"collections":{\n'):
+            raise ValueError("Invalid format: not a streaming JSON file")
+        json.loads(line + _DB_FOOTER)
+        while True:
+            line = file.readline()
+            if not line:
+                raise ValueError("Invalid format: the file is incomplete")
+            line = line.rstrip("\n")
+            if line == _DB_FOOTER:
+                return
+            header = json.loads("{" + line.removeprefix(",") + _COLLECTION_FOOTER + "}")
+            if len(header) != 1:
+                raise ValueError("Invalid format: broken collection header")
+            name, src = next(iter(header.items()))
+            if not isinstance(src, dict) or not isinstance(src.get("data"), list):
+                raise ValueError("Invalid format: target is not a collection")
+            data: List[Dict[str, Any]] = src["data"]
+            while True:
+                line = file.readline()
+                if not line:
+                    raise ValueError("Invalid format: the file is incomplete")
+                line = line.rstrip("\n")
+                if line == _COLLECTION_FOOTER:
+                    break
+                data.append(json.loads(line.removeprefix(",")))
+            yield name, src
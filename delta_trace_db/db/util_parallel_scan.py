@@ -0,0 +1,136 @@
+# coding: utf-8
+import multiprocessing
+import threading
+from typing import Any, Dict, List, Optional
+
+from delta_trace_db.query.nodes.query_node import QueryNode
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# ワーカープロセス内でのみ設定される走査対象。
+_source: Optional[List[Dict[str, Any]]] = None
+
+
+def _init_worker(targets: List[Dict[str, Any]]):
+    """
+    (en) Sets the records to scan in the worker process.
+    Since the workers are forked, the records are inherited instead of being serialized,
+    and workers restarted by the pool receive them in the same way.
+
+    (ja) ワーカープロセス内で走査対象のレコードを設定します。
+    ワーカーはフォークされるため、レコードはシリアライズされずに引き継がれ、
+    プールが再起動したワーカーも同様にこれを受け取ります。
+
+    Parameters
+    ----------
+    targets : List[Dict[str, Any]]
+        The records to scan.
+    """
+    global _source
+    _source = targets
+
+
+def _scan_partition(node_dict: Dict[str, Any], start: int, end: int) -> List[int]:
+    """
+    (en) Evaluates the node over the partition of the inherited records in the worker process,
+    and returns the positions of the matched records.
+
+    (ja) ワーカープロセス内で、引き継いだレコードの区間に対してノードを評価し、
+    マッチしたレコードの位置を返します。
+
+    Parameters
+    ----------
+    node_dict : Dict[str, Any]
+        The node serialized with to_dict.
+    start : int
+        The start position of the partition.
+    end : int
+        The end position of the partition (exclusive).
+    """
+    matches = QueryNode.from_dict(node_dict).compile()
+    source = _source
+    return [i for i in range(start, end) if matches(source[i])]
+
+
+class UtilParallelScan:
+    """
+    (en) A utility that evaluates a query node over the records in parallel worker processes.
+    The workers are forked for each scan, so that they share the records with the parent process
+    without serializing them, and only the node and the positions of the hits are transferred.
+    Since forking has a fixed cost, this is only worthwhile for large collections.
+    Forking while another thread holds a lock can deadlock the children,
+    so the scan is not parallelized in a process where multiple threads are running.
+
+    (ja) クエリノードの評価を、並列のワーカープロセスでレコードに対して行うユーティリティです。
+    ワーカーは走査毎にフォークされるため、レコードはシリアライズされずに親プロセスと共有され、
+    転送されるのはノードとヒットした位置のみです。
+    フォークには固定のコストがかかるため、大きなコレクションでのみ有効です。
+    他のスレッドがロックを保持したままフォークすると子プロセスがデッドロックする恐れがあるため、
+    複数のスレッドが動作しているプロセスでは並列に走査しません。
+    """
+
+    @staticmethod
+    def is_available() -> bool:
+        """
+        (en) True if worker processes can be forked on this platform.
+
+        (ja) このプラットフォームでワーカープロセスをフォークできる場合はtrueです。
+        """
+        return "fork" in multiprocessing.get_all_start_methods()
+
+    @staticmethod
+    def find_positions(targets: List[Dict[str, Any]], node: QueryNode, processes: int) -> Optional[List[int]]:
+        """
+        (en) Splits the targets into one partition per process, evaluates the node over them
+        in worker processes, and returns the positions of the matched records in ascending order.
+        Returns None if the scan cannot be run in parallel or fails in a worker process,
+        in which case the caller should evaluate the node by itself.
+        This includes the case where other threads are running, such as concurrent readers,
+        snapshot queries or the executor of AsyncDeltaTraceDatabase.
+
+        (ja) 対象をプロセス毎の区間に分割してワーカープロセスでノードを評価し、
+        マッチしたレコードの位置を昇順で返します。
+        並列に走査できない場合やワーカープロセスで失敗した場合はNoneを返すため、
+        その場合は呼び出し側でノードを評価してください。
+        これには、並行する読み込みやスナップショットのクエリ、AsyncDeltaTraceDatabaseの実行スレッドなど、
+        他のスレッドが動作している場合も含まれます。
+
+        Parameters
+        ----------
+        targets : List[Dict[str, Any]]
+            The records to scan. This must not be changed during the scan.
+        node : QueryNode
+            The node to evaluate. This must be serializable with to_dict.
+        processes : int
+            The number of worker processes.
+        """
+        if processes < 2 or not targets or not UtilParallelScan.is_available():
+            return None
+        if threading.active_count() > 1:
+            # 他のスレッドが保持するロックは子プロセスで解放されないため、フォークしない。
+            return None
+        try:
+            node_dict = node.to_dict()
+        except Exception:
+            _logger.debug("The node cannot be serialized, so the scan is not parallelized", exc_info=True)
+            return None
+        length = len(targets)
+        size = -(-length // processes)
+        tasks = [(node_dict, start, min(start + size, length)) for start in range(0, length, size)]
+        try:
+            pool = multiprocessing.get_context("fork").Pool(len(tasks), initializer=_init_worker,
+                                                             initargs=(targets,))
+        except OSError:
+            _logger.warning("Failed to start worker processes for the parallel scan", exc_info=True)
+            return None
+        with pool:
+            try:
+                parts = pool.starmap(_scan_partition, tasks, chunksize=1)
+            except Exception:
+                _logger.warning("The parallel scan failed, so the records are scanned serially", exc_info=True)
+                return None
+        r: List[int] = []
+        for part in parts:
+            r.extend(part)
+        return r
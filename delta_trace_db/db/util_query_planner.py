@@ -0,0 +1,292 @@
+# coding: utf-8
+import re
+from typing import Any, Callable, Dict, List, Optional
+
+from delta_trace_db.query.nodes.comparison_node import FieldEquals, FieldNotEquals, FieldGreaterThan, \
+    FieldLessThan, FieldGreaterThanOrEqual, FieldLessThanOrEqual, FieldMatchesRegex, FieldContains, FieldIn, \
+    FieldNotIn, FieldStartsWith, FieldEndsWith
+from delta_trace_db.query.nodes.enum_node_type import EnumNodeType
+from delta_trace_db.query.nodes.enum_value_type import EnumValueType
+from delta_trace_db.query.nodes.logical_node import AndNode, OrNode, NotNode
+from delta_trace_db.query.nodes.query_node import QueryNode
+
+# 比較ノードの評価にかかる相対的なコスト。
+_NODE_COSTS = {
+    FieldEquals: 1.0,
+    FieldNotEquals: 1.0,
+    FieldGreaterThan: 1.2,
+    FieldLessThan: 1.2,
+    FieldGreaterThanOrEqual: 1.2,
+    FieldLessThanOrEqual: 1.2,
+    FieldIn: 1.0,
+    FieldNotIn: 1.0,
+    FieldContains: 1.5,
+    FieldStartsWith: 1.5,
+    FieldEndsWith: 1.5,
+    FieldMatchesRegex: 8.0,
+}
+
+# 評価時の型変換にかかる追加のコスト。
+_V_TYPE_COSTS = {
+    EnumValueType.auto_: 0.0,
+    EnumValueType.string_: 0.5,
+    EnumValueType.boolean_: 0.8,
+    EnumValueType.int_: 1.0,
+    EnumValueType.floatStrict_: 1.0,
+    EnumValueType.floatEpsilon12_: 1.0,
+    EnumValueType.datetime_: 4.0,
+}
+
+# 統計情報が無い場合の選択率の既定値。
+_DEFAULT_SELECTIVITIES = {
+    FieldEquals: 0.1,
+    FieldNotEquals: 0.9,
+    FieldGreaterThan: 0.33,
+    FieldLessThan: 0.33,
+    FieldGreaterThanOrEqual: 0.33,
+    FieldLessThanOrEqual: 0.33,
+    FieldContains: 0.25,
+    FieldStartsWith: 0.25,
+    FieldEndsWith: 0.25,
+    FieldMatchesRegex: 0.25,
+}
+
+# 未知のノードのコストと選択率。
+_UNKNOWN_COST = 5.0
+_UNKNOWN_SELECTIVITY = 0.5
+_NESTED_FIELD_COST = 0.3
+_MIN_RATE = 1e-9
+
+
+class _Plan:
+    def __init__(self, node: QueryNode, cost: float, selectivity: float, is_safe: bool,
+                 children: Optional[List["_Plan"]] = None, is_estimated: bool = False):
+        """
+        (en) The planned node and its estimated cost and selectivity.
+
+        (ja) 計画済みのノードと、その見積もりコスト及び選択率です。
+
+        Parameters
+        ----------
+        node: QueryNode
+            The planned node.
+        cost: float
+            The estimated cost to evaluate the node for a single record.
+        selectivity: float
+            The estimated ratio of the records that match the node.
+        is_safe: bool
+            True if evaluating the node never raises an exception,
+            so that its evaluation order can be changed.
+        children: Optional[List[_Plan]]
+            The plans of the child nodes.
+        is_estimated: bool
+            True if the selectivity is estimated from the indexes.
+        """
+        self.node = node
+        self.cost = cost
+        self.selectivity = selectivity
+        self.is_safe = is_safe
+        self.children = children
+        self.is_estimated = is_estimated
+
+    def to_dict(self) -> Dict[str, Any]:
+        if isinstance(self.node, (AndNode, OrNode)):
+            return {
+                'type': (EnumNodeType.and_ if isinstance(self.node, AndNode) else EnumNodeType.or_).name,
+                'cost': self.cost,
+                'selectivity': self.selectivity,
+                'conditions': [c.to_dict() for c in self.children],
+            }
+        if isinstance(self.node, NotNode):
+            return {
+                'type': EnumNodeType.not_.name,
+                'cost': self.cost,
+                'selectivity': self.selectivity,
+                'condition': self.children[0].to_dict(),
+            }
+        return {
+            'node': self.node.to_dict(),
+            'cost': self.cost,
+            'selectivity': self.selectivity,
+            'isEstimated': self.is_estimated,
+        }
+
+
+class UtilQueryPlanner:
+    """
+    (en) A utility that rewrites the query node into an equivalent but cheaper form
+    before it is evaluated for each record.
+    Nested AndNode and OrNode are flattened, multiple FieldEquals on the same field
+    in an OrNode are merged into a FieldIn, and the children are reordered so that
+    cheap and selective conditions are evaluated first.
+    The order is changed only if none of the children can raise an exception,
+    so the result is always the same as evaluating the original node.
+
+    (ja) クエリノードを、レコード毎に評価する前に、等価でより低コストな形に書き換えるユーティリティです。
+    ネストされたAndNodeやOrNodeの平坦化、OrNode内の同一フィールドに対する複数のFieldEqualsの
+    FieldInへの統合、及び低コストで絞り込み効果の高い条件が先に評価されるような子ノードの並べ替えを行います。
+    並べ替えは子ノードがいずれも例外を送出し得ない場合のみ行われるため、
+    結果は常に元のノードを評価した場合と同じになります。
+    """
+
+    @staticmethod
+    def optimize(node: QueryNode, estimate: Optional[Callable[[QueryNode], Optional[int]]] = None,
+                 length: int = 0) -> QueryNode:
+        """
+        (en) Returns an equivalent node that is cheaper to evaluate.
+        The original node is not changed.
+
+        (ja) 評価コストがより低い、等価なノードを返します。
+        元のノードは変更されません。
+
+        Parameters
+        ----------
+        node: QueryNode
+            The node of the query.
+        estimate: Optional[Callable[[QueryNode], Optional[int]]]
+            A function that returns the estimated number of records matching
+            the comparison node, or None if it cannot be estimated.
+            This is usually provided by the indexes of the collection.
+        length: int
+            The number of records in the collection. Used with estimate.
+        """
+        return UtilQueryPlanner._plan(node, estimate, length).node
+
+    @staticmethod
+    def explain(node: QueryNode, estimate: Optional[Callable[[QueryNode], Optional[int]]] = None,
+                length: int = 0) -> Dict[str, Any]:
+        """
+        (en) Returns the plan chosen for the node as a dictionary.
+        Each node of the plan contains the estimated cost per record and the selectivity.
+
+        (ja) ノードに対して選択された計画を辞書で返します。
+        計画の各ノードには、レコード毎の見積もりコストと選択率が含まれます。
+
+        Parameters
+        ----------
+        node: QueryNode
+            The node of the query.
+        estimate: Optional[Callable[[QueryNode], Optional[int]]]
+            A function that returns the estimated number of records matching
+            the comparison node, or None if it cannot be estimated.
+        length: int
+            The number of records in the collection. Used with estimate.
+        """
+        return UtilQueryPlanner._plan(node, estimate, length).to_dict()
+
+    @staticmethod
+    def _plan(node: QueryNode, estimate: Optional[Callable[[QueryNode], Optional[int]]], length: int) -> _Plan:
+        if isinstance(node, (AndNode, OrNode)):
+            is_and = isinstance(node, AndNode)
+            # 同じ種類の論理ノードは、評価順を保ったまま平坦化できる。
+            conditions = UtilQueryPlanner._flatten(node, type(node))
+            children = [UtilQueryPlanner._plan(c, estimate, length) for c in conditions]
+            is_safe = all(c.is_safe for c in children)
+            if is_safe:
+                if not is_and:
+                    children = UtilQueryPlanner._merge_equals(children, estimate, length)
+                # コストあたりの判定の確定しやすさが高い順。
+                if is_and:
+                    children.sort(key=lambda c: c.cost / max(1.0 - c.selectivity, _MIN_RATE))
+                else:
+                    children.sort(key=lambda c: c.cost / max(c.selectivity, _MIN_RATE))
+            if len(children) == 1:
+                return children[0]
+            cost = 0.0
+            # 次の子ノードが評価される割合
+            reach = 1.0
+            for c in children:
+                cost += reach * c.cost
+                reach *= c.selectivity if is_and else 1.0 - c.selectivity
+            selectivity = reach if is_and else 1.0 - reach
+            new_node = AndNode([c.node for c in children]) if is_and else OrNode([c.node for c in children])
+            return _Plan(new_node, cost, selectivity, is_safe, children)
+        if isinstance(node, NotNode):
+            child = UtilQueryPlanner._plan(node.condition, estimate, length)
+            return _Plan(NotNode(child.node), child.cost, 1.0 - child.selectivity, child.is_safe, [child])
+        return UtilQueryPlanner._plan_leaf(node, estimate, length)
+
+    @staticmethod
+    def _flatten(node: QueryNode, node_class: type) -> List[QueryNode]:
+        r: List[QueryNode] = []
+        for c in node.conditions:
+            if type(c) is node_class:
+                r.extend(UtilQueryPlanner._flatten(c, node_class))
+            else:
+                r.append(c)
+        return r
+
+    @staticmethod
+    def _merge_equals(children: List[_Plan], estimate: Optional[Callable[[QueryNode], Optional[int]]],
+                      length: int) -> List[_Plan]:
+        """
+        (en) Merges multiple FieldEquals (auto_) on the same field into a single FieldIn.
+
+        (ja) 同じフィールドに対する複数のFieldEquals(auto_)を、単一のFieldInに統合します。
+        """
+        values: Dict[str, List[Any]] = {}
+        for c in children:
+            n = c.node
+            # 自身と等しくない値(NaN)は、FieldInでは同一性で一致してしまうため統合しない。
+            if type(n) is FieldEquals and n.v_type == EnumValueType.auto_ and n.value == n.value:
+                values.setdefault(n.field, []).append(n.value)
+        r: List[_Plan] = []
+        merged = set()
+        for c in children:
+            n = c.node
+            if type(n) is FieldEquals and len(values.get(n.field, ())) > 1 and n.value == n.value \
+                    and n.v_type == EnumValueType.auto_:
+                if n.field not in merged:
+                    merged.add(n.field)
+                    r.append(UtilQueryPlanner._plan_leaf(FieldIn(n.field, values[n.field]), estimate, length))
+            else:
+                r.append(c)
+        return r
+
+    @staticmethod
+    def _plan_leaf(node: QueryNode, estimate: Optional[Callable[[QueryNode], Optional[int]]], length: int) -> _Plan:
+        node_class = type(node)
+        if node_class not in _NODE_COSTS:
+            return _Plan(node, _UNKNOWN_COST, _UNKNOWN_SELECTIVITY, False)
+        cost = _NODE_COSTS[node_class] + _V_TYPE_COSTS.get(getattr(node, 'v_type', EnumValueType.auto_), 0.0) \
+               + node.field.count('.') * _NESTED_FIELD_COST
+        if node_class is FieldIn or node_class is FieldNotIn:
+            cost += 0.05 * len(node.values)
+        count = estimate(node) if estimate is not None and length > 0 else None
+        if count is not None:
+            selectivity = min(count / length, 1.0)
+        elif node_class is FieldIn:
+            selectivity = min(0.1 * len(node.values), 1.0)
+        elif node_class is FieldNotIn:
+            selectivity = 1.0 - min(0.1 * len(node.values), 1.0)
+        else:
+            selectivity = _DEFAULT_SELECTIVITIES[node_class]
+        return _Plan(node, cost, selectivity, UtilQueryPlanner._is_safe(node), is_estimated=count is not None)
+
+    @staticmethod
+    def _is_safe(node: QueryNode) -> bool:
+        """
+        (en) Returns true if evaluating the comparison node never raises an exception.
+
+        (ja) 比較ノードの評価が例外を送出し得ない場合はtrueを返します。
+        """
+        if isinstance(node, (FieldIn, FieldNotIn)):
+            return isinstance(node.values, (list, tuple))
+        if isinstance(node, (FieldStartsWith, FieldEndsWith)):
+            return isinstance(node.value, str)
+        if isinstance(node, FieldContains):
+            try:
+                hash(node.value)
+                return True
+            except TypeError:
+                return False
+        if isinstance(node, FieldMatchesRegex):
+            if not isinstance(node.pattern, str):
+                return False
+            try:
+                node.compiled_pattern
+                return True
+            except re.error:
+                return False
+        # 大小比較及び等価比較のノードは、評価時の例外を内部で処理する。
+        return True
@@ -0,0 +1,347 @@
+# coding: utf-8
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from delta_trace_db.query.query import Query
+from delta_trace_db.query.transaction_query import TransactionQuery
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# 各レコードの先頭に置く、ペイロードのバイト数とCRC32。
+_HEADER = struct.Struct(">II")
+
+
+class WriteAheadLog:
+    class_name = "WriteAheadLog"
+    version = "1"
+    log_file_name = "wal.log"
+    checkpoint_file_name = "checkpoint.bin"
+
+    def __init__(self, directory: str, group_commit_size: int = 1, group_commit_interval: float = 0.0):
+        """
+        (en) An append-only log of the queries that changed a DeltaTraceDatabase,
+        stored in the specified directory together with the last checkpoint.
+        Set it with DeltaTraceDatabase.set_write_ahead_log, and the DB appends
+        each successful query that changes the contents, including the cause,
+        and each successful transaction as a single record.
+        Each record is prefixed with its length and CRC32,
+        so a record torn by a crash is detected and discarded on recovery.
+        Each record is written to the OS when it is appended,
+        and fsync is called once for a group of records (group commit).
+        If the directory already contains a log, a torn record at its end is removed
+        and the new records are appended after the existing ones.
+
+        (ja) DeltaTraceDatabaseを変更したクエリの追記専用のログで、
+        指定したディレクトリに最後のチェックポイントと共に保存されます。
+        DeltaTraceDatabase.set_write_ahead_logで設定すると、DBは内容を変更した成功したクエリをcauseも含めて、
+        また成功したトランザクションを単一のレコードとして追記します。
+        各レコードの先頭にはその長さとCRC32が置かれるため、
+        クラッシュによって途切れたレコードは復旧時に検出されて破棄されます。
+        各レコードは追記時にOSへ書き込まれ、fsyncはレコードのグループ毎に一度呼ばれます(グループコミット)。
+        ディレクトリに既にログがある場合、その末尾の途切れたレコードは取り除かれ、
+        新しいレコードは既存のレコードの後に追記されます。
+
+        Parameters
+        ----------
+        directory : str
+            The directory of the log and the checkpoint. It is created if it does not exist.
+        group_commit_size : int
+            fsync is called when this number of records are waiting for it.
+            1 syncs every record. 0 disables this,
+            and unless group_commit_interval is set, the records are synced only by
+            sync, checkpoint, close and the OS.
+        group_commit_interval : float
+            If greater than 0, fsync is also called when appending a record
+            this number of seconds or more after the last fsync.
+        """
+        self.directory = directory
+        self.group_commit_size = group_commit_size
+        self.group_commit_interval = group_commit_interval
+        self._log_path = os.path.join(directory, self.log_file_name)
+        self._checkpoint_path = os.path.join(directory, self.checkpoint_file_name)
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._seq: int = self._read_checkpoint_seq()
+        end = 0
+        for seq, _, _, end in self._scan():
+            self._seq = max(self._seq, seq)
+        # 追記に失敗した場合に書きかけのレコードを取り除けるよう、バッファリングしない。
+        self._file = open(self._log_path, "ab", buffering=0)
+        if self._file.tell() != end:
+            _logger.warning("WriteAheadLog: Discarded a torn record at the end of the log")
+            self._file.truncate(end)
+            self._fsync(self._file)
+        self._pending: int = 0
+        self._last_sync: float = time.monotonic()
+
+    @property
+    def seq(self) -> int:
+        """
+        (en) The sequence number of the last appended record.
+
+        (ja) 最後に追記されたレコードのシーケンス番号です。
+        """
+        return self._seq
+
+    @staticmethod
+    def _fsync(file: Any):
+        """
+        (en) Flushes the file and writes it to the storage.
+
+        (ja) ファイルをフラッシュし、ストレージに書き込みます。
+
+        Parameters
+        ----------
+        file : Any
+            The binary file object.
+        """
+        file.flush()
+        os.fsync(file.fileno())
+
+    def _fsync_directory(self):
+        """
+        (en) Writes the entries of the directory to the storage, where supported.
+
+        (ja) 対応している環境では、ディレクトリのエントリをストレージに書き込みます。
+        """
+        if not hasattr(os, "O_DIRECTORY"):
+            return
+        fd = os.open(self.directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _scan(self) -> Iterator[Tuple[int, str, Dict[str, Any], int]]:
+        """
+        (en) Reads the valid records from the beginning of the log.
+        Reading stops at the first incomplete or corrupted record.
+
+        (ja) ログの先頭から有効なレコードを読み込みます。
+        最初の不完全な、または破損したレコードで読み込みを終了します。
+
+        Returns
+        -------
+        records : Iterator[Tuple[int, str, Dict[str, Any], int]]
+            The sequence number, the kind ("query" or "transaction"),
+            the dictionary of the query and the end offset of each record.
+        """
+        if not os.path.exists(self._log_path):
+            return
+        with open(self._log_path, "rb") as f:
+            end = 0
+            while True:
+                header = f.read(_HEADER.size)
+                if len(header) < _HEADER.size:
+                    return
+                length, crc = _HEADER.unpack(header)
+                payload = f.read(length)
+                if len(payload) < length or zlib.crc32(payload) != crc:
+                    return
+                try:
+                    record = json.loads(payload.decode("utf-8"))
+                    seq = record["seq"]
+                    kind = "query" if "query" in record else "transaction"
+                    src = record[kind]
+                except (UnicodeError, ValueError, KeyError, TypeError):
+                    return
+                end += _HEADER.size + length
+                yield seq, kind, src, end
+
+    def _read_checkpoint_seq(self) -> int:
+        """
+        (en) Returns the sequence number of the last record included in the checkpoint,
+        or 0 if there is no checkpoint.
+
+        (ja) チェックポイントに含まれる最後のレコードのシーケンス番号を返します。
+        チェックポイントが無い場合は0を返します。
+        """
+        if not os.path.exists(self._checkpoint_path):
+            return 0
+        with open(self._checkpoint_path, "rb") as f:
+            return json.loads(f.readline())["seq"]
+
+    def _append(self, kind: str, src: Dict[str, Any]) -> int:
+        """
+        (en) Appends a record and returns its sequence number.
+
+        (ja) レコードを追記し、そのシーケンス番号を返します。
+
+        Parameters
+        ----------
+        kind : str
+            "query" or "transaction".
+        src : Dict[str, Any]
+            The dictionary of the query.
+        """
+        with self._lock:
+            seq = self._seq + 1
+            payload = json.dumps({"seq": seq, kind: src}, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+            data = memoryview(_HEADER.pack(len(payload), zlib.crc32(payload)) + payload)
+            start = self._file.seek(0, os.SEEK_END)
+            try:
+                while data:
+                    data = data[self._file.write(data):]
+            except BaseException:
+                # 途切れたレコードの後に追記すると、復旧時にそれ以降が読めなくなる。
+                self._file.truncate(start)
+                raise
+            self._seq = seq
+            self._pending += 1
+            if (0 < self.group_commit_size <= self._pending
+                    or 0 < self.group_commit_interval <= time.monotonic() - self._last_sync):
+                self._sync_locked()
+            return seq
+
+    def append_query(self, q: Query) -> int:
+        """
+        (en) Appends the executed query and returns its sequence number.
+        This is intended to be called only from DeltaTraceDB.
+
+        (ja) 実行したクエリを追記し、そのシーケンス番号を返します。
+        これはDeltaTraceDBからのみ呼び出されることを想定しています。
+
+        Parameters
+        ----------
+        q : Query
+            The query.
+        """
+        return self._append("query", q.to_dict())
+
+    def append_transaction(self, q: TransactionQuery) -> int:
+        """
+        (en) Appends all queries of the transaction as a single record
+        and returns its sequence number.
+        This is intended to be called only from DeltaTraceDB.
+
+        (ja) トランザクションの全てのクエリを単一のレコードとして追記し、そのシーケンス番号を返します。
+        これはDeltaTraceDBからのみ呼び出されることを想定しています。
+
+        Parameters
+        ----------
+        q : TransactionQuery
+            The transaction query.
+        """
+        return self._append("transaction", q.to_dict())
+
+    def _sync_locked(self):
+        """
+        (en) Writes the appended records to the storage. The lock must be held.
+
+        (ja) 追記したレコードをストレージに書き込みます。ロックを保持している必要があります。
+        """
+        self._fsync(self._file)
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    def sync(self):
+        """
+        (en) Writes all appended records to the storage.
+
+        (ja) 追記した全てのレコードをストレージに書き込みます。
+        """
+        with self._lock:
+            if self._pending > 0:
+                self._sync_locked()
+
+    def write_checkpoint(self, db: Any):
+        """
+        (en) Replaces the checkpoint with the DB,
+        which must include all appended records and nothing else,
+        and empties the log.
+        The checkpoint is a JSON header line followed by the DB saved with write_binary.
+        It is written to a temporary file and renamed,
+        so the previous checkpoint remains if this is interrupted.
+        Use DeltaTraceDatabase.checkpoint instead of calling this directly.
+
+        (ja) チェックポイントを、追記された全てのレコードを含み、それ以外を含まないDBで置き換え、
+        ログを空にします。
+        チェックポイントは、JSONのヘッダ行と、それに続くwrite_binaryで保存したDBで構成されます。
+        これは一時ファイルに書き込んでから名前を変更するため、
+        中断された場合は以前のチェックポイントが残ります。
+        これを直接呼ばずに、DeltaTraceDatabase.checkpointを使用してください。
+
+        Parameters
+        ----------
+        db : DeltaTraceDatabase
+            The DB to save.
+        """
+        with self._lock:
+            self._sync_locked()
+            tmp_path = self._checkpoint_path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                header = {"className": self.class_name, "version": self.version, "seq": self._seq}
+                f.write(json.dumps(header, separators=(",", ":")).encode("utf-8") + b"\n")
+                db.write_binary(f)
+                self._fsync(f)
+            os.replace(tmp_path, self._checkpoint_path)
+            self._fsync_directory()
+            # ここで中断した場合、ログに残ったレコードはチェックポイントのシーケンス番号以下のため無視される。
+            self._file.truncate(0)
+            self._fsync(self._file)
+
+    def recover(self, db: Optional[Any] = None) -> Any:
+        """
+        (en) Restores the DB by loading the last checkpoint and replaying the records after it.
+        If a DB is specified, the collections are restored into it
+        while keeping its listeners and index settings, so set them before calling this.
+        The write-ahead log must not be set to the DB yet.
+
+        (ja) 最後のチェックポイントを読み込み、その後のレコードを再実行することでDBを復元します。
+        DBを指定した場合、そのリスナーとインデックスの設定を維持したままコレクションが復元されるため、
+        それらはこの呼び出しの前に設定してください。
+        DBにはまだ先行書き込みログを設定してはいけません。
+
+        Parameters
+        ----------
+        db : Optional[DeltaTraceDatabase]
+            The DB to restore into. If None, a new DB is created.
+
+        Returns
+        -------
+        db : DeltaTraceDatabase
+            The restored DB.
+
+        Raises
+        ------
+        ValueError
+            If the DB already has a write-ahead log, or a record could not be replayed.
+        """
+        # 遅延インポート
+        from delta_trace_db.db.delta_trace_db_core import DeltaTraceDatabase
+        if db is None:
+            db = DeltaTraceDatabase()
+        elif db.write_ahead_log is not None:
+            raise ValueError("The DB already has a write-ahead log")
+        checkpoint_seq = 0
+        if os.path.exists(self._checkpoint_path):
+            with open(self._checkpoint_path, "rb") as f:
+                checkpoint_seq = json.loads(f.readline())["seq"]
+                db.load_binary_keep_listener(f)
+        for seq, kind, src, _ in self._scan():
+            if seq <= checkpoint_seq:
+                continue
+            if kind == "query":
+                is_success = db.execute_query(Query.from_dict(src)).is_success
+            else:
+                is_success = db.execute_transaction_query(TransactionQuery.from_dict(src)).is_success
+            if not is_success:
+                raise ValueError(f"Failed to replay the record {seq} of the write-ahead log")
+        return db
+
+    def close(self):
+        """
+        (en) Writes all appended records to the storage and closes the log.
+
+        (ja) 追記した全てのレコードをストレージに書き込み、ログを閉じます。
+        """
+        with self._lock:
+            if not self._file.closed:
+                self._sync_locked()
+                self._file.close()
@@ -1,12 +1,142 @@
 # coding: utf-8
 from datetime import datetime
-from typing import Any, override
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, override
+import operator
 import re
 from delta_trace_db.query.nodes.enum_node_type import EnumNodeType
 from delta_trace_db.query.nodes.enum_value_type import EnumValueType
 from delta_trace_db.query.nodes.query_node import QueryNode
+from delta_trace_db.query.util_canonical import UtilCanonical
 from delta_trace_db.query.util_field import UtilField
 
+# 正規表現で特別な意味を持つ文字。
+_REGEX_SPECIAL_CHARS = frozenset(".^$*+?{}[]\\|()")
+
+
+@lru_cache(maxsize=256)
+def _compile_pattern(pattern: str) -> re.Pattern:
+    """
+    (en) Compiles the regex pattern.
+    The compiled patterns are kept in a process-wide LRU cache,
+    so that they are shared between deserialized queries.
+
+    (ja) 正規表現のパターンをコンパイルします。
+    コンパイル済みのパターンはプロセス全体のLRUキャッシュに保持されるため、
+    デシリアライズされたクエリ間でも共有されます。
+    """
+    return re.compile(pattern)
+
+
+def _always_false(data: Dict[str, Any]) -> bool:
+    return False
+
+
+def _make_converter(v_type: EnumValueType) -> Optional[Callable[[Any], Any]]:
+    """
+    (en) Returns the function that converts the field value for the comparison type,
+    or None for auto_.
+
+    (ja) 比較タイプに応じてフィールドの値を変換する関数を返します。auto_の場合はNoneを返します。
+    """
+    match v_type:
+        case EnumValueType.datetime_:
+            return lambda v: datetime.fromisoformat(str(v))
+        case EnumValueType.int_:
+            return lambda v: int(str(v))
+        case EnumValueType.floatStrict_ | EnumValueType.floatEpsilon12_:
+            return lambda v: float(str(v))
+        case EnumValueType.boolean_:
+            return lambda v: str(v).lower()
+        case EnumValueType.string_:
+            return str
+    return None
+
+
+def _cast_value(v_type: EnumValueType, value: Any) -> Any:
+    """
+    (en) Casts the compare value in the same way as evaluate.
+    Raises an exception if the cast fails.
+
+    (ja) 比較値をevaluateと同様にキャストします。キャストに失敗した場合は例外を送出します。
+    """
+    match v_type:
+        case EnumValueType.int_:
+            return int(value)
+        case EnumValueType.floatStrict_ | EnumValueType.floatEpsilon12_:
+            return float(value)
+        case EnumValueType.boolean_:
+            return str(value).lower()
+        case EnumValueType.string_:
+            return str(value)
+    return value
+
+
+def _compile_comparison(field: str, value: Any, v_type: EnumValueType, op: Callable[[Any, Any], bool],
+                        epsilon_op: Callable[[float, float], bool],
+                        is_magnitude: bool) -> Callable[[Dict[str, Any]], bool]:
+    """
+    (en) Compiles a comparison node into a function.
+    The path is split, the comparison type is selected and
+    the compare value is cast only once here.
+
+    (ja) 比較ノードを関数にコンパイルします。
+    パスの分割、比較タイプの選択、及び比較値のキャストはここで一度だけ行われます。
+
+    Parameters
+    ----------
+    field: str
+        The target variable name.
+    value: Any
+        The compare value.
+    v_type: EnumValueType
+        The comparison type.
+    op: Callable[[Any, Any], bool]
+        The comparison operator.
+    epsilon_op: Callable[[float, float], bool]
+        The comparison used for floatEpsilon12_.
+    is_magnitude: bool
+        If true, None is never matched and boolean_ is always False.
+    """
+    if is_magnitude and (value is None or v_type == EnumValueType.boolean_):
+        return _always_false
+    try:
+        target = _cast_value(v_type, value)
+    except Exception:
+        # evaluateでは常に例外となり、Falseになる。
+        return _always_false
+    get_value = UtilField.make_getter(field)
+    convert = _make_converter(v_type)
+    if convert is None:
+        if is_magnitude:
+            def evaluate(data: Dict[str, Any]) -> bool:
+                f_value = get_value(data)
+                if f_value is None:
+                    return False
+                try:
+                    return op(f_value, target)
+                except Exception:
+                    return False
+        else:
+            def evaluate(data: Dict[str, Any]) -> bool:
+                try:
+                    return op(get_value(data), target)
+                except Exception:
+                    return False
+        return evaluate
+    test = epsilon_op if v_type == EnumValueType.floatEpsilon12_ else op
+
+    def evaluate_converted(data: Dict[str, Any]) -> bool:
+        f_value = get_value(data)
+        if is_magnitude and f_value is None:
+            return False
+        try:
+            return test(convert(f_value), target)
+        except Exception:
+            return False
+
+    return evaluate_converted
+
 
 class FieldEquals(QueryNode):
     def __init__(self, field: str, value: Any, v_type: EnumValueType = EnumValueType.auto_):
@@ -65,6 +195,11 @@ class FieldEquals(QueryNode):
         except Exception:
             return False
 
+    @override
+    def compile(self) -> Callable[[Dict[str, Any]], bool]:
+        return _compile_comparison(self.field, self.value, self.v_type, operator.eq,
+                                   lambda x, t: abs(x - t) < 1e-12, False)
+
     @override
     def to_dict(self) -> dict:
         val = self.value.isoformat() if isinstance(self.value, datetime) else self.value
@@ -134,6 +269,11 @@ class FieldNotEquals(QueryNode):
         except Exception:
             return False
 
+    @override
+    def compile(self) -> Callable[[Dict[str, Any]], bool]:
+        return _compile_comparison(self.field, self.value, self.v_type, operator.ne,
+                                   lambda x, t: abs(x - t) >= 1e-12, False)
+
     @override
     def to_dict(self) -> dict:
         val = self.value.isoformat() if isinstance(self.value, datetime) else self.value
@@ -209,6 +349,11 @@ class FieldGreaterThan(QueryNode):
         except Exception:
             return False
 
+    @override
+    def compile(self) -> Callable[[Dict[str, Any]], bool]:
+        return _compile_comparison(self.field, self.value, self.v_type, operator.gt,
+                                   lambda x, t: x - t > 1e-12, True)
+
     @override
     def to_dict(self) -> dict:
         val = self.value.isoformat() if isinstance(self.value, datetime) else self.value
@@ -284,6 +429,11 @@ class FieldLessThan(QueryNode):
         except Exception:
             return False
 
+    @override
+    def compile(self) -> Callable[[Dict[str, Any]], bool]:
+        return _compile_comparison(self.field, self.value, self.v_type, operator.lt,
+                                   lambda x, t: t - x > 1e-12, True)
+
     @override
     def to_dict(self) -> dict:
         val = self.value.isoformat() if isinstance(self.value, datetime) else self.value
@@ -359,6 +509,11 @@ class FieldGreaterThanOrEqual(QueryNode):
         except Exception:
             return False
 
+    @override
+    def compile(self) -> Callable[[Dict[str, Any]], bool]:
+        return _compile_comparison(self.field, self.value, self.v_type, operator.ge,
+                                   lambda x, t: x - t >= -1e-12, True)
+
     @override
     def to_dict(self) -> dict:
         val = self.value.isoformat() if isinstance(self.value, datetime) else self.value
@@ -434,6 +589,11 @@ class FieldLessThanOrEqual(QueryNode):
         except Exception:
             return False
 
+    @override
+    def compile(self) -> Callable[[Dict[str, Any]], bool]:
+        return _compile_comparison(self.field, self.value, self.v_type, operator.le,
+                                   lambda x, t: t - x >= -1e-12, True)
+
     @override
     def to_dict(self) -> dict:
         val = self.value.isoformat() if isinstance(self.value, datetime) else self.value
@@ -450,8 +610,12 @@ class FieldMatchesRegex(QueryNode):
     def __init__(self, field: str, pattern: str):
         """
         (en) Query node for "RegExp(pattern).hasMatch(field)" operation.
+        The pattern is compiled on the first evaluation,
+        and the compiled patterns are shared across nodes with the same pattern.
 
         (ja) "RegExp(pattern).hasMatch(field)" 演算のためのクエリノード。
+        パターンは最初の評価時にコンパイルされ、
+        コンパイル済みのパターンは同じパターンを持つノード間で共有されます。
 
         Parameters
         ----------
@@ -462,17 +626,103 @@ class FieldMatchesRegex(QueryNode):
         """
         self.field = field
         self.pattern = pattern
+        self._compiled: Optional[re.Pattern] = None
 
     @classmethod
     def from_dict(cls, src: dict):
         return cls(src['field'], src['pattern'])
 
+    @property
+    def compiled_pattern(self) -> re.Pattern:
+        """
+        (en) The compiled pattern. It is compiled lazily and
+        compiled again if the pattern is changed.
+
+        (ja) コンパイル済みのパターンです。遅延してコンパイルされ、
+        パターンが変更された場合は再度コンパイルされます。
+
+        Raises
+        ------
+        re.error
+            If the pattern is invalid.
+        """
+        if self._compiled is None or self._compiled.pattern != self.pattern:
+            self._compiled = _compile_pattern(self.pattern)
+        return self._compiled
+
+    def literal_prefix(self) -> Optional[str]:
+        """
+        (en) Returns the literal string that every matching value must start with,
+        if the pattern is anchored to the start by ^ or \\A.
+        Returns None if the pattern is not anchored, contains alternation,
+        or is invalid.
+        This is used to narrow down the records by an ordered index.
+
+        (ja) パターンが^または\\Aで先頭に固定されている場合に、
+        マッチする値が必ず先頭に持つリテラル文字列を返します。
+        パターンが先頭に固定されていない場合、選択(|)を含む場合、または不正な場合はNoneを返します。
+        これは順序付きのインデックスでレコードを絞り込むために使用されます。
+        """
+        p = self.pattern
+        if not isinstance(p, str) or '|' in p:
+            return None
+        if p.startswith('^'):
+            i = 1
+        elif p.startswith('\\A'):
+            i = 2
+        else:
+            return None
+        try:
+            self.compiled_pattern
+        except Exception:
+            return None
+        r: List[str] = []
+        n = len(p)
+        while i < n:
+            c = p[i]
+            if c == '\\':
+                # \d や \w などの文字クラスは対象外。
+                if i + 1 >= n or p[i + 1].isalnum() or p[i + 1] == '_':
+                    break
+                literal = p[i + 1]
+                j = i + 2
+            elif c in _REGEX_SPECIAL_CHARS:
+                break
+            else:
+                literal = c
+                j = i + 1
+            # 直後の量指定子によって省略され得る文字は含めない。
+            if j < n and p[j] in '*?{':
+                break
+            r.append(literal)
+            if j < n and p[j] == '+':
+                break
+            i = j
+        return ''.join(r)
+
     @override
     def evaluate(self, data: dict) -> bool:
         value = UtilField.get_nested_field_value(data, self.field)
         if value is None:
             return False
-        return re.search(self.pattern, str(value)) is not None
+        return self.compiled_pattern.search(str(value)) is not None
+
+    @override
+    def compile(self) -> Callable[[Dict[str, Any]], bool]:
+        try:
+            search = self.compiled_pattern.search
+        except Exception:
+            # 不正なパターンでは、evaluateと同様に評価時に例外を送出させる。
+            return self.evaluate
+        get_value = UtilField.make_getter(self.field)
+
+        def evaluate(data: Dict[str, Any]) -> bool:
+            value = get_value(data)
+            if value is None:
+                return False
+            return search(str(value)) is not None
+
+        return evaluate
 
     @override
     def to_dict(self) -> dict:
@@ -514,6 +764,22 @@ class FieldContains(QueryNode):
             return self.value in v
         return False
 
+    @override
+    def compile(self) -> Callable[[Dict[str, Any]], bool]:
+        get_value = UtilField.make_getter(self.field)
+        value = self.value
+        is_str_value = isinstance(value, str)
+
+        def evaluate(data: Dict[str, Any]) -> bool:
+            v = get_value(data)
+            if isinstance(v, (list, tuple, set)):
+                return value in v
+            if is_str_value and isinstance(v, str):
+                return value in v
+            return False
+
+        return evaluate
+
     @override
     def to_dict(self) -> dict:
         return {
@@ -549,6 +815,12 @@ class FieldIn(QueryNode):
     def evaluate(self, data: dict) -> bool:
         return UtilField.get_nested_field_value(data, self.field) in self.values
 
+    @override
+    def compile(self) -> Callable[[Dict[str, Any]], bool]:
+        get_value = UtilField.make_getter(self.field)
+        values = self.values
+        return lambda data: get_value(data) in values
+
     @override
     def to_dict(self) -> dict:
         return {
@@ -558,6 +830,16 @@ class FieldIn(QueryNode):
             'version': '1',
         }
 
+    @override
+    def canonical_form(self) -> Dict[str, Any]:
+        # 値の順序と重複は結果に影響しない。
+        return {
+            'type': EnumNodeType.in_.name,
+            'field': self.field,
+            'values': UtilCanonical.sorted_values(self.values),
+            'version': '1',
+        }
+
 
 class FieldNotIn(QueryNode):
     def __init__(self, field: str, values: list):
@@ -584,6 +866,12 @@ class FieldNotIn(QueryNode):
     def evaluate(self, data: dict) -> bool:
         return UtilField.get_nested_field_value(data, self.field) not in self.values
 
+    @override
+    def compile(self) -> Callable[[Dict[str, Any]], bool]:
+        get_value = UtilField.make_getter(self.field)
+        values = self.values
+        return lambda data: get_value(data) not in values
+
     @override
     def to_dict(self) -> dict:
         return {
@@ -593,6 +881,16 @@ class FieldNotIn(QueryNode):
             'version': '2',
         }
 
+    @override
+    def canonical_form(self) -> Dict[str, Any]:
+        # 値の順序と重複は結果に影響しない。
+        return {
+            'type': EnumNodeType.notIn_.name,
+            'field': self.field,
+            'values': UtilCanonical.sorted_values(self.values),
+            'version': '2',
+        }
+
 
 class FieldStartsWith(QueryNode):
     def __init__(self, field: str, value: str):
@@ -620,6 +918,17 @@ class FieldStartsWith(QueryNode):
         f_value = UtilField.get_nested_field_value(data, self.field)
         return str(f_value).startswith(self.value) if f_value is not None else False
 
+    @override
+    def compile(self) -> Callable[[Dict[str, Any]], bool]:
+        get_value = UtilField.make_getter(self.field)
+        value = self.value
+
+        def evaluate(data: Dict[str, Any]) -> bool:
+            f_value = get_value(data)
+            return str(f_value).startswith(value) if f_value is not None else False
+
+        return evaluate
+
     @override
     def to_dict(self) -> dict:
         return {
@@ -656,6 +965,17 @@ class FieldEndsWith(QueryNode):
         f_value = UtilField.get_nested_field_value(data, self.field)
         return str(f_value).endswith(self.value) if f_value is not None else False
 
+    @override
+    def compile(self) -> Callable[[Dict[str, Any]], bool]:
+        get_value = UtilField.make_getter(self.field)
+        value = self.value
+
+        def evaluate(data: Dict[str, Any]) -> bool:
+            f_value = get_value(data)
+            return str(f_value).endswith(value) if f_value is not None else False
+
+        return evaluate
+
     @override
     def to_dict(self) -> dict:
         return {
@@ -1,5 +1,5 @@
 # coding: utf-8
-from typing import Any, Dict, override
+from typing import Any, Callable, Dict, override
 from delta_trace_db.query.nodes.enum_node_type import EnumNodeType
 from delta_trace_db.query.nodes.query_node import QueryNode
 
@@ -27,6 +27,25 @@ class AndNode(QueryNode):
     def evaluate(self, data: dict) -> bool:
         return all(c.evaluate(data) for c in self.conditions)
 
+    @override
+    def compile(self) -> Callable[[Dict[str, Any]], bool]:
+        compiled = [c.compile() for c in self.conditions]
+        if not compiled:
+            return lambda data: True
+        if len(compiled) == 1:
+            return compiled[0]
+        if len(compiled) == 2:
+            first, second = compiled
+            return lambda data: first(data) and second(data)
+
+        def evaluate(data: Dict[str, Any]) -> bool:
+            for c in compiled:
+                if not c(data):
+                    return False
+            return True
+
+        return evaluate
+
     @override
     def to_dict(self) -> dict:
         return {
@@ -35,6 +54,14 @@ class AndNode(QueryNode):
             'version': '1',
         }
 
+    @override
+    def canonical_form(self) -> Dict[str, Any]:
+        return {
+            'type': EnumNodeType.and_.name,
+            'conditions': [c.canonical_form() for c in sorted(self.conditions, key=lambda c: c.canonical_key())],
+            'version': '1',
+        }
+
 
 class OrNode(QueryNode):
     def __init__(self, conditions: list[QueryNode]):
@@ -59,6 +86,25 @@ class OrNode(QueryNode):
     def evaluate(self, data: dict) -> bool:
         return any(c.evaluate(data) for c in self.conditions)
 
+    @override
+    def compile(self) -> Callable[[Dict[str, Any]], bool]:
+        compiled = [c.compile() for c in self.conditions]
+        if not compiled:
+            return lambda data: False
+        if len(compiled) == 1:
+            return compiled[0]
+        if len(compiled) == 2:
+            first, second = compiled
+            return lambda data: first(data) or second(data)
+
+        def evaluate(data: Dict[str, Any]) -> bool:
+            for c in compiled:
+                if c(data):
+                    return True
+            return False
+
+        return evaluate
+
     @override
     def to_dict(self) -> dict:
         return {
@@ -67,6 +113,14 @@ class OrNode(QueryNode):
             'version': '1',
         }
 
+    @override
+    def canonical_form(self) -> Dict[str, Any]:
+        return {
+            'type': EnumNodeType.or_.name,
+            'conditions': [c.canonical_form() for c in sorted(self.conditions, key=lambda c: c.canonical_key())],
+            'version': '1',
+        }
+
 
 class NotNode(QueryNode):
     def __init__(self, condition: QueryNode):
@@ -91,6 +145,11 @@ class NotNode(QueryNode):
     def evaluate(self, data: dict) -> bool:
         return not self.condition.evaluate(data)
 
+    @override
+    def compile(self) -> Callable[[Dict[str, Any]], bool]:
+        compiled = self.condition.compile()
+        return lambda data: not compiled(data)
+
     @override
     def to_dict(self) -> dict:
         return {
@@ -99,6 +158,14 @@ class NotNode(QueryNode):
             'version': '1',
         }
 
+    @override
+    def canonical_form(self) -> Dict[str, Any]:
+        return {
+            'type': EnumNodeType.not_.name,
+            'condition': self.condition.canonical_form(),
+            'version': '1',
+        }
+
 
 __all__ = [
     "AndNode",
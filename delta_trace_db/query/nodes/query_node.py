@@ -1,11 +1,58 @@
 # coding: utf-8
+import weakref
 from abc import ABC, abstractmethod
-from typing import Any, Dict
+from typing import Any, Callable, Dict
 from delta_trace_db.query.nodes.enum_node_type import EnumNodeType
+from delta_trace_db.query.util_canonical import UtilCanonical
 
 
 class QueryNode(ABC):
 
+    def __setattr__(self, name: str, value: Any):
+        super().__setattr__(name, value)
+        if not name.startswith("_"):
+            QueryNode._add_owner(value, self)
+            # 変更されたノードに対して古いキーとハッシュを返さないよう、計算済みのものを破棄する。
+            self._invalidate_key()
+
+    @staticmethod
+    def _add_owner(value: Any, owner: Any):
+        """
+        (en) Registers the owner to the nodes in the value,
+        so that setting an attribute of the nodes also discards the key and hash of the owner.
+        The owners are held by weak references.
+
+        (ja) 値に含まれるノードに所有者を登録し、
+        ノードの属性の設定で所有者のキーとハッシュも破棄されるようにします。
+        所有者は弱参照で保持されます。
+
+        Parameters
+        ----------
+        value : Any
+            A node, a list of nodes, or any other value, which is ignored.
+        owner : Any
+            The parent node or query, which has _invalidate_key.
+        """
+        for node in value if isinstance(value, list) else (value,):
+            if isinstance(node, QueryNode):
+                owners = [r for r in node.__dict__.get("_owners", ()) if r() is not None]
+                if not any(r() is owner for r in owners):
+                    owners.append(weakref.ref(owner))
+                node.__dict__["_owners"] = owners
+
+    def _invalidate_key(self):
+        """
+        (en) Discards the cached key and hash of this node and its owners.
+
+        (ja) このノードとその所有者の、キャッシュされたキーとハッシュを破棄します。
+        """
+        self.__dict__.pop("_canonical_key", None)
+        self.__dict__.pop("_structural_hash", None)
+        for ref in self.__dict__.get("_owners", ()):
+            owner = ref()
+            if owner is not None:
+                owner._invalidate_key()
+
     @abstractmethod
     def evaluate(self, data: Dict[str, Any]) -> bool:
         """
@@ -15,6 +62,22 @@ class QueryNode(ABC):
         """
         pass
 
+    def compile(self) -> Callable[[Dict[str, Any]], bool]:
+        """
+        (en) Returns a function that gives the same result as evaluate.
+        The returned function is specialized for this node,
+        so it is faster when evaluating many objects with the same node.
+        If the node is changed, it must be compiled again.
+        By default, this returns evaluate itself.
+
+        (ja) evaluateと同じ結果を返す関数を返します。
+        戻り値の関数はこのノード専用に最適化されているため、
+        同じノードで多数のオブジェクトを評価する場合に高速です。
+        ノードを変更した場合は、再度コンパイルする必要があります。
+        デフォルトではevaluateそのものを返します。
+        """
+        return self.evaluate
+
     @abstractmethod
     def to_dict(self) -> Dict[str, Any]:
         """
@@ -32,6 +95,53 @@ class QueryNode(ABC):
         """
         pass
 
+    def canonical_form(self) -> Dict[str, Any]:
+        """
+        (en) Returns the dictionary that is the same for nodes with the same structure.
+        Nodes whose children can be reordered without changing the result,
+        such as AndNode and OrNode, sort their children.
+        By default, this returns to_dict.
+
+        (ja) 同じ構造のノードでは同一になる辞書を返します。
+        AndNodeやOrNodeなど、結果を変えずに子の順序を入れ替えられるノードでは、子がソートされます。
+        デフォルトではto_dictを返します。
+        """
+        return self.to_dict()
+
+    def canonical_key(self) -> str:
+        """
+        (en) Returns the canonical form as a compact JSON string with sorted keys.
+        This can be used as an exact key for caches and statistics.
+        The key is computed on the first call and cached until an attribute of the node
+        or of its child nodes is set, but changes inside lists, such as appending a child, are not detected.
+
+        (ja) 正規形を、キーをソートした簡潔なJSON文字列として返します。
+        これはキャッシュや統計の正確なキーとして使用できます。
+        キーは初回の呼び出し時に計算され、ノードやその子ノードの属性が設定されるまでキャッシュされますが、
+        子の追加などのリスト内の変更は検出されません。
+        """
+        key = self.__dict__.get("_canonical_key")
+        if key is None:
+            key = UtilCanonical.to_key(self.canonical_form())
+            self._canonical_key = key
+        return key
+
+    def structural_hash(self) -> int:
+        """
+        (en) Returns the 64-bit hash of the canonical key.
+        Unlike the built-in hash, this is the same in every process.
+        The hash is computed on the first call and cached.
+
+        (ja) 正規化したキーの64ビットのハッシュを返します。
+        組み込みのhashとは異なり、これは全てのプロセスで同一です。
+        ハッシュは初回の呼び出し時に計算されてキャッシュされます。
+        """
+        h = self.__dict__.get("_structural_hash")
+        if h is None:
+            h = UtilCanonical.to_hash(self.canonical_key())
+            self._structural_hash = h
+        return h
+
     @classmethod
     def from_dict(cls, src: Dict[str, Any]) -> "QueryNode":
         """
@@ -7,11 +7,17 @@ from delta_trace_db.query.sort.abstract_sort import AbstractSort
 from delta_trace_db.query.cause.cause import Cause
 from delta_trace_db.db.util_copy import UtilCopy
 from delta_trace_db.query.merge_query_params import MergeQueryParams
+from delta_trace_db.query.util_canonical import UtilCanonical
+
+
+# 生成時に正規化したキーを計算するクエリの種類。
+_EAGER_KEY_TYPES = frozenset((EnumQueryType.search, EnumQueryType.searchOne, EnumQueryType.getAll,
+                              EnumQueryType.count))
 
 
 class Query(CloneableFile):
     className: str = "Query"
-    version: str = "7"
+    version: str = "8"
 
     def __init__(self, target: str, type_: EnumQueryType, add_data: Optional[List[Dict[str, Any]]] = None,
                  override_data: Optional[Dict[str, Any]] = None, template: Optional[Dict[str, Any]] = None,
@@ -20,7 +26,8 @@ class Query(CloneableFile):
                  end_before: Optional[Dict[str, Any]] = None, rename_before: Optional[str] = None,
                  rename_after: Optional[str] = None, limit: Optional[int] = None, return_data: bool = False,
                  must_affect_at_least_one: bool = True, serial_key: Optional[str] = None, reset_serial: bool = False,
-                 merge_query_params: Optional[MergeQueryParams] = None, cause: Optional[Cause] = None):
+                 merge_query_params: Optional[MergeQueryParams] = None, cause: Optional[Cause] = None,
+                 cursor: Optional[str] = None):
         """
         (en) This is a query class for DB operations. It is usually built using
         QueryBuilder or RawQueryBuilder.
@@ -123,6 +130,16 @@ class Query(CloneableFile):
             program autonomously using artificial intelligence.
             By saving the entire query including this as a log,
             the DB history is recorded.
+        cursor: Optional[str]
+            Used only with search or getAll types.
+            If you pass in the next_cursor of a previous QueryResult,
+            the search will return results from the objects after the last object of that page,
+            and any offset, startAfter or endBefore specified will be ignored.
+            Unlike startAfter, the position is found from the values of the sort fields
+            and the serial number recorded in the cursor, so this works even if the last object
+            has been changed or deleted since then.
+            Records with the same sort values are returned in the order they were added.
+            The target collection must use a serialKey.
         """
         super().__init__()
         self.target = target
@@ -144,6 +161,35 @@ class Query(CloneableFile):
         self.reset_serial = reset_serial
         self.merge_query_params = merge_query_params
         self.cause = cause
+        self.cursor = cursor
+        # 正規化したキーとハッシュ。属性の設定で破棄され、次の参照時に再計算される。
+        self._canonical_key: Optional[str] = None
+        self._structural_hash: Optional[int] = None
+        if type_ in _EAGER_KEY_TYPES:
+            # 結果のキャッシュや統計のキーとなる読み込みのクエリは、生成時にキーを計算しておく。
+            # 書き込みのクエリは大きなデータを含みうるため、必要になるまで計算しない。
+            try:
+                self.canonical_key()
+            except (TypeError, ValueError):
+                pass
+
+    def __setattr__(self, name: str, value: Any):
+        super().__setattr__(name, value)
+        if not name.startswith("_"):
+            QueryNode._add_owner(value, self)
+            # ページングのためにoffset等を変更して再利用する場合があるため、計算済みのキーとハッシュを破棄する。
+            self._invalidate_key()
+
+    def _invalidate_key(self):
+        """
+        (en) Discards the cached key and hash.
+        This is also called when an attribute of the query node or its child nodes is set.
+
+        (ja) キャッシュされたキーとハッシュを破棄します。
+        これはクエリノードやその子ノードの属性が設定された場合にも呼ばれます。
+        """
+        self.__dict__["_canonical_key"] = None
+        self.__dict__["_structural_hash"] = None
 
     @classmethod
     def from_dict(cls, src: Dict[str, Any]) -> "Query":
@@ -174,6 +220,7 @@ class Query(CloneableFile):
             reset_serial=src.get("resetSerial", False),
             merge_query_params=mqp,
             cause=Cause.from_dict(src["cause"]) if src.get("cause") else None,
+            cursor=src.get("cursor"),
         )
 
     @override
@@ -208,8 +255,58 @@ class Query(CloneableFile):
                 else None
             ),
             "cause": self.cause.to_dict() if self.cause else None,
+            "cursor": self.cursor,
         }
 
     @override
     def clone(self) -> "Query":
         return Query.from_dict(self.to_dict())
+
+    def canonical_form(self) -> Dict[str, Any]:
+        """
+        (en) Returns the dictionary that is the same for queries with the same operation.
+        This is the same as to_dict, except that the cause is excluded
+        and the query node is replaced with its canonical form.
+
+        (ja) 同じ操作を行うクエリでは同一になる辞書を返します。
+        これはto_dictと同じですが、causeが除外され、クエリノードがその正規形に置き換えられます。
+        """
+        r = self.to_dict()
+        del r["cause"]
+        r["queryNode"] = self.query_node.canonical_form() if self.query_node else None
+        return r
+
+    def canonical_key(self) -> str:
+        """
+        (en) Returns the canonical form as a compact JSON string with sorted keys.
+        This can be used as an exact key for caches and statistics, such as the result cache.
+        The key of search, searchOne, getAll and count queries is computed when they are created,
+        and that of the other queries on the first call.
+        The key is cached until an attribute of the query, its query node or their child nodes is set,
+        but changes inside lists, dictionaries and sort objects are not detected,
+        so set the attribute again after changing them.
+
+        (ja) 正規形を、キーをソートした簡潔なJSON文字列として返します。
+        これは結果のキャッシュなど、キャッシュや統計の正確なキーとして使用できます。
+        search、searchOne、getAll、countのクエリのキーは生成時に、それ以外のクエリのキーは初回の呼び出し時に計算されます。
+        キーはクエリやそのクエリノード、それらの子ノードの属性が設定されるまでキャッシュされますが、
+        リストや辞書、ソートオブジェクト内の変更は検出されないため、それらを変更した後は属性を再度設定してください。
+        """
+        if self._canonical_key is None:
+            self._canonical_key = UtilCanonical.to_key(self.canonical_form())
+        return self._canonical_key
+
+    def structural_hash(self) -> int:
+        """
+        (en) Returns the 64-bit hash of the canonical key.
+        Unlike the built-in hash, this is the same in every process,
+        so it can also be used in logs.
+        The hash is computed on the first call and cached.
+
+        (ja) 正規化したキーの64ビットのハッシュを返します。
+        組み込みのhashとは異なり、これは全てのプロセスで同一であるため、ログでも使用できます。
+        ハッシュは初回の呼び出し時に計算されてキャッシュされます。
+        """
+        if self._structural_hash is None:
+            self._structural_hash = UtilCanonical.to_hash(self.canonical_key())
+        return self._structural_hash
@@ -30,7 +30,8 @@ class QueryBuilder:
                  serial_key: Optional[str] = None,
                  reset_serial: bool = False,
                  merge_query_params: Optional[MergeQueryParams] = None,
-                 cause: Optional[Cause] = None):
+                 cause: Optional[Cause] = None,
+                 cursor: Optional[str] = None):
         """
         (en) A builder class for easily constructing queries.
         In addition to constructors for creating each query,
@@ -61,6 +62,7 @@ class QueryBuilder:
         self.reset_serial = reset_serial
         self.merge_query_params = merge_query_params
         self.cause = cause
+        self.cursor = cursor
 
     @classmethod
     def add(cls, target: str,
@@ -318,7 +320,8 @@ class QueryBuilder:
                start_after: Optional[Dict[str, Any]] = None,
                end_before: Optional[Dict[str, Any]] = None,
                limit: Optional[int] = None,
-               cause: Optional[Cause] = None) -> "QueryBuilder":
+               cause: Optional[Cause] = None,
+               cursor: Optional[str] = None) -> "QueryBuilder":
         """
         (en) Gets objects from the specified collection that match
         the specified criteria.
@@ -368,6 +371,12 @@ class QueryBuilder:
             Optional metadata for auditing or logging.
             Useful in high-security environments or for autonomous AI programs
             to record the reason or initiator of a query.
+        cursor: Optional[str]
+            If you pass in the next_cursor of a previous QueryResult,
+            the search will return results from the objects after the last object of that page,
+            and any offset, startAfter or endBefore specified will be ignored.
+            This works even if the last object has been changed or deleted since then.
+            The target collection must use a serialKey.
         """
         return cls(target, EnumQueryType.search,
                    query_node=query_node,
@@ -376,7 +385,8 @@ class QueryBuilder:
                    start_after=start_after,
                    end_before=end_before,
                    limit=limit,
-                   cause=cause)
+                   cause=cause,
+                   cursor=cursor)
 
     @classmethod
     def search_one(cls, target: str,
@@ -416,7 +426,8 @@ class QueryBuilder:
                 start_after: Optional[Dict[str, Any]] = None,
                 end_before: Optional[Dict[str, Any]] = None,
                 limit: Optional[int] = None,
-                cause: Optional[Cause] = None) -> "QueryBuilder":
+                cause: Optional[Cause] = None,
+                cursor: Optional[str] = None) -> "QueryBuilder":
         """
         (en) Gets all items in the specified collection.
         If a limit(limit, offset, startAfter, endBefore, limit) is set,
@@ -466,6 +477,12 @@ class QueryBuilder:
             Optional metadata for auditing or logging.
             Useful in high-security environments or for autonomous AI programs
             to record the reason or initiator of a query.
+        cursor: Optional[str]
+            If you pass in the next_cursor of a previous QueryResult,
+            the search will return results from the objects after the last object of that page,
+            and any offset, startAfter or endBefore specified will be ignored.
+            This works even if the last object has been changed or deleted since then.
+            The target collection must use a serialKey.
         """
         return cls(target, EnumQueryType.getAll,
                    sort_obj=sort_obj,
@@ -473,7 +490,8 @@ class QueryBuilder:
                    start_after=start_after,
                    end_before=end_before,
                    limit=limit,
-                   cause=cause)
+                   cause=cause,
+                   cursor=cursor)
 
     @classmethod
     def conform_to_template(cls, target: str,
@@ -806,6 +824,22 @@ class QueryBuilder:
         self.end_before = new_end_before
         return self
 
+    def set_cursor(self, new_cursor: Optional[str]) -> "QueryBuilder":
+        """
+        (en) This method can be used if you want to change only the search position.
+
+        (ja) 検索位置だけを変更したい場合に利用できるメソッドです。
+
+        Parameters
+        ----------
+        new_cursor: Optional[str]
+            If you pass in the next_cursor of a previous QueryResult,
+            the search will return results from the objects after the last object of that page,
+            and any offset, startAfter or endBefore specified will be ignored.
+        """
+        self.cursor = new_cursor
+        return self
+
     def set_limit(self, new_limit: Optional[int]) -> "QueryBuilder":
         """
         (en) This method can be used if you want to change only the limit.
@@ -855,5 +889,6 @@ class QueryBuilder:
             serial_key=self.serial_key,
             reset_serial=self.reset_serial,
             merge_query_params=self.merge_query_params,
-            cause=self.cause
+            cause=self.cause,
+            cursor=self.cursor
         )
@@ -7,7 +7,7 @@ from delta_trace_db.query.query_execution_result import QueryExecutionResult
 
 class QueryResult(QueryExecutionResult):
     class_name: str = "QueryResult"
-    version: str = "6"
+    version: str = "7"
 
     def __init__(
         self,
@@ -19,6 +19,7 @@ class QueryResult(QueryExecutionResult):
         update_count: int,
         hit_count: int,
         error_message: Optional[str] = None,
+        next_cursor: Optional[str] = None,
     ):
         """
         (en) This class stores the query results and additional information from
@@ -74,6 +75,11 @@ class QueryResult(QueryExecutionResult):
             The total number of items searched.
         error_message: Optional[str]
             A message that is added only if an error occurs.
+        next_cursor: Optional[str]
+            A cursor pointing after the last object of this result.
+            This is set only for search and getAll queries with a limit
+            that returned limit objects from a collection using a serialKey.
+            To get the next page, pass this as the cursor of the same query.
         """
         super().__init__(is_success=is_success)
         self.target: str = target
@@ -83,6 +89,7 @@ class QueryResult(QueryExecutionResult):
         self.update_count: int = update_count
         self.hit_count: int = hit_count
         self.error_message: Optional[str] = error_message
+        self.next_cursor: Optional[str] = next_cursor
 
     @classmethod
     def from_dict(cls, src: Dict[str, Any]) -> "QueryResult":
@@ -95,6 +102,7 @@ class QueryResult(QueryExecutionResult):
             update_count=src["updateCount"],
             hit_count=src["hitCount"],
             error_message=src.get("errorMessage"),
+            next_cursor=src.get("nextCursor"),
         )
 
     def convert(self, from_dict: Callable) -> List:
@@ -129,4 +137,5 @@ class QueryResult(QueryExecutionResult):
             "updateCount": self.update_count,
             "hitCount": self.hit_count,
             "errorMessage": self.error_message,
+            "nextCursor": self.next_cursor,
         }
@@ -32,6 +32,7 @@ class RawQueryBuilder(QueryBuilder):
             reset_serial: bool = False,
             merge_query_params: Optional[MergeQueryParams] = None,
             cause: Optional[Cause] = None,
+            cursor: Optional[str] = None,
     ):
         super().__init__(
             target=target,
@@ -50,7 +51,8 @@ class RawQueryBuilder(QueryBuilder):
             serial_key=serial_key,
             reset_serial=reset_serial,
             merge_query_params=merge_query_params,
-            cause=cause
+            cause=cause,
+            cursor=cursor
         )
         self.raw_add_data = raw_add_data
         self.template = template
@@ -191,7 +193,8 @@ class RawQueryBuilder(QueryBuilder):
             start_after: Optional[Dict[str, Any]] = None,
             end_before: Optional[Dict[str, Any]] = None,
             limit: Optional[int] = None,
-            cause: Optional[Cause] = None
+            cause: Optional[Cause] = None,
+            cursor: Optional[str] = None
     ) -> "RawQueryBuilder":
         return cls(
             target=target,
@@ -202,7 +205,8 @@ class RawQueryBuilder(QueryBuilder):
             start_after=start_after,
             end_before=end_before,
             limit=limit,
-            cause=cause
+            cause=cause,
+            cursor=cursor
         )
 
     @classmethod
@@ -223,9 +227,10 @@ class RawQueryBuilder(QueryBuilder):
     def get_all(cls, target: str, sort_obj: Optional[AbstractSort] = None, offset: Optional[int] = None,
                 start_after: Optional[Dict[str, Any]] = None,
                 end_before: Optional[Dict[str, Any]] = None,
-                limit: Optional[int] = None, cause: Optional[Cause] = None) -> "RawQueryBuilder":
+                limit: Optional[int] = None, cause: Optional[Cause] = None,
+                cursor: Optional[str] = None) -> "RawQueryBuilder":
         return cls(target=target, type_=EnumQueryType.getAll, sort_obj=sort_obj, offset=offset, start_after=start_after,
-                   end_before=end_before, limit=limit, cause=cause)
+                   end_before=end_before, limit=limit, cause=cause, cursor=cursor)
 
     @classmethod
     def conform_to_template(
@@ -356,6 +361,11 @@ class RawQueryBuilder(QueryBuilder):
         self.end_before = new_end_before
         return self
 
+    @override
+    def set_cursor(self, new_cursor: Optional[str]) -> "RawQueryBuilder":
+        self.cursor = new_cursor
+        return self
+
     @override
     def set_limit(self, new_limit: Optional[int]) -> "RawQueryBuilder":
         self.limit = new_limit
@@ -382,5 +392,6 @@ class RawQueryBuilder(QueryBuilder):
             serial_key=self.serial_key,
             reset_serial=self.reset_serial,
             merge_query_params=self.merge_query_params,
-            cause=self.cause
+            cause=self.cause,
+            cursor=self.cursor
         )
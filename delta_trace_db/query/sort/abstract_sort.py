@@ -1,6 +1,6 @@
 # coding: utf-8
 from abc import ABC, abstractmethod
-from typing import Any, Callable, Dict
+from typing import Any, Callable, Dict, List, Optional
 
 
 class AbstractSort(ABC):
@@ -20,6 +20,27 @@ class AbstractSort(ABC):
         """
         pass
 
+    def get_sort_keys(self, items: List[Dict[str, Any]]) -> Optional[List[Any]]:
+        """
+        (en) Returns one sort key per record, such that sorting the records by the keys
+        gives exactly the same order as sorting them with get_comparator.
+        Returns None if the keys cannot reproduce the comparator for these records,
+        in which case the caller should sort with get_comparator.
+        The default implementation always returns None.
+
+        (ja) ソートキーを使ってレコードをソートした結果が、get_comparatorでソートした結果と
+        完全に同じになるような、レコード毎のソートキーを返します。
+        これらのレコードについてキーで比較関数を再現できない場合はNoneを返すため、
+        その場合は呼び出し側でget_comparatorを使ってソートしてください。
+        デフォルトの実装は常にNoneを返します。
+
+        Parameters
+        ----------
+        items: List[Dict[str, Any]]
+            The records to sort.
+        """
+        return None
+
     @abstractmethod
     def to_dict(self) -> Dict[str, Any]:
         """
@@ -1,5 +1,5 @@
 # coding: utf-8
-from typing import Any, Callable, Dict, List, override
+from typing import Any, Callable, Dict, List, Optional, override
 from delta_trace_db.query.sort.abstract_sort import AbstractSort
 from delta_trace_db.query.sort.single_sort import SingleSort
 
@@ -36,11 +36,23 @@ class MultiSort(AbstractSort):
             "sortOrders": [s.to_dict() for s in self.sort_orders],
         }
 
+    @override
+    def get_sort_keys(self, items: List[Dict[str, Any]]) -> Optional[List[Any]]:
+        columns = []
+        for sort_obj in self.sort_orders:
+            keys = sort_obj.get_sort_keys(items)
+            if keys is None:
+                return None
+            columns.append(keys)
+        return list(zip(*columns)) if columns else [()] * len(items)
+
     @override
     def get_comparator(self) -> Callable[[Dict[str, Any], Dict[str, Any]], int]:
+        comparators = [sort_obj.get_comparator() for sort_obj in self.sort_orders]
+
         def comparator(a: Dict[str, Any], b: Dict[str, Any]) -> int:
-            for sort_obj in self.sort_orders:
-                comp = sort_obj.get_comparator()(a, b)
+            for c in comparators:
+                comp = c(a, b)
                 if comp != 0:
                     return comp
             return 0
@@ -1,5 +1,6 @@
 # coding: utf-8
-from typing import Any, Callable, Dict, override
+import math
+from typing import Any, Callable, Dict, List, Optional, override
 from datetime import datetime
 
 from delta_trace_db.query.nodes.enum_value_type import EnumValueType
@@ -7,6 +8,24 @@ from delta_trace_db.query.sort.abstract_sort import AbstractSort
 from delta_trace_db.query.util_field import UtilField
 
 
+class _Reversed:
+    """
+    (en) A wrapper of a sort key that reverses the order of the wrapped value.
+
+    (ja) ラップした値の順序を逆転させる、ソートキーのラッパーです。
+    """
+    __slots__ = ("value",)
+
+    def __init__(self, value: Any):
+        self.value = value
+
+    def __eq__(self, other: "_Reversed") -> bool:
+        return self.value == other.value
+
+    def __lt__(self, other: "_Reversed") -> bool:
+        return other.value < self.value
+
+
 class SingleSort(AbstractSort):
     class_name = "SingleSort"
     version = "5"
@@ -138,6 +157,67 @@ class SingleSort(AbstractSort):
             case _:
                 raise Exception("Unknown type")
 
+    @override
+    def get_sort_keys(self, items: List[Dict[str, Any]]) -> Optional[List[Any]]:
+        # 値の取得と型変換はレコード毎に一度だけ行う。
+        # 変換に失敗する場合は、比較関数で実際に比較された場合のみ失敗させるためにNoneを返す。
+        getter = UtilField.make_getter(self.field)
+        try:
+            values = [self._convert_value(getter(item)) for item in items]
+        except Exception:
+            return None
+        present = [v for v in values if v is not None]
+        if present and not self._is_key_comparable(present):
+            return None
+        if present and isinstance(present[0], (bool, int, float)):
+            # 数値はそのまま並べられるため、逆順の場合は符号を反転する。bool値は1と0として扱う。
+            if isinstance(present[0], bool):
+                values = [None if v is None else int(v) for v in values]
+            if self.reversed:
+                values = [None if v is None else -v for v in values]
+        elif self.reversed:
+            values = [None if v is None else _Reversed(v) for v in values]
+        if len(present) == len(values):
+            return values
+        # null値は昇順ソートでは後ろに、降順ソートでは前に並べる。
+        if self.reversed:
+            return [(0,) if v is None else (1, v) for v in values]
+        return [(1,) if v is None else (0, v) for v in values]
+
+    def _is_key_comparable(self, values: List[Any]) -> bool:
+        """
+        (en) True if comparing the converted non-null values directly gives
+        the same results as the comparator, without raising an error.
+
+        (ja) 型変換済みの非null値を直接比較した結果が、エラーにならずに比較関数と同じになる場合はtrueです。
+
+        Parameters
+        ----------
+        values: List[Any]
+            The converted non-null values.
+        """
+        types = {type(v) for v in values}
+        if all(isinstance(v, datetime) for v in values):
+            # タイムゾーンの有無が混在する場合は比較できない。
+            return len({v.utcoffset() is None for v in values}) == 1
+        if len(types) != 1:
+            return False
+        t = next(iter(types))
+        if not issubclass(t, (int, float, str)):
+            return False
+        if issubclass(t, float):
+            # NaNは全ての値と等しいとみなされるため、キーでは再現できない。
+            if any(v != v for v in values):
+                return False
+            if self.v_type == EnumValueType.floatEpsilon12_:
+                # 許容誤差内の異なる値が無く、全て有限値の場合のみ、通常の比較と一致する。
+                if not all(math.isfinite(v) for v in values):
+                    return False
+                distinct = sorted(set(values))
+                if any(b - a < 1e-12 for a, b in zip(distinct, distinct[1:])):
+                    return False
+        return True
+
     @override
     def get_comparator(self) -> Callable[[Dict[str, Any], Dict[str, Any]], int]:
         def comparator(a: Dict[str, Any], b: Dict[str, Any]) -> int:
@@ -0,0 +1,66 @@
+# coding: utf-8
+import hashlib
+import json
+from typing import Any, List
+
+
+class UtilCanonical:
+    """
+    (en) Utility for making the canonical keys and structural hashes of queries.
+    The key is a compact JSON string with sorted dictionary keys,
+    and the hash is a 64-bit BLAKE2b digest of the key, so both are the same in every process.
+
+    (ja) クエリの正規化したキーと構造的なハッシュを作成するためのユーティリティです。
+    キーは辞書のキーをソートした簡潔なJSON文字列で、ハッシュはキーの64ビットのBLAKE2bダイジェストであるため、
+    どちらも全てのプロセスで同一になります。
+    """
+
+    @staticmethod
+    def to_key(canonical_form: Any) -> str:
+        """
+        (en) Converts the canonical form to its key.
+
+        (ja) 正規形をキーに変換します。
+
+        Parameters
+        ----------
+        canonical_form: Any
+            The canonical form, which can contain only JSON compatible values.
+
+        Raises
+        ------
+        TypeError
+            If the canonical form contains values that are not JSON compatible.
+        """
+        return json.dumps(canonical_form, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+
+    @staticmethod
+    def to_hash(key: str) -> int:
+        """
+        (en) Returns the 64-bit structural hash of the key.
+
+        (ja) キーの64ビットの構造的なハッシュを返します。
+
+        Parameters
+        ----------
+        key: str
+            The key made with to_key.
+        """
+        return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+    @staticmethod
+    def sorted_values(values: List[Any]) -> List[Any]:
+        """
+        (en) Returns the values without duplicates, sorted by their keys.
+        This is used for lists whose order does not matter, such as the values of FieldIn.
+
+        (ja) 重複を除いた値を、それぞれのキーの順にソートして返します。
+        これはFieldInの値など、順序が意味を持たないリストに使用します。
+
+        Parameters
+        ----------
+        values: List[Any]
+            The target values, which can contain only JSON compatible values.
+        """
+        by_key = {UtilCanonical.to_key(v): v for v in values}
+        return [by_key[k] for k in sorted(by_key)]
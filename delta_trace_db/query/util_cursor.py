@@ -0,0 +1,59 @@
+# coding: utf-8
+import base64
+import binascii
+import json
+from typing import Any, List, Tuple
+
+
+class UtilCursor:
+    """
+    (en) Utility for the cursor tokens used for paging.
+    A cursor is an opaque string that records the values of the sort fields
+    and the serial number of the last record of a page.
+
+    (ja) ページングに使用するカーソルのトークンに関するユーティリティです。
+    カーソルは、ページの最後のレコードのソート対象フィールドの値とシリアルナンバーを記録した、
+    不透明な文字列です。
+    """
+
+    @staticmethod
+    def encode(values: List[Any], serial: Any) -> str:
+        """
+        (en) Creates a cursor from the values of the sort fields and the serial number.
+
+        (ja) ソート対象フィールドの値とシリアルナンバーからカーソルを作成します。
+
+        Parameters
+        ----------
+        values: List[Any]
+            The values of the sort fields of the record, in the order of the sort.
+        serial: Any
+            The serial number of the record.
+        """
+        raw = json.dumps({"v": values, "s": serial}, separators=(",", ":"), ensure_ascii=False)
+        return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+    @staticmethod
+    def decode(cursor: str) -> Tuple[List[Any], Any]:
+        """
+        (en) Restores the values of the sort fields and the serial number from the cursor.
+
+        (ja) カーソルから、ソート対象フィールドの値とシリアルナンバーを復元します。
+
+        Parameters
+        ----------
+        cursor: str
+            A cursor made with encode.
+
+        Raises
+        ------
+        ValueError
+            If the cursor is invalid.
+        """
+        try:
+            src = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8"))
+        except (binascii.Error, UnicodeError, ValueError, AttributeError):
+            raise ValueError("Invalid cursor")
+        if not isinstance(src, dict) or not isinstance(src.get("v"), list) or "s" not in src:
+            raise ValueError("Invalid cursor")
+        return src["v"], src["s"]
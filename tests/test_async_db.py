@@ -0,0 +1,205 @@
+# coding: utf-8
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from delta_trace_db.db.async_delta_trace_db import AsyncDeltaTraceDatabase
+from delta_trace_db.db.delta_trace_db_core import DeltaTraceDatabase
+from delta_trace_db.db.enum_concurrency_mode import EnumConcurrencyMode
+from delta_trace_db.query.nodes.comparison_node import FieldEquals
+from delta_trace_db.query.nodes.query_node import QueryNode
+from delta_trace_db.query.raw_query_builder import RawQueryBuilder
+from delta_trace_db.query.transaction_query import TransactionQuery
+
+
+def _add_query(count: int):
+    return RawQueryBuilder.add(target="users", raw_add_data=[{"id": -1, "age": i % 10} for i in range(count)],
+                               serial_key="id").build()
+
+
+def test_async_db_execute():
+    async def main():
+        db = AsyncDeltaTraceDatabase(inline_cost_limit=100)
+        r = await db.execute_query(_add_query(1000))
+        assert r.is_success and r.db_length == 1000
+        r = await db.execute_query(RawQueryBuilder.search(target="users", query_node=FieldEquals("age", 3)).build())
+        assert r.hit_count == 100
+        tq = TransactionQuery(queries=[
+            RawQueryBuilder.update(target="users", query_node=FieldEquals("age", 3), override_data={"age": 30})
+            .build(),
+        ])
+        r = await db.execute_transaction_query(tq)
+        assert r.is_success
+        r = await db.execute_query_object(
+            RawQueryBuilder.count(target="users").build().to_dict())
+        assert r.hit_count == 1000
+        r = await db.execute_query_object(tq.to_dict())
+        assert r.is_success is False
+        with pytest.raises(ValueError):
+            await db.execute_query_object({"className": "Unknown"})
+        assert db.db.collection("users").length == 1000
+
+    asyncio.run(main())
+
+
+def test_async_db_estimate_cost():
+    db = AsyncDeltaTraceDatabase()
+    db.db.execute_query(_add_query(50))
+    assert db.estimate_cost(RawQueryBuilder.count(target="users").build()) == 0
+    assert db.estimate_cost(_add_query(10)) == 10
+    assert db.estimate_cost(RawQueryBuilder.get_all(target="users").build()) == 50
+    assert db.estimate_cost(RawQueryBuilder.get_all(target="none").build()) == 0
+    assert db.estimate_cost(TransactionQuery(queries=[
+        _add_query(10), RawQueryBuilder.get_all(target="users").build()])) == 60
+
+
+def test_async_db_offload_and_limit():
+    async def main():
+        executor = ThreadPoolExecutor(max_workers=4)
+        db = AsyncDeltaTraceDatabase(executor=executor, max_concurrency=2, inline_cost_limit=10)
+        await db.execute_query(_add_query(5))
+        threads = set()
+        running = 0
+        max_running = 0
+        original = db.db.execute_query
+
+        def tracked(q, collection_permissions=None):
+            nonlocal running, max_running
+            threads.add(threading.get_ident())
+            running += 1
+            max_running = max(max_running, running)
+            time.sleep(0.01)
+            running -= 1
+            return original(q, collection_permissions=collection_permissions)
+
+        db.db.execute_query = tracked
+        # 軽いクエリはイベントループのスレッドで実行される。
+        await db.execute_query(RawQueryBuilder.get_all(target="users").build())
+        assert threads == {threading.get_ident()}
+        await db.execute_query(_add_query(100))
+        threads.clear()
+        # 重いクエリはエクゼキュータで、同時実行数の上限内で実行される。
+        rs = await asyncio.gather(*[db.execute_query(RawQueryBuilder.get_all(target="users").build())
+                                    for _ in range(8)])
+        assert all(r.hit_count == 105 for r in rs)
+        assert threading.get_ident() not in threads
+        assert max_running <= 2
+        # collection_モードでは、軽いクエリもエクゼキュータで実行される。
+        db = AsyncDeltaTraceDatabase(DeltaTraceDatabase(concurrency_mode=EnumConcurrencyMode.collection_),
+                                     executor=executor, inline_cost_limit=10)
+        await db.execute_query(_add_query(5))
+        r = await db.execute_query(RawQueryBuilder.get_all(target="users").build())
+        assert r.hit_count == 5
+        executor.shutdown()
+
+    asyncio.run(main())
+
+
+def test_async_db_listener():
+    async def main():
+        db = AsyncDeltaTraceDatabase(inline_cost_limit=10)
+        called = []
+        done = asyncio.Event()
+
+        async def on_change():
+            called.append(threading.get_ident())
+            done.set()
+
+        db.add_async_listener("users", on_change)
+        # エクゼキュータ内での変更でも、イベントループ上で呼ばれる。
+        await db.execute_query(_add_query(100))
+        await asyncio.wait_for(done.wait(), 10)
+        assert called == [threading.get_ident()]
+        db.remove_async_listener("users", on_change)
+        await db.execute_query(_add_query(1))
+        await asyncio.sleep(0.05)
+        assert len(called) == 1
+        # 名前付きの登録と解除。
+        done.clear()
+        db.add_async_listener("users", on_change, name="n")
+        await db.execute_query(_add_query(1))
+        await asyncio.wait_for(done.wait(), 10)
+        db.remove_async_listener("users", on_change, name="n")
+        assert db.db.collection("users").named_listeners == {}
+
+    asyncio.run(main())
+
+
+class _SlowNode(QueryNode):
+    # 評価の度に待機し、ロックを長く保持する重いクエリを模擬するノード。
+    def __init__(self):
+        self.started = threading.Event()
+
+    def evaluate(self, data):
+        self.started.set()
+        time.sleep(0.0002)
+        return False
+
+    def to_dict(self):
+        return {"type": "slow"}
+
+
+def test_async_db_inline_does_not_wait_for_lock():
+    async def main():
+        db = AsyncDeltaTraceDatabase(inline_cost_limit=100)
+        await db.execute_query(_add_query(1000))
+        await db.execute_query(RawQueryBuilder.add(target="small", raw_add_data=[{"a": 1}]).build())
+        delays = []
+        stop = False
+
+        async def ticker():
+            while not stop:
+                t = time.perf_counter()
+                await asyncio.sleep(0.001)
+                delays.append(time.perf_counter() - t)
+
+        task = asyncio.create_task(ticker())
+        node = _SlowNode()
+        heavy = asyncio.ensure_future(db.execute_query(RawQueryBuilder.search(target="users",
+                                                                              query_node=node).build()))
+        # 重いクエリがエクゼキュータでロックを保持するまで待つ。
+        while not node.started.is_set():
+            await asyncio.sleep(0.001)
+        t = time.perf_counter()
+        r = await db.execute_query(RawQueryBuilder.get_all(target="small").build())
+        small_ms = (time.perf_counter() - t) * 1000
+        assert r.result == [{"a": 1}]
+        await heavy
+        stop = True
+        await task
+        # 軽いクエリはロックを待つ間、イベントループを止めない。
+        assert max(delays) < 0.1
+        print(f"end small query while a heavy query holds the lock: {small_ms:.0f} ms, "
+              f"max event loop delay {max(delays) * 1000:.0f} ms")
+
+    asyncio.run(main())
+
+
+def test_async_db_event_loop_latency_speed():
+    async def main():
+        db = AsyncDeltaTraceDatabase(inline_cost_limit=1000)
+        await db.execute_query(_add_query(200000))
+        delays = []
+        stop = False
+
+        async def ticker():
+            while not stop:
+                t = time.perf_counter()
+                await asyncio.sleep(0.001)
+                delays.append(time.perf_counter() - t)
+
+        task = asyncio.create_task(ticker())
+        t = time.perf_counter()
+        await asyncio.gather(*[db.execute_query(RawQueryBuilder.search(target="users",
+                                                                       query_node=FieldEquals("age", 3)).build())
+                               for _ in range(4)])
+        ms = (time.perf_counter() - t) * 1000
+        stop = True
+        await task
+        print(f"end async search 4 x 200000 records: {ms:.0f} ms, "
+              f"max event loop delay {max(delays) * 1000:.0f} ms")
+
+    asyncio.run(main())
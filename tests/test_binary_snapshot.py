@@ -0,0 +1,125 @@
+# coding: utf-8
+import io
+import json
+import marshal
+import time
+
+import pytest
+
+from delta_trace_db.db.delta_trace_db_collection import Collection
+from delta_trace_db.db.delta_trace_db_core import DeltaTraceDatabase
+from delta_trace_db.db.enum_concurrency_mode import EnumConcurrencyMode
+from delta_trace_db.db.util_binary_snapshot import UtilBinarySnapshot
+from delta_trace_db.query.nodes.comparison_node import FieldEquals
+from delta_trace_db.query.raw_query_builder import RawQueryBuilder
+
+
+class _MyStr(str):
+    pass
+
+
+def _make_db(mode: EnumConcurrencyMode = EnumConcurrencyMode.global_) -> DeltaTraceDatabase:
+    db = DeltaTraceDatabase(concurrency_mode=mode)
+    db.set_snapshot_reads("items")
+    db.execute_query(RawQueryBuilder.add(target="users", raw_add_data=[
+        {"id": -1, "name": f"user{i}", "age": i % 10, "score": i / 3, "active": i % 2 == 0,
+         "nested": {"tags": ["a", str(i)], "none": None}} for i in range(100)], serial_key="id").build())
+    db.execute_query(RawQueryBuilder.delete(target="users", query_node=FieldEquals("age", 3)).build())
+    db.execute_query(RawQueryBuilder.add(target="items", raw_add_data=[{"id": -1, "名前": "項目"}],
+                                         serial_key="id").build())
+    db.collection("empty")
+    return db
+
+
+def test_binary_snapshot_round_trip():
+    for mode in (EnumConcurrencyMode.global_, EnumConcurrencyMode.collection_):
+        db = _make_db(mode)
+        f = io.BytesIO()
+        db.write_binary(f)
+        f.seek(0)
+        restored = DeltaTraceDatabase.from_binary(f)
+        assert restored.to_dict() == db.to_dict()
+        assert restored.collection("users").get_serial_num() == 100
+        # 復元したデータは元のDBと共有されない。
+        restored.collection("users").raw[0]["nested"]["tags"].append("x")
+        assert restored.to_dict() != db.to_dict()
+    # コレクション単位でも同じ内容になり、marshalで扱えない型は変換される。
+    col = Collection()
+    col.raw.append({"name": _MyStr("a"), "list": [1, 2.5, True, None]})
+    restored_col = Collection.from_binary(col.to_binary())
+    assert restored_col.to_dict() == col.to_dict()
+    assert type(restored_col.raw[0]["name"]) is str
+
+
+def test_binary_snapshot_keep_listener():
+    db = _make_db()
+    f = io.BytesIO()
+    db.write_binary(f)
+    target = DeltaTraceDatabase()
+    target.add_index("users", "age")
+    called = []
+    target.add_listener("users", lambda: called.append(1))
+    target.execute_query(RawQueryBuilder.add(target="other", raw_add_data=[{"a": 1}]).build())
+    f.seek(0)
+    target.load_binary_keep_listener(f)
+    assert target.collection("users").length == db.collection("users").length
+    assert target.collection("other").length == 1
+    # インデックスの設定とリスナーは維持される。
+    r = target.execute_query(RawQueryBuilder.search(target="users", query_node=FieldEquals("age", 5)).build())
+    assert r.hit_count == 10
+    assert target.explain(RawQueryBuilder.search(target="users",
+                                                 query_node=FieldEquals("age", 5)).build())["scan"] == "index"
+    target.execute_query(RawQueryBuilder.delete_one(target="users", query_node=FieldEquals("age", 5)).build())
+    assert len(called) == 1
+
+
+def test_binary_snapshot_trusted_from_dict():
+    src = {"data": [{"a": 1}], "serialNum": 1}
+    assert Collection.from_dict(src, is_trusted=True).raw is src["data"]
+    assert Collection.from_dict(src).raw is not src["data"]
+    db = DeltaTraceDatabase.from_dict({"collections": {"users": src}}, is_trusted=True)
+    assert db.collection("users").raw is src["data"]
+    db.collection_from_dict_keep_listener("items", src, is_trusted=True)
+    assert db.collection("items").raw is src["data"]
+
+
+def test_binary_snapshot_invalid():
+    db = _make_db()
+    f = io.BytesIO()
+    db.write_binary(f)
+    data = f.getvalue()
+    for broken in (b"", b"XXXX" + data[4:], data[:-1], data[:len(data) // 2]):
+        with pytest.raises(ValueError):
+            DeltaTraceDatabase.from_binary(io.BytesIO(broken))
+    newer = data[:4] + (marshal.version + 1).to_bytes(2, "big") + data[6:]
+    with pytest.raises(ValueError):
+        DeltaTraceDatabase.from_binary(io.BytesIO(newer))
+    with pytest.raises(ValueError):
+        Collection.from_binary(marshal.dumps([1, 2]))
+    with pytest.raises(ValueError):
+        UtilBinarySnapshot.loads_collection(b"")
+
+
+def test_binary_snapshot_speed():
+    records_count = 100000
+    db = DeltaTraceDatabase()
+    db.execute_query(RawQueryBuilder.add(target="users", raw_add_data=[
+        {"id": -1, "name": f"user{i}", "age": i % 100, "nested": {"tags": ["a", "b"], "score": i / 7}}
+        for i in range(records_count)], serial_key="id").build())
+    t = time.perf_counter()
+    text = json.dumps(db.to_dict())
+    json_save_ms = (time.perf_counter() - t) * 1000
+    t = time.perf_counter()
+    DeltaTraceDatabase.from_dict(json.loads(text))
+    json_load_ms = (time.perf_counter() - t) * 1000
+    f = io.BytesIO()
+    t = time.perf_counter()
+    db.write_binary(f)
+    binary_save_ms = (time.perf_counter() - t) * 1000
+    f.seek(0)
+    t = time.perf_counter()
+    restored = DeltaTraceDatabase.from_binary(f)
+    binary_load_ms = (time.perf_counter() - t) * 1000
+    assert restored.collection("users").length == records_count
+    print(f"end save and load of {records_count} records: json {json_save_ms:.0f} ms / {json_load_ms:.0f} ms "
+          f"({len(text)} chars), binary {binary_save_ms:.0f} ms / {binary_load_ms:.0f} ms ({len(f.getvalue())} bytes)")
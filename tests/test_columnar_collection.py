@@ -0,0 +1,248 @@
+# coding: utf-8
+import json
+import time
+import tracemalloc
+
+import pytest
+
+from delta_trace_db.db.columnar_collection import ColumnarCollection
+from delta_trace_db.db.delta_trace_db_collection import Collection
+from delta_trace_db.db.delta_trace_db_core import DeltaTraceDatabase
+from delta_trace_db.db.enum_concurrency_mode import EnumConcurrencyMode
+from delta_trace_db.query.nodes.comparison_node import FieldEquals, FieldNotEquals, FieldGreaterThan, \
+    FieldLessThanOrEqual, FieldIn, FieldNotIn, FieldStartsWith
+from delta_trace_db.query.nodes.enum_value_type import EnumValueType
+from delta_trace_db.query.nodes.logical_node import AndNode, OrNode, NotNode
+from delta_trace_db.query.raw_query_builder import RawQueryBuilder
+from delta_trace_db.query.sort.single_sort import SingleSort
+from delta_trace_db.query.transaction_query import TransactionQuery
+
+
+def _records(records_count: int = 200) -> list:
+    r = []
+    for i in range(records_count):
+        item = {"id": -1, "name": f"item{i % 50}", "age": i % 30, "score": i / 4}
+        # 不揃いなフィールド、型の混在、ネスト、キーの順序の違いを含める。
+        if i % 3 == 0:
+            item["extra"] = [1, {"a": i}]
+        if i % 7 == 0:
+            item["age"] = None if i % 2 == 0 else str(i)
+        if i % 11 == 0:
+            item = {"meta": {"kind": i % 2}, **item}
+        if i % 13 == 0:
+            del item["score"]
+        if i == 5:
+            item["age"] = 2 ** 70
+        if i == 6:
+            item["age"] = True
+        r.append(item)
+    return r
+
+
+def _make_dbs(mode: EnumConcurrencyMode = EnumConcurrencyMode.global_):
+    db = DeltaTraceDatabase(concurrency_mode=mode)
+    columnar = DeltaTraceDatabase(concurrency_mode=mode)
+    columnar.set_columnar("items")
+    for d in (db, columnar):
+        d.execute_query(RawQueryBuilder.add(target="items", raw_add_data=_records(), serial_key="id").build())
+    return db, columnar
+
+
+def _assert_same(db: DeltaTraceDatabase, columnar: DeltaTraceDatabase):
+    # キーの順序も含めて一致すること。
+    assert json.dumps(columnar.to_dict()) == json.dumps(db.to_dict())
+
+
+def test_columnar_same_results():
+    for mode in (EnumConcurrencyMode.global_, EnumConcurrencyMode.collection_):
+        db, columnar = _make_dbs(mode)
+        col = columnar.collection("items")
+        assert isinstance(col, ColumnarCollection)
+        assert col.column_kinds["score"] == "float"
+        assert col.column_kinds["name"] == "str"
+        assert col.column_kinds["age"] == "obj"
+        assert col.column_kinds["id"] == "int"
+        _assert_same(db, columnar)
+        nodes = [
+            FieldEquals("id", 10),
+            FieldEquals("id", 10.0),
+            FieldEquals("age", 1),
+            FieldEquals("age", None),
+            FieldEquals("score", None),
+            FieldEquals("extra", [1, {"a": 3}]),
+            FieldEquals("meta.kind", 1),
+            FieldNotEquals("score", 2.5),
+            FieldNotEquals("score", None),
+            FieldNotEquals("name", "item3"),
+            FieldGreaterThan("score", 30),
+            FieldGreaterThan("score", "a"),
+            FieldGreaterThan("name", "item4"),
+            FieldGreaterThan("id", None),
+            FieldLessThanOrEqual("id", 5),
+            FieldLessThanOrEqual("age", 3),
+            FieldGreaterThan("score", "10", v_type=EnumValueType.floatStrict_),
+            FieldIn("id", [1, 2, 300, "4"]),
+            FieldIn("score", [None, 1.0]),
+            FieldNotIn("name", ["item1", "item2"]),
+            FieldNotIn("score", [0.25]),
+            FieldIn("extra", [[1, {"a": 0}]]),
+            FieldStartsWith("name", "item1"),
+            AndNode([FieldGreaterThan("score", 10), FieldStartsWith("name", "item1")]),
+            AndNode([FieldGreaterThan("score", 10), FieldLessThanOrEqual("id", 100)]),
+            OrNode([FieldEquals("id", 3), FieldEquals("name", "item7")]),
+            OrNode([FieldEquals("id", 3), FieldStartsWith("name", "item7")]),
+            NotNode(FieldEquals("id", 3)),
+        ]
+        for node in nodes:
+            for q in (
+                    RawQueryBuilder.search(target="items", query_node=node).build(),
+                    RawQueryBuilder.search(target="items", query_node=node,
+                                           sort_obj=SingleSort("id", reversed_=True), offset=2, limit=5).build(),
+                    RawQueryBuilder.search_one(target="items", query_node=node).build(),
+            ):
+                assert columnar.execute_query(q).to_dict() == db.execute_query(q).to_dict()
+        for q in (
+                RawQueryBuilder.get_all(target="items").build(),
+                RawQueryBuilder.get_all(target="items", offset=190, limit=20).build(),
+                RawQueryBuilder.get_all(target="items", offset=-1, limit=0).build(),
+                RawQueryBuilder.get_all(target="items", sort_obj=SingleSort("id"), limit=10).build(),
+                RawQueryBuilder.count(target="items").build(),
+        ):
+            assert columnar.execute_query(q).to_dict() == db.execute_query(q).to_dict()
+        # カーソルによるページング。
+        q = RawQueryBuilder.get_all(target="items", sort_obj=SingleSort("id"), limit=30).build()
+        r1 = db.execute_query(q)
+        r2 = columnar.execute_query(q)
+        assert r2.next_cursor == r1.next_cursor
+        q = RawQueryBuilder.get_all(target="items", sort_obj=SingleSort("id"), limit=30,
+                                    cursor=r1.next_cursor).build()
+        assert columnar.execute_query(q).to_dict() == db.execute_query(q).to_dict()
+        explain = columnar.explain(
+            RawQueryBuilder.search(target="items", query_node=FieldEquals("name", "item3")).build())
+        assert explain["scan"] == "column"
+        assert explain["scanCount"] == 4
+        # rawは復元したレコードを返し、その編集はコレクションに影響しない。
+        col.raw[0]["name"] = "changed"
+        _assert_same(db, columnar)
+
+
+def test_columnar_write():
+    db, columnar = _make_dbs()
+    calls = []
+    columnar.add_listener("items", lambda: calls.append(1))
+    queries = [
+        RawQueryBuilder.add(target="items", raw_add_data=[{"id": -1, "name": "new", "age": 1.5, "other": "x"}],
+                            serial_key="id", return_data=True).build(),
+        RawQueryBuilder.update(target="items", query_node=FieldEquals("age", 3),
+                               override_data={"age": 33, "meta.kind": "k"}, return_data=True).build(),
+        RawQueryBuilder.update_one(target="items", query_node=FieldGreaterThan("score", 40),
+                                   override_data={"name": "one"}).build(),
+        RawQueryBuilder.delete(target="items", query_node=FieldIn("name", ["item3", "item4"]),
+                               return_data=True).build(),
+        RawQueryBuilder.delete_one(target="items", query_node=FieldEquals("name", "item5")).build(),
+        RawQueryBuilder.rename_field(target="items", rename_before="name", rename_after="label").build(),
+        RawQueryBuilder.conform_to_template(target="items", template={"id": 0, "label": "", "age": 0}).build(),
+        RawQueryBuilder.search(target="items", query_node=FieldEquals("age", 0)).build(),
+        RawQueryBuilder.clear_add(target="items", raw_add_data=[{"id": -1, "v": 1}, {"id": -1}], serial_key="id",
+                                  reset_serial=True).build(),
+        RawQueryBuilder.add(target="items", raw_add_data=[{"id": -1, "v": "s"}], serial_key="id").build(),
+        RawQueryBuilder.search(target="items", query_node=FieldEquals("v", None)).build(),
+        RawQueryBuilder.clear(target="items").build(),
+    ]
+    for q in queries:
+        assert columnar.execute_query(q).to_dict() == db.execute_query(q).to_dict()
+        _assert_same(db, columnar)
+        assert not columnar.collection("items")._is_materialized
+    assert len(calls) == 10
+
+
+def test_columnar_transaction():
+    db, columnar = _make_dbs()
+    for d in (db, columnar):
+        d.execute_query(RawQueryBuilder.add(target="users", raw_add_data=[{"id": -1, "n": 1}],
+                                            serial_key="id").build())
+    columnar.set_columnar("users")
+    for queries in (
+            [
+                RawQueryBuilder.add(target="items", raw_add_data=[{"id": -1}], serial_key="id").build(),
+                RawQueryBuilder.update(target="users", query_node=FieldEquals("id", 0),
+                                       override_data={"n": 2}).build(),
+                RawQueryBuilder.delete(target="items", query_node=FieldEquals("id", 1000)).build(),
+            ],
+            [
+                RawQueryBuilder.add(target="items", raw_add_data=[{"id": -1}], serial_key="id").build(),
+                RawQueryBuilder.delete(target="users", query_node=FieldEquals("id", 0)).build(),
+            ],
+            [
+                RawQueryBuilder.search(target="items", query_node=FieldEquals("id", 1)).build(),
+                RawQueryBuilder.delete(target="users", query_node=FieldEquals("id", 1000)).build(),
+            ],
+    ):
+        r1 = db.execute_query_object(TransactionQuery(queries=queries))
+        r2 = columnar.execute_query_object(TransactionQuery(queries=queries))
+        assert r2.is_success == r1.is_success
+        _assert_same(db, columnar)
+        assert not columnar.collection("items")._is_materialized
+        assert not columnar.collection("users")._is_materialized
+
+
+def test_columnar_settings(tmp_path):
+    db = DeltaTraceDatabase()
+    db.execute_query(RawQueryBuilder.add(target="items", raw_add_data=_records(), serial_key="id").build())
+    db.add_index("items", "name")
+    db.set_read_only_results("items")
+    calls = []
+    db.add_listener("items", lambda: calls.append(1))
+    expected = db.to_dict()
+    db.set_columnar("items")
+    col = db.collection("items")
+    assert isinstance(col, ColumnarCollection)
+    assert col.is_read_only_results
+    assert col.indexes == []
+    assert col.get_serial_num() == 200
+    with pytest.raises(ValueError):
+        db.add_index("items", "name")
+    db.execute_query(RawQueryBuilder.add(target="items", raw_add_data=[{"id": -1}], serial_key="id").build())
+    assert calls == [1]
+    assert db.collection("items").raw[-1] == {"id": 200}
+    # 上書きの復元では列指向の格納が維持され、シリアライズでは通常のコレクションになる。
+    db.collection_from_dict_keep_listener("items", expected["collections"]["items"])
+    assert isinstance(db.collection("items"), ColumnarCollection)
+    assert db.to_dict() == expected
+    path = str(tmp_path / "db.json")
+    db.save_to(path)
+    assert type(DeltaTraceDatabase.load_from(path).collection("items")) is Collection
+    assert isinstance(db.clone().collection("items"), Collection)
+    db.set_columnar("items", False)
+    assert type(db.collection("items")) is Collection
+    assert db.to_dict() == expected
+    assert db.collection("items").is_read_only_results
+
+
+def test_columnar_speed():
+    records_count = 100000
+    records = [{"id": -1, "name": f"user{i % 1000}", "age": i % 100, "score": i / 7}
+               for i in range(records_count)]
+    q = RawQueryBuilder.search(target="users", query_node=AndNode([
+        FieldGreaterThan("age", 90), FieldLessThanOrEqual("score", 5000)])).build()
+    tracemalloc.start()
+    db = DeltaTraceDatabase()
+    db.execute_query(RawQueryBuilder.add(target="users", raw_add_data=records, serial_key="id").build())
+    rows_memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    tracemalloc.start()
+    columnar = DeltaTraceDatabase()
+    columnar.set_columnar("users")
+    columnar.execute_query(RawQueryBuilder.add(target="users", raw_add_data=records, serial_key="id").build())
+    columns_memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    t = time.perf_counter()
+    r1 = db.execute_query(q)
+    rows_ms = (time.perf_counter() - t) * 1000
+    t = time.perf_counter()
+    r2 = columnar.execute_query(q)
+    columns_ms = (time.perf_counter() - t) * 1000
+    assert r1.to_dict() == r2.to_dict()
+    assert columns_memory < rows_memory
+    print(f"end a range search of {records_count} records: rows {rows_ms:.0f} ms, "
+          f"{rows_memory // 1024 // 1024} MB, columns {columns_ms:.0f} ms, {columns_memory // 1024 // 1024} MB")
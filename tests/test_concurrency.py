@@ -0,0 +1,190 @@
+# coding: utf-8
+import sys
+import threading
+import time
+
+import pytest
+
+from delta_trace_db.db.delta_trace_db_core import DeltaTraceDatabase
+from delta_trace_db.db.enum_concurrency_mode import EnumConcurrencyMode
+from delta_trace_db.db.rw_lock import RWLock
+from delta_trace_db.query.nodes.comparison_node import FieldEquals, FieldGreaterThanOrEqual
+from delta_trace_db.query.raw_query_builder import RawQueryBuilder
+from delta_trace_db.query.transaction_query import TransactionQuery
+
+
+def _run_threads(funcs, timeout: float = 60):
+    errors = []
+
+    def wrap(f):
+        def run():
+            try:
+                f()
+            except Exception as e:
+                errors.append(e)
+
+        return run
+
+    threads = [threading.Thread(target=wrap(f)) for f in funcs]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(timeout)
+        # デッドロックした場合はここで失敗する。
+        assert not t.is_alive()
+    assert not errors, errors
+
+
+def test_rw_lock_readers_share():
+    lock = RWLock()
+    both_reading = threading.Barrier(2, timeout=10)
+
+    def reader():
+        with lock.read():
+            # 両方のスレッドが同時に読み込みロックを保持できなければタイムアウトする。
+            both_reading.wait()
+
+    _run_threads([reader, reader])
+
+
+def test_rw_lock_writer_excludes():
+    lock = RWLock()
+    state = {"inside": 0, "max": 0}
+
+    def writer():
+        for _ in range(200):
+            with lock.write():
+                state["inside"] += 1
+                state["max"] = max(state["max"], state["inside"])
+                time.sleep(0)
+                state["inside"] -= 1
+
+    def reader():
+        for _ in range(200):
+            with lock.read():
+                assert state["inside"] == 0
+
+    _run_threads([writer, writer, reader, reader])
+    assert state["max"] == 1
+
+
+def test_rw_lock_reentrant():
+    lock = RWLock()
+    with lock.write():
+        with lock.write():
+            with lock.read():
+                pass
+    with lock.read():
+        with lock.read():
+            with pytest.raises(RuntimeError):
+                lock.acquire_write()
+
+    def writer():
+        # 全て解放されていれば、別のスレッドから書き込みロックを取得できる。
+        with lock.write():
+            pass
+
+    _run_threads([writer])
+
+
+def _make_db(mode: EnumConcurrencyMode, names, records_count: int) -> DeltaTraceDatabase:
+    db = DeltaTraceDatabase(concurrency_mode=mode)
+    for name in names:
+        data = [{"id": -1, "age": i % 100, "name": f"user{i}"} for i in range(records_count)]
+        db.execute_query(RawQueryBuilder.add(target=name, raw_add_data=data, serial_key="id").build())
+    return db
+
+
+def test_collection_mode_concurrent_writes():
+    db = _make_db(EnumConcurrencyMode.collection_, ["a", "b"], 100)
+    assert db.concurrency_mode == EnumConcurrencyMode.collection_
+
+    def adder(name):
+        def run():
+            for i in range(100):
+                r = db.execute_query(RawQueryBuilder.add(target=name, raw_add_data=[{"id": -1, "age": 1000}],
+                                                         serial_key="id").build())
+                assert r.is_success
+
+        return run
+
+    def transfer(first, second):
+        def run():
+            # 逆順にコレクションを扱うトランザクション同士でもデッドロックしない。
+            for i in range(50):
+                tq = TransactionQuery(queries=[
+                    RawQueryBuilder.update_one(target=first, query_node=FieldEquals("id", i),
+                                               override_data={"age": -1}).build(),
+                    RawQueryBuilder.update_one(target=second, query_node=FieldEquals("id", i),
+                                               override_data={"age": -1}).build(),
+                ])
+                assert db.execute_transaction_query(tq).is_success
+
+        return run
+
+    def deleter(name):
+        def run():
+            for i in range(50, 100):
+                assert db.execute_query(RawQueryBuilder.delete_one(target=name, query_node=FieldEquals("id", i))
+                                        .build()).is_success
+
+        return run
+
+    def reader(name):
+        def run():
+            for _ in range(100):
+                r = db.execute_query(RawQueryBuilder.search(target=name,
+                                                            query_node=FieldGreaterThanOrEqual("age", 0)).build())
+                assert r.is_success
+                db.to_dict()
+
+        return run
+
+    _run_threads([adder("a"), adder("b"), transfer("a", "b"), transfer("b", "a"),
+                  deleter("a"), deleter("b"), reader("a"), reader("b")])
+    for name in ("a", "b"):
+        assert db.collection(name).length == 150
+        r = db.execute_query(RawQueryBuilder.search(target=name, query_node=FieldEquals("age", -1)).build())
+        assert r.hit_count == 50
+        assert db.collection(name).get_serial_num() == 200
+    assert db.clone().concurrency_mode == EnumConcurrencyMode.collection_
+
+
+def test_collection_mode_same_result():
+    queries = [
+        RawQueryBuilder.add(target="a", raw_add_data=[{"id": -1, "age": 5}], serial_key="id").build(),
+        RawQueryBuilder.delete(target="a", query_node=FieldEquals("age", 3)).build(),
+        RawQueryBuilder.search(target="a", query_node=FieldEquals("age", 5)).build(),
+        RawQueryBuilder.get_all(target="a").build(),
+        RawQueryBuilder.count(target="a").build(),
+        RawQueryBuilder.remove_collection(target="b").build(),
+        RawQueryBuilder.search(target="b", query_node=FieldEquals("age", 5)).build(),
+    ]
+    db1 = _make_db(EnumConcurrencyMode.global_, ["a", "b"], 100)
+    db2 = _make_db(EnumConcurrencyMode.collection_, ["a", "b"], 100)
+    for q in queries:
+        assert db1.execute_query(q).to_dict() == db2.execute_query(q).to_dict()
+    assert db1.to_dict() == db2.to_dict()
+
+
+def test_concurrency_read_scaling_speed():
+    records_count = 20000
+    searches = 20
+    names = ["c0", "c1", "c2", "c3"]
+    gil = getattr(sys, "_is_gil_enabled", lambda: True)()
+    print(f"start read scaling test: records {records_count} per collection, GIL enabled: {gil}")
+    for mode in (EnumConcurrencyMode.global_, EnumConcurrencyMode.collection_):
+        db = _make_db(mode, names, records_count)
+        for threads_count in (1, 2, 4):
+            def reader(name):
+                def run():
+                    for _ in range(searches):
+                        db.execute_query(RawQueryBuilder.search(target=name,
+                                                                query_node=FieldEquals("age", 50)).build())
+
+                return run
+
+            t = time.perf_counter()
+            _run_threads([reader(names[i]) for i in range(threads_count)])
+            ms = (time.perf_counter() - t) * 1000
+            print(f"end {mode.name} {threads_count} threads x {searches} searches: {ms:.0f} ms")
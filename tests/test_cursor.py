@@ -0,0 +1,128 @@
+# coding: utf-8
+import random
+import time
+
+from delta_trace_db.db.delta_trace_db_core import DeltaTraceDatabase
+from delta_trace_db.query.nodes.comparison_node import FieldEquals, FieldGreaterThanOrEqual
+from delta_trace_db.query.nodes.enum_value_type import EnumValueType
+from delta_trace_db.query.query import Query
+from delta_trace_db.query.query_result import QueryResult
+from delta_trace_db.query.raw_query_builder import RawQueryBuilder
+from delta_trace_db.query.sort.multi_sort import MultiSort
+from delta_trace_db.query.sort.single_sort import SingleSort
+
+
+def _make_db(records_count: int) -> DeltaTraceDatabase:
+    rnd = random.Random(5)
+    db = DeltaTraceDatabase()
+    data = []
+    for i in range(records_count):
+        item = {"id": -1, "age": rnd.choice([None, rnd.randrange(10)]), "name": f"user{rnd.randrange(50)}",
+                "score": rnd.choice([rnd.random(), 0.5, 0.5 + 1e-13]), "info": {"rank": rnd.randrange(3)}}
+        data.append(item)
+    db.execute_query(RawQueryBuilder.add(target="users", raw_add_data=data, serial_key="id").build())
+    return db
+
+
+def _pages(db: DeltaTraceDatabase, builder: RawQueryBuilder, limit: int):
+    r = []
+    cursor = None
+    while True:
+        res = db.execute_query(builder.set_limit(limit).set_cursor(cursor).build())
+        assert res.is_success
+        r.extend(res.result)
+        cursor = res.next_cursor
+        if cursor is None:
+            return r
+
+
+def test_cursor_pages_same_as_full_sort():
+    db = _make_db(300)
+    sorts = [
+        None,
+        SingleSort("age"),
+        SingleSort("age", reversed_=True),
+        SingleSort("score", v_type=EnumValueType.floatEpsilon12_),
+        SingleSort("info.rank"),
+        MultiSort([SingleSort("name", reversed_=True), SingleSort("age")]),
+    ]
+    for sort_obj in sorts:
+        for limit in (1, 7, 50, 300):
+            full = db.execute_query(RawQueryBuilder.get_all(target="users", sort_obj=sort_obj).build()).result
+            assert _pages(db, RawQueryBuilder.get_all(target="users", sort_obj=sort_obj), limit) == full
+            full = db.execute_query(RawQueryBuilder.search(target="users", query_node=FieldEquals("age", 3),
+                                                           sort_obj=sort_obj).build()).result
+            assert _pages(db, RawQueryBuilder.search(target="users", query_node=FieldEquals("age", 3),
+                                                     sort_obj=sort_obj), limit) == full
+
+
+def test_cursor_after_changes():
+    db = _make_db(100)
+    sort_obj = SingleSort("age")
+    full = db.execute_query(RawQueryBuilder.get_all(target="users", sort_obj=sort_obj).build()).result
+    r = db.execute_query(RawQueryBuilder.get_all(target="users", sort_obj=sort_obj, limit=30).build())
+    last = r.result[-1]
+    # ページの最後のレコードが変更、または削除されても、続きから取得できる。
+    db.execute_query(RawQueryBuilder.update_one(target="users", query_node=FieldEquals("id", last["id"]),
+                                                override_data={"age": 1000}).build())
+    r2 = db.execute_query(RawQueryBuilder.get_all(target="users", sort_obj=sort_obj, limit=10,
+                                                  cursor=r.next_cursor).build())
+    assert r2.result == full[30:40]
+    db.execute_query(RawQueryBuilder.delete_one(target="users", query_node=FieldEquals("id", last["id"])).build())
+    r2 = db.execute_query(RawQueryBuilder.get_all(target="users", sort_obj=sort_obj, limit=10,
+                                                  cursor=r.next_cursor).build())
+    assert r2.result == full[30:40]
+    # 既に返したレコードの前に追加されたレコードは返さない。
+    db.execute_query(RawQueryBuilder.add(target="users", raw_add_data=[{"id": -1, "age": -1}],
+                                         serial_key="id").build())
+    r2 = db.execute_query(RawQueryBuilder.get_all(target="users", sort_obj=sort_obj, limit=10,
+                                                  cursor=r.next_cursor).build())
+    assert r2.result == full[30:40]
+
+
+def test_cursor_errors_and_serialization():
+    db = _make_db(20)
+    r = db.execute_query(RawQueryBuilder.get_all(target="users", sort_obj=SingleSort("age"), limit=5).build())
+    assert r.next_cursor is not None
+    assert QueryResult.from_dict(r.to_dict()).next_cursor == r.next_cursor
+    q = RawQueryBuilder.get_all(target="users", sort_obj=SingleSort("age"), limit=5, cursor=r.next_cursor).build()
+    assert Query.from_dict(q.to_dict()).cursor == r.next_cursor
+    # ページが埋まらない場合は、次のカーソルは無い。
+    assert db.execute_query(RawQueryBuilder.get_all(target="users", limit=30).build()).next_cursor is None
+    assert db.execute_query(RawQueryBuilder.get_all(target="users").build()).next_cursor is None
+    # 不正なカーソルや、ソートと一致しないカーソルは失敗する。
+    for cursor in ("???", "e30=", r.next_cursor):
+        res = db.execute_query(RawQueryBuilder.get_all(target="users", sort_obj=MultiSort(
+            [SingleSort("age"), SingleSort("name")]), limit=5, cursor=cursor).build())
+        assert res.is_success is False
+    # シリアルキーを使わないコレクションでは、カーソルは作られない。
+    db.execute_query(RawQueryBuilder.add(target="plain", raw_add_data=[{"v": 1}, {"v": 2}]).build())
+    assert db.execute_query(RawQueryBuilder.get_all(target="plain", limit=1).build()).next_cursor is None
+    # スナップショット読み込みでも、カーソルを指定したクエリは通常通り実行される。
+    db.set_snapshot_reads("users")
+    r2 = db.execute_query(q)
+    assert r2.is_success and len(r2.result) == 5
+
+
+def test_cursor_speed():
+    records_count = 100000
+    page = 20
+    db = DeltaTraceDatabase()
+    db.set_read_only_results("users")
+    db.execute_query(RawQueryBuilder.add(target="users", raw_add_data=[
+        {"id": -1, "name": f"user{i}", "age": i % 100} for i in range(records_count)], serial_key="id").build())
+    sort_obj = MultiSort([SingleSort("age"), SingleSort("name")])
+    node = FieldGreaterThanOrEqual("age", 0)
+    deep = records_count - page * 2
+    t = time.perf_counter()
+    r1 = db.execute_query(RawQueryBuilder.search(target="users", query_node=node, sort_obj=sort_obj,
+                                                 offset=deep, limit=page).build())
+    offset_ms = (time.perf_counter() - t) * 1000
+    anchor = db.execute_query(RawQueryBuilder.search(target="users", query_node=node, sort_obj=sort_obj,
+                                                     offset=deep - page, limit=page).build())
+    t = time.perf_counter()
+    r2 = db.execute_query(RawQueryBuilder.search(target="users", query_node=node, sort_obj=sort_obj,
+                                                 limit=page, cursor=anchor.next_cursor).build())
+    cursor_ms = (time.perf_counter() - t) * 1000
+    assert r1.result == r2.result
+    print(f"end deep page of {records_count} records: offset {offset_ms:.0f} ms, cursor {cursor_ms:.0f} ms")
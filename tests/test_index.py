@@ -0,0 +1,137 @@
+# coding: utf-8
+from delta_trace_db.db.delta_trace_db_core import DeltaTraceDatabase
+from delta_trace_db.db.index.enum_index_type import EnumIndexType
+from delta_trace_db.query.nodes.comparison_node import FieldEquals, FieldIn, FieldGreaterThan
+from delta_trace_db.query.nodes.logical_node import AndNode, OrNode, NotNode
+from delta_trace_db.query.raw_query_builder import RawQueryBuilder
+from delta_trace_db.query.transaction_query import TransactionQuery
+
+
+def _make_data():
+    return [
+        {"id": -1, "name": f"user{i}", "group": i % 3, "nestedObj": {"num": i % 5}, "tags": [i % 2]}
+        for i in range(30)
+    ]
+
+
+def _make_db(with_index: bool) -> DeltaTraceDatabase:
+    db = DeltaTraceDatabase()
+    if with_index:
+        db.add_index("users", "id")
+        db.add_index("users", "group")
+        db.add_index("users", "nestedObj.num")
+        db.add_index("users", "tags")
+    db.execute_query(RawQueryBuilder.add(target="users", raw_add_data=_make_data(), serial_key="id").build())
+    return db
+
+
+def _search(db: DeltaTraceDatabase, node):
+    return db.execute_query(RawQueryBuilder.search(target="users", query_node=node).build())
+
+
+def test_index_search_same_result():
+    db1 = _make_db(False)
+    db2 = _make_db(True)
+    nodes = [
+        FieldEquals("id", 5),
+        FieldEquals("id", 5.0),
+        FieldEquals("id", 100),
+        FieldEquals("group", 1),
+        FieldEquals("nestedObj.num", 3),
+        FieldEquals("nestedObj.none", None),
+        FieldEquals("tags", [1]),
+        FieldIn("group", [0, 2]),
+        FieldIn("id", [3, 7, [1], 9]),
+        AndNode([FieldEquals("group", 1), FieldGreaterThan("id", 10)]),
+        AndNode([FieldEquals("group", 1), FieldEquals("nestedObj.num", 2)]),
+        OrNode([FieldEquals("id", 1), FieldEquals("id", 29)]),
+        OrNode([FieldEquals("id", 1), FieldGreaterThan("id", 25)]),
+        NotNode(FieldEquals("group", 1)),
+    ]
+    for node in nodes:
+        r1 = _search(db1, node)
+        r2 = _search(db2, node)
+        assert r1.is_success and r2.is_success
+        # 順序も含めて一致する必要がある。
+        assert r1.result == r2.result
+        assert r1.hit_count == r2.hit_count
+
+
+def test_index_narrows_targets():
+    db = _make_db(True)
+    col = db.collection("users")
+    assert len(col._scan_targets(FieldEquals("id", 5))) == 1
+    assert len(col._scan_targets(FieldIn("id", [1, 2, 3]))) == 3
+    assert len(col._scan_targets(AndNode([FieldEquals("group", 1), FieldEquals("id", 4)]))) == 1
+    assert len(col._scan_targets(FieldGreaterThan("id", 5))) == 30
+    db.remove_index("users", "id")
+    assert len(col._scan_targets(FieldEquals("id", 5))) == 30
+
+
+def test_index_maintenance():
+    db1 = _make_db(False)
+    db2 = _make_db(True)
+    queries = [
+        RawQueryBuilder.update(target="users", query_node=FieldEquals("group", 1),
+                               override_data={"group": 5, "nestedObj": {"num": 9}}).build(),
+        RawQueryBuilder.update_one(target="users", query_node=FieldEquals("group", 5),
+                                   override_data={"group": 0}, return_data=True).build(),
+        RawQueryBuilder.delete(target="users", query_node=FieldEquals("nestedObj.num", 9),
+                               return_data=True).build(),
+        RawQueryBuilder.delete_one(target="users", query_node=FieldEquals("group", 0)).build(),
+        RawQueryBuilder.add(target="users", raw_add_data=_make_data(), serial_key="id").build(),
+        RawQueryBuilder.rename_field(target="users", rename_before="group", rename_after="g").build(),
+        RawQueryBuilder.rename_field(target="users", rename_before="g", rename_after="group").build(),
+        RawQueryBuilder.conform_to_template(target="users", template={"id": -1, "group": 7, "name": ""}).build(),
+        RawQueryBuilder.add(target="users", raw_add_data=_make_data(), serial_key="id").build(),
+    ]
+    check_nodes = [
+        FieldEquals("id", 3),
+        FieldEquals("id", 40),
+        FieldEquals("group", 0),
+        FieldEquals("group", 5),
+        FieldEquals("group", 7),
+        FieldEquals("nestedObj.num", 9),
+        FieldEquals("nestedObj.num", None),
+        FieldIn("group", [1, 2, 7]),
+    ]
+    for q in queries:
+        r1 = db1.execute_query(q)
+        r2 = db2.execute_query(q)
+        assert r1.is_success == r2.is_success
+        assert r1.result == r2.result
+        for node in check_nodes:
+            assert _search(db1, node).result == _search(db2, node).result
+    # clear系
+    for q in [
+        RawQueryBuilder.clear_add(target="users", raw_add_data=_make_data(), serial_key="id",
+                                  reset_serial=True).build(),
+        RawQueryBuilder.clear(target="users").build(),
+    ]:
+        db1.execute_query(q)
+        db2.execute_query(q)
+        for node in check_nodes:
+            assert _search(db1, node).result == _search(db2, node).result
+    assert len(db2.collection("users")._seq) == 0
+
+
+def test_index_transaction_rollback():
+    db = _make_db(True)
+    tq = TransactionQuery(queries=[
+        RawQueryBuilder.update(target="users", query_node=FieldEquals("id", 3), override_data={"id": 300}).build(),
+        RawQueryBuilder.delete(target="users", query_node=FieldEquals("id", 1000)).build(),
+    ])
+    r = db.execute_query_object(tq)
+    assert r.is_success is False
+    # ロールバック後もインデックスが維持され、元の値で検索できること。
+    col = db.collection("users")
+    assert len(col.indexes) == 4
+    assert len(col._scan_targets(FieldEquals("id", 3))) == 1
+    assert len(col._scan_targets(FieldEquals("id", 300))) == 0
+    assert _search(db, FieldEquals("id", 3)).hit_count == 1
+
+
+def test_index_type_enum():
+    db = DeltaTraceDatabase()
+    db.add_index("users", "id", index_type=EnumIndexType.hash_)
+    assert db.collection("users").indexes[0].index_type == EnumIndexType.hash_
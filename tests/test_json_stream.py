@@ -0,0 +1,106 @@
+# coding: utf-8
+import json
+import os
+import time
+import tracemalloc
+
+import pytest
+
+from delta_trace_db.db.delta_trace_db_core import DeltaTraceDatabase
+from delta_trace_db.db.enum_concurrency_mode import EnumConcurrencyMode
+from delta_trace_db.db.util_json_stream import UtilJsonStream
+from delta_trace_db.query.nodes.comparison_node import FieldEquals
+from delta_trace_db.query.raw_query_builder import RawQueryBuilder
+
+
+def _make_db(mode: EnumConcurrencyMode = EnumConcurrencyMode.global_) -> DeltaTraceDatabase:
+    db = DeltaTraceDatabase(concurrency_mode=mode)
+    # スナップショット読み込みのコレクションを先に作成し、書き込み順が入れ替わる場合を確認する。
+    db.set_snapshot_reads("items")
+    db.execute_query(RawQueryBuilder.add(target="items", raw_add_data=[
+        {"id": -1, "名前": "項目", "text": "line1\nline2,\"]}"}], serial_key="id").build())
+    db.execute_query(RawQueryBuilder.add(target="users", raw_add_data=[
+        {"id": -1, "name": f"user{i}", "age": i % 10, "score": i / 3, "active": i % 2 == 0,
+         "nested": {"tags": ["a", str(i)], "none": None}} for i in range(100)], serial_key="id").build())
+    db.execute_query(RawQueryBuilder.delete(target="users", query_node=FieldEquals("age", 3)).build())
+    db.collection("empty")
+    db.collection("x,\"]}\n")
+    return db
+
+
+def test_json_stream_round_trip(tmp_path):
+    for mode in (EnumConcurrencyMode.global_, EnumConcurrencyMode.collection_):
+        db = _make_db(mode)
+        path = str(tmp_path / f"{mode.name}.json")
+        db.save_to(path)
+        restored = DeltaTraceDatabase.load_from(path)
+        assert restored.to_dict() == db.to_dict()
+        assert restored.collection("users").get_serial_num() == 100
+        # ファイルは通常のJSONとしても読み込める。
+        with open(path, "r", encoding="utf-8") as f:
+            assert DeltaTraceDatabase.from_dict(json.load(f)).to_dict() == db.to_dict()
+        assert not os.path.exists(path + ".tmp")
+    path = str(tmp_path / "none.json")
+    DeltaTraceDatabase().save_to(path)
+    assert DeltaTraceDatabase.load_from(path).to_dict() == DeltaTraceDatabase().to_dict()
+
+
+def test_json_stream_invalid(tmp_path, monkeypatch):
+    db = _make_db()
+    path = str(tmp_path / "db.json")
+    db.save_to(path)
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    broken_path = str(tmp_path / "broken.json")
+    for broken in ("", text[:-4], text[:len(text) // 2], json.dumps(db.to_dict()),
+                   text.replace('"data":[', '"data":{', 1)):
+        with open(broken_path, "w", encoding="utf-8") as f:
+            f.write(broken)
+        with pytest.raises(ValueError):
+            DeltaTraceDatabase.load_from(broken_path)
+    # 保存に失敗した場合は以前のファイルが残り、一時ファイルは削除される。
+    monkeypatch.setattr(UtilJsonStream, "db_footer", staticmethod(lambda: 1 / 0))
+    with pytest.raises(ZeroDivisionError):
+        DeltaTraceDatabase().save_to(path)
+    assert DeltaTraceDatabase.load_from(path).to_dict() == db.to_dict()
+    assert not os.path.exists(path + ".tmp")
+
+
+def test_json_stream_speed(tmp_path):
+    records_count = 50000
+    db = DeltaTraceDatabase()
+    db.execute_query(RawQueryBuilder.add(target="users", raw_add_data=[
+        {"id": -1, "name": f"user{i}", "age": i % 100, "nested": {"tags": ["a", "b"], "score": i / 7}}
+        for i in range(records_count)], serial_key="id").build())
+    path1 = str(tmp_path / "dump.json")
+    path2 = str(tmp_path / "stream.json")
+    t = time.perf_counter()
+    with open(path1, "w", encoding="utf-8") as f:
+        json.dump(db.to_dict(), f)
+    dump_save_ms = (time.perf_counter() - t) * 1000
+    t = time.perf_counter()
+    db.save_to(path2)
+    stream_save_ms = (time.perf_counter() - t) * 1000
+    t = time.perf_counter()
+    with open(path1, "r", encoding="utf-8") as f:
+        DeltaTraceDatabase.from_dict(json.load(f))
+    dump_load_ms = (time.perf_counter() - t) * 1000
+    t = time.perf_counter()
+    DeltaTraceDatabase.load_from(path2)
+    stream_load_ms = (time.perf_counter() - t) * 1000
+    # 読み込み時のメモリのピークを比較する。
+    tracemalloc.start()
+    with open(path1, "r", encoding="utf-8") as f:
+        restored1 = DeltaTraceDatabase.from_dict(json.load(f))
+    dump_peak = tracemalloc.get_traced_memory()[1]
+    del restored1
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    restored2 = DeltaTraceDatabase.load_from(path2)
+    stream_peak = tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    assert restored2.collection("users").length == records_count
+    assert stream_peak < dump_peak
+    print(f"end save and load of {records_count} records: json.dump {dump_save_ms:.0f} ms / "
+          f"json.load {dump_load_ms:.0f} ms, peak {dump_peak // 1024 // 1024} MB, "
+          f"streaming {stream_save_ms:.0f} ms / {stream_load_ms:.0f} ms, peak {stream_peak // 1024 // 1024} MB")
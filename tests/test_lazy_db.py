@@ -0,0 +1,115 @@
+# coding: utf-8
+import threading
+import time
+
+import pytest
+
+from delta_trace_db.db.delta_trace_db_core import DeltaTraceDatabase
+from delta_trace_db.db.enum_concurrency_mode import EnumConcurrencyMode
+from delta_trace_db.db.lazy_delta_trace_db import LazyDeltaTraceDatabase
+from delta_trace_db.db.util_collection_files import UtilCollectionFiles
+from delta_trace_db.query.nodes.comparison_node import FieldEquals
+from delta_trace_db.query.raw_query_builder import RawQueryBuilder
+
+_NAMES = ["users", "Users", "項目", "a/b", ".."]
+
+
+def _make_db(records_count: int = 20) -> DeltaTraceDatabase:
+    db = DeltaTraceDatabase()
+    for name in _NAMES:
+        db.execute_query(RawQueryBuilder.add(target=name, raw_add_data=[
+            {"id": -1, "name": f"{name}{i}", "age": i % 10} for i in range(records_count)], serial_key="id").build())
+    return db
+
+
+def test_lazy_db_load_on_access(tmp_path):
+    directory = str(tmp_path)
+    db = _make_db()
+    db.save_collections(directory)
+    assert sorted(UtilCollectionFiles.list_files(directory)) == sorted(_NAMES)
+    for mode in (EnumConcurrencyMode.global_, EnumConcurrencyMode.collection_):
+        lazy = LazyDeltaTraceDatabase(directory, concurrency_mode=mode)
+        assert not any(lazy.is_loaded(name) for name in _NAMES)
+        q = RawQueryBuilder.search(target="Users", query_node=FieldEquals("age", 3)).build()
+        assert lazy.execute_query(q).to_dict() == db.execute_query(q).to_dict()
+        assert [lazy.is_loaded(name) for name in _NAMES] == [False, True, False, False, False]
+        assert lazy.find_collection("項目").length == 20
+        assert lazy.is_loaded("項目")
+        # 存在しないコレクションは通常通り扱われる。
+        assert lazy.find_collection("none") is None
+        assert lazy.is_loaded("none")
+        # 全てのコレクションが必要な操作では、全てが読み込まれる。
+        assert lazy.to_dict() == db.to_dict()
+        assert all(lazy.is_loaded(name) for name in _NAMES)
+    lazy = LazyDeltaTraceDatabase(directory)
+    assert set(lazy.raw.keys()) == set(_NAMES)
+    assert LazyDeltaTraceDatabase(str(tmp_path / "none")).to_dict() == DeltaTraceDatabase().to_dict()
+
+
+def test_lazy_db_save(tmp_path):
+    directory = str(tmp_path / "db")
+    _make_db().save_collections(directory)
+    lazy = LazyDeltaTraceDatabase(directory)
+    lazy.execute_query(RawQueryBuilder.delete(target="users", query_node=FieldEquals("age", 1)).build())
+    lazy.remove_collection("Users")
+    lazy.execute_query(RawQueryBuilder.add(target="new", raw_add_data=[{"a": 1}]).build())
+    lazy.collection_from_dict("..", {"data": [{"b": 2}], "serialNum": 5})
+    # 開いたディレクトリへの保存では、読み込まれていないコレクションは読み込まれない。
+    lazy.save_collections()
+    assert not lazy.is_loaded("項目")
+    assert not lazy.is_loaded("a/b")
+    assert sorted(UtilCollectionFiles.list_files(directory)) == sorted(["users", "項目", "a/b", "..", "new"])
+    reopened = LazyDeltaTraceDatabase(directory)
+    assert reopened.collection("users").length == 18
+    assert reopened.collection("..").get_serial_num() == 5
+    assert reopened.collection("new").raw == [{"a": 1}]
+    # 他のディレクトリへの保存では、全てのコレクションが保存される。
+    other = str(tmp_path / "other")
+    reopened.save_collections(other)
+    assert LazyDeltaTraceDatabase(other).to_dict() == lazy.to_dict()
+    with pytest.raises(ValueError):
+        LazyDeltaTraceDatabase().save_collections()
+
+
+def test_lazy_db_concurrent_load(tmp_path):
+    directory = str(tmp_path)
+    _make_db(5000).save_collections(directory)
+    lazy = LazyDeltaTraceDatabase(directory, concurrency_mode=EnumConcurrencyMode.collection_)
+    results = []
+
+    def run():
+        results.append(lazy.find_collection("users"))
+
+    threads = [threading.Thread(target=run) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(results) == 8
+    assert all(r is results[0] for r in results)
+    assert results[0].length == 5000
+
+
+def test_lazy_db_speed(tmp_path):
+    collections_count = 30
+    records_count = 5000
+    db = DeltaTraceDatabase()
+    for c in range(collections_count):
+        db.execute_query(RawQueryBuilder.add(target=f"col{c}", raw_add_data=[
+            {"id": -1, "name": f"user{i}", "age": i % 100} for i in range(records_count)], serial_key="id").build())
+    directory = str(tmp_path / "collections")
+    db.save_collections(directory)
+    path = str(tmp_path / "db.json")
+    db.save_to(path)
+    q = RawQueryBuilder.search(target="col3", query_node=FieldEquals("age", 5)).build()
+    t = time.perf_counter()
+    eager = DeltaTraceDatabase.load_from(path)
+    eager.execute_query(q)
+    eager_ms = (time.perf_counter() - t) * 1000
+    t = time.perf_counter()
+    lazy = LazyDeltaTraceDatabase(directory)
+    r = lazy.execute_query(q)
+    lazy_ms = (time.perf_counter() - t) * 1000
+    assert r.hit_count == records_count // 100
+    print(f"end cold start and a search of {collections_count} collections of {records_count} records: "
+          f"load all {eager_ms:.0f} ms, lazy {lazy_ms:.1f} ms")
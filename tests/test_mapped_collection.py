@@ -0,0 +1,202 @@
+# coding: utf-8
+import os
+import time
+import tracemalloc
+
+import pytest
+
+from delta_trace_db.db.delta_trace_db_core import DeltaTraceDatabase
+from delta_trace_db.db.enum_concurrency_mode import EnumConcurrencyMode
+from delta_trace_db.db.mapped_collection import MappedCollection
+from delta_trace_db.db.mapped_segment import MappedSegment
+from delta_trace_db.query.nodes.comparison_node import FieldEquals, FieldIn, FieldGreaterThan
+from delta_trace_db.query.nodes.logical_node import AndNode, OrNode, NotNode
+from delta_trace_db.query.raw_query_builder import RawQueryBuilder
+from delta_trace_db.query.sort.single_sort import SingleSort
+from delta_trace_db.query.transaction_query import TransactionQuery
+
+
+def _make_db(records_count: int = 200) -> DeltaTraceDatabase:
+    db = DeltaTraceDatabase()
+    db.execute_query(RawQueryBuilder.add(target="items", raw_add_data=[
+        {"id": -1, "name": f"item{i}", "group": i % 7, "score": i / 3,
+         "tags": ["a", str(i % 3)] if i % 5 == 0 else None,
+         "meta": {"kind": ["x", "y", 1, True][i % 4]}} for i in range(records_count)], serial_key="id").build())
+    return db
+
+
+def _count_decoded(monkeypatch) -> list:
+    decoded = [0]
+    record = MappedSegment.record
+
+    def counted(self, position):
+        decoded[0] += 1
+        return record(self, position)
+
+    monkeypatch.setattr(MappedSegment, "record", counted)
+    return decoded
+
+
+def test_mapped_collection_same_results(tmp_path):
+    path = str(tmp_path / "items.dtms")
+    db = _make_db()
+    assert db.collection_to_mapped("items", path, columns=["group", "tags", "meta.kind"])
+    assert not db.collection_to_mapped("none", path + "2")
+    for mode in (EnumConcurrencyMode.global_, EnumConcurrencyMode.collection_):
+        mapped = DeltaTraceDatabase(concurrency_mode=mode)
+        col = mapped.collection_from_mapped("items", path)
+        assert col.is_mapped
+        assert col.get_serial_num() == 200
+        nodes = [
+            FieldEquals("group", 3),
+            FieldEquals("group", 3.0),
+            FieldEquals("group", 100),
+            FieldEquals("tags", ["a", "1"]),
+            FieldEquals("meta.kind", 1),
+            FieldEquals("meta.kind", True),
+            FieldIn("group", [1, 2, "1"]),
+            FieldGreaterThan("score", 30),
+            AndNode([FieldEquals("group", 1), FieldGreaterThan("score", 10)]),
+            AndNode([FieldEquals("group", 1), FieldIn("meta.kind", ["y"])]),
+            OrNode([FieldEquals("group", 1), FieldEquals("meta.kind", "x")]),
+            OrNode([FieldEquals("group", 1), FieldGreaterThan("score", 60)]),
+            NotNode(FieldEquals("group", 1)),
+        ]
+        for node in nodes:
+            for q in (
+                    RawQueryBuilder.search(target="items", query_node=node).build(),
+                    RawQueryBuilder.search(target="items", query_node=node,
+                                           sort_obj=SingleSort("score", reversed_=True), offset=2, limit=5).build(),
+                    RawQueryBuilder.search_one(target="items", query_node=node).build(),
+            ):
+                assert mapped.execute_query(q).to_dict() == db.execute_query(q).to_dict()
+        for q in (
+                RawQueryBuilder.get_all(target="items").build(),
+                RawQueryBuilder.get_all(target="items", offset=190, limit=20).build(),
+                RawQueryBuilder.get_all(target="items", offset=-1, limit=0).build(),
+                RawQueryBuilder.get_all(target="items", sort_obj=SingleSort("name"), limit=10).build(),
+                RawQueryBuilder.count(target="items").build(),
+        ):
+            assert mapped.execute_query(q).to_dict() == db.execute_query(q).to_dict()
+        assert mapped.to_dict() == db.to_dict()
+        # 読み込みのみでは展開されない。
+        assert col.is_mapped
+        col.close()
+
+
+def test_mapped_collection_lazy_decode(tmp_path, monkeypatch):
+    path = str(tmp_path / "items.dtms")
+    _make_db(1000).collection_to_mapped("items", path, columns=["group"])
+    db = DeltaTraceDatabase()
+    db.collection_from_mapped("items", path)
+    decoded = _count_decoded(monkeypatch)
+    r = db.execute_query(RawQueryBuilder.search(target="items", query_node=FieldEquals("group", 3)).build())
+    assert r.hit_count == 143
+    assert decoded[0] == 143
+    explain = db.explain(RawQueryBuilder.search(target="items", query_node=FieldEquals("group", 3)).build())
+    assert explain["scan"] == "column"
+    assert explain["scanCount"] == 143
+    decoded[0] = 0
+    r = db.execute_query(RawQueryBuilder.get_all(target="items", offset=500, limit=10).build())
+    assert [v["id"] for v in r.result] == list(range(500, 510))
+    assert decoded[0] == 10
+    decoded[0] = 0
+    r = db.execute_query(RawQueryBuilder.search_one(target="items", query_node=FieldGreaterThan("id", 4)).build())
+    assert r.result[0]["id"] == 5
+    assert decoded[0] == 6
+    decoded[0] = 0
+    assert db.execute_query(RawQueryBuilder.count(target="items").build()).hit_count == 1000
+    assert decoded[0] == 0
+
+
+def test_mapped_collection_write(tmp_path):
+    path = str(tmp_path / "items.dtms")
+    db = _make_db()
+    db.collection_to_mapped("items", path, columns=["group"])
+    mapped = DeltaTraceDatabase()
+    col = mapped.collection_from_mapped("items", path)
+    calls = []
+    mapped.add_listener("items", lambda: calls.append(1))
+    # 失敗したトランザクションは、展開後の変更も含めて取り消される。
+    r = mapped.execute_query_object(TransactionQuery(queries=[
+        RawQueryBuilder.update(target="items", query_node=FieldEquals("group", 2),
+                               override_data={"group": 20}).build(),
+        RawQueryBuilder.delete(target="items", query_node=FieldEquals("id", 1000)).build(),
+    ]))
+    assert r.is_success is False
+    assert mapped.to_dict() == db.to_dict()
+    # 書き込みでは全件が展開され、以後は通常のコレクションと同様に動作する。
+    for q in (
+            RawQueryBuilder.update(target="items", query_node=FieldEquals("group", 2),
+                                   override_data={"group": 20}).build(),
+            RawQueryBuilder.delete(target="items", query_node=FieldEquals("group", 4)).build(),
+            RawQueryBuilder.add(target="items", raw_add_data=[{"id": -1, "group": 3}], serial_key="id").build(),
+    ):
+        assert mapped.execute_query(q).to_dict() == db.execute_query(q).to_dict()
+        assert not col.is_mapped
+    assert calls == [1, 1, 1]
+    q = RawQueryBuilder.search(target="items", query_node=FieldEquals("group", 3)).build()
+    assert mapped.execute_query(q).to_dict() == db.execute_query(q).to_dict()
+    # セグメントのファイルは変更されない。
+    assert MappedCollection.open(path).length == 200
+    mapped.execute_query(RawQueryBuilder.clear(target="items").build())
+    assert mapped.collection("items").length == 0
+    # 展開せずに書き込むことで、開いたセグメントを同じパスに上書きできる。
+    col = mapped.collection_from_mapped("items", path)
+    mapped.collection_to_mapped("items", path, columns=["group"])
+    assert col.is_mapped
+    assert MappedCollection.open(path).to_dict() == _make_db().collection("items").to_dict()
+
+
+def test_mapped_collection_invalid(tmp_path):
+    path = str(tmp_path / "items.dtms")
+    _make_db().collection_to_mapped("items", path)
+    with open(path, "rb") as f:
+        payload = f.read()
+    broken_path = str(tmp_path / "broken.dtms")
+    for broken in (b"", b"DTMS", payload[:-1], payload[:len(payload) // 2] + payload[-22:]):
+        with open(broken_path, "wb") as f:
+            f.write(broken)
+        with pytest.raises(ValueError):
+            MappedCollection.open(broken_path)
+    # 書き込みに失敗した場合は以前のファイルが残り、一時ファイルは削除される。
+    with pytest.raises(TypeError):
+        MappedSegment.write(path, [{"a": 1}, {"b": object()}], 0)
+    assert not os.path.exists(path + ".tmp")
+    assert MappedCollection.open(path).length == 200
+
+
+def test_mapped_collection_speed(tmp_path):
+    records_count = 100000
+    db = DeltaTraceDatabase()
+    db.execute_query(RawQueryBuilder.add(target="items", raw_add_data=[
+        {"id": -1, "name": f"item{i}", "group": i % 1000, "nested": {"tags": ["a", "b"], "score": i / 7}}
+        for i in range(records_count)], serial_key="id").build())
+    path = str(tmp_path / "items.dtms")
+    db.collection_to_mapped("items", path, columns=["group"])
+    binary_path = str(tmp_path / "db.bin")
+    with open(binary_path, "wb") as f:
+        db.write_binary(f)
+    del db
+    q = RawQueryBuilder.search(target="items", query_node=FieldEquals("group", 5)).build()
+    tracemalloc.start()
+    t = time.perf_counter()
+    with open(binary_path, "rb") as f:
+        loaded = DeltaTraceDatabase.from_binary(f)
+    r1 = loaded.execute_query(q)
+    load_ms = (time.perf_counter() - t) * 1000
+    load_memory = tracemalloc.get_traced_memory()[0]
+    del loaded
+    tracemalloc.stop()
+    tracemalloc.start()
+    t = time.perf_counter()
+    mapped = DeltaTraceDatabase()
+    mapped.collection_from_mapped("items", path)
+    r2 = mapped.execute_query(q)
+    mapped_ms = (time.perf_counter() - t) * 1000
+    mapped_memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    assert r1.to_dict() == r2.to_dict()
+    assert mapped_memory < load_memory
+    print(f"end open and a search of {records_count} records: load {load_ms:.0f} ms, "
+          f"{load_memory // 1024 // 1024} MB, mapped {mapped_ms:.1f} ms, {mapped_memory // 1024} KB")
@@ -0,0 +1,106 @@
+# coding: utf-8
+import os
+import threading
+import time
+
+from delta_trace_db.db.delta_trace_db_core import DeltaTraceDatabase
+from delta_trace_db.db.util_parallel_scan import UtilParallelScan
+from delta_trace_db.query.nodes.comparison_node import FieldEquals, FieldGreaterThan, FieldMatchesRegex
+from delta_trace_db.query.nodes.logical_node import AndNode, OrNode
+from delta_trace_db.query.nodes.query_node import QueryNode
+from delta_trace_db.query.raw_query_builder import RawQueryBuilder
+from delta_trace_db.query.sort.single_sort import SingleSort
+
+
+def _make_db(records_count: int, processes: int, snapshot: bool = False) -> DeltaTraceDatabase:
+    db = DeltaTraceDatabase()
+    db.set_parallel_scan("users", processes, min_records=10)
+    if snapshot:
+        db.set_snapshot_reads("users")
+    db.execute_query(RawQueryBuilder.add(target="users", raw_add_data=[
+        {"id": -1, "name": f"user{i}", "age": i % 100, "score": (i * 7919) % 1000} for i in range(records_count)],
+                                         serial_key="id").build())
+    return db
+
+
+def test_parallel_scan_same_result():
+    queries = [
+        RawQueryBuilder.search(target="users", query_node=FieldEquals("age", 3)).build(),
+        RawQueryBuilder.search(target="users", query_node=AndNode([FieldGreaterThan("age", 50),
+                                                                   FieldMatchesRegex("name", "7$")]),
+                               sort_obj=SingleSort("score", reversed_=True), offset=5, limit=20).build(),
+        RawQueryBuilder.search(target="users", query_node=OrNode([FieldEquals("age", 1), FieldEquals("age", 2)]),
+                               sort_obj=SingleSort("score"), limit=7).build(),
+        RawQueryBuilder.search(target="users", query_node=FieldEquals("age", 1000)).build(),
+        RawQueryBuilder.search_one(target="users", query_node=FieldEquals("age", 5)).build(),
+    ]
+    for snapshot in (False, True):
+        db1 = _make_db(3000, 1, snapshot)
+        db2 = _make_db(3000, 3, snapshot)
+        assert db2.collection("users").parallel_scan_processes == 3
+        for q in queries:
+            assert db1.execute_query(q).to_dict() == db2.execute_query(q).to_dict()
+        # 書き込み後の状態に対しても同じ結果になる。
+        for db in (db1, db2):
+            db.execute_query(RawQueryBuilder.delete(target="users", query_node=FieldEquals("age", 2)).build())
+        for q in queries:
+            assert db1.execute_query(q).to_dict() == db2.execute_query(q).to_dict()
+
+
+def test_parallel_scan_find_positions():
+    targets = [{"v": i % 4} for i in range(101)]
+    assert UtilParallelScan.find_positions(targets, FieldEquals("v", 1), 1) is None
+    assert UtilParallelScan.find_positions([], FieldEquals("v", 1), 4) is None
+    if UtilParallelScan.is_available():
+        assert UtilParallelScan.find_positions(targets, FieldEquals("v", 1), 4) == list(range(1, 101, 4))
+
+
+
+class _UnknownNode(QueryNode):
+    # to_dictは成功するが、ワーカープロセスではfrom_dictで復元できないノード。
+    def evaluate(self, data):
+        return data.get("v") == 1
+
+    def to_dict(self):
+        return {"type": "unknown"}
+
+
+def test_parallel_scan_fallback():
+    targets = [{"v": i % 4} for i in range(101)]
+    # ワーカープロセスでの失敗はNoneとなり、コレクションでは逐次の走査になる。
+    assert UtilParallelScan.find_positions(targets, _UnknownNode(), 4) is None
+    db = _make_db(300, 4)
+    db.execute_query(RawQueryBuilder.update(target="users", query_node=FieldEquals("age", 3),
+                                            override_data={"v": 1}).build())
+    r = db.execute_query(RawQueryBuilder.search(target="users", query_node=_UnknownNode()).build())
+    assert r.hit_count == 3
+    # 他のスレッドが動作している間はフォークしない。
+    started = threading.Event()
+    stop = threading.Event()
+    t = threading.Thread(target=lambda: (started.set(), stop.wait()))
+    t.start()
+    try:
+        started.wait()
+        assert UtilParallelScan.find_positions(targets, FieldEquals("v", 1), 4) is None
+    finally:
+        stop.set()
+        t.join()
+
+
+def test_parallel_scan_speed():
+    records_count = 300000
+    cpu_count = os.cpu_count()
+    print(f"start parallel scan test: records {records_count}, cpu count: {cpu_count}, "
+          f"fork available: {UtilParallelScan.is_available()}")
+    db = _make_db(records_count, 1)
+    q = RawQueryBuilder.search(target="users", query_node=AndNode([FieldMatchesRegex("name", "^user1.*9$"),
+                                                                   FieldGreaterThan("score", 500)]),
+                               sort_obj=SingleSort("score"), limit=100).build()
+    expected = db.execute_query(q).to_dict()
+    for processes in (1, 2, 4):
+        db.set_parallel_scan("users", processes, min_records=10000)
+        t = time.perf_counter()
+        r = db.execute_query(q)
+        ms = (time.perf_counter() - t) * 1000
+        assert r.to_dict() == expected
+        print(f"end parallel scan {processes} processes: {ms:.0f} ms")
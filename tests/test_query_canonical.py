@@ -0,0 +1,127 @@
+# coding: utf-8
+import json
+import time
+from datetime import datetime, timezone
+
+from delta_trace_db.db.delta_trace_db_core import DeltaTraceDatabase
+from delta_trace_db.query.cause.actor import Actor
+from delta_trace_db.query.cause.cause import Cause
+from delta_trace_db.query.cause.enum_actor_type import EnumActorType
+from delta_trace_db.query.cause.temporal_trace.temporal_trace import TemporalTrace
+from delta_trace_db.query.nodes.comparison_node import FieldEquals, FieldGreaterThan, FieldIn, FieldNotIn, \
+    FieldStartsWith
+from delta_trace_db.query.nodes.logical_node import AndNode, OrNode, NotNode
+from delta_trace_db.query.query import Query
+from delta_trace_db.query.raw_query_builder import RawQueryBuilder
+from delta_trace_db.query.sort.multi_sort import MultiSort
+from delta_trace_db.query.sort.single_sort import SingleSort
+from delta_trace_db.query.util_canonical import UtilCanonical
+
+
+def _cause(why: str) -> Cause:
+    return Cause(who=Actor(actor_type=EnumActorType.human, actor_id="1"), when=TemporalTrace(), what="test",
+                 why=why, from_="test")
+
+
+def test_canonical_node():
+    a = AndNode([FieldEquals("a", 1), OrNode([FieldIn("x", [3, 1, 3]), FieldGreaterThan("b", 2)]),
+                 NotNode(OrNode([FieldStartsWith("s", "u"), FieldNotIn("y", ["b", "a"])]))])
+    b = AndNode([NotNode(OrNode([FieldNotIn("y", ["a", "b"]), FieldStartsWith("s", "u")])),
+                 OrNode([FieldGreaterThan("b", 2), FieldIn("x", [1, 3])]), FieldEquals("a", 1)])
+    assert a.canonical_key() == b.canonical_key()
+    assert a.structural_hash() == b.structural_hash()
+    assert a.structural_hash() == UtilCanonical.to_hash(a.canonical_key())
+    # 正規形はto_dictと同じく復元可能で、復元しても同じキーになる。
+    restored = AndNode.from_dict(json.loads(a.canonical_key()))
+    assert restored.canonical_key() == a.canonical_key()
+    # 順序が意味を持つ部分や、値が異なる場合は別のキーになる。
+    different = [
+        AndNode([FieldEquals("a", 1)]),
+        OrNode([FieldEquals("a", 1)]),
+        AndNode([FieldEquals("a", "1")]),
+        AndNode([FieldEquals("a", datetime(2025, 1, 1, tzinfo=timezone.utc))]),
+        NotNode(FieldEquals("a", 1)),
+        FieldEquals("a", 1),
+    ]
+    keys = {n.canonical_key() for n in different}
+    assert len(keys) == len(different)
+    assert len({n.structural_hash() for n in different}) == len(different)
+
+
+def test_canonical_query():
+    node1 = AndNode([FieldEquals("a", 1), FieldGreaterThan("b", 2)])
+    node2 = AndNode([FieldGreaterThan("b", 2), FieldEquals("a", 1)])
+    q1 = RawQueryBuilder.search(target="users", query_node=node1, sort_obj=SingleSort("a"), limit=3,
+                                cause=_cause("first")).build()
+    q2 = RawQueryBuilder.search(target="users", query_node=node2, sort_obj=SingleSort("a"), limit=3,
+                                cause=_cause("second")).build()
+    q3 = RawQueryBuilder.search(target="users", query_node=node2, sort_obj=SingleSort("a"), limit=4).build()
+    q4 = RawQueryBuilder.search(target="users", query_node=node2,
+                                sort_obj=MultiSort([SingleSort("a"), SingleSort("b")]), limit=3).build()
+    assert "cause" not in q1.canonical_form()
+    assert q1.canonical_key() == q2.canonical_key()
+    assert q1.structural_hash() == q2.structural_hash()
+    assert len({q.structural_hash() for q in (q1, q3, q4)}) == 3
+    # 復元したクエリでも同じハッシュになる。
+    restored = Query.from_dict(json.loads(json.dumps(q1.to_dict())))
+    assert restored.structural_hash() == q1.structural_hash()
+    assert RawQueryBuilder.get_all(target="users").build().canonical_form()["queryNode"] is None
+
+
+def test_canonical_query_result_cache():
+    db = DeltaTraceDatabase()
+    db.set_result_cache("users", 8)
+    db.execute_query(RawQueryBuilder.add(target="users", raw_add_data=[{"id": -1, "a": i % 3, "b": i}
+                                                                       for i in range(10)], serial_key="id").build())
+    q1 = RawQueryBuilder.search(target="users", query_node=AndNode([FieldEquals("a", 1), FieldGreaterThan("b", 2)]),
+                                cause=_cause("first")).build()
+    q2 = RawQueryBuilder.search(target="users", query_node=AndNode([FieldGreaterThan("b", 2), FieldEquals("a", 1)]),
+                                cause=_cause("second")).build()
+    assert db.execute_query(q1).to_dict() == db.execute_query(q2).to_dict()
+    stats = db.collection("users").result_cache_stats
+    assert stats["hits"] == 1 and stats["misses"] == 1
+
+
+
+def test_canonical_mutated_query():
+    db = DeltaTraceDatabase()
+    db.set_result_cache("users", 8)
+    db.execute_query(RawQueryBuilder.add(target="users", raw_add_data=[{"a": i} for i in range(10)]).build())
+    # ページングのためにクエリを変更して再利用しても、次のページが返る。
+    q = RawQueryBuilder.get_all(target="users", limit=2).build()
+    key = q.canonical_key()
+    h = q.structural_hash()
+    assert db.execute_query(q).result == [{"a": 0}, {"a": 1}]
+    q.offset = 4
+    assert q.canonical_key() != key
+    assert q.structural_hash() != h
+    assert db.execute_query(q).result == [{"a": 4}, {"a": 5}]
+    # 読み込みのクエリのキーは生成時に計算される。
+    node = FieldEquals("a", 1)
+    q = RawQueryBuilder.search(target="users", query_node=AndNode([FieldGreaterThan("a", 0), node])).build()
+    assert q._canonical_key is not None
+    key = q.canonical_key()
+    node_key = node.canonical_key()
+    assert db.execute_query(q).result == [{"a": 1}]
+    # ネストしたノードの変更は、親のノードとクエリのキーも破棄する。
+    node.value = 2
+    assert node.canonical_key() != node_key
+    assert q.canonical_key() != key
+    assert db.execute_query(q).result == [{"a": 2}]
+    assert Query.from_dict(q.to_dict())._canonical_key == q.canonical_key()
+
+
+def test_canonical_speed():
+    count = 10000
+    node = AndNode([FieldEquals("group", i % 7) for i in range(5)] + [OrNode([FieldIn("x", list(range(20)))])])
+    q = Query.from_dict(RawQueryBuilder.search(target="users", query_node=node, limit=10,
+                                               cause=_cause("speed")).build().to_dict())
+    t = time.perf_counter()
+    for _ in range(count):
+        json.dumps(q.to_dict(), sort_keys=True)
+    dumps_ms = (time.perf_counter() - t) * 1000
+    t = time.perf_counter()
+    for _ in range(count):
+        q.structural_hash()
+    hash_ms = (time.perf_counter() - t) * 1000
+    print(f"end identity of a query {count} times: json.dumps {dumps_ms:.0f} ms, structural_hash {hash_ms:.1f} ms")
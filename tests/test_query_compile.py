@@ -0,0 +1,75 @@
+# coding: utf-8
+from datetime import datetime, timezone
+
+from delta_trace_db.query.nodes.comparison_node import FieldEquals, FieldNotEquals, FieldGreaterThan, \
+    FieldLessThan, FieldGreaterThanOrEqual, FieldLessThanOrEqual, FieldMatchesRegex, FieldContains, FieldIn, \
+    FieldNotIn, FieldStartsWith, FieldEndsWith
+from delta_trace_db.query.nodes.enum_value_type import EnumValueType
+from delta_trace_db.query.nodes.logical_node import AndNode, OrNode, NotNode
+from delta_trace_db.query.nodes.query_node import QueryNode
+
+_VALUES = [None, 0, 1, 1.0, 1.5, 2, -3, float("nan"), True, False, "1", "1.5", "abc", "ABC", "true", "",
+           "2025-01-01T00:00:00", "2025-01-01T00:00:00+00:00", [1, 2], {"a": 1}]
+
+
+def _make_data():
+    r = [{"v": v, "n": {"v": v}} for v in _VALUES]
+    r.append({"other": 1})
+    r.append({"n": 1})
+    return r
+
+
+def _make_nodes():
+    nodes = []
+    compare_values = [None, 1, 1.5, "1", "abc", True, float("nan"), [1, 2],
+                      datetime(2025, 1, 1), datetime(2025, 1, 1, tzinfo=timezone.utc)]
+    for cls in (FieldEquals, FieldNotEquals, FieldGreaterThan, FieldLessThan, FieldGreaterThanOrEqual,
+                FieldLessThanOrEqual):
+        for field in ("v", "n.v", "none"):
+            for value in compare_values:
+                for v_type in EnumValueType:
+                    nodes.append(cls(field, value, v_type=v_type))
+    for field in ("v", "n.v"):
+        nodes.extend([
+            FieldMatchesRegex(field, "^a"),
+            FieldMatchesRegex(field, "1"),
+            FieldContains(field, 1),
+            FieldContains(field, "b"),
+            FieldIn(field, [1, "abc", None]),
+            FieldNotIn(field, [1, "abc", None]),
+            FieldStartsWith(field, "a"),
+            FieldEndsWith(field, "0"),
+        ])
+    nodes.extend([
+        AndNode([]),
+        OrNode([]),
+        AndNode([FieldEquals("v", 1)]),
+        OrNode([FieldEquals("v", 1)]),
+        AndNode([FieldGreaterThan("v", 0), FieldLessThan("v", 2)]),
+        AndNode([FieldGreaterThan("v", 0), FieldLessThan("v", 2), FieldNotEquals("v", 1.5)]),
+        OrNode([FieldEquals("v", "abc"), FieldEquals("n.v", 2)]),
+        OrNode([FieldEquals("v", "abc"), FieldEquals("n.v", 2), FieldStartsWith("v", "2025")]),
+        NotNode(OrNode([FieldEquals("v", None), AndNode([FieldIn("v", [1, 2])])])),
+    ])
+    return nodes
+
+
+def test_compile_same_result():
+    data = _make_data()
+    for node in _make_nodes():
+        compiled = node.compile()
+        for d in data:
+            assert compiled(d) == node.evaluate(d), (node.to_dict(), d)
+
+
+def test_compile_custom_node():
+    class _Custom(QueryNode):
+        def evaluate(self, data: dict) -> bool:
+            return data.get("v") == 1
+
+        def to_dict(self) -> dict:
+            return {}
+
+    node = AndNode([_Custom(), FieldEquals("n.v", 1)])
+    compiled = node.compile()
+    assert [compiled(d) for d in _make_data()] == [node.evaluate(d) for d in _make_data()]
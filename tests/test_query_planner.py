@@ -0,0 +1,116 @@
+# coding: utf-8
+from delta_trace_db.db.delta_trace_db_core import DeltaTraceDatabase
+from delta_trace_db.db.index.enum_index_type import EnumIndexType
+from delta_trace_db.db.util_query_planner import UtilQueryPlanner
+from delta_trace_db.query.nodes.comparison_node import FieldEquals, FieldIn, FieldGreaterThan, FieldMatchesRegex, \
+    FieldStartsWith, FieldLessThan, FieldNotEquals
+from delta_trace_db.query.nodes.enum_value_type import EnumValueType
+from delta_trace_db.query.nodes.logical_node import AndNode, OrNode, NotNode
+from delta_trace_db.query.raw_query_builder import RawQueryBuilder
+
+
+def _make_data():
+    return [
+        {"id": -1, "name": f"user{i}", "group": i % 4, "age": i % 50, "date": f"2025-01-{1 + i % 28:02d}",
+         "nested": {"v": i % 3}}
+        for i in range(200)
+    ]
+
+
+def _make_db(with_index: bool) -> DeltaTraceDatabase:
+    db = DeltaTraceDatabase()
+    if with_index:
+        db.add_index("users", "group")
+        db.add_index("users", "age", index_type=EnumIndexType.sorted_)
+    db.execute_query(RawQueryBuilder.add(target="users", raw_add_data=_make_data(), serial_key="id").build())
+    return db
+
+
+def _nodes():
+    return [
+        AndNode([FieldMatchesRegex("name", "1$"), FieldEquals("group", 1)]),
+        AndNode([FieldEquals("date", "2025-01-05", v_type=EnumValueType.datetime_), FieldEquals("group", 2),
+                 AndNode([FieldGreaterThan("age", 10), FieldNotEquals("nested.v", 0)])]),
+        OrNode([FieldEquals("group", 1), FieldMatchesRegex("name", "^user1"), FieldEquals("group", 3),
+                OrNode([FieldLessThan("age", 3)])]),
+        OrNode([FieldEquals("group", 1), FieldEquals("group", float("nan")), FieldEquals("group", 2)]),
+        NotNode(AndNode([FieldEquals("group", 1), FieldStartsWith("name", "user")])),
+        AndNode([]),
+        OrNode([]),
+        AndNode([OrNode([FieldEquals("group", 0), FieldEquals("group", 1)]), FieldGreaterThan("age", 45)]),
+    ]
+
+
+def test_planner_same_result():
+    db1 = _make_db(False)
+    db2 = _make_db(True)
+    data = db1.collection("users").raw
+    for node in _nodes():
+        expected = [i for i in data if node.evaluate(i)]
+        for db in (db1, db2):
+            r = db.execute_query(RawQueryBuilder.search(target="users", query_node=node).build())
+            assert r.is_success
+            assert r.result == expected
+
+
+def test_planner_rewrite():
+    node = AndNode([FieldMatchesRegex("name", "1$"),
+                    AndNode([FieldEquals("date", "2025-01-05", v_type=EnumValueType.datetime_),
+                             FieldEquals("group", 1)])])
+    optimized = UtilQueryPlanner.optimize(node)
+    # 平坦化され、低コストな条件が先に評価される。
+    assert [type(c) for c in optimized.conditions] == [FieldEquals, FieldEquals, FieldMatchesRegex]
+    assert optimized.conditions[0].field == "group"
+    # 元のノードは変更されない。
+    assert len(node.conditions) == 2
+    # 同一フィールドのFieldEqualsはFieldInに統合される。
+    optimized = UtilQueryPlanner.optimize(OrNode([FieldEquals("a", 1), FieldEquals("b", 1), FieldEquals("a", 2)]))
+    assert len(optimized.conditions) == 2
+    merged = [c for c in optimized.conditions if isinstance(c, FieldIn)][0]
+    assert merged.field == "a" and merged.values == [1, 2]
+    # 単一の条件はそのまま返される。
+    single = FieldEquals("a", 1)
+    assert UtilQueryPlanner.optimize(AndNode([single])) is single
+
+
+def test_planner_keeps_order_of_unsafe_nodes():
+    # 不正な正規表現は例外を送出し得るため、並べ替えられない。
+    node = AndNode([FieldMatchesRegex("name", "("), FieldEquals("group", 1)])
+    assert UtilQueryPlanner.optimize(node).conditions[0] is node.conditions[0]
+    db = _make_db(False)
+    r = db.execute_query(RawQueryBuilder.search(
+        target="users", query_node=AndNode([FieldEquals("group", 9), FieldMatchesRegex("name", "(")])).build())
+    assert r.is_success and r.hit_count == 0
+
+
+def test_planner_uses_index_selectivity():
+    db = _make_db(True)
+    col = db.collection("users")
+    # インデックスにより、ageの条件の方が絞り込み効果が高いと見積もられる。
+    node = AndNode([FieldEquals("group", 1), FieldGreaterThan("age", 48)])
+    optimized = col._plan(node)
+    assert isinstance(optimized.conditions[0], FieldGreaterThan)
+    assert isinstance(_make_db(False).collection("users")._plan(node).conditions[0], FieldEquals)
+
+
+def test_explain():
+    db = _make_db(True)
+    q = RawQueryBuilder.search(target="users", query_node=AndNode([FieldMatchesRegex("name", "1$"),
+                                                                   FieldGreaterThan("age", 48)])).build()
+    r = db.explain(q)
+    assert r["target"] == "users"
+    assert r["length"] == 200
+    assert r["scan"] == "index"
+    assert r["scanCount"] == 4
+    plan = r["plan"]
+    assert plan["type"] == "and_"
+    assert plan["conditions"][0]["node"]["type"] == "greaterThan_"
+    assert plan["conditions"][0]["isEstimated"] is True
+    assert plan["conditions"][1]["isEstimated"] is False
+    assert 0 <= plan["selectivity"] <= 1
+    r = db.explain(RawQueryBuilder.search(target="users", query_node=FieldMatchesRegex("name", "1$")).build())
+    assert r["scan"] == "full" and r["scanCount"] == 200
+    # 存在しないコレクションは作成されない。
+    r = db.explain(RawQueryBuilder.search(target="none", query_node=FieldEquals("a", 1)).build())
+    assert r["length"] == 0
+    assert db.find_collection("none") is None
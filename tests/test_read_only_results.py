@@ -0,0 +1,114 @@
+# coding: utf-8
+import json
+
+import pytest
+
+from delta_trace_db.db.delta_trace_db_core import DeltaTraceDatabase
+from delta_trace_db.db.read_only_view import ReadOnlyDict, ReadOnlyList
+from delta_trace_db.query.nodes.comparison_node import FieldEquals, FieldGreaterThan
+from delta_trace_db.query.raw_query_builder import RawQueryBuilder
+from delta_trace_db.query.sort.single_sort import SingleSort
+from delta_trace_db.query.transaction_query import TransactionQuery
+
+
+def _make_data():
+    return [{"id": -1, "name": f"user{i}", "age": i % 10, "tags": [i, {"v": i}], "nested": {"n": i}}
+            for i in range(30)]
+
+
+def _make_db(read_only: bool, with_index: bool = False) -> DeltaTraceDatabase:
+    db = DeltaTraceDatabase()
+    if read_only:
+        db.set_read_only_results("users")
+    if with_index:
+        db.add_index("users", "age")
+    db.execute_query(RawQueryBuilder.add(target="users", raw_add_data=_make_data(), serial_key="id").build())
+    return db
+
+
+def test_read_only_results_same_result():
+    for with_index in (False, True):
+        db1 = _make_db(False, with_index)
+        db2 = _make_db(True, with_index)
+        queries = [
+            RawQueryBuilder.search(target="users", query_node=FieldEquals("age", 3)).build(),
+            RawQueryBuilder.search(target="users", query_node=FieldGreaterThan("age", 5),
+                                   sort_obj=SingleSort("name"), limit=5).build(),
+            RawQueryBuilder.search_one(target="users", query_node=FieldEquals("age", 4)).build(),
+            RawQueryBuilder.get_all(target="users", sort_obj=SingleSort("age", reversed_=True)).build(),
+            RawQueryBuilder.update(target="users", query_node=FieldEquals("age", 1), override_data={"age": 11},
+                                   return_data=True).build(),
+            RawQueryBuilder.update_one(target="users", query_node=FieldEquals("age", 2),
+                                       override_data={"name": "x"}, return_data=True).build(),
+            RawQueryBuilder.delete(target="users", query_node=FieldEquals("age", 11), return_data=True).build(),
+            RawQueryBuilder.delete_one(target="users", query_node=FieldEquals("age", 0)).build(),
+            RawQueryBuilder.add(target="users", raw_add_data=_make_data(), serial_key="id",
+                                return_data=True).build(),
+            RawQueryBuilder.rename_field(target="users", rename_before="name", rename_after="n2",
+                                         return_data=True).build(),
+            RawQueryBuilder.conform_to_template(target="users", template={"id": 0, "age": 0, "n2": ""}).build(),
+            RawQueryBuilder.get_all(target="users").build(),
+        ]
+        for q in queries:
+            r1 = db1.execute_query(q)
+            r2 = db2.execute_query(q)
+            assert r1.is_success and r2.is_success
+            assert r1.result == r2.result
+            assert r1.to_dict() == r2.to_dict()
+            assert all(isinstance(i, ReadOnlyDict) for i in r2.result)
+            assert db2.execute_query(RawQueryBuilder.search(target="users", query_node=FieldEquals("age", 3))
+                                     .build()).result == \
+                   db1.execute_query(RawQueryBuilder.search(target="users", query_node=FieldEquals("age", 3))
+                                     .build()).result
+
+
+def test_read_only_results_cannot_be_changed():
+    db = _make_db(True)
+    r = db.execute_query(RawQueryBuilder.search(target="users", query_node=FieldEquals("age", 3)).build())
+    item = r.result[0]
+    with pytest.raises(TypeError):
+        item["age"] = 5
+    assert isinstance(item["tags"], ReadOnlyList)
+    assert isinstance(item["tags"][1], ReadOnlyDict)
+    with pytest.raises(AttributeError):
+        item["tags"].append(1)
+    with pytest.raises(TypeError):
+        item["nested"]["n"] = 1
+    # 編集可能なコピーは取得できる。
+    mutable = item.to_mutable()
+    mutable["tags"].append(1)
+    assert type(mutable) is dict
+    assert len(item["tags"]) == 2
+    # QueryResultは通常の辞書に変換できる。
+    json.dumps(r.to_dict())
+
+
+def test_read_only_results_are_snapshots():
+    db = _make_db(True, with_index=True)
+    before = db.execute_query(RawQueryBuilder.search(target="users", query_node=FieldEquals("age", 3)).build())
+    db.execute_query(RawQueryBuilder.update(target="users", query_node=FieldEquals("age", 3),
+                                            override_data={"age": 30, "name": "changed"}).build())
+    db.execute_query(RawQueryBuilder.rename_field(target="users", rename_before="nested",
+                                                  rename_after="nested2").build())
+    db.execute_query(RawQueryBuilder.conform_to_template(target="users",
+                                                         template={"id": 0, "age": 0, "extra": 1}).build())
+    assert [i["age"] for i in before.result] == [3, 3, 3]
+    assert "nested" in before.result[0]
+    assert "extra" not in before.result[0]
+    after = db.execute_query(RawQueryBuilder.search(target="users", query_node=FieldEquals("age", 30)).build())
+    assert after.hit_count == 3
+    assert after.result[0] == {"id": 3, "age": 30, "extra": 1}
+    assert len(db.collection("users")._scan_targets(FieldEquals("age", 30))) == 3
+
+
+def test_read_only_results_setting_kept_after_rollback():
+    db = _make_db(True)
+    tq = TransactionQuery(queries=[
+        RawQueryBuilder.update(target="users", query_node=FieldEquals("age", 3), override_data={"age": 30}).build(),
+        RawQueryBuilder.rename_field(target="users", rename_before="none", rename_after="x").build(),
+    ])
+    assert db.execute_query_object(tq).is_success is False
+    assert db.collection("users").is_read_only_results
+    r = db.execute_query(RawQueryBuilder.search(target="users", query_node=FieldEquals("age", 3)).build())
+    assert r.hit_count == 3
+    assert isinstance(r.result[0], ReadOnlyDict)
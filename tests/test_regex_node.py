@@ -0,0 +1,88 @@
+# coding: utf-8
+from delta_trace_db.db.delta_trace_db_core import DeltaTraceDatabase
+from delta_trace_db.db.index.enum_index_type import EnumIndexType
+from delta_trace_db.query.nodes.comparison_node import FieldMatchesRegex, FieldStartsWith
+from delta_trace_db.query.nodes.enum_value_type import EnumValueType
+from delta_trace_db.query.nodes.query_node import QueryNode
+from delta_trace_db.query.raw_query_builder import RawQueryBuilder
+
+
+def test_regex_compiled_lazily_and_shared():
+    node1 = FieldMatchesRegex("name", "^ab+c")
+    assert node1._compiled is None
+    assert node1.evaluate({"name": "abbc"}) is True
+    node2 = QueryNode.from_dict(node1.to_dict())
+    assert node2.compiled_pattern is node1.compiled_pattern
+    assert "compiled" not in str(node1.to_dict())
+    # パターンを変更した場合は再コンパイルされる。
+    node1.pattern = "^x"
+    assert node1.evaluate({"name": "abbc"}) is False
+    assert node1.evaluate({"name": "xyz"}) is True
+
+
+def test_regex_literal_prefix():
+    cases = {
+        "^abc": "abc",
+        "^abc$": "abc",
+        "\\Aabc": "abc",
+        "^ab*c": "a",
+        "^ab?": "a",
+        "^ab{2}": "a",
+        "^ab+c": "ab",
+        "^a\\.b": "a.b",
+        "^a\\db": "a",
+        "^(abc)": "",
+        "^[ab]c": "",
+        "abc": None,
+        "^abc|def": None,
+        "(?i)^abc": None,
+        "^abc(": None,
+    }
+    for pattern, expected in cases.items():
+        assert FieldMatchesRegex("f", pattern).literal_prefix() == expected, pattern
+
+
+def _make_data():
+    r = [{"name": f"user{i}", "code": f"c{i % 10}", "mixed": [f"m{i}", i, None][i % 3]} for i in range(100)]
+    r.append({"other": 1})
+    return r
+
+
+def _make_db(with_index: bool) -> DeltaTraceDatabase:
+    db = DeltaTraceDatabase()
+    if with_index:
+        db.add_index("items", "name", index_type=EnumIndexType.sorted_)
+        db.add_index("items", "code", index_type=EnumIndexType.sorted_, v_type=EnumValueType.string_)
+        db.add_index("items", "mixed", index_type=EnumIndexType.sorted_)
+    db.execute_query(RawQueryBuilder.add(target="items", raw_add_data=_make_data()).build())
+    return db
+
+
+def test_regex_prefix_index():
+    db1 = _make_db(False)
+    db2 = _make_db(True)
+    nodes = [
+        FieldMatchesRegex("name", "^user1"),
+        FieldMatchesRegex("name", "^user1\\d$"),
+        FieldMatchesRegex("name", "^user"),
+        FieldMatchesRegex("name", "1$"),
+        FieldMatchesRegex("code", "^c5"),
+        FieldMatchesRegex("mixed", "^m1"),
+        FieldMatchesRegex("mixed", "^1"),
+        FieldStartsWith("name", "user9"),
+        FieldStartsWith("name", "x"),
+        FieldStartsWith("code", "c"),
+        FieldStartsWith("mixed", "1"),
+    ]
+    for node in nodes:
+        q = RawQueryBuilder.search(target="items", query_node=node).build()
+        r1 = db1.execute_query(q)
+        r2 = db2.execute_query(q)
+        assert r1.is_success and r2.is_success
+        assert r1.result == r2.result
+    col = db2.collection("items")
+    assert len(col._scan_targets(FieldMatchesRegex("name", "^user1"))) == 11
+    assert len(col._scan_targets(FieldStartsWith("name", "user9"))) == 11
+    assert len(col._scan_targets(FieldMatchesRegex("code", "^c5"))) == 10
+    # 文字列以外の値を含むauto_のインデックスは利用されない。
+    assert len(col._scan_targets(FieldStartsWith("mixed", "1"))) == 101
@@ -0,0 +1,138 @@
+# coding: utf-8
+import random
+import time
+
+from delta_trace_db.db.delta_trace_db_core import DeltaTraceDatabase
+from delta_trace_db.db.result_cache import ResultCache
+from delta_trace_db.query.nodes.comparison_node import FieldEquals, FieldGreaterThanOrEqual, FieldLessThan
+from delta_trace_db.query.raw_query_builder import RawQueryBuilder
+from delta_trace_db.query.sort.single_sort import SingleSort
+from delta_trace_db.query.transaction_query import TransactionQuery
+
+
+def _make_db(mode: str) -> DeltaTraceDatabase:
+    db = DeltaTraceDatabase()
+    if mode == "read_only":
+        db.set_read_only_results("users")
+    elif mode == "snapshot":
+        db.set_snapshot_reads("users")
+    db.execute_query(RawQueryBuilder.add(target="users", raw_add_data=[
+        {"id": -1, "name": f"user{i}", "age": i % 10} for i in range(100)], serial_key="id").build())
+    return db
+
+
+def _reads(rnd: random.Random):
+    age = rnd.randrange(10)
+    return [
+        RawQueryBuilder.search(target="users", query_node=FieldEquals("age", age), sort_obj=SingleSort("name"),
+                               limit=5).build(),
+        RawQueryBuilder.search(target="users", query_node=FieldGreaterThanOrEqual("age", age)).build(),
+        RawQueryBuilder.get_all(target="users", sort_obj=SingleSort("age", reversed_=True), offset=age,
+                                limit=10).build(),
+    ]
+
+
+def test_result_cache_same_result():
+    rnd = random.Random(7)
+    for mode in ("normal", "read_only", "snapshot"):
+        db1 = _make_db(mode)
+        db2 = _make_db(mode)
+        db2.set_result_cache("users", 16)
+        for step in range(200):
+            age = rnd.randrange(10)
+            match step % 5:
+                case 0:
+                    q = RawQueryBuilder.update(target="users", query_node=FieldEquals("age", age),
+                                               override_data={"name": f"u{step}"}).build()
+                case 1:
+                    q = RawQueryBuilder.add(target="users", raw_add_data=[{"id": -1, "name": "a", "age": age}],
+                                            serial_key="id").build()
+                case 2:
+                    q = RawQueryBuilder.delete_one(target="users", query_node=FieldEquals("age", age)).build()
+                case 3:
+                    q = TransactionQuery(queries=[
+                        RawQueryBuilder.delete(target="users", query_node=FieldLessThan("age", age)).build(),
+                        RawQueryBuilder.rename_field(target="users", rename_before="none",
+                                                     rename_after="x").build()])
+                case _:
+                    q = None
+            if isinstance(q, TransactionQuery):
+                assert db1.execute_transaction_query(q).is_success is False
+                assert db2.execute_transaction_query(q).is_success is False
+            elif q is not None:
+                db1.execute_query(q)
+                db2.execute_query(q)
+            for _ in range(2):
+                for read in _reads(rnd):
+                    assert db1.execute_query(read).to_dict() == db2.execute_query(read).to_dict()
+        stats = db2.collection("users").result_cache_stats
+        assert stats["hits"] > 0 and stats["misses"] > 0
+        assert db1.collection("users").result_cache_stats is None
+
+
+def test_result_cache_copies_and_budgets():
+    db = _make_db("normal")
+    db.set_result_cache("users", 2)
+    col = db.collection("users")
+    q = RawQueryBuilder.search(target="users", query_node=FieldEquals("age", 1)).build()
+    r1 = db.execute_query(q)
+    # 結果を変更しても、キャッシュした結果には影響しない。
+    r1.result[0]["name"] = "changed"
+    r2 = db.execute_query(q)
+    assert r2.result[0]["name"] == "user1"
+    assert col.result_cache_stats == {"hits": 1, "misses": 1, "entries": 1,
+                                      "bytes": col.result_cache_stats["bytes"]}
+    # 最大件数を超えると、最も長く使われていない結果から破棄される。
+    for age in (2, 3, 1):
+        db.execute_query(RawQueryBuilder.search(target="users", query_node=FieldEquals("age", age)).build())
+    assert col.result_cache_stats["entries"] == 2
+    assert col.result_cache_stats["hits"] == 1
+    # バイト数の上限より大きい結果は格納されない。
+    db.set_result_cache("users", 10, 1000)
+    db.execute_query(RawQueryBuilder.get_all(target="users").build())
+    db.execute_query(RawQueryBuilder.search(target="users", query_node=FieldEquals("id", 0)).build())
+    assert col.result_cache_stats["entries"] == 1
+    assert col.result_cache_stats["bytes"] <= 1000
+    # 古い世代の結果は格納されず、新しい世代で操作すると全て破棄される。
+    cache = ResultCache(10, 10000)
+    cache.put("a", 1, [{}], 1, None)
+    cache.put("b", 0, [{}], 1, None)
+    assert cache.stats()["entries"] == 1
+    assert cache.get("a", 2) is None
+    assert cache.stats()["entries"] == 0
+
+
+
+def test_result_cache_pinned_hit():
+    for sort_obj in (None, SingleSort("age")):
+        db = _make_db("snapshot")
+        db.set_result_cache("users", 10)
+        col = db.collection("users")
+        q = RawQueryBuilder.get_all(target="users", sort_obj=sort_obj).build()
+        # トランザクション中などと同様に、固定せずに実行した結果をキャッシュする。
+        expected = col.get_all(q).to_dict()
+        # 固定したキャッシュのヒットは、その後の書き込みの影響を受けない。
+        run = col.snapshot_query(q)
+        db.execute_query(RawQueryBuilder.add(target="users", raw_add_data=[{"id": -1, "age": 0}],
+                                             serial_key="id").build())
+        assert run().to_dict() == expected
+        assert db.execute_query(q).hit_count == 101
+
+
+def test_result_cache_speed():
+    records_count = 100000
+    db = DeltaTraceDatabase()
+    db.set_read_only_results("users")
+    db.set_result_cache("users", 64)
+    db.execute_query(RawQueryBuilder.add(target="users", raw_add_data=[
+        {"id": -1, "name": f"user{i}", "age": i % 100} for i in range(records_count)], serial_key="id").build())
+    q = RawQueryBuilder.search(target="users", query_node=FieldGreaterThanOrEqual("age", 50),
+                               sort_obj=SingleSort("name"), limit=20).build()
+    t = time.perf_counter()
+    r1 = db.execute_query(q)
+    miss_ms = (time.perf_counter() - t) * 1000
+    t = time.perf_counter()
+    r2 = db.execute_query(q)
+    hit_ms = (time.perf_counter() - t) * 1000
+    assert r1.to_dict() == r2.to_dict()
+    print(f"end identical search of {records_count} records: miss {miss_ms:.0f} ms, hit {hit_ms:.2f} ms")
@@ -0,0 +1,104 @@
+# coding: utf-8
+from delta_trace_db.db.delta_trace_db_collection import Collection
+from delta_trace_db.db.delta_trace_db_core import DeltaTraceDatabase
+from delta_trace_db.query.nodes.comparison_node import FieldEquals, FieldStartsWith
+from delta_trace_db.query.raw_query_builder import RawQueryBuilder
+from delta_trace_db.query.transaction_query import TransactionQuery
+
+
+def _make_db(records_count: int = 100) -> DeltaTraceDatabase:
+    db = DeltaTraceDatabase()
+    q = RawQueryBuilder.add(
+        target="items",
+        raw_add_data=[{"serial": -1, "name": f"item{i}"} for i in range(records_count)],
+        serial_key="serial",
+    ).build()
+    assert db.execute_query(q).is_success
+    return db
+
+
+def test_serial_key_map_lookup():
+    db = _make_db()
+    col = db.collection("items")
+    assert col.get_serial_key() == "serial"
+    assert len(col.indexes) == 1
+    assert len(col._scan_targets(FieldEquals("serial", 42))) == 1
+    r = db.execute_query(RawQueryBuilder.search_one(target="items", query_node=FieldEquals("serial", 42)).build())
+    assert r.result[0]["name"] == "item42"
+    r = db.execute_query(RawQueryBuilder.update_one(target="items", query_node=FieldEquals("serial", 42),
+                                                    override_data={"name": "updated"}, return_data=True).build())
+    assert r.result[0] == {"serial": 42, "name": "updated"}
+
+
+def test_serial_key_map_delete_without_shift():
+    db = _make_db()
+    col = db.collection("items")
+    data_ref = col._data
+    for i in (10, 20, 30):
+        r = db.execute_query(RawQueryBuilder.delete_one(target="items", query_node=FieldEquals("serial", i),
+                                                        return_data=True).build())
+        assert r.is_success
+        assert r.result[0]["serial"] == i
+        assert r.db_length == col.length
+    # リストは詰められず、削除済みの位置として記録されている。
+    assert col._data is data_ref
+    assert col._tombstones == 3
+    assert col.length == 97
+    # 削除済みのレコードは検索されない。
+    r = db.execute_query(RawQueryBuilder.search(target="items", query_node=FieldEquals("serial", 20)).build())
+    assert r.hit_count == 0
+    r = db.execute_query(RawQueryBuilder.search(target="items", query_node=FieldEquals("serial", 21)).build())
+    assert r.hit_count == 1
+    # 全件走査の前に詰められる。
+    r = db.execute_query(RawQueryBuilder.search(target="items", query_node=FieldStartsWith("name", "item")).build())
+    assert r.hit_count == 97
+    assert col._tombstones == 0
+    assert len(col.raw) == 97
+    assert [i["serial"] for i in col.raw][9:12] == [9, 11, 12]
+
+
+def test_serial_key_map_compaction():
+    db = _make_db()
+    plain = _make_db()
+    plain.collection("items").remove_index("serial")
+    assert plain.collection("items").get_serial_key() is None
+    for i in range(0, 100, 3):
+        q = RawQueryBuilder.delete_one(target="items", query_node=FieldEquals("serial", i)).build()
+        assert db.execute_query(q).is_success
+        assert plain.execute_query(q).is_success
+    col = db.collection("items")
+    # 半数を超える前は詰められない。
+    assert col._tombstones == 34
+    for i in range(1, 100, 3):
+        q = RawQueryBuilder.delete_one(target="items", query_node=FieldEquals("serial", i)).build()
+        db.execute_query(q)
+        plain.execute_query(q)
+    assert col._tombstones < col.length
+    assert db.to_dict() == plain.to_dict()
+    q = RawQueryBuilder.get_all(target="items").build()
+    assert db.execute_query(q).result == plain.execute_query(q).result
+    # 追加後も正しく検索できる。
+    q = RawQueryBuilder.add(target="items", raw_add_data=[{"serial": -1, "name": "new"}], serial_key="serial").build()
+    assert db.execute_query(q).result == plain.execute_query(q).result
+    q = RawQueryBuilder.search(target="items", query_node=FieldEquals("serial", 100)).build()
+    assert db.execute_query(q).result == [{"serial": 100, "name": "new"}]
+
+
+def test_serial_key_map_transaction_rollback():
+    db = _make_db(10)
+    db.execute_query(RawQueryBuilder.delete_one(target="items", query_node=FieldEquals("serial", 3)).build())
+    tq = TransactionQuery(queries=[
+        RawQueryBuilder.delete_one(target="items", query_node=FieldEquals("serial", 5)).build(),
+        RawQueryBuilder.delete_one(target="items", query_node=FieldEquals("serial", 3)).build(),
+    ])
+    assert db.execute_query_object(tq).is_success is False
+    col = db.collection("items")
+    assert col.length == 9
+    assert col.get_serial_key() == "serial"
+    assert len(col._scan_targets(FieldEquals("serial", 5))) == 1
+
+
+def test_serial_key_map_from_dict():
+    col = Collection.from_dict(_make_db(5).collection_to_dict("items"))
+    assert col.get_serial_key() is None
+    assert col.length == 5
@@ -0,0 +1,204 @@
+# coding: utf-8
+import threading
+import time
+
+from delta_trace_db.db.delta_trace_db_core import DeltaTraceDatabase
+from delta_trace_db.db.enum_concurrency_mode import EnumConcurrencyMode
+from delta_trace_db.db.index.enum_index_type import EnumIndexType
+from delta_trace_db.query.nodes.comparison_node import FieldEquals, FieldGreaterThan
+from delta_trace_db.query.raw_query_builder import RawQueryBuilder
+from delta_trace_db.query.sort.single_sort import SingleSort
+from delta_trace_db.query.transaction_query import TransactionQuery
+
+
+def _make_data(count: int = 30):
+    return [{"id": -1, "name": f"user{i}", "age": i % 10, "tags": [i, {"v": i}]} for i in range(count)]
+
+
+def _make_db(snapshot: bool, with_index: bool = False,
+             mode: EnumConcurrencyMode = EnumConcurrencyMode.global_) -> DeltaTraceDatabase:
+    db = DeltaTraceDatabase(concurrency_mode=mode)
+    if snapshot:
+        db.set_snapshot_reads("users")
+    if with_index:
+        db.add_index("users", "age")
+        db.add_index("users", "name", EnumIndexType.sorted_)
+    db.execute_query(RawQueryBuilder.add(target="users", raw_add_data=_make_data(), serial_key="id").build())
+    return db
+
+
+def test_snapshot_reads_same_result():
+    for with_index in (False, True):
+        db1 = _make_db(False, with_index)
+        db2 = _make_db(True, with_index)
+        queries = [
+            RawQueryBuilder.search(target="users", query_node=FieldEquals("age", 3)).build(),
+            RawQueryBuilder.search(target="users", query_node=FieldGreaterThan("age", 1),
+                                   sort_obj=SingleSort("name", reversed_=True), offset=2, limit=30).build(),
+            RawQueryBuilder.search_one(target="users", query_node=FieldEquals("age", 4)).build(),
+            RawQueryBuilder.get_all(target="users", sort_obj=SingleSort("name"), limit=25).build(),
+            RawQueryBuilder.count(target="users").build(),
+            RawQueryBuilder.delete_one(target="users", query_node=FieldEquals("age", 0)).build(),
+            RawQueryBuilder.update(target="users", query_node=FieldEquals("age", 1), override_data={"age": 11},
+                                   return_data=True).build(),
+            RawQueryBuilder.get_all(target="users").build(),
+            RawQueryBuilder.delete(target="users", query_node=FieldEquals("age", 11)).build(),
+            RawQueryBuilder.add(target="users", raw_add_data=_make_data(), serial_key="id").build(),
+            RawQueryBuilder.rename_field(target="users", rename_before="name", rename_after="n2").build(),
+            RawQueryBuilder.search(target="users", query_node=FieldEquals("age", 2)).build(),
+            RawQueryBuilder.count(target="users").build(),
+            RawQueryBuilder.clear(target="users").build(),
+            RawQueryBuilder.get_all(target="users").build(),
+        ]
+        for q in queries:
+            r1 = db1.execute_query(q)
+            r2 = db2.execute_query(q)
+            assert r1.is_success and r2.is_success
+            assert r1.to_dict() == r2.to_dict()
+            assert db1.to_dict() == db2.to_dict()
+            assert db1.collection_to_dict("users") == db2.collection_to_dict("users")
+
+
+def test_snapshot_reads_pinned_version_unchanged():
+    db = _make_db(True, with_index=True)
+    col = db.collection("users")
+    pinned_all = col.snapshot_query(RawQueryBuilder.get_all(target="users").build())
+    pinned_search = col.snapshot_query(RawQueryBuilder.search(target="users",
+                                                              query_node=FieldEquals("age", 3)).build())
+    pinned_dict = col.snapshot_to_dict()
+    expected_all = db.execute_query(RawQueryBuilder.get_all(target="users").build()).result
+    expected_dict = db.collection_to_dict("users")
+    # 固定後に全ての種類の書き込みを行う。
+    db.execute_query(RawQueryBuilder.update(target="users", query_node=FieldEquals("age", 3),
+                                            override_data={"age": 30}).build())
+    db.execute_query(RawQueryBuilder.delete_one(target="users", query_node=FieldEquals("age", 4)).build())
+    db.execute_query(RawQueryBuilder.delete(target="users", query_node=FieldEquals("age", 5)).build())
+    db.execute_query(RawQueryBuilder.add(target="users", raw_add_data=_make_data(5), serial_key="id").build())
+    db.execute_query(RawQueryBuilder.conform_to_template(target="users",
+                                                         template={"id": 0, "age": 0, "x": 1}).build())
+    db.execute_query(RawQueryBuilder.rename_field(target="users", rename_before="x", rename_after="y").build())
+    tq = TransactionQuery(queries=[
+        RawQueryBuilder.clear(target="users").build(),
+        RawQueryBuilder.rename_field(target="users", rename_before="none", rename_after="z").build(),
+    ])
+    assert db.execute_transaction_query(tq).is_success is False
+    db.execute_query(RawQueryBuilder.clear_add(target="users", raw_add_data=_make_data(3), serial_key="id").build())
+    r = pinned_all()
+    assert r.result == expected_all
+    assert r.db_length == 30
+    r = pinned_search()
+    assert r.hit_count == 3 and all(i["age"] == 3 and "name" in i for i in r.result)
+    assert pinned_dict() == expected_dict
+    assert db.execute_query(RawQueryBuilder.count(target="users").build()).db_length == 3
+
+
+def test_snapshot_reads_update_after_read():
+    # 読み込みで固定された格納リストは、複数件の更新の途中でコピーに差し替わる。
+    for with_index in (False, True):
+        for return_data in (False, True):
+            dbs = []
+            for snapshot in (False, True):
+                db = DeltaTraceDatabase()
+                if snapshot:
+                    db.set_snapshot_reads("users")
+                if with_index:
+                    db.add_index("users", "a")
+                db.execute_query(RawQueryBuilder.add(target="users",
+                                                     raw_add_data=[{"a": 1, "b": i} for i in range(5)]).build())
+                db.execute_query(RawQueryBuilder.get_all(target="users").build())
+                dbs.append(db)
+            q = RawQueryBuilder.update(target="users", query_node=FieldEquals("a", 1), override_data={"a": 2},
+                                       return_data=return_data).build()
+            r1 = dbs[0].execute_query(q)
+            r2 = dbs[1].execute_query(q)
+            assert r2.is_success and r2.update_count == 5
+            assert r1.to_dict() == r2.to_dict()
+            assert dbs[0].to_dict() == dbs[1].to_dict()
+
+
+def test_snapshot_reads_threads():
+    # 読み込み中も書き込みが進み、読み込み側は常に一貫したバージョンを見る。
+    for mode in (EnumConcurrencyMode.global_, EnumConcurrencyMode.collection_):
+        db = DeltaTraceDatabase(concurrency_mode=mode)
+        db.set_snapshot_reads("accounts")
+        db.execute_query(RawQueryBuilder.add(target="accounts", raw_add_data=[
+            {"id": -1, "balance": 100} for _ in range(1000)], serial_key="id").build())
+        errors = []
+        stop = threading.Event()
+
+        def writer():
+            i = 0
+            while not stop.is_set():
+                a, b = i % 1000, (i * 7 + 1) % 1000
+                i += 1
+                if a == b:
+                    continue
+                tq = TransactionQuery(queries=[
+                    RawQueryBuilder.update_one(target="accounts", query_node=FieldEquals("id", a),
+                                               override_data={"balance": 90}).build(),
+                    RawQueryBuilder.update_one(target="accounts", query_node=FieldEquals("id", b),
+                                               override_data={"balance": 110}).build(),
+                ])
+                db.execute_transaction_query(tq)
+                tq = TransactionQuery(queries=[
+                    RawQueryBuilder.update(target="accounts", query_node=FieldEquals("id", a),
+                                           override_data={"balance": 100}).build(),
+                    RawQueryBuilder.update(target="accounts", query_node=FieldEquals("id", b),
+                                           override_data={"balance": 100}).build(),
+                ])
+                db.execute_transaction_query(tq)
+
+        def reader():
+            try:
+                for _ in range(30):
+                    r = db.execute_query(RawQueryBuilder.get_all(target="accounts",
+                                                                 sort_obj=SingleSort("balance")).build())
+                    total = sum(i["balance"] for i in r.result)
+                    if len(r.result) != 1000 or total != 100000:
+                        errors.append(total)
+            except Exception as e:
+                errors.append(e)
+
+        w = threading.Thread(target=writer)
+        readers = [threading.Thread(target=reader) for _ in range(3)]
+        w.start()
+        for t in readers:
+            t.start()
+        for t in readers:
+            t.join(60)
+        stop.set()
+        w.join(60)
+        assert not w.is_alive()
+        assert not errors
+
+
+def test_snapshot_reads_speed():
+    records_count = 100000
+    for snapshot in (False, True):
+        db = DeltaTraceDatabase(concurrency_mode=EnumConcurrencyMode.collection_)
+        if snapshot:
+            db.set_snapshot_reads("users")
+        db.execute_query(RawQueryBuilder.add(target="users", raw_add_data=[
+            {"id": -1, "name": f"user{i}", "age": i % 100} for i in range(records_count)], serial_key="id").build())
+        done = threading.Event()
+        write_times = []
+
+        def reader():
+            for _ in range(3):
+                db.execute_query(RawQueryBuilder.get_all(target="users", sort_obj=SingleSort("name")).build())
+            done.set()
+
+        t = threading.Thread(target=reader)
+        start = time.perf_counter()
+        t.start()
+        i = 0
+        while not done.is_set():
+            s = time.perf_counter()
+            db.execute_query(RawQueryBuilder.update_one(target="users", query_node=FieldEquals("id", i % 100),
+                                                        override_data={"age": i}).build())
+            write_times.append(time.perf_counter() - s)
+            i += 1
+        t.join()
+        total_ms = (time.perf_counter() - start) * 1000
+        print(f"end snapshot reads {snapshot}: {len(write_times)} writes during reads in {total_ms:.0f} ms, "
+              f"max write latency {max(write_times) * 1000:.0f} ms")
@@ -0,0 +1,102 @@
+# coding: utf-8
+import functools
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from delta_trace_db.db.delta_trace_db_collection import Collection
+from delta_trace_db.query.nodes.enum_value_type import EnumValueType
+from delta_trace_db.query.sort.multi_sort import MultiSort
+from delta_trace_db.query.sort.single_sort import SingleSort
+
+
+def _cmp_sorted(sort_obj, items):
+    return sorted(items, key=functools.cmp_to_key(sort_obj.get_comparator()))
+
+
+def _make_items(rnd: random.Random, count: int):
+    base = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    items = []
+    for i in range(count):
+        item = {
+            "i": i,
+            "n": rnd.choice([None, rnd.randrange(5), rnd.randrange(5)]),
+            "f": rnd.choice([None, rnd.random(), 0.5, 0.5 + 1e-13, -0.0, 0.0]),
+            "s": rnd.choice([None, "a", "b", "B", "", "ab"]),
+            "b": rnd.choice([None, True, False]),
+            "t": rnd.choice([None, (base + timedelta(hours=rnd.randrange(3))).isoformat(),
+                             "2025-01-01T09:00:00+09:00"]),
+            "nested": {"v": rnd.choice([None, 1, 2])},
+        }
+        if rnd.random() < 0.1:
+            del item["n"]
+        items.append(item)
+    return items
+
+
+def test_sort_keys_same_as_comparator():
+    rnd = random.Random(3)
+    sorts = []
+    for reversed_ in (False, True):
+        sorts += [
+            SingleSort("n", reversed_=reversed_),
+            SingleSort("f", reversed_=reversed_),
+            SingleSort("f", reversed_=reversed_, v_type=EnumValueType.floatEpsilon12_),
+            SingleSort("s", reversed_=reversed_),
+            SingleSort("s", reversed_=reversed_, v_type=EnumValueType.string_),
+            SingleSort("b", reversed_=reversed_),
+            SingleSort("n", reversed_=reversed_, v_type=EnumValueType.boolean_),
+            SingleSort("t", reversed_=reversed_, v_type=EnumValueType.datetime_),
+            SingleSort("nested.v", reversed_=reversed_, v_type=EnumValueType.string_),
+            SingleSort("none", reversed_=reversed_),
+        ]
+    sorts.append(MultiSort([SingleSort("b"), SingleSort("s", reversed_=True), SingleSort("n")]))
+    sorts.append(MultiSort([SingleSort("n", reversed_=True), SingleSort("f", v_type=EnumValueType.floatEpsilon12_)]))
+    sorts.append(MultiSort([]))
+    for _ in range(20):
+        items = _make_items(rnd, rnd.randrange(0, 60))
+        for sort_obj in sorts:
+            expected = _cmp_sorted(sort_obj, items)
+            assert Collection._sort_records(sort_obj, items) == expected
+            assert Collection._sort_records(sort_obj, items, 5) == expected[:5]
+
+
+def test_sort_keys_fallback():
+    # 許容誤差内の値はキーでは再現できないため、比較関数が使われる。
+    items = [{"v": 1.0}, {"v": 1.0 + 1e-13}, {"v": 1.0 - 1e-13}, {"v": 0.5}]
+    sort_obj = SingleSort("v", v_type=EnumValueType.floatEpsilon12_)
+    assert sort_obj.get_sort_keys(items) is None
+    assert Collection._sort_records(sort_obj, items) == _cmp_sorted(sort_obj, items)
+    assert SingleSort("v").get_sort_keys([{"v": float("nan")}, {"v": 1.0}]) is None
+    # 型が異なる値は、比較関数と同じく例外になる。
+    items = [{"v": 1}, {"v": "1"}]
+    assert SingleSort("v").get_sort_keys(items) is None
+    with pytest.raises(Exception):
+        Collection._sort_records(SingleSort("v"), items)
+    with pytest.raises(Exception):
+        Collection._sort_records(SingleSort("v"), [{"v": 1}, {"v": 1.0}])
+    with pytest.raises(Exception):
+        Collection._sort_records(SingleSort("v", v_type=EnumValueType.int_), [{"v": "x"}, {"v": 1}])
+    # 1件以下では比較されないため、例外にならない。
+    assert Collection._sort_records(SingleSort("v", v_type=EnumValueType.int_), [{"v": "x"}]) == [{"v": "x"}]
+    # 先頭のキーで順序が決まる場合、後続のキーは比較関数と同じく評価されない。
+    items = [{"a": 1, "v": "x"}, {"a": 0, "v": 1}]
+    sort_obj = MultiSort([SingleSort("a"), SingleSort("v", v_type=EnumValueType.int_)])
+    assert Collection._sort_records(sort_obj, items) == [items[1], items[0]]
+
+
+def test_sort_keys_speed():
+    records_count = 30000
+    rnd = random.Random(1)
+    items = [{"name": f"user{rnd.randrange(records_count)}", "age": rnd.randrange(100)} for _ in range(records_count)]
+    sort_obj = MultiSort([SingleSort("age", reversed_=True), SingleSort("name")])
+    t = time.perf_counter()
+    expected = _cmp_sorted(sort_obj, items)
+    cmp_ms = (time.perf_counter() - t) * 1000
+    t = time.perf_counter()
+    r = Collection._sort_records(sort_obj, items)
+    key_ms = (time.perf_counter() - t) * 1000
+    assert r == expected
+    print(f"end sort {records_count} records: comparator {cmp_ms:.0f} ms, sort keys {key_ms:.0f} ms")
@@ -0,0 +1,127 @@
+# coding: utf-8
+from datetime import datetime, timezone
+
+from delta_trace_db.db.delta_trace_db_core import DeltaTraceDatabase
+from delta_trace_db.db.index.enum_index_type import EnumIndexType
+from delta_trace_db.query.nodes.comparison_node import FieldGreaterThan, FieldLessThan, FieldGreaterThanOrEqual, \
+    FieldLessThanOrEqual, FieldEquals
+from delta_trace_db.query.nodes.enum_value_type import EnumValueType
+from delta_trace_db.query.nodes.logical_node import AndNode
+from delta_trace_db.query.raw_query_builder import RawQueryBuilder
+from delta_trace_db.query.sort.single_sort import SingleSort
+
+
+def _make_data():
+    r = []
+    for i in range(40):
+        r.append({
+            "n": i % 7,
+            "mixed": [i, str(i), float(i) + 0.5, None, [i], True][i % 6],
+            "s": f"v{i % 9}",
+            "dt": datetime(2025, 1, 1 + i % 20).isoformat() if i % 5 else
+            datetime(2025, 1, 1 + i % 20, tzinfo=timezone.utc).isoformat(),
+            "nested": {"num": str(i % 11)},
+        })
+    r.append({"other": 1})
+    return r
+
+
+def _make_db(with_index: bool) -> DeltaTraceDatabase:
+    db = DeltaTraceDatabase()
+    if with_index:
+        db.add_index("items", "n", index_type=EnumIndexType.sorted_)
+        db.add_index("items", "mixed", index_type=EnumIndexType.sorted_)
+        db.add_index("items", "s", index_type=EnumIndexType.sorted_, v_type=EnumValueType.string_)
+        db.add_index("items", "dt", index_type=EnumIndexType.sorted_, v_type=EnumValueType.datetime_)
+        db.add_index("items", "nested.num", index_type=EnumIndexType.sorted_, v_type=EnumValueType.int_)
+    db.execute_query(RawQueryBuilder.add(target="items", raw_add_data=_make_data()).build())
+    return db
+
+
+def _range_nodes():
+    nodes = []
+    for cls in (FieldGreaterThan, FieldLessThan, FieldGreaterThanOrEqual, FieldLessThanOrEqual):
+        nodes.extend([
+            cls("n", 3),
+            cls("n", 3.5),
+            cls("n", None),
+            cls("mixed", 10),
+            cls("mixed", "2"),
+            cls("mixed", True),
+            cls("s", "v4", v_type=EnumValueType.string_),
+            cls("dt", datetime(2025, 1, 10)),
+            cls("dt", datetime(2025, 1, 10, tzinfo=timezone.utc)),
+            cls("nested.num", 5, v_type=EnumValueType.int_),
+            cls("nested.num", "x", v_type=EnumValueType.int_),
+        ])
+    nodes.append(AndNode([FieldGreaterThan("n", 1), FieldLessThan("n", 5)]))
+    nodes.append(AndNode([FieldGreaterThan("n", 1), FieldEquals("s", "v3")]))
+    return nodes
+
+
+def test_sorted_index_range_same_result():
+    db1 = _make_db(False)
+    db2 = _make_db(True)
+    for node in _range_nodes():
+        q = RawQueryBuilder.search(target="items", query_node=node).build()
+        r1 = db1.execute_query(q)
+        r2 = db2.execute_query(q)
+        assert r1.is_success and r2.is_success
+        assert r1.result == r2.result
+
+
+def test_sorted_index_narrows_targets():
+    db = _make_db(True)
+    col = db.collection("items")
+    assert len(col._scan_targets(FieldGreaterThan("n", 5))) == 5
+    assert len(col._scan_targets(FieldLessThan("n", None))) == 0
+    assert len(col._scan_targets(AndNode([FieldGreaterThan("n", 1), FieldLessThan("n", 3)]))) == 6
+
+
+def test_sorted_index_order():
+    db1 = _make_db(False)
+    db2 = _make_db(True)
+    sorts = [
+        SingleSort("n"),
+        SingleSort("n", reversed_=True),
+        SingleSort("s", v_type=EnumValueType.string_),
+        SingleSort("s", reversed_=True, v_type=EnumValueType.string_),
+    ]
+    for sort_obj in sorts:
+        q = RawQueryBuilder.get_all(target="items", sort_obj=sort_obj).build()
+        r1 = db1.execute_query(q)
+        r2 = db2.execute_query(q)
+        assert r1.result == r2.result
+        q = RawQueryBuilder.get_all(target="items", sort_obj=sort_obj, offset=5, limit=10).build()
+        assert db1.execute_query(q).result == db2.execute_query(q).result
+        q = RawQueryBuilder.search(target="items", query_node=FieldGreaterThan("n", 0), sort_obj=sort_obj).build()
+        assert db1.execute_query(q).result == db2.execute_query(q).result
+        # 削除済みのレコードのソートではインデックスは使われない。
+        q = RawQueryBuilder.delete(target="items", query_node=FieldGreaterThan("n", 4), sort_obj=sort_obj,
+                                   return_data=True).build()
+        assert db1.clone().execute_query(q).result == db2.execute_query(q).result
+        db2 = _make_db(True)
+    # 型が混在する場合は通常のソートと同様に失敗する。
+    q = RawQueryBuilder.get_all(target="items", sort_obj=SingleSort("mixed")).build()
+    assert db1.execute_query(q).is_success is False
+    assert db2.execute_query(q).is_success is False
+
+
+def test_sorted_index_maintenance():
+    db1 = _make_db(False)
+    db2 = _make_db(True)
+    queries = [
+        RawQueryBuilder.update(target="items", query_node=FieldGreaterThan("n", 4),
+                               override_data={"n": 0, "s": "v0"}).build(),
+        RawQueryBuilder.delete_one(target="items", query_node=FieldLessThanOrEqual("n", 0)).build(),
+        RawQueryBuilder.delete(target="items", query_node=FieldGreaterThanOrEqual("s", "v7",
+                                                                                  v_type=EnumValueType.string_)).build(),
+        RawQueryBuilder.add(target="items", raw_add_data=_make_data()).build(),
+        RawQueryBuilder.rename_field(target="items", rename_before="nested", rename_after="nested2").build(),
+    ]
+    for q in queries:
+        db1.execute_query(q)
+        db2.execute_query(q)
+        for node in _range_nodes():
+            sq = RawQueryBuilder.search(target="items", query_node=node, sort_obj=SingleSort("n")).build()
+            assert db1.execute_query(sq).result == db2.execute_query(sq).result
@@ -0,0 +1,176 @@
+# coding: utf-8
+import random
+import sys
+import threading
+import time
+
+from delta_trace_db.db.delta_trace_db_core import DeltaTraceDatabase
+from delta_trace_db.db.enum_concurrency_mode import EnumConcurrencyMode
+from delta_trace_db.query.nodes.comparison_node import FieldEquals, FieldGreaterThanOrEqual, FieldLessThan
+from delta_trace_db.query.nodes.enum_value_type import EnumValueType
+from delta_trace_db.query.raw_query_builder import RawQueryBuilder
+from delta_trace_db.query.sort.multi_sort import MultiSort
+from delta_trace_db.query.sort.single_sort import SingleSort
+from delta_trace_db.query.transaction_query import TransactionQuery
+
+_SORTS = [
+    SingleSort("age"),
+    SingleSort("age", reversed_=True),
+    SingleSort("name", reversed_=True),
+    SingleSort("info.rank", v_type=EnumValueType.int_),
+    MultiSort([SingleSort("age", reversed_=True), SingleSort("name")]),
+    SingleSort("score", v_type=EnumValueType.floatEpsilon12_),
+]
+
+
+def _record(rnd: random.Random):
+    return {"id": -1, "age": rnd.choice([None, rnd.randrange(5)]), "name": f"n{rnd.randrange(8)}",
+            "score": rnd.random(), "info": {"rank": rnd.randrange(3)}}
+
+
+def _random_query(rnd: random.Random):
+    node = FieldEquals("age", rnd.randrange(5))
+    match rnd.randrange(9):
+        case 0:
+            return RawQueryBuilder.add(target="users", raw_add_data=[_record(rnd) for _ in range(rnd.randrange(1, 4))],
+                                       serial_key="id").build()
+        case 1:
+            return RawQueryBuilder.update(target="users", query_node=node,
+                                          override_data={"age": rnd.choice([None, rnd.randrange(5)])}).build()
+        case 2:
+            return RawQueryBuilder.update_one(target="users", query_node=node,
+                                              override_data={"name": f"n{rnd.randrange(8)}"}).build()
+        case 3:
+            return RawQueryBuilder.delete_one(target="users", query_node=node).build()
+        case 4:
+            return RawQueryBuilder.delete(target="users", query_node=FieldLessThan("id", rnd.randrange(100))).build()
+        case 5:
+            # 互換性の無い型の値が入ると、ビューは破棄されて通常のソートになる。
+            return RawQueryBuilder.update_one(target="users", query_node=node,
+                                              override_data={"info": {"rank": "x" if rnd.random() < 0.1 else 1}}).build()
+        case 6:
+            return RawQueryBuilder.update(target="users", query_node=FieldGreaterThanOrEqual("id", 0),
+                                          override_data={"score": 0.5}).build()
+        case 7 if rnd.random() < 0.1:
+            return RawQueryBuilder.add(target="users", raw_add_data=[{"id": -1, "age": "s"}],
+                                       serial_key="id").build()
+        case _:
+            return RawQueryBuilder.search(target="users", query_node=node).build()
+
+
+def test_sorted_view_same_result():
+    rnd = random.Random(11)
+    for mode in ("normal", "read_only", "snapshot"):
+        db1 = DeltaTraceDatabase()
+        db2 = DeltaTraceDatabase()
+        db1.set_max_sorted_views("users", 0)
+        # 全てのビューを保持して、差分での更新を確認する。
+        db2.set_max_sorted_views("users", len(_SORTS))
+        for db in (db1, db2):
+            if mode == "read_only":
+                db.set_read_only_results("users")
+            elif mode == "snapshot":
+                db.set_snapshot_reads("users")
+            db.execute_query(RawQueryBuilder.add(target="users", raw_add_data=[_record(random.Random(1))
+                                                                               for _ in range(50)],
+                                                 serial_key="id").build())
+        views_count = 0
+        for step in range(120):
+            q = _random_query(rnd)
+            q.must_affect_at_least_one = False
+            if step % 10 == 0:
+                # 失敗するトランザクションでは、全ての変更が取り消される。
+                tq = TransactionQuery(queries=[q, RawQueryBuilder.rename_field(
+                    target="users", rename_before="none", rename_after="x").build()])
+                assert db1.execute_transaction_query(tq).is_success is False
+                assert db2.execute_transaction_query(tq).is_success is False
+            else:
+                db1.execute_query(q)
+                db2.execute_query(q)
+            for sort_obj in _SORTS:
+                for offset, limit in ((None, None), (3, 5)):
+                    q = RawQueryBuilder.get_all(target="users", sort_obj=sort_obj, offset=offset,
+                                                limit=limit).build()
+                    assert db1.execute_query(q).to_dict() == db2.execute_query(q).to_dict()
+                q = RawQueryBuilder.search(target="users", query_node=FieldGreaterThanOrEqual("id", 10),
+                                           sort_obj=sort_obj).build()
+                assert db1.execute_query(q).to_dict() == db2.execute_query(q).to_dict()
+            assert len(db1.collection("users")._sorted_views) == 0
+            views_count += len(db2.collection("users")._sorted_views)
+        # スナップショット読み込みはロックの外で実行されるため、ビューを使わない。
+        assert (views_count == 0) == (mode == "snapshot")
+        assert db1.to_dict() == db2.to_dict()
+
+
+def test_sorted_view_lru():
+    db = DeltaTraceDatabase()
+    db.execute_query(RawQueryBuilder.add(target="users", raw_add_data=[{"id": -1, "a": i % 3, "b": i % 5}
+                                                                       for i in range(20)], serial_key="id").build())
+    col = db.collection("users")
+    db.set_max_sorted_views("users", 2)
+    assert col.max_sorted_views == 2
+    for field in ("a", "b", "id", "a"):
+        db.execute_query(RawQueryBuilder.get_all(target="users", sort_obj=SingleSort(field)).build())
+    # 最も長く使われていない"b"のビューが破棄される。
+    assert [v.sort_obj.field for v in col._sorted_views.values()] == ["id", "a"]
+    db.set_max_sorted_views("users", 0)
+    assert len(col._sorted_views) == 0
+    db.execute_query(RawQueryBuilder.get_all(target="users", sort_obj=SingleSort("a")).build())
+    assert len(col._sorted_views) == 0
+
+
+
+def test_sorted_view_concurrent_readers():
+    db = DeltaTraceDatabase(concurrency_mode=EnumConcurrencyMode.collection_)
+    db.execute_query(RawQueryBuilder.add(target="users", raw_add_data=[{"id": -1, "a": i % 3, "b": i % 5}
+                                                                       for i in range(200)], serial_key="id").build())
+    # 上限が1の場合、並行する読み込みの間でビューの作成と破棄が頻繁に起こる。
+    db.set_max_sorted_views("users", 1)
+    expected = {field: db.execute_query(RawQueryBuilder.get_all(target="users", sort_obj=SingleSort(field),
+                                                                limit=10).build()).to_dict()
+                for field in ("a", "b", "id")}
+    errors = []
+
+    def read(fields):
+        try:
+            for _ in range(200):
+                for field in fields:
+                    r = db.execute_query(RawQueryBuilder.get_all(target="users", sort_obj=SingleSort(field),
+                                                                 limit=10).build())
+                    assert r.to_dict() == expected[field]
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=read, args=(fields,))
+               for fields in (("a", "b"), ("b", "id"), ("id", "a"), ("a", "id"))]
+    # スレッドの切り替えを頻繁にして、競合を起こりやすくする。
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    finally:
+        sys.setswitchinterval(interval)
+    assert errors == []
+    assert len(db.collection("users")._sorted_views) == 1
+
+
+def test_sorted_view_speed():
+    records_count = 100000
+    db = DeltaTraceDatabase()
+    db.set_read_only_results("users")
+    db.execute_query(RawQueryBuilder.add(target="users", raw_add_data=[
+        {"id": -1, "name": f"user{i}", "age": i % 100} for i in range(records_count)], serial_key="id").build())
+    sort_obj = MultiSort([SingleSort("age"), SingleSort("name")])
+    times = []
+    for i in range(10):
+        t = time.perf_counter()
+        db.execute_query(RawQueryBuilder.get_all(target="users", sort_obj=sort_obj, offset=i * 20,
+                                                 limit=20).build())
+        times.append((time.perf_counter() - t) * 1000)
+        db.execute_query(RawQueryBuilder.update_one(target="users", query_node=FieldEquals("id", i),
+                                                    override_data={"age": 50}).build())
+    print(f"end paged getAll of {records_count} records with writes in between: "
+          f"first {times[0]:.0f} ms, following max {max(times[1:]):.1f} ms")
@@ -0,0 +1,81 @@
+# coding: utf-8
+import random
+import time
+
+from delta_trace_db.db.delta_trace_db_core import DeltaTraceDatabase
+from delta_trace_db.query.nodes.comparison_node import FieldGreaterThanOrEqual
+from delta_trace_db.query.nodes.enum_value_type import EnumValueType
+from delta_trace_db.query.raw_query_builder import RawQueryBuilder
+from delta_trace_db.query.sort.multi_sort import MultiSort
+from delta_trace_db.query.sort.single_sort import SingleSort
+
+
+def _make_data(count: int):
+    rnd = random.Random(7)
+    data = []
+    for i in range(count):
+        item = {"id": -1, "name": f"user{rnd.randrange(count)}", "age": rnd.randrange(20), "score": rnd.random()}
+        # null値と欠損値を混ぜる。
+        if i % 7 == 0:
+            item["age"] = None
+        if i % 11 == 0:
+            del item["score"]
+        data.append(item)
+    return data
+
+
+def test_top_k_sort_same_as_full_sort():
+    db = DeltaTraceDatabase()
+    db.execute_query(RawQueryBuilder.add(target="users", raw_add_data=_make_data(2000), serial_key="id").build())
+    sorts = [
+        SingleSort("age"),
+        SingleSort("age", reversed_=True),
+        SingleSort("score", v_type=EnumValueType.floatEpsilon12_),
+        SingleSort("score", reversed_=True),
+        MultiSort([SingleSort("age", reversed_=True), SingleSort("name")]),
+    ]
+    for sort_obj in sorts:
+        full = db.execute_query(RawQueryBuilder.get_all(target="users", sort_obj=sort_obj).build()).result
+        for offset, limit in ((None, 1), (None, 20), (0, 20), (15, 30), (-3, 10), (1990, 20), (None, 0)):
+            start = offset if offset is not None and offset > 0 else 0
+            expected = full[start:start + limit]
+            r = db.execute_query(RawQueryBuilder.get_all(target="users", sort_obj=sort_obj, offset=offset,
+                                                         limit=limit).build())
+            assert r.result == expected
+            r = db.execute_query(RawQueryBuilder.search(target="users", query_node=FieldGreaterThanOrEqual("id", 0),
+                                                        sort_obj=sort_obj, offset=offset, limit=limit).build())
+            assert r.result == expected and r.hit_count == 2000
+        # startAfterとendBeforeは全件のソート結果に対して適用される。
+        r = db.execute_query(RawQueryBuilder.get_all(target="users", sort_obj=sort_obj, start_after=full[100],
+                                                     limit=5).build())
+        assert r.result == full[101:106]
+        r = db.execute_query(RawQueryBuilder.get_all(target="users", sort_obj=sort_obj, end_before=full[100],
+                                                     limit=5).build())
+        assert r.result == full[95:100]
+
+
+def test_top_k_sort_incompatible_types():
+    # 比較できない値を含む場合は、limitやコレクションの大きさに関わらず全件のソートと同様に失敗する。
+    for position in (0, 500, 999):
+        db = DeltaTraceDatabase()
+        data = [{"v": i} for i in range(1000)]
+        data[position]["v"] = "text"
+        db.execute_query(RawQueryBuilder.add(target="users", raw_add_data=data).build())
+        for limit in (None, 0, 1, 5):
+            for sort_obj in (SingleSort("v"), SingleSort("v", reversed_=True)):
+                r = db.execute_query(RawQueryBuilder.get_all(target="users", sort_obj=sort_obj,
+                                                             limit=limit).build())
+                assert r.is_success is False
+
+
+def test_top_k_sort_speed():
+    records_count = 100000
+    db = DeltaTraceDatabase()
+    db.set_read_only_results("users", True)
+    db.execute_query(RawQueryBuilder.add(target="users", raw_add_data=_make_data(records_count),
+                                         serial_key="id").build())
+    for limit in (20, None):
+        t = time.perf_counter()
+        db.execute_query(RawQueryBuilder.get_all(target="users", sort_obj=SingleSort("score"), limit=limit).build())
+        ms = (time.perf_counter() - t) * 1000
+        print(f"end sort {records_count} records with limit {limit}: {ms:.0f} ms")
@@ -0,0 +1,126 @@
+# coding: utf-8
+import json
+import random
+
+from delta_trace_db.db.delta_trace_db_core import DeltaTraceDatabase
+from delta_trace_db.db.index.enum_index_type import EnumIndexType
+from delta_trace_db.query.nodes.comparison_node import FieldEquals, FieldGreaterThan, FieldLessThan
+from delta_trace_db.query.raw_query_builder import RawQueryBuilder
+from delta_trace_db.query.transaction_query import TransactionQuery
+
+
+def _make_db(read_only: bool, with_index: bool) -> DeltaTraceDatabase:
+    db = DeltaTraceDatabase()
+    if read_only:
+        db.set_read_only_results("users")
+    if with_index:
+        db.add_index("users", "age")
+        db.add_index("users", "score", EnumIndexType.sorted_)
+    data = [{"id": -1, "name": f"user{i}", "age": i % 7, "score": i % 13, "tags": [i]} for i in range(60)]
+    db.execute_query(RawQueryBuilder.add(target="users", raw_add_data=data, serial_key="id").build())
+    # 削除済みの位置が残った状態からも戻せることを確認する。
+    db.execute_query(RawQueryBuilder.delete_one(target="users", query_node=FieldEquals("id", 10)).build())
+    return db
+
+
+def _random_queries(rnd: random.Random):
+    queries = []
+    for _ in range(rnd.randint(1, 8)):
+        age = rnd.randint(0, 7)
+        match rnd.randint(0, 9):
+            case 0:
+                queries.append(RawQueryBuilder.add(target="users", raw_add_data=[
+                    {"id": -1, "name": "new", "age": age, "score": 1, "tags": []}], serial_key="id").build())
+            case 1:
+                queries.append(RawQueryBuilder.update(target="users", query_node=FieldEquals("age", age),
+                                                      override_data={"age": age + 1, "extra": [age]}).build())
+            case 2:
+                queries.append(RawQueryBuilder.update_one(target="users", query_node=FieldLessThan("score", age),
+                                                          override_data={"name": "x"}).build())
+            case 3:
+                queries.append(RawQueryBuilder.delete(target="users", query_node=FieldEquals("age", age)).build())
+            case 4:
+                queries.append(RawQueryBuilder.delete(target="users",
+                                                      query_node=FieldGreaterThan("score", 11)).build())
+            case 5:
+                queries.append(RawQueryBuilder.delete_one(target="users",
+                                                          query_node=FieldEquals("score", age)).build())
+            case 6:
+                queries.append(RawQueryBuilder.conform_to_template(
+                    target="users", template={"id": 0, "name": "", "age": 0, "score": 0, "memo": None}).build())
+            case 7:
+                queries.append(RawQueryBuilder.clear(target="users", reset_serial=rnd.random() < 0.5).build())
+            case 8:
+                queries.append(RawQueryBuilder.clear_add(target="users", raw_add_data=[
+                    {"id": -1, "name": "c", "age": age, "score": 2}], serial_key="id").build())
+            case _:
+                queries.append(RawQueryBuilder.add(target="users", raw_add_data=[
+                    {"id": -1, "name": "n", "age": age, "score": age}], serial_key="id").build())
+    # 対象が無くても失敗しないようにする。
+    for q in queries:
+        q.must_affect_at_least_one = False
+    return queries
+
+
+def _state(db: DeltaTraceDatabase):
+    # キーの順序も含めて比較する。
+    return json.dumps(db.collection_to_dict("users"))
+
+
+def test_transaction_undo_log_rollback():
+    rnd = random.Random(1)
+    for read_only in (False, True):
+        for with_index in (False, True):
+            for _ in range(100):
+                db = _make_db(read_only, with_index)
+                col = db.collection("users")
+                before = _state(db)
+                queries = _random_queries(rnd)
+                # 最後に失敗するクエリを加え、全体をロールバックさせる。
+                queries.append(RawQueryBuilder.rename_field(target="users", rename_before="none",
+                                                            rename_after="x").build())
+                assert db.execute_transaction_query(TransactionQuery(queries=queries)).is_success is False
+                assert db.collection("users") is col
+                assert _state(db) == before
+                # ロールバック後も各クエリは正しく動作する。
+                expected = _make_db(read_only, with_index)
+                for q in queries[:-1] + [RawQueryBuilder.search(target="users",
+                                                               query_node=FieldEquals("age", 3)).build()]:
+                    r1 = db.execute_query(q)
+                    r2 = expected.execute_query(q)
+                    assert r1.to_dict() == r2.to_dict()
+                assert _state(db) == _state(expected)
+
+
+def test_transaction_undo_log_commit():
+    rnd = random.Random(2)
+    for read_only in (False, True):
+        for with_index in (False, True):
+            for _ in range(50):
+                db = _make_db(read_only, with_index)
+                expected = _make_db(read_only, with_index)
+                queries = _random_queries(rnd)
+                assert db.execute_transaction_query(TransactionQuery(queries=queries)).is_success
+                for q in queries:
+                    expected.execute_query(q)
+                assert _state(db) == _state(expected)
+                # コミット後は取り消し用の記録を保持しない。
+                assert db.collection("users")._undo_log is None
+
+
+def test_transaction_undo_log_rename_and_return_data():
+    db = _make_db(True, True)
+    before = _state(db)
+    r = db.execute_query(RawQueryBuilder.search(target="users", query_node=FieldEquals("age", 3)).build())
+    tq = TransactionQuery(queries=[
+        RawQueryBuilder.rename_field(target="users", rename_before="name", rename_after="n2").build(),
+        RawQueryBuilder.update(target="users", query_node=FieldEquals("age", 3), override_data={"age": 9},
+                               return_data=True).build(),
+        RawQueryBuilder.update(target="users", query_node=FieldEquals("age", 9), override_data={"age": 3}).build(),
+        RawQueryBuilder.rename_field(target="users", rename_before="none", rename_after="x").build(),
+    ])
+    assert db.execute_transaction_query(tq).is_success is False
+    assert _state(db) == before
+    assert [i["age"] for i in r.result] == [3] * len(r.result)
+    assert db.execute_query(RawQueryBuilder.search(target="users", query_node=FieldEquals("age", 3))
+                            .build()).result == r.result
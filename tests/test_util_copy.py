@@ -0,0 +1,106 @@
+# coding: utf-8
+import time
+from collections import OrderedDict
+from enum import IntEnum
+
+import pytest
+
+from delta_trace_db.db.read_only_view import ReadOnlyDict
+from delta_trace_db.db.util_copy import UtilCopy
+
+
+def _reference_copy(value, depth=0):
+    # 以前の再帰による実装。結果と速度の比較用。
+    if depth > 100:
+        raise ValueError('Exceeded max allowed nesting depth')
+    if isinstance(value, dict):
+        return {k: _reference_copy(v, depth=depth + 1) for k, v in value.items()}
+    elif isinstance(value, list):
+        return [_reference_copy(v, depth=depth + 1) for v in value]
+    elif isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    else:
+        raise ValueError('Unsupported type for JSON deep copy')
+
+
+def _nest(depth: int, leaf):
+    v = leaf
+    for i in range(depth):
+        v = {"a": v} if i % 2 == 0 else [v]
+    return v
+
+
+class _Color(IntEnum):
+    red = 1
+
+
+def _assert_same(value):
+    try:
+        expected = _reference_copy(value)
+    except ValueError as e:
+        with pytest.raises(ValueError) as info:
+            UtilCopy.jsonable_deep_copy(value)
+        assert str(info.value) == str(e)
+        return
+    r = UtilCopy.jsonable_deep_copy(value)
+    assert r == expected
+    assert type(r) is type(expected)
+
+
+def test_util_copy_same_result():
+    values = [
+        None, 1, 1.5, True, "a", [], {}, [1, "a", None], {"a": 1, "b": [1, {"c": 2}]},
+        OrderedDict(a=1, b=[1]), {"a": _Color.red}, {"a": (1, 2)}, {"a": {1, 2}}, [b"x"],
+        {"a": 1, "b": object(), "c": [_nest(200, 1)]}, {"a": _nest(200, 1), "b": object()},
+    ]
+    for depth in (98, 99, 100, 101, 102):
+        for leaf in (1, [], {}, [1], {"x": 1}, object()):
+            values.append(_nest(depth, leaf))
+    for value in values:
+        _assert_same(value)
+    # コピーであり、元のデータとは独立している。
+    src = {"a": [1, {"b": 2}], "c": {"d": [3]}}
+    r = UtilCopy.jsonable_deep_copy(src)
+    r["a"][1]["b"] = 5
+    r["c"]["d"].append(4)
+    assert src == {"a": [1, {"b": 2}], "c": {"d": [3]}}
+    # 読み取り専用のビューも通常の辞書としてコピーされる。
+    r = UtilCopy.jsonable_deep_copy([ReadOnlyDict(src)])
+    assert r == [src] and type(r[0]) is dict and type(r[0]["c"]["d"]) is list
+
+
+def test_util_copy_validated():
+    src = [{"a": [1, {"b": 2.5}], "c": None, "d": True}, {"e": "x"}]
+    r = UtilCopy.validated_deep_copy(src)
+    assert r == src
+    r[0]["a"][1]["b"] = 5
+    assert src[0]["a"][1]["b"] == 2.5
+    assert type(r[0]["d"]) is bool
+    # marshalで扱えない型はjsonable_deep_copyでコピーされる。
+    src = [{"a": _Color.red, "b": [1]}]
+    r = UtilCopy.validated_deep_copy(src)
+    assert r == src and r[0]["a"] is _Color.red
+    r[0]["b"].append(2)
+    assert src[0]["b"] == [1]
+
+
+def test_util_copy_speed():
+    records_count = 50000
+    flat = [{"id": i, "name": f"sample{i}", "age": i, "score": i * 0.5, "active": True, "memo": None}
+            for i in range(records_count)]
+    nested = [{"id": i, "name": f"sample{i}", "tags": ["a", "b", i],
+               "nestedObj": {"a": 1, "b": {"c": [1, 2, {"d": "x"}]}}} for i in range(records_count)]
+    for label, data in (("flat", flat), ("nested", nested)):
+        print(f"start copy {label} records: {records_count}")
+        t = time.perf_counter()
+        r1 = _reference_copy(data)
+        reference_ms = (time.perf_counter() - t) * 1000
+        t = time.perf_counter()
+        r2 = UtilCopy.jsonable_deep_copy(data)
+        new_ms = (time.perf_counter() - t) * 1000
+        t = time.perf_counter()
+        r3 = UtilCopy.validated_deep_copy(data)
+        validated_ms = (time.perf_counter() - t) * 1000
+        print(f"end copy {label}: reference {reference_ms:.0f} ms, current {new_ms:.0f} ms, "
+              f"validated {validated_ms:.0f} ms")
+        assert r1 == r2 == r3
@@ -0,0 +1,172 @@
+# coding: utf-8
+import json
+import os
+import time
+
+import pytest
+
+import delta_trace_db.db.write_ahead_log as write_ahead_log
+from delta_trace_db.db.delta_trace_db_core import DeltaTraceDatabase
+from delta_trace_db.db.write_ahead_log import WriteAheadLog
+from delta_trace_db.query.merge_query_params import MergeQueryParams
+from delta_trace_db.query.nodes.comparison_node import FieldEquals, FieldLessThan
+from delta_trace_db.query.query_builder import QueryBuilder
+from delta_trace_db.query.raw_query_builder import RawQueryBuilder
+from delta_trace_db.query.transaction_query import TransactionQuery
+
+
+def _add(target: str, count: int, start: int = 0):
+    return RawQueryBuilder.add(target=target, raw_add_data=[
+        {"id": -1, "name": f"user{i}", "age": i % 10} for i in range(start, start + count)], serial_key="id").build()
+
+
+def _make_db(directory: str, **kwargs) -> DeltaTraceDatabase:
+    db = DeltaTraceDatabase()
+    db.set_write_ahead_log(WriteAheadLog(directory, **kwargs))
+    return db
+
+
+def test_write_ahead_log_recover(tmp_path):
+    directory = str(tmp_path / "wal")
+    db = _make_db(directory)
+    wal = db.write_ahead_log
+    db.execute_query(_add("users", 20))
+    db.execute_query(_add("items", 5))
+    db.execute_query(RawQueryBuilder.update(target="users", query_node=FieldEquals("age", 3),
+                                            override_data={"name": "updated"}).build())
+    db.execute_query(RawQueryBuilder.delete_one(target="users", query_node=FieldEquals("age", 4)).build())
+    assert wal.seq == 4
+    # 読み込みや失敗したクエリ、失敗したトランザクションは記録されない。
+    db.execute_query(RawQueryBuilder.get_all(target="users").build())
+    db.execute_query(RawQueryBuilder.search(target="users", query_node=FieldEquals("age", 1)).build())
+    db.execute_query(RawQueryBuilder.update(target="users", query_node=FieldEquals("age", 100),
+                                            override_data={"name": "x"}, must_affect_at_least_one=True).build())
+    assert db.execute_transaction_query(TransactionQuery(queries=[
+        RawQueryBuilder.delete(target="users", query_node=FieldLessThan("age", 2)).build(),
+        RawQueryBuilder.rename_field(target="users", rename_before="none", rename_after="x").build()])).is_success \
+           is False
+    assert wal.seq == 4
+    # 成功したトランザクションは単一のレコードになる。
+    assert db.execute_transaction_query(TransactionQuery(queries=[
+        RawQueryBuilder.delete(target="users", query_node=FieldLessThan("age", 2)).build(),
+        _add("users", 3, 100)])).is_success
+    assert wal.seq == 5
+    db.execute_query(RawQueryBuilder.remove_collection(target="items").build())
+    db.execute_query(QueryBuilder.merge(merge_query_params=MergeQueryParams(
+        base="users", source=[], relation_key="id", source_keys=[], output="merged",
+        dsl_tmp={"id": "base.id", "name": "base.name"}, serial_base="users")).build())
+    assert wal.seq == 7
+    wal.close()
+    # 新しいDBと、既存のDBのどちらにも復元できる。
+    recovered = WriteAheadLog(directory).recover()
+    assert recovered.to_dict() == db.to_dict()
+    assert recovered.collection("users").get_serial_num() == db.collection("users").get_serial_num()
+    target = DeltaTraceDatabase()
+    assert WriteAheadLog(directory).recover(target) is target
+    assert target.to_dict() == db.to_dict()
+    # 既に先行書き込みログを設定したDBには復元できない。
+    with pytest.raises(ValueError):
+        WriteAheadLog(directory).recover(_make_db(str(tmp_path / "other")))
+
+
+def test_write_ahead_log_checkpoint(tmp_path):
+    directory = str(tmp_path)
+    db = _make_db(directory)
+    with pytest.raises(ValueError):
+        DeltaTraceDatabase().checkpoint()
+    db.execute_query(_add("users", 10))
+    db.execute_query(RawQueryBuilder.delete(target="users", query_node=FieldEquals("age", 1)).build())
+    log_path = os.path.join(directory, WriteAheadLog.log_file_name)
+    with open(log_path, "rb") as f:
+        old_log = f.read()
+    db.checkpoint()
+    assert os.path.getsize(log_path) == 0
+    db.execute_query(_add("users", 5, 10))
+    assert db.write_ahead_log.seq == 3
+    db.write_ahead_log.close()
+    assert WriteAheadLog(directory).recover().to_dict() == db.to_dict()
+    # チェックポイントに含まれるレコードがログに残っていても、二重に再実行されない。
+    with open(log_path, "rb") as f:
+        new_log = f.read()
+    with open(log_path, "wb") as f:
+        f.write(old_log + new_log)
+    wal = WriteAheadLog(directory)
+    assert wal.seq == 3
+    assert wal.recover().to_dict() == db.to_dict()
+    wal.close()
+
+
+def test_write_ahead_log_torn_tail(tmp_path):
+    directory = str(tmp_path)
+    db = _make_db(directory)
+    db.execute_query(_add("users", 10))
+    db.execute_query(_add("users", 10, 10))
+    db.write_ahead_log.close()
+    log_path = os.path.join(directory, WriteAheadLog.log_file_name)
+    size = os.path.getsize(log_path)
+    # クラッシュで途切れたレコードを再現する。
+    with open(log_path, "ab") as f:
+        f.write(b"\x00\x00\x01\x00\x12\x34")
+    wal = WriteAheadLog(directory)
+    assert os.path.getsize(log_path) == size
+    recovered = wal.recover()
+    assert recovered.to_dict() == db.to_dict()
+    # 途切れたレコードの後ではなく、最後の有効なレコードの後に追記される。
+    recovered.set_write_ahead_log(wal)
+    recovered.execute_query(_add("users", 1, 20))
+    assert wal.seq == 3
+    wal.close()
+    assert WriteAheadLog(directory).recover().to_dict() == recovered.to_dict()
+    # 破損したレコード以降は読み込まれない。
+    with open(log_path, "r+b") as f:
+        f.seek(size - 1)
+        f.write(b"\xff")
+    assert WriteAheadLog(directory).seq == 1
+    with open(os.path.join(directory, WriteAheadLog.checkpoint_file_name), "wb") as f:
+        f.write(json.dumps({"seq": 0}).encode("utf-8") + b"\n" + b"broken")
+    with pytest.raises(ValueError):
+        WriteAheadLog(directory).recover()
+
+
+def test_write_ahead_log_group_commit(tmp_path, monkeypatch):
+    calls = []
+    real_fsync = os.fsync
+    monkeypatch.setattr(write_ahead_log.os, "fsync", lambda fd: (calls.append(fd), real_fsync(fd)))
+    db = _make_db(str(tmp_path / "a"), group_commit_size=4)
+    calls.clear()
+    for i in range(10):
+        db.execute_query(_add("users", 1, i))
+    assert len(calls) == 2
+    db.write_ahead_log.sync()
+    assert len(calls) == 3
+    db.write_ahead_log.sync()
+    assert len(calls) == 3
+    db.write_ahead_log.close()
+    db = _make_db(str(tmp_path / "b"), group_commit_size=0, group_commit_interval=3600)
+    calls.clear()
+    for i in range(10):
+        db.execute_query(_add("users", 1, i))
+    assert len(calls) == 0
+    db.write_ahead_log.close()
+    assert len(calls) == 1
+    assert WriteAheadLog(str(tmp_path / "b")).recover().to_dict() == db.to_dict()
+
+
+def test_write_ahead_log_speed(tmp_path):
+    records_count = 20000
+    count = 100
+    db = DeltaTraceDatabase()
+    db.execute_query(_add("users", records_count))
+    db.set_write_ahead_log(WriteAheadLog(str(tmp_path), group_commit_size=0))
+    t = time.perf_counter()
+    for i in range(count):
+        db.execute_query(RawQueryBuilder.update(target="users", query_node=FieldEquals("id", i),
+                                                override_data={"name": "updated"}).build())
+    db.write_ahead_log.sync()
+    wal_ms = (time.perf_counter() - t) * 1000
+    t = time.perf_counter()
+    json.dumps(db.to_dict())
+    dump_ms = (time.perf_counter() - t) * 1000
+    db.write_ahead_log.close()
+    print(f"end {count} updates of {records_count} records: write-ahead log {wal_ms:.0f} ms, "
+          f"a single full dump {dump_ms:.0f} ms")